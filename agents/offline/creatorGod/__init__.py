@@ -5,3 +5,12 @@ from .creator_god import CreatorGod, StageLLMConfig
 from .character_filter_agent import CharacterFilterAgent
 from .world_setting_agent import WorldSettingAgent
 from .character_detail_agent import CharacterDetailAgent
+from .stage_dag import Stage, StageDAG
+from .name_index import NameIndex
+from .work_ledger import WorkLedger
+from .ingest import NovelText, TextView, read_novel
+from .chunker import ChunkStats, TokenChunker
+from .extraction_tiers import ExtractionProfile, TierPolicy
+from .profile_reducer import ProfileReducer, merge_profiles
+from .estimator import BuildEstimate, GenesisEstimator, LatencyModel
+from .job_queue import GenesisJob, GenesisJobQueue, run_worker, run_workers
@@ -1,16 +1,32 @@
 """
 角色档案子客体：为单个角色生成详细档案
+
+提取深度按角色重要性分级（见 extraction_tiers）：主角多批深度提取，龙套一次精简提取。
+龙套按共同出场的原文分组，一次调用为一组角色建档（打包模式），
+返回结果逐个校验，缺失或不合格的角色再单独提取。
+一个角色的多批结果由 ProfileReducer 去重归并（必要时分层精炼）为一张档案。
 """
 import json
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from config.settings import settings
 from utils.llm_factory import get_llm
+from utils.llm_telemetry import estimate_tokens
 from utils.logger import setup_logger
-from .utils import load_prompt, parse_json_response, escape_braces
+from utils.tracing import span
+from .extraction_tiers import TierPolicy
+from .name_index import NameIndex, _spread, character_names, merge_spans
+from .profile_reducer import ProfileReducer
+from .chunker import TokenChunker
+from .ingest import TextView
+from .utils import load_prompt, escape_braces
+from .work_ledger import WorkLedger, invoke_json, plan_keys
+
+STAGE = "stage3.detail"
 
 
 class CharacterDetailAgent:
@@ -21,16 +37,32 @@ class CharacterDetailAgent:
         llm=None,
         prompt_filename: str = "character_detail.txt",
         logger=None,
+        chunker: Optional[TokenChunker] = None,
+        batch_prompt_filename: str = "character_detail_batch.txt",
+        light_prompt_filename: str = "character_detail_light.txt",
     ):
         self.logger = logger or setup_logger("许劭", "genesis_group.log")
-        self.llm = llm or get_llm()
+        self.llm = llm or get_llm(agent_name="Genesis.detail")
         self.prompt_template = load_prompt(prompt_filename)
+        self.batch_prompt_template = load_prompt(batch_prompt_filename)
+        self.light_prompt_template = load_prompt(light_prompt_filename)
+        # 按重要性分级的提取策略（CreatorGod 按世界目录的覆盖配置注入）
+        self.tier_policy = TierPolicy()
+        # 多批结果的归并与精炼
+        self.reducer = ProfileReducer(self.llm, logger=self.logger)
+        # 最近一次 run() 各级别的角色数
+        self.last_tiers: Dict[str, int] = {}
+        # 按模型上下文窗口切分长小说（CreatorGod 按阶段模型配置注入）
+        self.chunker = chunker or TokenChunker.for_model()
+        # 工作项账本（由 CreatorGod 注入），命中时跳过已完成的调用
+        self.ledger: Optional[WorkLedger] = None
 
     def _build_prompt(
         self, 
         char_name: str, 
         char_id: str, 
-        characters_list: Optional[List[Dict[str, Any]]] = None
+        characters_list: Optional[List[Dict[str, Any]]] = None,
+        schema: str = "full",
     ) -> str:
         """
         构建提示词，包含角色列表信息以保持ID一致性
@@ -39,8 +71,10 @@ class CharacterDetailAgent:
             char_name: 目标角色名
             char_id: 目标角色ID
             characters_list: 阶段1生成的角色列表，用于ID同步
+            schema: full 为完整档案，light 为精简档案
         """
-        prompt = self.prompt_template.replace("{target_name}", char_name)
+        template = self.light_prompt_template if schema == "light" else self.prompt_template
+        prompt = template.replace("{target_name}", char_name)
         prompt = prompt.replace("{target_id}", char_id)
         
         # 构建角色列表信息（用于relationship_matrix中的ID引用）
@@ -52,11 +86,71 @@ class CharacterDetailAgent:
         
         return escape_braces(prompt)
 
+    def _prompt_for(
+        self,
+        char_info: Dict[str, Any],
+        characters_list: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
+        """按角色所属级别选择完整或精简提示词"""
+        schema = self.tier_policy.profile(char_info).schema
+        return self._build_prompt(char_info.get("name"), char_info.get("id"), characters_list, schema)
+
+    def _get_chain(self, prompt_text: str):
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", prompt_text),
+                ("human", "{novel_text}"),
+            ]
+        )
+        return prompt | self.llm | StrOutputParser()
+
+    def build_index(self, novel_text: str, characters_list: List[Dict[str, Any]]) -> NameIndex:
+        """一次扫描全书，建立所有角色名字/别名的位置索引"""
+        index = NameIndex(novel_text, characters_list)
+        stats = index.stats()
+        self.logger.info(f"🔎 名字索引: {stats['names']} 个称呼，共 {stats['mentions']} 处提及")
+        return index
+
+    def _contexts(
+        self,
+        novel_text: str,
+        char_info: Dict[str, Any],
+        index: Optional[NameIndex] = None,
+    ) -> Tuple[str, List[Union[str, TextView]]]:
+        """
+        决定为角色发送哪些上下文，每段上下文对应一次 LLM 调用（片段半径与批数由角色级别决定）
+
+        Returns:
+            (mode, texts)：mode 为 excerpts（提及片段）/ whole（全文）/ chunked（含角色名的分块）
+        """
+        profile = self.tier_policy.profile(char_info)
+        if index is not None and index.text_tokens > settings.GENESIS_DETAIL_CONTEXT_TOKENS:
+            batches = index.context_batches(
+                char_info.get("id"),
+                max_tokens=settings.GENESIS_DETAIL_CONTEXT_TOKENS,
+                radius=profile.radius,
+                max_batches=profile.max_batches or None,
+            )
+            if batches:
+                return "excerpts", batches
+
+        chunks = self.chunker.split(novel_text)
+        if len(chunks) <= 1:
+            return "whole", [novel_text]
+
+        # 简单过滤：如果片段中不包含角色名或别名，大概率可以跳过（优化速度）
+        names = character_names(char_info)
+        views = [view for view in chunks if view.contains_any(names)]
+        if profile.max_batches:
+            views = _spread(views, profile.max_batches)
+        return "chunked", views
+
     def create_one(
         self, 
         novel_text: str, 
         char_info: Dict[str, Any],
-        characters_list: Optional[List[Dict[str, Any]]] = None
+        characters_list: Optional[List[Dict[str, Any]]] = None,
+        index: Optional[NameIndex] = None,
     ) -> Dict[str, Any]:
         """
         为单个角色生成档案
@@ -65,111 +159,199 @@ class CharacterDetailAgent:
             novel_text: 小说文本
             char_info: 当前角色信息
             characters_list: 阶段1生成的角色列表，用于ID同步
+            index: 名字索引；提供且全书超出单次上下文预算时只发送角色提及处的片段
         """
-        char_id = char_info.get("id")
         char_name = char_info.get("name")
-        importance = char_info.get("importance")
+        mode, texts = self._contexts(novel_text, char_info, index)
+        if mode == "excerpts":
+            self.logger.info(
+                f"   📎 {char_name}: {len(texts)} 批提及片段，"
+                f"约 {sum(estimate_tokens(text) for text in texts)} tokens"
+            )
+        elif mode == "chunked":
+            self.logger.warning(f"⚠️ 小说过长，将分块处理：{len(texts)} 个片段包含 {char_name}")
+        elif index is not None and index.text_tokens > settings.GENESIS_DETAIL_CONTEXT_TOKENS:
+            self.logger.warning(f"⚠️ 未在文中找到 {char_name} 的提及，改用全文")
 
-        # 估算 Token 数
-        estimated_tokens = len(novel_text) / 1.5
-        MAX_TOKENS = 600000  # 安全阈值（模型限制100万，留余量给prompt）
-        
-        if estimated_tokens > MAX_TOKENS:
-            self.logger.warning(f"⚠️ 小说过长 (约 {int(estimated_tokens)} tokens)，将进行分块处理...")
-            return self._create_one_chunked(novel_text, char_info, characters_list)
+        prompt_text = self._prompt_for(char_info, characters_list)
+        chain = self._get_chain(prompt_text)
 
-        prompt_text = self._build_prompt(char_name, char_id, characters_list)
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", prompt_text),
-                ("human", "{novel_text}"),
-            ]
+        self.reducer.ledger = self.ledger
+        if mode == "whole":
+            char_data = self._invoke(chain, novel_text, prompt_text, f"{char_info.get('id')} 全文")
+            return self.reducer.reduce(char_info, [char_data])
+
+        parts: List[Dict[str, Any]] = []
+        for i, text in enumerate(texts, 1):
+            if mode == "chunked":
+                self.logger.info(f"🤖 处理片段 {i}/{len(texts)}...")
+            try:
+                parts.append(self._invoke(chain, text, prompt_text, f"{char_info.get('id')} 片段 {i}/{len(texts)}"))
+            except Exception as e:
+                if len(texts) == 1:
+                    raise
+                self.logger.warning(f"⚠️ 片段 {i}/{len(texts)} 处理失败: {e}")
+        if texts and not parts:
+            raise RuntimeError(f"{char_name} 的全部 {len(texts)} 个片段处理失败")
+        return self.reducer.reduce(char_info, parts)
+
+    def _invoke(
+        self, chain, text: Union[str, TextView], prompt_text: str, item: str, expect: Tuple[type, ...] = (dict,)
+    ) -> Any:
+        return invoke_json(
+            chain, str(text), ledger=self.ledger, stage=STAGE, item=item,
+            prompt_text=prompt_text, llm=self.llm, expect=expect,
         )
-        chain = prompt | self.llm | StrOutputParser()
 
-        response = chain.invoke({"novel_text": novel_text}, config={"timeout": 18000})
-        char_data = parse_json_response(response)
-        char_data["importance"] = importance
-        return char_data
+    def plan(
+        self,
+        novel_text: str,
+        characters_list: List[Dict[str, Any]],
+        index: Optional[NameIndex] = None,
+        groups: Optional[List[Tuple[List[Dict[str, Any]], str]]] = None,
+    ) -> None:
+        """把本阶段所有调用（打包调用 + 单角色调用）登记到账本，供进度统计使用"""
+        if self.ledger is None:
+            return
+        keys: List[str] = []
+        packed = set()
+        for members, context in groups or []:
+            prompt_text = self._build_batch_prompt(members, characters_list)
+            keys.extend(plan_keys(STAGE, [context], prompt_text, self.llm))
+            packed.update(c.get("id") for c in members)
+        for char_info in characters_list:
+            if char_info.get("id") in packed:
+                continue
+            _, texts = self._contexts(novel_text, char_info, index)
+            prompt_text = self._prompt_for(char_info, characters_list)
+            keys.extend(plan_keys(STAGE, texts, prompt_text, self.llm))
+        self.ledger.plan(STAGE, keys)
+
+    def _build_batch_prompt(
+        self,
+        members: List[Dict[str, Any]],
+        characters_list: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
+        """构建打包提示词（精简档案）：列出本组目标角色（含别名）与完整角色表"""
+        targets = [
+            {"id": c.get("id"), "name": c.get("name"), "aliases": character_names(c)[1:]}
+            for c in members
+        ]
+        prompt = self.batch_prompt_template.replace("{targets}", json.dumps(targets, ensure_ascii=False, indent=2))
+        prompt = prompt.replace("{characters_list}", json.dumps(characters_list or [], ensure_ascii=False, indent=2))
+        return escape_braces(prompt)
+
+    def _packable(self, char_info: Dict[str, Any]) -> bool:
+        return self.tier_policy.profile(char_info).packable
 
-    def _create_one_chunked(
+    def pack_groups(
         self,
         novel_text: str,
-        char_info: Dict[str, Any],
-        characters_list: Optional[List[Dict[str, Any]]] = None
-    ) -> Dict[str, Any]:
-        """分块生成角色档案"""
-        CHUNK_SIZE = 50000
-        OVERLAP = 2000
-        
-        chunks = []
-        start = 0
-        while start < len(novel_text):
-            end = min(start + CHUNK_SIZE, len(novel_text))
-            chunks.append(novel_text[start:end])
-            if end == len(novel_text):
-                break
-            start = end - OVERLAP
-            
-        self.logger.info(f"📚 将小说切分为 {len(chunks)} 个片段进行处理")
-        
-        merged_data = {
-            "id": char_info.get("id"),
-            "name": char_info.get("name"),
-            "importance": char_info.get("importance"),
-            "age": "",
-            "gender": "",
-            "appearance": "",
-            "personality": "",
-            "background": "",
-            "relationships": []
-        }
-        
-        prompt_text = self._build_prompt(char_info.get("name"), char_info.get("id"), characters_list)
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", prompt_text),
-                ("human", "{novel_text}"),
-            ]
-        )
-        chain = prompt | self.llm | StrOutputParser()
-        
-        for i, chunk in enumerate(chunks, 1):
-            # 简单过滤：如果片段中不包含角色名，大概率可以跳过（优化速度）
-            if char_info.get("name") not in chunk:
+        characters_list: List[Dict[str, Any]],
+        index: NameIndex,
+    ) -> List[Tuple[List[Dict[str, Any]], str]]:
+        """
+        把可打包（精简级别）的角色按共同出场的原文分组
+
+        全书放得下一次调用时，各组共用全文；否则按首次出场位置排序，相邻角色的提及片段
+        合并去重后不超过 GENESIS_DETAIL_CONTEXT_TOKENS 即归为一组。
+        自身片段就超出预算、或从未被提及的角色不打包。
+
+        Returns:
+            [(组内角色, 上下文)]，只包含至少两名角色的组
+        """
+        pack_size = settings.GENESIS_DETAIL_PACK_SIZE
+        budget = settings.GENESIS_DETAIL_CONTEXT_TOKENS
+        candidates = [c for c in characters_list if self._packable(c)] if pack_size > 1 else []
+        if len(candidates) < 2:
+            return []
+
+        if index.text_tokens <= budget:
+            batches = [candidates[i:i + pack_size] for i in range(0, len(candidates), pack_size)]
+            return [(members, novel_text) for members in batches if len(members) > 1]
+
+        entries = []
+        for char_info in candidates:
+            spans = index.windows(char_info.get("id"), self.tier_policy.profile(char_info).radius)
+            if spans and index.span_tokens(spans) <= budget:
+                entries.append((spans[0][0], char_info, spans))
+        entries.sort(key=lambda entry: entry[0])
+
+        groups: List[Tuple[List[Dict[str, Any]], str]] = []
+        members: List[Dict[str, Any]] = []
+        spans: List[Tuple[int, int]] = []
+        for _, char_info, own in entries:
+            combined = merge_spans(spans + own)
+            if members and (len(members) >= pack_size or index.span_tokens(combined) > budget):
+                if len(members) > 1:
+                    groups.append((members, index.excerpt(spans)))
+                members, combined = [], own
+            members.append(char_info)
+            spans = combined
+        if len(members) > 1:
+            groups.append((members, index.excerpt(spans)))
+        return groups
+
+    def create_batch(
+        self,
+        context: str,
+        members: List[Dict[str, Any]],
+        characters_list: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        一次调用为一组角色建档
+
+        Returns:
+            (通过校验的档案 {角色ID: 档案}, 需要单独提取的角色)；整体解析失败时全部需要单独提取
+        """
+        prompt_text = self._build_batch_prompt(members, characters_list)
+        chain = self._get_chain(prompt_text)
+        item = "batch " + ",".join(str(c.get("id")) for c in members)
+        try:
+            response = self._invoke(chain, context, prompt_text, item, expect=(dict, list))
+        except Exception as e:
+            self.logger.warning(f"⚠️ 打包提取失败，改为逐个提取: {e}")
+            return {}, list(members)
+
+        records = self._split_batch(response)
+        results: Dict[str, Dict[str, Any]] = {}
+        missing: List[Dict[str, Any]] = []
+        for char_info in members:
+            record = records.get(char_info.get("id"))
+            if not self._valid_record(record):
+                missing.append(char_info)
                 continue
-                
-            self.logger.info(f"🤖 处理片段 {i}/{len(chunks)}...")
-            try:
-                response = chain.invoke({"novel_text": chunk}, config={"timeout": 18000})
-                chunk_data = parse_json_response(response)
-                
-                # 合并逻辑
-                if not merged_data["age"] and chunk_data.get("age"):
-                    merged_data["age"] = chunk_data["age"]
-                if not merged_data["gender"] and chunk_data.get("gender"):
-                    merged_data["gender"] = chunk_data["gender"]
-                    
-                if chunk_data.get("appearance"):
-                    merged_data["appearance"] += f"\n{chunk_data['appearance']}"
-                if chunk_data.get("personality"):
-                    merged_data["personality"] += f"\n{chunk_data['personality']}"
-                if chunk_data.get("background"):
-                    merged_data["background"] += f"\n{chunk_data['background']}"
-                    
-                if chunk_data.get("relationships"):
-                    # 合并关系（简单追加，后续可能需要去重或LLM整理，这里先保留所有线索）
-                    existing_rels = {(r.get("target_id"), r.get("relationship")) for r in merged_data["relationships"]}
-                    for rel in chunk_data["relationships"]:
-                        key = (rel.get("target_id"), rel.get("relationship"))
-                        if key not in existing_rels:
-                            merged_data["relationships"].append(rel)
-                            existing_rels.add(key)
-                            
-            except Exception as e:
-                self.logger.warning(f"⚠️ 片段 {i} 处理失败: {e}")
-        
-        return merged_data
+            results[char_info.get("id")] = self.reducer.reduce(char_info, [record])
+        return results, missing
+
+    @staticmethod
+    def _split_batch(response: Any) -> Dict[str, Dict[str, Any]]:
+        """把打包结果拆成 {角色ID: 档案}，兼容 {"characters": [...]}、按 ID 为键的对象与列表三种形式"""
+        if isinstance(response, dict) and isinstance(response.get("characters"), list):
+            response = response["characters"]
+        if isinstance(response, list):
+            return {r.get("id"): r for r in response if isinstance(r, dict) and r.get("id")}
+        if not isinstance(response, dict):
+            return {}
+        records: Dict[str, Dict[str, Any]] = {}
+        for key, record in response.items():
+            if isinstance(record, dict):
+                records[key] = record
+                if record.get("id"):
+                    records.setdefault(record["id"], record)
+        return records
+
+    @staticmethod
+    def _valid_record(record: Any) -> bool:
+        """档案至少要有标签、行为规则或外貌之一，且列表字段必须是列表"""
+        if not isinstance(record, dict):
+            return False
+        for key in ("traits", "behavior_rules", "possessions", "voice_samples"):
+            if key in record and not isinstance(record[key], list):
+                return False
+        if "relationship_matrix" in record and not isinstance(record["relationship_matrix"], dict):
+            return False
+        return any(record.get(key) for key in ("traits", "behavior_rules", "current_appearance"))
 
     def _save_character(
         self, 
@@ -205,17 +387,45 @@ class CharacterDetailAgent:
 
         characters_details: Dict[str, Dict[str, Any]] = {}
         total = len(characters_list)
+        self.last_tiers = self.tier_policy.counts(characters_list)
+        self.logger.info(
+            f"🎚️ 提取分级: 深度 {self.last_tiers['deep']} / 常规 {self.last_tiers['standard']} / 精简 {self.last_tiers['light']}"
+        )
+        index = self.build_index(novel_text, characters_list)
+        groups = self.pack_groups(novel_text, characters_list, index)
+        self.plan(novel_text, characters_list, index, groups)
 
-        for idx, char_info in enumerate(characters_list, 1):
+        packed = set()
+        if groups:
+            self.logger.info(
+                f"📦 打包提取: {sum(len(members) for members, _ in groups)} 个次要角色合并为 {len(groups)} 次调用"
+            )
+        for g, (members, context) in enumerate(groups, 1):
+            names = "、".join(str(c.get("name")) for c in members)
+            self.logger.info(f"[组 {g}/{len(groups)}] 处理角色: {names}")
+            with span("genesis.detail.batch", size=len(members)):
+                results, missing = self.create_batch(context, members, characters_list)
+            for char_id, char_data in results.items():
+                characters_details[char_id] = char_data
+                packed.add(char_id)
+                if world_dir:
+                    self._save_character(world_dir, char_id, char_data)
+            if missing:
+                self.logger.warning(f"   ⚠️ {len(missing)} 个角色未通过校验，改为单独提取")
+
+        singles = [c for c in characters_list if c.get("id") not in packed]
+        for idx, char_info in enumerate(singles, 1):
             char_id = char_info.get("id")
             char_name = char_info.get("name")
             importance = char_info.get("importance")
             self.logger.info(
-                f"[{idx}/{total}] 处理角色: {char_name} (重要性 {importance})"
+                f"[{idx}/{len(singles)}] 处理角色: {char_name} (重要性 {importance}，"
+                f"{self.tier_policy.tier_of(char_info)})"
             )
             try:
                 # 传入characters_list以保持ID一致性
-                char_data = self.create_one(novel_text, char_info, characters_list)
+                with span("genesis.detail.character", character=char_name):
+                    char_data = self.create_one(novel_text, char_info, characters_list, index=index)
                 characters_details[char_id] = char_data
                 self.logger.info(f"   ✅ {char_name} 档案创建完成")
                 
@@ -235,5 +445,10 @@ class CharacterDetailAgent:
                 if world_dir:
                     self._save_character(world_dir, char_id, error_data)
 
+        # 按角色表顺序返回
+        characters_details = {
+            c.get("id"): characters_details[c.get("id")]
+            for c in characters_list if c.get("id") in characters_details
+        }
         self.logger.info(f"✅ 角色档案生成完成: {len(characters_details)}/{total}")
         return characters_details
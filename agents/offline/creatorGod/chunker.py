@@ -0,0 +1,230 @@
+"""
+按章节 / 段落边界、按 token 预算切分小说
+
+分块大小由阶段所用模型的上下文窗口决定（GENESIS_CHUNK_FILL 比例留给原文，其余给提示词与输出），
+优先在章节标题处断开，其次在段落处断开；只有在段落处断开时才把上一段（不超过
+GENESIS_CHUNK_OVERLAP 字）带入下一块作为衔接。全书放得下一块时不切分。
+
+用法：
+    chunker = TokenChunker.for_model("glm-4")
+    views = chunker.split(novel_text)
+    chunker.stats.to_dict()
+"""
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import settings
+from utils.llm_telemetry import estimate_tokens
+from .ingest import TextView
+
+# 常见模型的上下文窗口（token），按子串匹配模型名，长的键优先
+MODEL_CONTEXT_TOKENS: Dict[str, int] = {
+    "mock": 1_000_000,
+    "gemini": 1_000_000,
+    "glm-4-long": 1_000_000,
+    "glm-4": 128_000,
+    "gpt-4.1": 1_000_000,
+    "gpt-4o": 128_000,
+    "claude": 200_000,
+    "deepseek": 64_000,
+    "qwen": 128_000,
+}
+DEFAULT_CONTEXT_TOKENS = 128_000
+
+CHAPTER_PATTERN = re.compile(
+    r"^[ \t　]*(?:第[0-9０-９零〇一二三四五六七八九十百千万两]+[章回节卷集部篇]"
+    r"|chapter\s+\d+|序章|序言|楔子|引子|尾声|后记|番外)[^\n]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+_SENTENCE_END = re.compile(r"[。！？!?…]+[”」』]?")
+
+
+def context_window(model_name: Optional[str]) -> int:
+    name = (model_name or "").lower()
+    for key in sorted(MODEL_CONTEXT_TOKENS, key=len, reverse=True):
+        if key in name:
+            return MODEL_CONTEXT_TOKENS[key]
+    return DEFAULT_CONTEXT_TOKENS
+
+
+def default_model_name(provider: Optional[str] = None) -> str:
+    """与 LLMFactory 相同的默认模型选择"""
+    provider = provider or settings.LLM_PROVIDER
+    if provider == "mock":
+        return "mock"
+    if provider == "openrouter":
+        return settings.OPENROUTER_MODEL
+    return settings.MODEL_NAME
+
+
+@dataclass
+class ChunkStats:
+    """最近一次切分的统计"""
+
+    chunks: int = 0
+    total_tokens: int = 0
+    max_tokens: int = 0
+    mean_tokens: int = 0
+    budget_tokens: int = 0
+    chapter_cuts: int = 0
+    paragraph_cuts: int = 0
+    sentence_cuts: int = 0  # 超长段落内部在句末（或硬切）断开
+    overlap_chars: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class _Block:
+    """切分的最小单位：一个段落（过长的段落再按句拆开）"""
+
+    start: int
+    end: int
+    tokens: int
+    chapter: bool = False  # 以章节标题开头
+
+
+class TokenChunker:
+    """
+    按 token 预算切分文本，分块为指向原文的 TextView
+
+    Args:
+        budget_tokens: 每块原文的 token 上限
+        overlap_chars: 段落处断开时带入下一块的上一段最大字数（0 表示不重叠）
+    """
+
+    def __init__(self, budget_tokens: int, overlap_chars: Optional[int] = None):
+        self.budget_tokens = max(1, int(budget_tokens))
+        self.overlap_chars = settings.GENESIS_CHUNK_OVERLAP if overlap_chars is None else overlap_chars
+        self.stats = ChunkStats(budget_tokens=self.budget_tokens)
+        self._cache: Optional[Tuple[str, List[TextView]]] = None
+
+    @classmethod
+    def for_model(
+        cls,
+        model_name: Optional[str] = None,
+        context_tokens: Optional[int] = None,
+        overlap_chars: Optional[int] = None,
+    ) -> "TokenChunker":
+        """
+        按模型上下文窗口确定预算
+
+        优先级：context_tokens 参数 > GENESIS_CONTEXT_TOKENS > 按模型名查表
+        """
+        window = context_tokens or settings.GENESIS_CONTEXT_TOKENS or context_window(model_name or default_model_name())
+        return cls(int(window * settings.GENESIS_CHUNK_FILL), overlap_chars)
+
+    def split(self, text: str) -> List[TextView]:
+        """切分文本；同一文本重复调用时复用上次结果（阶段3 每个角色都会调用）"""
+        if self._cache is not None and self._cache[0] is text:
+            return self._cache[1]
+        views = self._split(text)
+        self._cache = (text, views)
+        return views
+
+    def _split(self, text: str) -> List[TextView]:
+        stats = ChunkStats(budget_tokens=self.budget_tokens)
+        total = estimate_tokens(text)
+        if total <= self.budget_tokens:
+            views = [TextView(text)] if text else []
+            stats.chunks = len(views)
+            stats.total_tokens = stats.max_tokens = stats.mean_tokens = total
+            self.stats = stats
+            return views
+
+        blocks = self._blocks(text)
+        views: List[TextView] = []
+        sizes: List[int] = []
+        i = 0
+        carry: Optional[_Block] = None  # 上一块末段，作为本块开头的衔接
+        while i < len(blocks):
+            if carry is not None and carry.tokens + blocks[i].tokens > self.budget_tokens:
+                carry = None
+            start = carry.start if carry else blocks[i].start
+            used = carry.tokens if carry else 0
+            j = i
+            last_chapter = None  # 本块内（非首段）最后一个章节标题的位置
+            while j < len(blocks) and (j == i or used + blocks[j].tokens <= self.budget_tokens):
+                if blocks[j].chapter and j > i:
+                    last_chapter = j
+                used += blocks[j].tokens
+                j += 1
+
+            if j < len(blocks):
+                chapter_used = sum(b.tokens for b in blocks[i:last_chapter]) if last_chapter else 0
+                if last_chapter and chapter_used >= self.budget_tokens // 2:
+                    # 章节处断开：下一块从新章节开始，不需要重叠
+                    j = last_chapter
+                    stats.chapter_cuts += 1
+                    next_carry = None
+                else:
+                    if text[blocks[j - 1].end - 1] == "\n":
+                        stats.paragraph_cuts += 1
+                    else:
+                        stats.sentence_cuts += 1
+                    tail = blocks[j - 1]
+                    keep = self.overlap_chars > 0 and j - 1 > i and (tail.end - tail.start) <= self.overlap_chars
+                    next_carry = tail if keep else None
+            else:
+                next_carry = None
+
+            end = blocks[j - 1].end
+            views.append(TextView(text, start, end))
+            sizes.append((carry.tokens if carry else 0) + sum(b.tokens for b in blocks[i:j]))
+            if next_carry is not None:
+                stats.overlap_chars += next_carry.end - next_carry.start
+            carry = next_carry
+            i = j
+
+        stats.chunks = len(views)
+        stats.total_tokens = sum(sizes)
+        stats.max_tokens = max(sizes)
+        stats.mean_tokens = stats.total_tokens // len(sizes)
+        self.stats = stats
+        return views
+
+    def _blocks(self, text: str) -> List[_Block]:
+        """按换行切成段落（段末换行归入本段），标记章节标题，过长段落按句 / 按字拆开"""
+        chapter_starts = {m.start() for m in CHAPTER_PATTERN.finditer(text)}
+        blocks: List[_Block] = []
+        pos = 0
+        length = len(text)
+        while pos < length:
+            newline = text.find("\n", pos)
+            end = length if newline == -1 else newline + 1
+            tokens = estimate_tokens(text, pos, end)
+            chapter = pos in chapter_starts
+            if tokens <= self.budget_tokens:
+                blocks.append(_Block(pos, end, tokens, chapter))
+            else:
+                for k, (s, e) in enumerate(self._split_long(text, pos, end)):
+                    blocks.append(_Block(s, e, estimate_tokens(text, s, e), chapter and k == 0))
+            pos = end
+        return blocks
+
+    def _split_long(self, text: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """超出预算的单个段落：在句末断开，仍超出时按字数硬切"""
+        pieces: List[Tuple[int, int]] = []
+        piece_start = pos = start
+        piece_tokens = 0
+        for m in _SENTENCE_END.finditer(text, start, end):
+            sentence_tokens = estimate_tokens(text, pos, m.end())
+            if piece_tokens + sentence_tokens > self.budget_tokens and pos > piece_start:
+                pieces.append((piece_start, pos))
+                piece_start, piece_tokens = pos, 0
+            piece_tokens += sentence_tokens
+            pos = m.end()
+        pieces.append((piece_start, end))
+
+        result: List[Tuple[int, int]] = []
+        for s, e in pieces:
+            # 每个字最多计 1 token，按预算的字数硬切可保证每段不超预算
+            while estimate_tokens(text, s, e) > self.budget_tokens:
+                cut = s + self.budget_tokens
+                result.append((s, cut))
+                s = cut
+            if e > s:
+                result.append((s, e))
+        return result
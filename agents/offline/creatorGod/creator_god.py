@@ -1,17 +1,30 @@
 """
 CreatorGod：组合三个离线 LLM 子客体（角色过滤 / 世界设定 / 角色档案）
+
+阶段1（角色过滤）与阶段2（世界观）都只读取小说原文、互不依赖，经 StageDAG 并发执行；
+阶段3（角色档案）等两者完成后开始。所有阶段共享一份 LLM 预算（GENESIS_MAX_LLM_*）。
+每次 LLM 调用的结果按输入指纹记入工作项账本（WorkLedger），中断后重跑只执行未完成的工作项。
+阶段3 按角色重要性分级提取（TierPolicy），世界目录下的 extraction_tiers.json 可覆盖分级。
 """
 import json
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, Optional, Tuple, Union
 
 from config.settings import settings
 from utils.llm_factory import get_llm
+from utils.llm_telemetry import LLMBudget, LLMBudgetExceeded, SharedLLMRateLimit
 from utils.logger import setup_logger
+from utils.tracing import span, traced
 from .character_detail_agent import CharacterDetailAgent
 from .character_filter_agent import CharacterFilterAgent
+from .chunker import TokenChunker, default_model_name
+from .estimator import BuildEstimate, GenesisEstimator
+from .extraction_tiers import TierPolicy
+from .ingest import read_novel
+from .stage_dag import Stage, StageDAG
+from .work_ledger import WorkLedger
 from .world_setting_agent import WorldSettingAgent
 
 
@@ -23,6 +36,8 @@ class StageLLMConfig:
     model_name: Optional[str] = None
     temperature: Optional[float] = None
     max_tokens: Optional[int] = None
+    # 模型上下文窗口（token），决定长小说的分块大小；None 时按模型名查表
+    context_tokens: Optional[int] = None
 
 
 class CreatorGod:
@@ -34,25 +49,61 @@ class CreatorGod:
             Dict[str, Union[StageLLMConfig, Dict[str, Any]]]
         ] = None,
         logger=None,
+        llm_budget: Optional[LLMBudget] = None,
+        ledger: Optional[WorkLedger] = None,
+        tier_config: Optional[Dict[str, Any]] = None,
+        rate_limit: Optional[SharedLLMRateLimit] = None,
+        parallel: bool = True,
     ):
         self.logger = logger or setup_logger("CreatorGod", "genesis_group.log")
         self.stage_llm_configs = {
             key: self._normalize_config(cfg)
             for key, cfg in (stage_llm_configs or {}).items()
         }
+        # 本实例所有阶段共享的 LLM 预算
+        self.llm_budget = llm_budget or LLMBudget(
+            max_calls=settings.GENESIS_MAX_LLM_CALLS,
+            max_tokens=settings.GENESIS_MAX_LLM_TOKENS,
+        )
+        # 跨进程共享的调用限流（创世队列的 worker 注入）
+        self.rate_limit = rate_limit
+        # False 时阶段 1、2 也依次执行（调试或限流严格时使用）
+        self.parallel = parallel
+        # 角色档案分级配置（格式同 extraction_tiers.json，世界目录中的文件优先）
+        self.tier_config = tier_config
+        # 最近一次流水线的阶段耗时与预算使用情况
+        self.last_summary: Dict[str, Any] = {}
 
         self.character_filter_agent = CharacterFilterAgent(
             llm=self._build_stage_llm("filter"),
             logger=self.logger,
+            chunker=self._build_stage_chunker("filter"),
         )
         self.world_setting_agent = WorldSettingAgent(
             llm=self._build_stage_llm("world"),
             logger=self.logger,
+            chunker=self._build_stage_chunker("world"),
         )
         self.character_detail_agent = CharacterDetailAgent(
             llm=self._build_stage_llm("detail"),
             logger=self.logger,
+            chunker=self._build_stage_chunker("detail"),
         )
+        # 工作项账本：未指定时 run() 按小说文件名、run_pipeline() 按世界目录自动创建
+        self.ledger: Optional[WorkLedger] = None
+        if ledger is not None:
+            self.use_ledger(ledger)
+
+    def use_ledger(self, ledger: WorkLedger) -> None:
+        """三个阶段共用同一账本"""
+        self.ledger = ledger
+        for agent in (self.character_filter_agent, self.world_setting_agent, self.character_detail_agent):
+            agent.ledger = ledger
+
+    @staticmethod
+    def ledger_path(novel_filename: str) -> Path:
+        """按小说文件名定位账本（--continue-build 与首次构建使用同一文件）"""
+        return settings.GENESIS_DIR / "ledgers" / f"{Path(novel_filename).stem}.jsonl"
 
     def _normalize_config(
         self, cfg: Union[StageLLMConfig, Dict[str, Any]]
@@ -64,15 +115,16 @@ class CreatorGod:
             model_name=cfg.get("model_name"),
             temperature=cfg.get("temperature"),
             max_tokens=cfg.get("max_tokens"),
+            context_tokens=cfg.get("context_tokens"),
         )
 
     def _build_stage_llm(self, stage: str):
-        """为每个阶段单独创建 LLM，可使用不同模型"""
+        """为每个阶段单独创建 LLM，可使用不同模型（均挂载共享预算与限流）"""
         cfg = self.stage_llm_configs.get(stage)
         if not cfg:
-            return get_llm()
+            return self._attach_limits(get_llm(agent_name=f"Genesis.{stage}"))
 
-        kwargs: Dict[str, Any] = {}
+        kwargs: Dict[str, Any] = {"agent_name": f"Genesis.{stage}"}
         if cfg.provider is not None:
             kwargs["provider"] = cfg.provider
         if cfg.model_name is not None:
@@ -82,58 +134,149 @@ class CreatorGod:
         if cfg.max_tokens is not None:
             kwargs["max_tokens"] = cfg.max_tokens
 
-        return get_llm(**kwargs)
+        return self._attach_limits(get_llm(**kwargs))
+
+    def _attach_limits(self, llm):
+        llm = self.llm_budget.attach(llm)
+        if self.rate_limit is not None:
+            llm = self.rate_limit.attach(llm)
+        return llm
+
+    def _build_stage_chunker(self, stage: str) -> TokenChunker:
+        """按阶段所用模型的上下文窗口确定分块大小"""
+        cfg = self.stage_llm_configs.get(stage) or StageLLMConfig()
+        model_name = cfg.model_name or default_model_name(cfg.provider)
+        return TokenChunker.for_model(model_name, context_tokens=cfg.context_tokens)
 
     def _read_novel(self, novel_path: Path) -> str:
-        """读取小说文本，兼容多种常见中文编码"""
+        """读取小说文本：按开头样本判断编码（兼容多种常见中文编码），只解码一遍"""
         if not novel_path.exists():
             self.logger.error(f"❌ 小说文件不存在: {novel_path}")
             raise FileNotFoundError(f"小说文件不存在: {novel_path}")
 
-        tried = []
-        for enc in ["utf-8-sig", "utf-8", "gb18030", "gbk", "big5"]:
-            try:
-                text = novel_path.read_text(encoding=enc)
-                self.logger.info(f"✅ 成功读取小说: {novel_path.name} ({len(text)}字) 使用编码: {enc}")
-                return text
-            except UnicodeDecodeError as e:
-                tried.append(f"{enc}: {e}")
-                continue
-            except Exception as e:
-                tried.append(f"{enc}: {e}")
-                continue
-
-        # 最后兜底：忽略非法字节读取，避免流程中断
-        self.logger.warning(f"⚠️ 所有候选编码解码失败，尝试忽略非法字节读取。尝试记录: {tried}")
-        text = novel_path.read_text(encoding="utf-8", errors="ignore")
-        self.logger.info(f"✅ 成功读取小说（忽略非法字节）: {novel_path.name} ({len(text)}字)")
-        return text
+        novel = read_novel(novel_path)
+        self.logger.info(f"✅ 成功读取小说: {novel_path.name} ({len(novel)}字) 使用编码: {novel.encoding}")
+        return novel.text
 
+    @traced("genesis.pipeline", root=True)
     def run_pipeline(self, novel_text: str, world_dir: Optional[Path] = None):
         """
         执行三阶段流水线（每阶段完成后立即保存）
         
         Args:
             novel_text: 小说文本
-            world_dir: 可选的世界目录，若提供则每阶段完成后立即保存
+            world_dir: 可选的世界目录，若提供则每阶段完成后立即保存，账本也保存在其中
         """
-        # 阶段1：角色过滤
-        characters_list = self.character_filter_agent.run(novel_text)
-        if world_dir:
-            self._save_characters_list(world_dir, characters_list)
-        
-        # 阶段2：世界观提取
-        world_setting = self.world_setting_agent.run(novel_text)
-        if world_dir:
-            self._save_world_setting(world_dir, world_setting)
-        
-        # 阶段3：角色档案（传入characters_list以保持ID一致）
-        characters_details = self.character_detail_agent.run(
-            novel_text, characters_list, world_dir
-        )
-        
+        if self.ledger is None:
+            self.use_ledger(WorkLedger(world_dir / "genesis_ledger.jsonl" if world_dir else None))
+        _, world_setting, characters_list, characters_details = self._run_stages(novel_text, world_dir)
         return world_setting, characters_list, characters_details
 
+    def _run_stages(
+        self,
+        novel_text: str,
+        world_dir: Optional[Path] = None,
+        resolve_world_dir: bool = False,
+    ) -> Tuple[Optional[Path], Dict[str, Any], Any, Dict[str, Dict[str, Any]]]:
+        """
+        按 DAG 执行三个阶段：阶段1、2 并发，阶段3 依赖两者
+
+        Args:
+            world_dir: 世界目录；已知时阶段1、2 完成后各自立即保存
+            resolve_world_dir: world_dir 未知时，阶段3 开始前按阶段2 的世界名称确定目录并补存阶段1、2产物
+
+        Returns:
+            (world_dir, world_setting, characters_list, characters_details)
+        """
+        state: Dict[str, Any] = {"world_dir": world_dir}
+
+        def filter_stage(_: Dict[str, Any]) -> Any:
+            characters_list = self.character_filter_agent.run(novel_text)
+            if state["world_dir"]:
+                self._save_characters_list(state["world_dir"], characters_list)
+            return characters_list
+
+        def world_stage(_: Dict[str, Any]) -> Dict[str, Any]:
+            world_setting = self.world_setting_agent.run(novel_text)
+            if state["world_dir"]:
+                self._save_world_setting(state["world_dir"], world_setting)
+            return world_setting
+
+        def detail_stage(deps: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+            characters_list = deps["stage1.filter"]
+            if state["world_dir"] is None and resolve_world_dir:
+                # 没有预先指定世界名称，从世界设定中获取
+                world_name = deps["stage2.world"].get("meta", {}).get("world_name", "未知世界")
+                state["world_dir"] = settings.DATA_DIR / "worlds" / world_name
+                state["world_dir"].mkdir(parents=True, exist_ok=True)
+                self.logger.info(f"📁 从世界设定中获取世界名称: {world_name}")
+                self._save_characters_list(state["world_dir"], characters_list)
+                self._save_world_setting(state["world_dir"], deps["stage2.world"])
+            if state["world_dir"]:
+                (state["world_dir"] / "characters").mkdir(exist_ok=True)
+            self.character_detail_agent.tier_policy = TierPolicy.load(state["world_dir"], self.tier_config)
+            # 传入characters_list以保持ID一致
+            return self.character_detail_agent.run(novel_text, characters_list, state["world_dir"])
+
+        dag = StageDAG(
+            [
+                Stage("stage1.filter", filter_stage),
+                Stage("stage2.world", world_stage),
+                Stage("stage3.detail", detail_stage, deps=("stage1.filter", "stage2.world")),
+            ],
+            logger=self.logger,
+            max_workers=None if self.parallel else 1,
+            should_continue=lambda: not self.llm_budget.exhausted,
+        )
+        try:
+            results = dag.run()
+        finally:
+            self._record_summary(dag, state["world_dir"])
+        if "stage3.detail" not in results:
+            raise LLMBudgetExceeded(f"LLM 预算已用完，未执行的阶段: {sorted(set(dag.stages) - set(results))}")
+        return state["world_dir"], results["stage2.world"], results["stage1.filter"], results["stage3.detail"]
+
+    def _record_summary(self, dag: StageDAG, world_dir: Optional[Path]) -> None:
+        """记录阶段耗时与预算使用（有世界目录时写入 genesis_summary.json）"""
+        budget = self.llm_budget.snapshot()
+        self.last_summary = {**dag.summary(), "llm_budget": budget}
+        if self.ledger is not None:
+            self.last_summary["ledger"] = {
+                "path": str(self.ledger.path) if self.ledger.path else None,
+                "reused": self.ledger.hits,
+                "executed": self.ledger.misses,
+                "stages": self.ledger.completion(),
+            }
+            self.logger.info(f"📒 工作项账本: 复用 {self.ledger.hits}，新执行 {self.ledger.misses}")
+        chunking = {
+            stage: agent.chunker.stats.to_dict()
+            for stage, agent in (
+                ("filter", self.character_filter_agent),
+                ("world", self.world_setting_agent),
+                ("detail", self.character_detail_agent),
+            )
+            if getattr(agent, "chunker", None) is not None
+        }
+        if chunking:
+            self.last_summary["chunking"] = chunking
+        tiers = getattr(self.character_detail_agent, "last_tiers", None)
+        if tiers:
+            self.last_summary["tiers"] = tiers
+        reducer = getattr(self.character_detail_agent, "reducer", None)
+        if reducer is not None:
+            self.last_summary["profile_reduce"] = {
+                "consolidated": reducer.consolidated,
+                "fallbacks": reducer.fallbacks,
+            }
+        self.logger.info(
+            f"💰 LLM 预算: 调用 {budget['calls']}/{budget['max_calls'] or '∞'}，"
+            f"token {budget['tokens']}/{budget['max_tokens'] or '∞'}"
+        )
+        if world_dir:
+            summary_file = world_dir / "genesis_summary.json"
+            with summary_file.open("w", encoding="utf-8") as f:
+                json.dump(self.last_summary, f, ensure_ascii=False, indent=2)
+
     def _save_characters_list(self, world_dir: Path, characters_list: Any) -> None:
         """保存角色列表（阶段1产物）"""
         world_dir.mkdir(parents=True, exist_ok=True)
@@ -231,6 +374,8 @@ class CreatorGod:
 
         success_count = 0
         still_failed = []
+        index = self.character_detail_agent.build_index(novel_text, characters_list)
+        characters_by_id = {c.get("id"): c for c in characters_list}
         for char_id, char_name, importance in failed:
             retry_count = 0
             success = False
@@ -245,14 +390,14 @@ class CreatorGod:
                     )
                     time.sleep(retry_delay)
                 try:
-                    char_info = {
+                    char_info = characters_by_id.get(char_id) or {
                         "id": char_id,
                         "name": char_name,
                         "importance": importance,
                     }
                     # 传入characters_list以保持ID一致性
                     char_data = self.character_detail_agent.create_one(
-                        novel_text, char_info, characters_list
+                        novel_text, char_info, characters_list, index=index
                     )
                     char_file = characters_dir / f"character_{char_id}.json"
                     with char_file.open("w", encoding="utf-8") as f:
@@ -278,6 +423,24 @@ class CreatorGod:
                 self.logger.warning(f"   - {cname} (ID: {cid}, 重要性 {importance})")
         self.logger.info("=" * 80)
 
+    def estimate(
+        self,
+        novel_filename: str,
+        world_name: Optional[str] = None,
+        concurrency: int = 1,
+    ) -> BuildEstimate:
+        """
+        试运行：按当前配置估算构建所需的调用次数、提示词 token 与耗时，不调用 LLM
+
+        Args:
+            world_name: 已有世界时使用其 characters_list.json 与 extraction_tiers.json
+            concurrency: 额外给出阶段内调用按该路数并行时的假设耗时（projected_seconds）
+        """
+        novel_text = self._read_novel(settings.NOVELS_DIR / novel_filename)
+        world_dir = settings.DATA_DIR / "worlds" / world_name if world_name else None
+        return GenesisEstimator(self).estimate(novel_text, concurrency=concurrency, world_dir=world_dir)
+
+    @traced("genesis.run", root=True)
     def run(self, novel_filename: str = "example_novel.txt", world_name: Optional[str] = None) -> Path:
         """
         完整流程：读取小说 -> 三阶段（每阶段完成后保存） -> 自动重试
@@ -291,7 +454,10 @@ class CreatorGod:
         self.logger.info("=" * 80)
 
         novel_path = settings.NOVELS_DIR / novel_filename
-        novel_text = self._read_novel(novel_path)
+        if self.ledger is None:
+            self.use_ledger(WorkLedger(self.ledger_path(novel_filename)))
+        with span("genesis.read_novel"):
+            novel_text = self._read_novel(novel_path)
 
         # 如果提前指定了世界名称，可以在阶段1完成后就开始保存
         # 否则需要等阶段2完成获取世界名称后再保存
@@ -302,34 +468,16 @@ class CreatorGod:
         else:
             world_dir = None
         
-        # 阶段1：角色过滤
-        characters_list = self.character_filter_agent.run(novel_text)
-        
-        # 阶段2：世界观提取
-        world_setting = self.world_setting_agent.run(novel_text)
-        
-        # 如果没有预先指定世界名称，从世界设定中获取
-        if not world_name:
-            world_name = world_setting.get("meta", {}).get("world_name", "未知世界")
-            world_dir = settings.DATA_DIR / "worlds" / world_name
-            world_dir.mkdir(parents=True, exist_ok=True)
-            self.logger.info(f"📁 从世界设定中获取世界名称: {world_name}")
-        
-        # 阶段1和阶段2数据现在可以保存了
-        self._save_characters_list(world_dir, characters_list)
-        self._save_world_setting(world_dir, world_setting)
-        
-        # 阶段3：角色档案（每个角色创建后即时保存）
-        characters_dir = world_dir / "characters"
-        characters_dir.mkdir(exist_ok=True)
-        characters_details = self.character_detail_agent.run(
-            novel_text, characters_list, world_dir
+        # 阶段1、2 并发；阶段3 开始前确定世界目录并保存阶段1、2产物，之后每个角色创建后即时保存
+        world_dir, _, characters_list, _ = self._run_stages(
+            novel_text, world_dir, resolve_world_dir=True
         )
 
-        self._auto_retry_failed_characters(
-            world_dir=world_dir,
-            world_name=world_name,
-            novel_text=novel_text,
-            characters_list=characters_list,
-        )
+        with span("genesis.auto_retry"):
+            self._auto_retry_failed_characters(
+                world_dir=world_dir,
+                world_name=world_name,
+                novel_text=novel_text,
+                characters_list=characters_list,
+            )
         return world_dir
@@ -0,0 +1,336 @@
+"""
+创世流水线的试运行估算：只做分块、名字索引与提示词构建，不调用 LLM
+
+统计每个阶段的调用次数与提示词 token，并用历史遥测（logs/llm_telemetry_*.jsonl）中
+同一阶段的延迟拟合出单次调用耗时，按实际的执行方式推算墙钟时间：各阶段内的调用依次发出，
+只有阶段1 与阶段2 互相重叠（CreatorGod(parallel=False) 时也依次执行）。
+concurrency 仅用于额外给出“阶段内调用并行化后”的假设耗时（projected_seconds）。
+
+阶段3 依赖阶段1 的角色表：提供 characters_list（或世界目录中已有的 characters_list.json）时
+按真实角色逐个构建上下文；否则假设 GENESIS_ESTIMATE_CAST 个角色、重要性均匀分布，
+每个角色按其级别的批数上限计，结果为上限估计。
+
+用法：
+    estimate = GenesisEstimator(CreatorGod()).estimate(novel_text)
+    print(estimate.to_dict())
+"""
+import json
+import math
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from config.settings import settings
+from utils.llm_telemetry import estimate_tokens
+from .extraction_tiers import TierPolicy
+
+# 没有历史遥测时使用的单次调用耗时：固定开销 + 每千 token 提示词的耗时
+DEFAULT_BASE_SECONDS = 8.0
+DEFAULT_SECONDS_PER_1K_TOKENS = 0.4
+# 一份部分档案的典型大小（估算精炼调用的输入）
+TYPICAL_PART_TOKENS = 400
+
+# 阶段 → 遥测中的 Agent 名（get_llm(agent_name=...)）
+STAGE_AGENTS = {
+    "stage1.filter": "Genesis.filter",
+    "stage2.world": "Genesis.world",
+    "stage3.detail": "Genesis.detail",
+    "stage3.reduce": "Genesis.detail",
+}
+
+
+@dataclass
+class LatencyModel:
+    """单次调用耗时 ≈ base_seconds + seconds_per_1k_tokens × 提示词千 token 数"""
+
+    base_seconds: float = DEFAULT_BASE_SECONDS
+    seconds_per_1k_tokens: float = DEFAULT_SECONDS_PER_1K_TOKENS
+    samples: int = 0
+
+    def predict(self, prompt_tokens: int) -> float:
+        return self.base_seconds + self.seconds_per_1k_tokens * prompt_tokens / 1000
+
+    @classmethod
+    def fit(cls, records: Sequence[Dict[str, Any]]) -> "LatencyModel":
+        """对成功调用的 (提示词 token, 耗时) 做最小二乘；样本不足或斜率为负时只取平均耗时"""
+        points = [
+            (float(r.get("prompt_tokens") or 0), float(r["latency_ms"]) / 1000)
+            for r in records
+            if r.get("success", True) and r.get("latency_ms") is not None
+        ]
+        if not points:
+            return cls()
+        n = len(points)
+        mean_x = sum(x for x, _ in points) / n
+        mean_y = sum(y for _, y in points) / n
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        if n < 3 or var_x == 0:
+            return cls(mean_y, 0.0, n)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+        if slope <= 0:
+            return cls(mean_y, 0.0, n)
+        return cls(max(0.0, mean_y - slope * mean_x), slope * 1000, n)
+
+
+def load_telemetry(log_dir: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """读取所有 llm_telemetry_*.jsonl 记录（跳过损坏的行）"""
+    records: List[Dict[str, Any]] = []
+    for path in sorted(Path(log_dir or settings.LOGS_DIR).glob("llm_telemetry_*.jsonl")):
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(record, dict):
+                    records.append(record)
+    return records
+
+
+def latency_models(records: Iterable[Dict[str, Any]]) -> Dict[str, LatencyModel]:
+    """按阶段拟合耗时模型；某阶段没有历史记录时沿用其他创世阶段的记录，仍没有则用默认值"""
+    by_agent: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        by_agent.setdefault(record.get("agent"), []).append(record)
+    genesis = [r for agent, rs in by_agent.items() if str(agent).startswith("Genesis.") for r in rs]
+    return {
+        stage: LatencyModel.fit(by_agent.get(agent) or genesis)
+        for stage, agent in STAGE_AGENTS.items()
+    }
+
+
+def _wall_seconds(durations: Sequence[float], concurrency: int) -> float:
+    """concurrency 个工作者按最长任务优先分配调用时的完成时间"""
+    if not durations:
+        return 0.0
+    workers = [0.0] * max(1, min(concurrency, len(durations)))
+    for duration in sorted(durations, reverse=True):
+        i = workers.index(min(workers))
+        workers[i] += duration
+    return max(workers)
+
+
+@dataclass
+class StageEstimate:
+    stage: str
+    calls: int = 0
+    prompt_tokens: int = 0
+    max_prompt_tokens: int = 0
+    serial_seconds: float = 0.0
+    # 阶段内调用按 concurrency 路并行时的假设耗时（当前各 Agent 依次调用，仅作参考）
+    projected_seconds: float = 0.0
+    notes: List[str] = field(default_factory=list)
+    _durations: List[float] = field(default_factory=list, repr=False)
+
+    def add(self, prompt_tokens: int, model: LatencyModel) -> None:
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+        self._durations.append(model.predict(prompt_tokens))
+
+    def finish(self, concurrency: int) -> None:
+        self.serial_seconds = round(sum(self._durations), 1)
+        self.projected_seconds = round(_wall_seconds(self._durations, concurrency), 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("_durations")
+        return data
+
+
+@dataclass
+class BuildEstimate:
+    """一次世界构建的估算结果"""
+
+    novel_tokens: int
+    characters: int
+    assumed_cast: bool
+    concurrency: int
+    stages: Dict[str, StageEstimate]
+    telemetry_samples: Dict[str, int]
+    parallel_stages: bool = True
+
+    @property
+    def total_calls(self) -> int:
+        return sum(s.calls for s in self.stages.values())
+
+    @property
+    def total_prompt_tokens(self) -> int:
+        return sum(s.prompt_tokens for s in self.stages.values())
+
+    def _timeline(self, attr: str) -> float:
+        """阶段1、2 并发（parallel_stages 为 False 时依次），阶段3 在两者之后，精炼紧随各角色的提取"""
+        seconds = {name: getattr(stage, attr) for name, stage in self.stages.items()}
+        pair = (seconds["stage1.filter"], seconds["stage2.world"])
+        first = max(pair) if self.parallel_stages else sum(pair)
+        return round(first + seconds["stage3.detail"] + seconds["stage3.reduce"], 1)
+
+    @property
+    def wall_seconds(self) -> float:
+        """按当前实现（阶段内依次调用）推算的墙钟时间"""
+        return self._timeline("serial_seconds")
+
+    @property
+    def projected_seconds(self) -> float:
+        """假设阶段内调用按 concurrency 路并行时的墙钟时间"""
+        return self._timeline("projected_seconds")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "novel_tokens": self.novel_tokens,
+            "characters": self.characters,
+            "assumed_cast": self.assumed_cast,
+            "concurrency": self.concurrency,
+            "total_calls": self.total_calls,
+            "total_prompt_tokens": self.total_prompt_tokens,
+            "wall_seconds": self.wall_seconds,
+            "projected_seconds": self.projected_seconds,
+            "parallel_stages": self.parallel_stages,
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+            "telemetry_samples": self.telemetry_samples,
+        }
+
+
+class GenesisEstimator:
+    """
+    按 CreatorGod 的阶段配置（分块大小、提示词、分级策略）估算一次构建
+
+    Args:
+        god: 提供各阶段 Agent 的 CreatorGod；只读取其配置，不调用 LLM、不写账本
+        telemetry: 历史遥测记录；为 None 时从日志目录读取
+    """
+
+    def __init__(self, god: Any, telemetry: Optional[Sequence[Dict[str, Any]]] = None):
+        self.god = god
+        records = load_telemetry() if telemetry is None else telemetry
+        self.models = latency_models(records)
+
+    def estimate(
+        self,
+        novel_text: str,
+        characters_list: Optional[List[Dict[str, Any]]] = None,
+        concurrency: int = 1,
+        world_dir: Optional[Path] = None,
+    ) -> BuildEstimate:
+        if characters_list is None and world_dir and (Path(world_dir) / "characters_list.json").exists():
+            with (Path(world_dir) / "characters_list.json").open("r", encoding="utf-8") as f:
+                characters_list = json.load(f)
+        assumed = characters_list is None
+        if assumed:
+            cast = max(1, settings.GENESIS_ESTIMATE_CAST)
+            characters_list = [
+                {"id": f"npc_{i + 1:03d}", "name": f"角色{i + 1}", "importance": round(1 - i / cast, 3)}
+                for i in range(cast)
+            ]
+
+        stages = {name: StageEstimate(name) for name in STAGE_AGENTS}
+        self._scan_stage(stages["stage1.filter"], self.god.character_filter_agent, novel_text)
+        self._scan_stage(stages["stage2.world"], self.god.world_setting_agent, novel_text)
+        detail = self.god.character_detail_agent
+        policy = TierPolicy.load(world_dir, getattr(self.god, "tier_config", None))
+        if assumed:
+            self._assumed_details(stages, detail, policy, novel_text, characters_list)
+        else:
+            self._details(stages, detail, policy, novel_text, characters_list)
+
+        for stage in stages.values():
+            stage.finish(concurrency)
+        return BuildEstimate(
+            novel_tokens=estimate_tokens(novel_text),
+            characters=len(characters_list),
+            assumed_cast=assumed,
+            concurrency=concurrency,
+            stages=stages,
+            telemetry_samples={name: model.samples for name, model in self.models.items()},
+            parallel_stages=getattr(self.god, "parallel", True),
+        )
+
+    def _scan_stage(self, stage: StageEstimate, agent: Any, novel_text: str) -> None:
+        prompt_tokens = estimate_tokens(agent.prompt_text)
+        chunks = agent.chunker.split(novel_text)
+        for view in chunks:
+            stage.add(prompt_tokens + estimate_tokens(view.source, view.start, view.end), self.models[stage.stage])
+        if len(chunks) > 1:
+            stage.notes.append(f"{len(chunks)} 个分块（每块不超过 {agent.chunker.budget_tokens} tokens）")
+
+    def _details(
+        self,
+        stages: Dict[str, StageEstimate],
+        agent: Any,
+        policy: TierPolicy,
+        novel_text: str,
+        characters_list: List[Dict[str, Any]],
+    ) -> None:
+        """真实角色表：与 CharacterDetailAgent.run 相同的打包与上下文选择"""
+        stage, reduce = stages["stage3.detail"], stages["stage3.reduce"]
+        previous, agent.tier_policy = agent.tier_policy, policy
+        try:
+            index = agent.build_index(novel_text, characters_list)
+            groups = agent.pack_groups(novel_text, characters_list, index)
+            packed = set()
+            for members, context in groups:
+                prompt_text = agent._build_batch_prompt(members, characters_list)
+                stage.add(estimate_tokens(prompt_text) + estimate_tokens(context), self.models[stage.stage])
+                packed.update(c.get("id") for c in members)
+            for char_info in characters_list:
+                if char_info.get("id") in packed:
+                    continue
+                prompt_tokens = estimate_tokens(agent._prompt_for(char_info, characters_list))
+                _, texts = agent._contexts(novel_text, char_info, index)
+                for text in texts:
+                    stage.add(prompt_tokens + estimate_tokens(str(text)), self.models[stage.stage])
+                self._add_reduce(reduce, agent, len(texts))
+            if groups:
+                stage.notes.append(f"{len(packed)} 个精简级角色打包为 {len(groups)} 次调用")
+        finally:
+            agent.tier_policy = previous
+        stage.notes.append("分级: " + ", ".join(f"{k} {v}" for k, v in policy.counts(characters_list).items()))
+
+    def _assumed_details(
+        self,
+        stages: Dict[str, StageEstimate],
+        agent: Any,
+        policy: TierPolicy,
+        novel_text: str,
+        characters_list: List[Dict[str, Any]],
+    ) -> None:
+        """假设的角色表：没有名字可索引，每个角色按级别批数上限、每批按上下文预算计（上限估计）"""
+        stage, reduce = stages["stage3.detail"], stages["stage3.reduce"]
+        text_tokens = estimate_tokens(novel_text)
+        budget = settings.GENESIS_DETAIL_CONTEXT_TOKENS
+        per_call = min(text_tokens, budget)
+        needed = max(1, math.ceil(text_tokens / budget))
+        prompt_tokens = {
+            schema: estimate_tokens(agent._build_prompt("角色", "npc_000", characters_list, schema))
+            for schema in ("full", "light")
+        }
+        light = [c for c in characters_list if policy.profile(c).packable]
+        pack_size = settings.GENESIS_DETAIL_PACK_SIZE
+        if pack_size > 1 and len(light) > 1:
+            batch_prompt = estimate_tokens(agent._build_batch_prompt(light[:pack_size], characters_list))
+            for _ in range(math.ceil(len(light) / pack_size)):
+                stage.add(batch_prompt + per_call, self.models[stage.stage])
+            packed = {c.get("id") for c in light}
+        else:
+            packed = set()
+        for char_info in characters_list:
+            if char_info.get("id") in packed:
+                continue
+            profile = policy.profile(char_info)
+            calls = min(needed, profile.max_batches) if profile.max_batches else needed
+            for _ in range(calls):
+                stage.add(prompt_tokens[profile.schema] + per_call, self.models[stage.stage])
+            self._add_reduce(reduce, agent, calls)
+        stage.notes.append(
+            f"未提供角色表，假设 {len(characters_list)} 个角色（GENESIS_ESTIMATE_CAST），为上限估计"
+        )
+
+    def _add_reduce(self, stage: StageEstimate, agent: Any, parts: int) -> None:
+        """多批结果去重后可能超过档案上限，按一次精炼计"""
+        reducer = getattr(agent, "reducer", None)
+        if parts < 2 or reducer is None or not reducer.token_cap:
+            return
+        card_tokens = min(parts * TYPICAL_PART_TOKENS, reducer.input_tokens)
+        if card_tokens <= reducer.token_cap:
+            return
+        stage.add(estimate_tokens(reducer.prompt_template) + card_tokens, self.models[stage.stage])
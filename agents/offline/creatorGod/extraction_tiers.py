@@ -0,0 +1,128 @@
+"""
+角色档案的分级提取：按阶段1给出的重要性决定每个角色的提取深度
+
+- deep（主角级）：完整档案，提及片段半径加倍，按预算分多批提取后合并
+- standard（常规）：完整档案，批数减半
+- light（龙套）：精简档案，只取一批片段、一次调用，可与其他龙套打包提取
+
+阈值与各级参数来自 GENESIS_TIER_*；世界目录下的 extraction_tiers.json 可覆盖：
+    {
+      "thresholds": {"deep": 0.8, "light": 0.2},
+      "characters": {"npc_007": "deep", "店小二": "light"},
+      "profiles": {"light": {"radius": 100}}
+    }
+
+用法：
+    policy = TierPolicy.load(world_dir)
+    profile = policy.profile(char_info)
+"""
+import json
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from config.settings import settings
+
+DEEP = "deep"
+STANDARD = "standard"
+LIGHT = "light"
+TIERS = (DEEP, STANDARD, LIGHT)
+
+OVERRIDE_FILENAME = "extraction_tiers.json"
+
+
+@dataclass(frozen=True)
+class ExtractionProfile:
+    """一个级别的提取参数"""
+
+    name: str
+    # full 使用完整档案提示词，light 使用精简提示词
+    schema: str = "full"
+    # 提及片段前后各取多少字
+    radius: int = 300
+    # 单个角色最多几批片段（每批一次调用）；0 表示不限
+    max_batches: int = 0
+    # 是否参与多角色打包提取
+    packable: bool = False
+
+
+def default_profiles() -> Dict[str, ExtractionProfile]:
+    radius = settings.GENESIS_MENTION_RADIUS
+    max_batches = settings.GENESIS_DETAIL_MAX_BATCHES
+    return {
+        DEEP: ExtractionProfile(DEEP, "full", radius * 2, max_batches),
+        STANDARD: ExtractionProfile(STANDARD, "full", radius, max(1, max_batches // 2) if max_batches else 0),
+        LIGHT: ExtractionProfile(LIGHT, "light", radius // 2, 1, packable=True),
+    }
+
+
+@dataclass
+class TierPolicy:
+    """
+    角色 → 提取级别
+
+    Args:
+        deep_min: 重要性不低于该值为 deep
+        light_max: 重要性不高于该值为 light
+        overrides: 按角色 ID 或名字强制指定级别
+        profiles: 各级别的提取参数
+    """
+
+    deep_min: float = field(default_factory=lambda: settings.GENESIS_TIER_DEEP_MIN_IMPORTANCE)
+    light_max: float = field(default_factory=lambda: settings.GENESIS_TIER_LIGHT_MAX_IMPORTANCE)
+    overrides: Dict[str, str] = field(default_factory=dict)
+    profiles: Dict[str, ExtractionProfile] = field(default_factory=default_profiles)
+
+    @classmethod
+    def load(cls, world_dir: Optional[Path] = None, config: Optional[Dict[str, Any]] = None) -> "TierPolicy":
+        """默认配置 ← config（CreatorGod 参数）← 世界目录下的 extraction_tiers.json"""
+        policy = cls()
+        if config:
+            policy.apply(config)
+        if world_dir:
+            override_file = Path(world_dir) / OVERRIDE_FILENAME
+            if override_file.exists():
+                with override_file.open("r", encoding="utf-8") as f:
+                    policy.apply(json.load(f))
+        return policy
+
+    def apply(self, config: Dict[str, Any]) -> None:
+        """合并一份覆盖配置；未知级别名直接报错，避免拼写错误被静默忽略"""
+        thresholds = config.get("thresholds") or {}
+        if DEEP in thresholds:
+            self.deep_min = float(thresholds[DEEP])
+        if LIGHT in thresholds:
+            self.light_max = float(thresholds[LIGHT])
+        for key, tier in (config.get("characters") or {}).items():
+            self._check(tier)
+            self.overrides[key] = tier
+        for tier, params in (config.get("profiles") or {}).items():
+            self._check(tier)
+            self.profiles[tier] = replace(self.profiles[tier], **params)
+
+    @staticmethod
+    def _check(tier: str) -> None:
+        if tier not in TIERS:
+            raise ValueError(f"未知的提取级别: {tier}（可选 {', '.join(TIERS)}）")
+
+    def tier_of(self, char_info: Dict[str, Any]) -> str:
+        for key in (char_info.get("id"), char_info.get("name")):
+            if key in self.overrides:
+                return self.overrides[key]
+        importance = char_info.get("importance")
+        if not isinstance(importance, (int, float)):
+            return STANDARD
+        if importance >= self.deep_min:
+            return DEEP
+        if importance <= self.light_max:
+            return LIGHT
+        return STANDARD
+
+    def profile(self, char_info: Dict[str, Any]) -> ExtractionProfile:
+        return self.profiles[self.tier_of(char_info)]
+
+    def counts(self, characters: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        result = {tier: 0 for tier in TIERS}
+        for char_info in characters:
+            result[self.tier_of(char_info)] += 1
+        return result
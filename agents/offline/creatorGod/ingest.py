@@ -0,0 +1,141 @@
+"""
+小说读取：按文件开头的样本判断编码，流式解码一次；分块以 (起点, 终点) 偏移表示
+
+整部小说在内存中只保留一份字符串，分块是指向它的 TextView，调用 LLM 前才取出对应片段，
+不会为每个阶段、每个角色复制一遍全部分块。
+
+用法：
+    novel = read_novel(path)
+    for view in chunk_views(novel.text, 50000, 2000):
+        chain.invoke({"novel_text": str(view)})
+"""
+import codecs
+import io
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from utils.logger import setup_logger
+
+logger = setup_logger("CreatorGod", "genesis_group.log")
+
+# 与旧版逐个尝试的顺序一致（gbk 是 gb18030 的子集，不再单独尝试）
+CANDIDATE_ENCODINGS = ("utf-8", "gb18030", "big5")
+SAMPLE_BYTES = 64 * 1024
+BLOCK_BYTES = 256 * 1024
+
+
+@dataclass
+class NovelText:
+    """读入内存的小说：唯一一份文本与检测到的编码"""
+
+    text: str
+    encoding: str
+    path: Optional[Path] = None
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+
+class TextView:
+    """source[start:end] 的只读视图；str(view) 时才复制出片段"""
+
+    __slots__ = ("source", "start", "end")
+
+    def __init__(self, source: str, start: int = 0, end: Optional[int] = None):
+        self.source = source
+        self.start = start
+        self.end = len(source) if end is None else end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __str__(self) -> str:
+        if self.start == 0 and self.end == len(self.source):
+            return self.source
+        return self.source[self.start:self.end]
+
+    def __repr__(self) -> str:
+        return f"TextView({self.start}, {self.end})"
+
+    def contains(self, needle: str) -> bool:
+        return bool(needle) and self.source.find(needle, self.start, self.end) != -1
+
+    def contains_any(self, needles: Iterable[str]) -> bool:
+        return any(self.contains(needle) for needle in needles)
+
+
+def chunk_views(text: str, chunk_size: int = 50000, overlap: int = 2000) -> List[TextView]:
+    """按固定长度切分，相邻分块重叠 overlap 个字符"""
+    views = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        views.append(TextView(text, start, end))
+        if end == len(text):
+            break
+        start = end - overlap
+    return views
+
+
+def detect_encoding(sample: bytes, at_eof: bool = False) -> Optional[str]:
+    """
+    根据文件开头的样本判断编码
+
+    样本末尾可能截断一个多字节字符，只要求样本能被增量解码（非最终块）即可。
+    无候选编码能解码时返回 None。
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=at_eof)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def _decode_stream(f, encoding: str, first_block: bytes, block_bytes: int) -> str:
+    """
+    增量解码整个文件（换行符统一为 \\n，与 read_text 一致）
+
+    解码期间同时持有各块结果与拼接后的文本，瞬时峰值约为两份文本；返回后只剩一份。
+    """
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+    parts = [decoder.decode(first_block)]
+    while True:
+        block = f.read(block_bytes)
+        if not block:
+            break
+        parts.append(decoder.decode(block))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+
+def read_novel(path: Path, sample_bytes: int = SAMPLE_BYTES, block_bytes: int = BLOCK_BYTES) -> NovelText:
+    """
+    读取小说：读开头样本判断编码，随后按块流式解码（只解码一遍）
+
+    样本之后出现无法解码的字节时，回退为逐个编码整体尝试，最后忽略非法字节。
+    """
+    path = Path(path)
+    with path.open("rb") as f:
+        first_block = f.read(max(sample_bytes, 1))
+        encoding = detect_encoding(first_block, at_eof=len(first_block) < sample_bytes)
+        if encoding is not None:
+            try:
+                return NovelText(_decode_stream(f, encoding, first_block, block_bytes), encoding, path)
+            except UnicodeDecodeError as e:
+                logger.warning(f"⚠️ 按样本判断的编码 {encoding} 在后文解码失败: {e}")
+
+    for candidate in ("utf-8-sig",) + CANDIDATE_ENCODINGS:
+        if candidate == encoding:
+            continue
+        try:
+            return NovelText(path.read_text(encoding=candidate), candidate, path)
+        except UnicodeDecodeError:
+            continue
+
+    logger.warning("⚠️ 所有候选编码解码失败，忽略非法字节读取")
+    return NovelText(path.read_text(encoding="utf-8", errors="ignore"), "utf-8", path)
@@ -0,0 +1,481 @@
+"""
+创世任务队列：SQLite 持久化的本地队列，多个 worker 进程批量构建世界
+
+每本小说是一个任务（queued → running → done / failed / cancelled）。worker 在事务中认领任务，
+运行期间定时写心跳。Ctrl+C 中断时启动器立即把被终止的 worker 名下的任务放回队列；
+进程崩溃或机器重启后，下次启动时回收本机启动器遗留的任务与心跳超过 GENESIS_QUEUE_STALE_SECONDS 的任务。
+重跑时 CreatorGod 的工作项账本（按小说文件名）会跳过已完成的 LLM 调用。
+失败或拖垮 worker 的任务在 GENESIS_QUEUE_MAX_ATTEMPTS 次以内自动重新排队，之后标记失败。
+
+所有 worker 通过同一数据库中的 SharedLLMRateLimit 共享每分钟调用额度。
+
+用法：
+    queue = GenesisJobQueue()
+    queue.submit("白鹿原.txt")
+    run_workers(processes=2)          # 阻塞到队列清空
+    queue.jobs()                      # 查看状态
+
+命令行见项目根目录的 genesis_queue.py。
+"""
+import json
+import multiprocessing
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from utils.llm_telemetry import SharedLLMRateLimit
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger("GenesisQueue", "genesis_queue.log")
+
+GENESIS_JOBS = metrics.counter(
+    "storymaker_genesis_jobs_total", "创世队列任务结束次数", ["status"]
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+# 同一本小说存在这些状态的任务时，不重复提交
+_ACTIVE = (QUEUED, RUNNING)
+
+# 构建函数：(小说文件名, 世界名, 限流) -> (世界目录, 构建摘要)
+Builder = Callable[[str, Optional[str], Optional[SharedLLMRateLimit]], Tuple[Path, Dict[str, Any]]]
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+@dataclass
+class GenesisJob:
+    id: int
+    novel: str
+    world_name: Optional[str]
+    status: str
+    priority: int
+    attempts: int
+    max_attempts: int
+    worker: Optional[str]
+    heartbeat_at: Optional[float]
+    created_at: str
+    started_at: Optional[str]
+    finished_at: Optional[str]
+    world_dir: Optional[str]
+    error: Optional[str]
+    summary: Optional[Dict[str, Any]]
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "GenesisJob":
+        data = dict(row)
+        data["summary"] = json.loads(data["summary"]) if data.get("summary") else None
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class GenesisJobQueue:
+    """
+    创世任务队列（每个进程各自打开一个实例，连接可跨线程使用）
+
+    Args:
+        db_path: 队列数据库；默认 settings.GENESIS_QUEUE_DB
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path or settings.GENESIS_QUEUE_DB)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None：由 _transaction 显式 BEGIN IMMEDIATE，认领任务时互斥
+        self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+
+            CREATE TABLE IF NOT EXISTS genesis_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                novel TEXT NOT NULL,
+                world_name TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                priority INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                worker TEXT,
+                heartbeat_at REAL,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                world_dir TEXT,
+                error TEXT,
+                summary TEXT
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_genesis_jobs_claim ON genesis_jobs (status, priority, id);
+            """
+        )
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    # ------------------------------------------------------------------
+    # 提交与查询
+    # ------------------------------------------------------------------
+
+    def submit(
+        self,
+        novel: str,
+        world_name: Optional[str] = None,
+        priority: int = 0,
+        max_attempts: Optional[int] = None,
+    ) -> Tuple[int, bool]:
+        """
+        提交一本小说
+
+        Returns:
+            (任务 ID, 是否新建)；同一本小说已有排队或运行中的任务时返回已有任务
+        """
+        max_attempts = max_attempts or settings.GENESIS_QUEUE_MAX_ATTEMPTS
+
+        def insert(conn: sqlite3.Connection) -> Tuple[int, bool]:
+            existing = conn.execute(
+                f"SELECT id FROM genesis_jobs WHERE novel = ? AND status IN ({','.join('?' * len(_ACTIVE))})",
+                (novel, *_ACTIVE),
+            ).fetchone()
+            if existing:
+                return existing["id"], False
+            cursor = conn.execute(
+                "INSERT INTO genesis_jobs (novel, world_name, priority, max_attempts, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (novel, world_name, priority, max_attempts, _now()),
+            )
+            return cursor.lastrowid, True
+
+        job_id, created = self._transaction(insert)
+        if created:
+            logger.info(f"📥 提交任务 #{job_id}: {novel}")
+        return job_id, created
+
+    def get(self, job_id: int) -> Optional[GenesisJob]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM genesis_jobs WHERE id = ?", (job_id,)).fetchone()
+        return GenesisJob.from_row(row) if row else None
+
+    def jobs(self, status: Optional[str] = None) -> List[GenesisJob]:
+        query, args = "SELECT * FROM genesis_jobs", ()
+        if status:
+            query, args = query + " WHERE status = ?", (status,)
+        with self._lock:
+            rows = self.conn.execute(query + " ORDER BY id", args).fetchall()
+        return [GenesisJob.from_row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) AS n FROM genesis_jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    # ------------------------------------------------------------------
+    # worker 侧
+    # ------------------------------------------------------------------
+
+    def claim(self, worker: str) -> Optional[GenesisJob]:
+        """认领优先级最高、最早提交的排队任务"""
+
+        def take(conn: sqlite3.Connection) -> Optional[int]:
+            row = conn.execute(
+                "SELECT id FROM genesis_jobs WHERE status = ? ORDER BY priority DESC, id LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE genesis_jobs SET status = ?, worker = ?, attempts = attempts + 1, "
+                "heartbeat_at = ?, started_at = ?, error = NULL WHERE id = ?",
+                (RUNNING, worker, time.time(), _now(), row["id"]),
+            )
+            return row["id"]
+
+        job_id = self._transaction(take)
+        return self.get(job_id) if job_id is not None else None
+
+    def heartbeat(self, job_id: int, worker: str) -> None:
+        with self._lock:
+            self.conn.execute(
+                "UPDATE genesis_jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (time.time(), job_id, worker, RUNNING),
+            )
+
+    def complete(self, job_id: int, world_dir: Optional[Path], summary: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            self.conn.execute(
+                "UPDATE genesis_jobs SET status = ?, finished_at = ?, world_dir = ?, summary = ? "
+                "WHERE id = ? AND status = ?",
+                (DONE, _now(), str(world_dir) if world_dir else None,
+                 json.dumps(summary, ensure_ascii=False) if summary else None, job_id, RUNNING),
+            )
+        GENESIS_JOBS.inc(status=DONE)
+
+    def fail(self, job_id: int, error: str) -> str:
+        """记录失败；尝试次数未用完时重新排队。返回任务的新状态"""
+
+        def update(conn: sqlite3.Connection) -> str:
+            row = conn.execute("SELECT attempts, max_attempts, status FROM genesis_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["status"] != RUNNING:
+                return row["status"] if row else FAILED
+            status = QUEUED if row["attempts"] < row["max_attempts"] else FAILED
+            conn.execute(
+                "UPDATE genesis_jobs SET status = ?, error = ?, worker = NULL, finished_at = ? WHERE id = ?",
+                (status, error, _now() if status == FAILED else None, job_id),
+            )
+            return status
+
+        status = self._transaction(update)
+        GENESIS_JOBS.inc(status="retry" if status == QUEUED else FAILED)
+        return status
+
+    def _release(self, rows: List[sqlite3.Row], reason: str) -> List[int]:
+        """把 worker 已不在的运行中任务放回队列；尝试次数已用完的（反复拖垮 worker）标记失败"""
+
+        def release(conn: sqlite3.Connection) -> Tuple[List[int], List[int]]:
+            requeued, failed = [], []
+            for row in rows:
+                job = conn.execute(
+                    "SELECT attempts, max_attempts FROM genesis_jobs WHERE id = ? AND status = ? AND worker IS ?",
+                    (row["id"], RUNNING, row["worker"]),
+                ).fetchone()
+                if job is None:
+                    continue
+                if job["attempts"] < job["max_attempts"]:
+                    conn.execute(
+                        "UPDATE genesis_jobs SET status = ?, worker = NULL, error = ? WHERE id = ?",
+                        (QUEUED, f"{reason}，已重新排队", row["id"]),
+                    )
+                    requeued.append(row["id"])
+                else:
+                    conn.execute(
+                        "UPDATE genesis_jobs SET status = ?, worker = NULL, error = ?, finished_at = ? WHERE id = ?",
+                        (FAILED, f"{reason}，尝试次数已用完", _now(), row["id"]),
+                    )
+                    failed.append(row["id"])
+            return requeued, failed
+
+        requeued, failed = self._transaction(release)
+        if requeued:
+            logger.warning(f"♻️ {reason}，重新排队: {requeued}")
+        if failed:
+            GENESIS_JOBS.inc(len(failed), status=FAILED)
+            logger.error(f"❌ {reason}，尝试次数已用完: {failed}")
+        return requeued + failed
+
+    def recover_stale(self, stale_seconds: Optional[float] = None) -> List[int]:
+        """
+        回收心跳超时的运行中任务（worker 进程已退出或机器重启）
+
+        Returns:
+            被回收的任务 ID（重新排队或因尝试次数用完而标记失败）
+        """
+        stale_seconds = settings.GENESIS_QUEUE_STALE_SECONDS if stale_seconds is None else stale_seconds
+        cutoff = time.time() - stale_seconds
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, worker FROM genesis_jobs WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (RUNNING, cutoff),
+            ).fetchall()
+        return self._release(rows, "worker 失联")
+
+    def release_workers(self, workers: Callable[[str], bool]) -> List[int]:
+        """
+        回收指定 worker 名下的运行中任务（这些 worker 已确认退出，不必等心跳超时）
+
+        Args:
+            workers: 判断 worker 名是否需要回收
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, worker FROM genesis_jobs WHERE status = ? AND worker IS NOT NULL", (RUNNING,)
+            ).fetchall()
+        return self._release([row for row in rows if workers(row["worker"])], "worker 已退出")
+
+    # ------------------------------------------------------------------
+    # 管理
+    # ------------------------------------------------------------------
+
+    def cancel(self, job_id: int) -> bool:
+        """取消排队中的任务（运行中的任务不中断）"""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE genesis_jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, _now(), job_id, QUEUED),
+            )
+        return cursor.rowcount > 0
+
+    def retry(self, job_id: int) -> bool:
+        """把失败或已取消的任务重新排队（重置尝试次数）"""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE genesis_jobs SET status = ?, attempts = 0, error = NULL, finished_at = NULL "
+                "WHERE id = ? AND status IN (?, ?)",
+                (QUEUED, job_id, FAILED, CANCELLED),
+            )
+        return cursor.rowcount > 0
+
+
+def build_world(
+    novel: str,
+    world_name: Optional[str],
+    rate_limit: Optional[SharedLLMRateLimit],
+) -> Tuple[Path, Dict[str, Any]]:
+    """默认构建函数：完整运行 CreatorGod（含自动重试失败角色）"""
+    from .creator_god import CreatorGod
+
+    god = CreatorGod(rate_limit=rate_limit)
+    world_dir = god.run(novel_filename=novel, world_name=world_name)
+    return world_dir, god.last_summary
+
+
+def run_worker(
+    db_path: Optional[Path] = None,
+    worker: Optional[str] = None,
+    until_empty: bool = True,
+    poll_seconds: float = 5.0,
+    builder: Builder = build_world,
+    calls_per_minute: Optional[float] = None,
+) -> int:
+    """
+    worker 主循环：认领任务 → 构建 → 记录结果
+
+    Args:
+        until_empty: 队列为空时退出；否则持续轮询
+        builder: 构建函数（测试时可替换）
+        calls_per_minute: 所有 worker 共享的每分钟调用额度；默认 GENESIS_LLM_CALLS_PER_MINUTE
+
+    Returns:
+        本 worker 处理的任务数
+    """
+    queue = GenesisJobQueue(db_path)
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    calls_per_minute = settings.GENESIS_LLM_CALLS_PER_MINUTE if calls_per_minute is None else calls_per_minute
+    rate_limit = SharedLLMRateLimit(queue.db_path, calls_per_minute) if calls_per_minute > 0 else None
+    handled = 0
+    try:
+        while True:
+            job = queue.claim(worker)
+            if job is None:
+                if until_empty:
+                    return handled
+                time.sleep(poll_seconds)
+                continue
+
+            logger.info(f"🏗️ [{worker}] 开始任务 #{job.id}: {job.novel}（第 {job.attempts} 次）")
+            stop = threading.Event()
+
+            def beat(job_id: int = job.id) -> None:
+                while not stop.wait(settings.GENESIS_QUEUE_HEARTBEAT_SECONDS):
+                    queue.heartbeat(job_id, worker)
+
+            heart = threading.Thread(target=beat, name=f"genesis-heartbeat-{job.id}", daemon=True)
+            heart.start()
+            try:
+                world_dir, summary = builder(job.novel, job.world_name, rate_limit)
+                queue.complete(job.id, world_dir, summary)
+                logger.info(f"✅ [{worker}] 任务 #{job.id} 完成: {world_dir}")
+            except Exception as e:
+                status = queue.fail(job.id, f"{type(e).__name__}: {e}")
+                logger.error(f"❌ [{worker}] 任务 #{job.id} 失败（{status}）: {e}\n{traceback.format_exc()}")
+            finally:
+                stop.set()
+                heart.join()
+            handled += 1
+    finally:
+        queue.close()
+
+
+def launcher_worker_name(index: int, host: Optional[str] = None) -> str:
+    """run_workers 启动的第 index 个 worker 的名字"""
+    return f"{host or socket.gethostname()}:w{index}"
+
+
+def _is_launcher_worker(worker: str, host: Optional[str] = None) -> bool:
+    return re.fullmatch(re.escape(host or socket.gethostname()) + r":w\d+", worker) is not None
+
+
+def run_workers(
+    processes: Optional[int] = None,
+    db_path: Optional[Path] = None,
+    until_empty: bool = True,
+    calls_per_minute: Optional[float] = None,
+) -> None:
+    """
+    启动多个 worker 进程并等待退出
+
+    启动前回收心跳超时的任务，以及本机上一次启动的 worker（host:wN）遗留的运行中任务——
+    它们必然已随上一个启动器退出。同一台机器上不要同时运行两个启动器。
+    """
+    processes = max(1, processes or settings.GENESIS_QUEUE_WORKERS)
+    queue = GenesisJobQueue(db_path)
+    queue.recover_stale()
+    queue.release_workers(_is_launcher_worker)
+    db_path = queue.db_path
+    queue.close()
+
+    names = [launcher_worker_name(i) for i in range(1, processes + 1)]
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=run_worker,
+            kwargs={
+                "db_path": db_path,
+                "worker": name,
+                "until_empty": until_empty,
+                "calls_per_minute": calls_per_minute,
+            },
+            name=f"genesis-worker-{i}",
+        )
+        for i, name in enumerate(names, 1)
+    ]
+    for process in workers:
+        process.start()
+    logger.info(f"🚀 已启动 {processes} 个创世 worker")
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
+        # 被中断的任务立即放回队列；已完成的调用记录在账本中，重跑时跳过
+        queue = GenesisJobQueue(db_path)
+        try:
+            queue.release_workers(set(names).__contains__)
+        finally:
+            queue.close()
+        raise
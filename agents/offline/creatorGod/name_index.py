@@ -0,0 +1,183 @@
+"""
+角色名 / 别名倒排索引
+
+一次扫描整部小说，记录每个角色的名字与别名出现的位置；为单个角色提取档案时，
+只把提及处前后的片段（而不是整段 5 万字的分块）拼成上下文，并按 token 预算分批。
+出场很少的配角通常只需一次调用、几千 token。
+
+用法：
+    index = NameIndex(novel_text, characters_list)
+    batches = index.context_batches("npc_003", max_tokens=60000)
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.llm_telemetry import estimate_tokens
+
+# 片段之间的分隔，提示模型这是节选
+EXCERPT_SEPARATOR = "\n……\n"
+# 片段边界尽量对齐到这些字符之后
+_SENTENCE_ENDS = "。！？!?…\n"
+
+
+def character_names(char_info: Dict[str, Any]) -> List[str]:
+    """角色的名字与别名（aliases 可为列表或以顿号/逗号分隔的字符串）"""
+    names = [char_info.get("name") or ""]
+    aliases = char_info.get("aliases") or []
+    if isinstance(aliases, str):
+        aliases = re.split(r"[、,，/;；\s]+", aliases)
+    names.extend(alias for alias in aliases if isinstance(alias, str))
+    seen, result = set(), []
+    for name in names:
+        name = name.strip()
+        if name and name not in seen:
+            seen.add(name)
+            result.append(name)
+    return result
+
+
+class NameIndex:
+    """名字 → 出现位置；角色 ID → 合并后的出现位置"""
+
+    def __init__(self, text: str, characters: Sequence[Dict[str, Any]]):
+        self.text = text
+        self._owners: Dict[str, List[str]] = {}
+        for char_info in characters:
+            char_id = char_info.get("id")
+            if not char_id:
+                continue
+            for name in character_names(char_info):
+                owners = self._owners.setdefault(name, [])
+                if char_id not in owners:
+                    owners.append(char_id)
+        self.name_offsets: Dict[str, List[int]] = {name: [] for name in self._owners}
+        self._scan()
+        # 全书 token 估算（只算一次，供各角色判断是否需要按片段提取）
+        self.text_tokens = estimate_tokens(text)
+
+    def _scan(self) -> None:
+        """单遍扫描：长名字优先，"张三丰" 不会被记成 "张三" """
+        if not self._owners:
+            return
+        names = sorted(self._owners, key=len, reverse=True)
+        pattern = re.compile("|".join(re.escape(name) for name in names))
+        for match in pattern.finditer(self.text):
+            self.name_offsets[match.group()].append(match.start())
+
+    def occurrences(self, char_id: str) -> List[Tuple[int, int]]:
+        """角色所有提及的 (起点, 终点)，按位置排序"""
+        spans = [
+            (offset, offset + len(name))
+            for name, owners in self._owners.items() if char_id in owners
+            for offset in self.name_offsets[name]
+        ]
+        return sorted(spans)
+
+    def mention_count(self, char_id: str) -> int:
+        return len(self.occurrences(char_id))
+
+    def _snap(self, start: int, end: int, slack: int) -> Tuple[int, int]:
+        """把片段两端向外延伸到最近的句子边界（最多 slack 个字符）"""
+        text = self.text
+        floor = max(0, start - slack)
+        for i in range(start - 1, floor - 1, -1):
+            if text[i] in _SENTENCE_ENDS:
+                start = i + 1
+                break
+        else:
+            start = floor
+        ceiling = min(len(text), end + slack)
+        for i in range(end, ceiling):
+            if text[i] in _SENTENCE_ENDS:
+                end = i + 1
+                break
+        else:
+            end = ceiling
+        return start, end
+
+    def windows(self, char_id: str, radius: int = 300) -> List[Tuple[int, int]]:
+        """提及处前后 radius 字、对齐句子边界并合并重叠后的片段区间"""
+        return merge_spans(
+            self._snap(max(0, start - radius), min(len(self.text), end + radius), radius // 2)
+            for start, end in self.occurrences(char_id)
+        )
+
+    def excerpt(self, spans: Sequence[Tuple[int, int]]) -> str:
+        """把若干区间的原文拼成一段节选"""
+        return EXCERPT_SEPARATOR.join(self.text[start:end] for start, end in spans)
+
+    def span_tokens(self, spans: Sequence[Tuple[int, int]]) -> int:
+        return sum(estimate_tokens(self.text, start, end) for start, end in spans)
+
+    def context_batches(
+        self,
+        char_id: str,
+        max_tokens: int,
+        radius: int = 300,
+        max_batches: Optional[int] = None,
+    ) -> List[str]:
+        """
+        把角色的提及片段按 token 预算打包成若干批（每批一次 LLM 调用）
+
+        Args:
+            max_tokens: 每批上下文的 token 上限
+            max_batches: 批数上限；超出时在全书范围内均匀抽取片段，保证前中后段都有覆盖
+
+        Returns:
+            每批拼接好的上下文；角色从未被提及时为空列表
+        """
+        windows = self.windows(char_id, radius)
+        if not windows:
+            return []
+        pieces = [(self.text[start:end], estimate_tokens(self.text, start, end)) for start, end in windows]
+        batches = _pack(pieces, max_tokens)
+        if max_batches is not None and len(batches) > max_batches:
+            total = sum(tokens for _, tokens in pieces)
+            keep = max(1, int(len(pieces) * max_batches * max_tokens / max(total, 1)))
+            pieces = _spread(pieces, keep)
+            batches = _pack(pieces, max_tokens)[:max_batches]
+        return [EXCERPT_SEPARATOR.join(batch) for batch in batches]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "names": len(self._owners),
+            "mentions": sum(len(offsets) for offsets in self.name_offsets.values()),
+        }
+
+
+def merge_spans(spans: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """合并重叠或相接的区间（结果按位置排序）"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _pack(pieces: Iterable[Tuple[str, int]], max_tokens: int) -> List[List[str]]:
+    """按顺序装箱；单个片段超出预算时按字符截断"""
+    batches: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for text, tokens in pieces:
+        if tokens > max_tokens:
+            text = text[:max_tokens]
+            tokens = max_tokens
+        if current and used + tokens > max_tokens:
+            batches.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _spread(items: List[Any], keep: int) -> List[Any]:
+    """从列表中均匀抽取 keep 个元素（保持原顺序）"""
+    if keep >= len(items):
+        return items
+    step = len(items) / keep
+    return [items[int(i * step)] for i in range(keep)]
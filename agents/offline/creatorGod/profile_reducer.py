@@ -0,0 +1,193 @@
+"""
+角色档案的归并（map-reduce 的 reduce 阶段）
+
+一个角色的档案由多批片段分别提取（map），再在这里归并：
+1. 确定性归并：标量保留首个非空值；列表按规范形式去重，被包含的短条目并入长条目；
+   关系按对象合并，每个子字段保留首个非空值。
+2. 可选的 LLM 精炼：归并后的档案仍超过 GENESIS_PROFILE_TOKEN_CAP 时，请模型压缩成一张精炼的卡片。
+   单次精炼的输入不超过 GENESIS_REDUCE_INPUT_TOKENS；超出时先把部分档案分组、逐组归并精炼，
+   再对上一层的结果继续归并（分层 reduce）。
+
+精炼失败或结果不合格时保留确定性归并的结果，不会丢失信息。
+
+用法：
+    reducer = ProfileReducer(llm)
+    reducer.ledger = ledger
+    profile = reducer.reduce(char_info, partial_profiles)
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from config.settings import settings
+from utils.character_data import dedupe_texts
+from utils.llm_telemetry import estimate_tokens
+from utils.logger import setup_logger
+from .utils import escape_braces, load_prompt
+from .work_ledger import WorkLedger, invoke_json
+
+STAGE = "stage3.reduce"
+
+# 由角色表决定、不参与归并的字段
+_IDENTITY_FIELDS = ("id", "name", "importance")
+# 视为缺失的标量值
+_EMPTY_SCALARS = (None, "", "未知", "String")
+
+
+def _is_empty(value: Any) -> bool:
+    if isinstance(value, (list, dict)):
+        return not value
+    return value in _EMPTY_SCALARS
+
+
+def merge_profiles(parts: Sequence[Dict[str, Any]], base: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """确定性归并若干份档案（base 中已有的值优先）"""
+    merged: Dict[str, Any] = dict(base or {})
+    for part in parts:
+        if not isinstance(part, dict):
+            continue
+        for key, value in part.items():
+            if key in _IDENTITY_FIELDS or _is_empty(value):
+                continue
+            existing = merged.get(key)
+            if isinstance(value, list):
+                items = list(existing) if isinstance(existing, list) else []
+                merged[key] = items + value
+            elif isinstance(value, dict):
+                combined = {k: dict(v) if isinstance(v, dict) else v for k, v in existing.items()} \
+                    if isinstance(existing, dict) else {}
+                for sub_key, sub_value in value.items():
+                    current = combined.get(sub_key)
+                    if isinstance(current, dict) and isinstance(sub_value, dict):
+                        # 同一关系对象：逐个子字段补齐，已有的不覆盖
+                        for field_name, field_value in sub_value.items():
+                            if _is_empty(current.get(field_name)) and not _is_empty(field_value):
+                                current[field_name] = field_value
+                    elif sub_key not in combined:
+                        combined[sub_key] = sub_value
+                merged[key] = combined
+            elif _is_empty(existing):
+                merged[key] = value
+    for key, value in merged.items():
+        if isinstance(value, list):
+            merged[key] = dedupe_texts(value)
+    return merged
+
+
+def profile_tokens(profile: Dict[str, Any]) -> int:
+    return estimate_tokens(json.dumps(profile, ensure_ascii=False))
+
+
+class ProfileReducer:
+    """
+    分层归并一个角色的多份部分档案
+
+    Args:
+        llm: 精炼所用的模型；为 None 时只做确定性归并
+        token_cap: 档案超过该 token 数才调用模型精炼（0 表示不精炼）
+        input_tokens: 单次精炼调用的输入上限
+    """
+
+    def __init__(
+        self,
+        llm: Any = None,
+        token_cap: Optional[int] = None,
+        input_tokens: Optional[int] = None,
+        prompt_filename: str = "character_consolidate.txt",
+        logger=None,
+    ):
+        self.llm = llm
+        self.token_cap = settings.GENESIS_PROFILE_TOKEN_CAP if token_cap is None else token_cap
+        self.input_tokens = settings.GENESIS_REDUCE_INPUT_TOKENS if input_tokens is None else input_tokens
+        self.prompt_template = load_prompt(prompt_filename)
+        self.logger = logger or setup_logger("许劭", "genesis_group.log")
+        self.ledger: Optional[WorkLedger] = None
+        # 精炼调用次数（成功 / 回退）
+        self.consolidated = 0
+        self.fallbacks = 0
+
+    def reduce(self, char_info: Dict[str, Any], parts: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        """归并并（必要时）精炼，返回以角色表的 id / name / importance 为准的档案"""
+        identity = {key: char_info.get(key) for key in _IDENTITY_FIELDS}
+        level: List[Dict[str, Any]] = [merge_profiles([part]) for part in parts if isinstance(part, dict)]
+        depth = 0
+        while True:
+            merged = merge_profiles(level)
+            tokens = profile_tokens(merged)
+            if not self.llm or not self.token_cap or tokens <= self.token_cap:
+                return {**identity, **merged}
+            if tokens <= self.input_tokens:
+                return {**identity, **self._consolidate(char_info, merged, f"L{depth}")}
+
+            groups = self._group(level)
+            if len(level) <= 1 or len(groups) >= len(level):
+                # 每份部分档案都已单独超出输入上限，无法再分组，保留确定性结果
+                return {**identity, **merged}
+            depth += 1
+            self.logger.info(
+                f"   🧩 {char_info.get('name')}: 档案约 {tokens} tokens，分 {len(groups)} 组归并（第 {depth} 层）"
+            )
+            level = [
+                self._consolidate(char_info, merge_profiles(group), f"L{depth}-{i}")
+                for i, group in enumerate(groups, 1)
+            ]
+
+    def _group(self, level: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """按顺序装箱，每组合计不超过单次精炼的输入上限"""
+        groups: List[List[Dict[str, Any]]] = []
+        current: List[Dict[str, Any]] = []
+        used = 0
+        for profile in level:
+            tokens = profile_tokens(profile)
+            if current and used + tokens > self.input_tokens:
+                groups.append(current)
+                current, used = [], 0
+            current.append(profile)
+            used += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def _consolidate(self, char_info: Dict[str, Any], merged: Dict[str, Any], item: str) -> Dict[str, Any]:
+        """请模型压缩一份档案；失败或结果缺少关键字段时返回原档案"""
+        if profile_tokens(merged) <= self.token_cap:
+            return merged
+        prompt_text = escape_braces(self.prompt_template.replace("{target_name}", str(char_info.get("name"))))
+        chain = ChatPromptTemplate.from_messages(
+            [("system", prompt_text), ("human", "{novel_text}")]
+        ) | self.llm | StrOutputParser()
+        card = json.dumps(merged, ensure_ascii=False, indent=2)
+        try:
+            result = invoke_json(
+                chain, card, ledger=self.ledger, stage=STAGE,
+                item=f"{char_info.get('id')} {item}", prompt_text=prompt_text, llm=self.llm,
+            )
+        except Exception as e:
+            self.fallbacks += 1
+            self.logger.warning(f"⚠️ {char_info.get('name')} 档案精炼失败，保留去重结果: {e}")
+            return merged
+        if not self._acceptable(merged, result):
+            self.fallbacks += 1
+            self.logger.warning(f"⚠️ {char_info.get('name')} 档案精炼结果不完整，保留去重结果")
+            return merged
+        self.consolidated += 1
+        consolidated = merge_profiles([result])
+        # 模型遗漏的字段用确定性结果补齐
+        for key, value in merged.items():
+            consolidated.setdefault(key, value)
+        return consolidated
+
+    @staticmethod
+    def _acceptable(merged: Dict[str, Any], result: Any) -> bool:
+        """精炼结果必须是档案，列表字段仍是列表，且没有丢掉原有的关系对象"""
+        if not isinstance(result, dict) or not result.get("traits"):
+            return False
+        for key, value in merged.items():
+            if isinstance(value, list) and key in result and not isinstance(result[key], list):
+                return False
+        relations = result.get("relationship_matrix") or {}
+        if not isinstance(relations, dict):
+            return False
+        return set(merged.get("relationship_matrix") or {}) <= set(relations)
@@ -0,0 +1,175 @@
+"""
+创世流水线的阶段 DAG：没有依赖关系的阶段并发执行，并记录每个阶段的耗时
+
+阶段函数是同步的（内部为阻塞的 LLM 调用），在线程池中执行；
+每个阶段复制提交时的上下文，追踪 span 与遥测标签在工作线程中照常生效。
+
+用法：
+    dag = StageDAG([
+        Stage("filter", lambda deps: filter_agent.run(text)),
+        Stage("world", lambda deps: world_agent.run(text)),
+        Stage("detail", lambda deps: detail_agent.run(text, deps["filter"]), deps=("filter", "world")),
+    ])
+    results = dag.run()
+    dag.summary()
+"""
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils.logger import setup_logger
+from utils.tracing import span
+
+
+@dataclass
+class Stage:
+    """一个阶段：func 接收其依赖阶段的结果（按阶段名索引）"""
+
+    name: str
+    func: Callable[[Dict[str, Any]], Any]
+    deps: Tuple[str, ...] = ()
+
+
+@dataclass
+class StageTiming:
+    """阶段执行记录（offset 为相对 DAG 启动的秒数）"""
+
+    name: str
+    status: str = "pending"  # pending / done / failed / skipped
+    start_offset: Optional[float] = None
+    seconds: Optional[float] = None
+    error: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"status": self.status}
+        if self.start_offset is not None:
+            data["start_offset"] = round(self.start_offset, 3)
+        if self.seconds is not None:
+            data["seconds"] = round(self.seconds, 3)
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class StageDAG:
+    """按依赖关系调度阶段；任一阶段失败时不再启动依赖它的阶段，等在途阶段结束后抛出该异常"""
+
+    def __init__(
+        self,
+        stages: Sequence[Stage],
+        max_workers: Optional[int] = None,
+        logger=None,
+        should_continue: Optional[Callable[[], bool]] = None,
+    ):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"阶段重名: {stage.name}")
+            self.stages[stage.name] = stage
+        self._validate()
+        self.max_workers = max_workers or len(self.stages) or 1
+        self.logger = logger or setup_logger("CreatorGod", "genesis_group.log")
+        # 返回 False 时不再启动新阶段（如 LLM 预算已用完），已启动的阶段照常结束
+        self.should_continue = should_continue
+        self.timings: Dict[str, StageTiming] = {name: StageTiming(name) for name in self.stages}
+        self.wall_seconds: Optional[float] = None
+
+    def _validate(self) -> None:
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"阶段 {stage.name} 依赖未定义的阶段 {dep}")
+        # 拓扑检查：不断移除无未完成依赖的阶段
+        remaining = {name: set(stage.deps) for name, stage in self.stages.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"阶段依赖存在环: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def _run_stage(self, stage: Stage, inputs: Dict[str, Any], origin: float) -> Any:
+        timing = self.timings[stage.name]
+        started = time.perf_counter()
+        timing.start_offset = started - origin
+        try:
+            with span(f"genesis.{stage.name}"):
+                return stage.func(inputs)
+        finally:
+            timing.seconds = time.perf_counter() - started
+
+    def run(self) -> Dict[str, Any]:
+        """执行全部阶段，返回 {阶段名: 结果}"""
+        origin = time.perf_counter()
+        results: Dict[str, Any] = {}
+        running: Dict[Future, str] = {}
+        error: Optional[BaseException] = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="genesis-stage") as executor:
+            while True:
+                if error is None:
+                    for name in self._ready(results, running.values()):
+                        if self.should_continue is not None and not self.should_continue():
+                            break
+                        stage = self.stages[name]
+                        inputs = {dep: results[dep] for dep in stage.deps}
+                        context = contextvars.copy_context()
+                        self.logger.info(f"▶️  阶段开始: {name}")
+                        future = executor.submit(context.run, self._run_stage, stage, inputs, origin)
+                        running[future] = name
+                if not running:
+                    break
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    timing = self.timings[name]
+                    try:
+                        results[name] = future.result()
+                        timing.status = "done"
+                        self.logger.info(f"✅ 阶段完成: {name} ({timing.seconds:.2f}s)")
+                    except Exception as e:  # noqa: BLE001 - 记录后在所有在途阶段结束时抛出
+                        timing.status = "failed"
+                        timing.error = f"{type(e).__name__}: {e}"
+                        self.logger.error(f"❌ 阶段失败: {name}: {e}")
+                        if error is None:
+                            error = e
+
+        for timing in self.timings.values():
+            if timing.status == "pending":
+                timing.status = "skipped"
+        self.wall_seconds = time.perf_counter() - origin
+        self.logger.info(self.format_summary())
+        if error is not None:
+            raise error
+        return results
+
+    def _ready(self, results: Dict[str, Any], running) -> List[str]:
+        running = set(running)
+        return [
+            name for name, stage in self.stages.items()
+            if name not in results
+            and name not in running
+            and self.timings[name].status == "pending"
+            and all(dep in results for dep in stage.deps)
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        """各阶段状态与耗时；serial_seconds 为各阶段耗时之和（串行执行时的理论总耗时）"""
+        serial = sum(t.seconds or 0.0 for t in self.timings.values())
+        return {
+            "wall_seconds": round(self.wall_seconds or 0.0, 3),
+            "serial_seconds": round(serial, 3),
+            "stages": {name: timing.to_dict() for name, timing in self.timings.items()},
+        }
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f"📊 流水线耗时 {summary['wall_seconds']:.2f}s（各阶段合计 {summary['serial_seconds']:.2f}s）"]
+        for name, info in summary["stages"].items():
+            seconds = f"{info['seconds']:.2f}s" if "seconds" in info else "-"
+            lines.append(f"   {name:<16} {info['status']:<8} {seconds}")
+        return "\n".join(lines)
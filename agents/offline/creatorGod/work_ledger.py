@@ -0,0 +1,173 @@
+"""
+创世流水线的工作项账本：每个（阶段，分块 / 角色）LLM 调用的结果按输入指纹落盘
+
+指纹 = 阶段名 + 输入文本哈希 + 提示词哈希 + 模型配置。重跑时指纹未变的工作项直接复用结果，
+因此崩溃、限流中断或 --continue-build 都从中断处继续；只改了某个阶段的提示词时，
+其他阶段的结果不受影响。失败的调用不记录，下次重跑会重新执行。
+
+账本是追加写的 JSONL 文件（同一指纹以最后一条为准），每个阶段开始时记录本次计划的工作项，
+ProgressTracker.load_genesis_progress() 据此统计真实完成度。
+
+用法：
+    ledger = WorkLedger(path)
+    data = invoke_json(chain, text, ledger=ledger, stage="stage1.filter", item="chunk 1/3",
+                       prompt_text=prompt_text, llm=llm)
+"""
+import copy
+import hashlib
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.metrics import metrics
+from .utils import parse_json_response
+
+GENESIS_WORK_ITEMS = metrics.counter(
+    "storymaker_genesis_work_items_total", "创世工作项数（result=hit 为命中账本跳过的调用）", ["stage", "result"]
+)
+
+_MISSING = object()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def model_fingerprint(llm: Any) -> Dict[str, Any]:
+    """影响输出的模型配置：实现类、模型名与采样参数"""
+    fingerprint: Dict[str, Any] = {"class": type(llm).__name__}
+    for attr in ("model_name", "model", "temperature", "max_tokens", "top_p"):
+        value = getattr(llm, attr, None)
+        if isinstance(value, (str, int, float, bool)):
+            fingerprint[attr] = value
+    return fingerprint
+
+
+class WorkLedger:
+    """
+    工作项账本
+
+    Args:
+        path: 账本文件路径；为 None 时只在内存中记录（同一进程内仍可复用）
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._plans: Dict[str, List[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        if self.path and self.path.exists():
+            self._load()
+
+    def _load(self) -> None:
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程在写入中途被杀时最后一行可能不完整，跳过即可
+                    continue
+                if "plan" in record:
+                    self._plans[record["plan"]] = list(record.get("keys") or [])
+                elif "key" in record:
+                    self._results[record["key"]] = record
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def key(stage: str, text: str, prompt_text: str, model: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            [stage, content_hash(text), content_hash(prompt_text), model],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return content_hash(payload)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            record = self._results.get(key)
+        # 返回副本，调用方合并结果时不会改动账本中的记录
+        return copy.deepcopy(record["result"]) if record else default
+
+    def put(self, key: str, stage: str, item: str, result: Any) -> None:
+        record = {
+            "key": key,
+            "stage": stage,
+            "item": item,
+            "result": result,
+            "at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self._results[key] = record
+            self._append(record)
+
+    def plan(self, stage: str, keys: Iterable[str]) -> None:
+        """记录某阶段本次需要完成的工作项（覆盖该阶段之前的计划）"""
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            self._plans[stage] = keys
+            self._append({"plan": stage, "keys": keys})
+
+    def run(self, key: str, stage: str, item: str, compute: Callable[[], Any]) -> Any:
+        """命中账本时直接返回，否则执行 compute 并记录结果（异常不记录，原样抛出）"""
+        cached = self.get(key, _MISSING)
+        if cached is not _MISSING:
+            with self._lock:
+                self.hits += 1
+            GENESIS_WORK_ITEMS.inc(stage=stage, result="hit")
+            return cached
+        result = compute()
+        with self._lock:
+            self.misses += 1
+        GENESIS_WORK_ITEMS.inc(stage=stage, result="miss")
+        self.put(key, stage, item, result)
+        return result
+
+    def completion(self) -> Dict[str, Dict[str, int]]:
+        """各阶段计划的工作项中已有结果的数量：{stage: {"done": n, "total": m}}"""
+        with self._lock:
+            return {
+                stage: {"done": sum(1 for key in keys if key in self._results), "total": len(keys)}
+                for stage, keys in self._plans.items()
+            }
+
+
+def invoke_json(
+    chain: Any,
+    text: str,
+    *,
+    ledger: Optional[WorkLedger],
+    stage: str,
+    item: str,
+    prompt_text: str,
+    llm: Any,
+    expect: Tuple[type, ...] = (dict,),
+) -> Any:
+    """调用链并解析 JSON；提供账本时按输入指纹复用已完成的结果。expect 为接受的顶层类型（按顺序尝试）"""
+
+    def compute() -> Any:
+        response = chain.invoke({"novel_text": text}, config={"timeout": 18000})
+        return parse_json_response(response, expect=expect)
+
+    if ledger is None:
+        return compute()
+    key = WorkLedger.key(stage, text, prompt_text, model_fingerprint(llm))
+    return ledger.run(key, stage, item, compute)
+
+
+def plan_keys(stage: str, texts: Iterable[Any], prompt_text: str, llm: Any) -> List[str]:
+    """texts 可以是字符串或 TextView（逐个取出片段计算哈希，不同时持有全部分块）"""
+    model = model_fingerprint(llm)
+    return [WorkLedger.key(stage, str(text), prompt_text, model) for text in texts]
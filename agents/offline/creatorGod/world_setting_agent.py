@@ -1,14 +1,19 @@
 """
 世界观设定子客体：负责抽取世界规则与地理
 """
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Union
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
 from utils.llm_factory import get_llm
 from utils.logger import setup_logger
-from .utils import load_prompt, parse_json_response, escape_braces
+from .chunker import TokenChunker
+from .ingest import TextView
+from .utils import load_prompt, escape_braces
+from .work_ledger import WorkLedger, invoke_json, plan_keys
+
+STAGE = "stage2.world"
 
 
 class WorldSettingAgent:
@@ -19,10 +24,25 @@ class WorldSettingAgent:
         llm=None,
         prompt_filename: str = "world_setting.txt",
         logger=None,
+        chunker: Optional[TokenChunker] = None,
     ):
         self.logger = logger or setup_logger("Demiurge", "genesis_group.log")
-        self.llm = llm or get_llm()
+        self.llm = llm or get_llm(agent_name="Genesis.world")
         self.prompt_text = escape_braces(load_prompt(prompt_filename))
+        # 按模型上下文窗口切分长小说（CreatorGod 按阶段模型配置注入）
+        self.chunker = chunker or TokenChunker.for_model()
+        # 工作项账本（由 CreatorGod 注入），命中时跳过已完成的调用
+        self.ledger: Optional[WorkLedger] = None
+
+    def _invoke(self, chain, text: Union[str, TextView], item: str) -> Any:
+        return invoke_json(
+            chain, str(text), ledger=self.ledger, stage=STAGE, item=item,
+            prompt_text=self.prompt_text, llm=self.llm,
+        )
+
+    def _plan(self, texts: List[Union[str, TextView]]) -> None:
+        if self.ledger is not None:
+            self.ledger.plan(STAGE, plan_keys(STAGE, texts, self.prompt_text, self.llm))
 
     def run(self, novel_text: str) -> Dict[str, Any]:
         """抽取世界设定"""
@@ -30,13 +50,10 @@ class WorldSettingAgent:
         self.logger.info("📍 阶段2：提取世界观设定")
         self.logger.info("=" * 60)
 
-        # 估算 Token 数
-        estimated_tokens = len(novel_text) / 1.5
-        MAX_TOKENS = 600000  # 安全阈值（模型限制100万，留余量给prompt）
-        
-        if estimated_tokens > MAX_TOKENS:
-            self.logger.warning(f"⚠️ 小说过长 (约 {int(estimated_tokens)} tokens)，将进行分块处理...")
-            return self._run_chunked(novel_text)
+        chunks = self.chunker.split(novel_text)
+        if len(chunks) > 1:
+            self.logger.warning(f"⚠️ 小说过长 (约 {self.chunker.stats.total_tokens} tokens)，将进行分块处理...")
+            return self._run_chunked(novel_text, chunks)
 
         prompt = ChatPromptTemplate.from_messages(
             [
@@ -45,31 +62,24 @@ class WorldSettingAgent:
             ]
         )
         chain = prompt | self.llm | StrOutputParser()
+        self._plan([novel_text])
 
         self.logger.info("🤖 正在调用世界观 LLM...")
         try:
-            response = chain.invoke({"novel_text": novel_text}, config={"timeout": 18000})
-            world_setting = parse_json_response(response)
+            world_setting = self._invoke(chain, novel_text, "全文")
             return world_setting
         except Exception as e:
             self.logger.error(f"❌ 世界观提取失败: {e}")
             raise e
 
-    def _run_chunked(self, novel_text: str) -> Dict[str, Any]:
-        """分块处理长小说"""
-        CHUNK_SIZE = 50000
-        OVERLAP = 2000
-        
-        chunks = []
-        start = 0
-        while start < len(novel_text):
-            end = min(start + CHUNK_SIZE, len(novel_text))
-            chunks.append(novel_text[start:end])
-            if end == len(novel_text):
-                break
-            start = end - OVERLAP
-            
-        self.logger.info(f"📚 将小说切分为 {len(chunks)} 个片段进行处理")
+    def _run_chunked(self, novel_text: str, chunks: Optional[List[TextView]] = None) -> Dict[str, Any]:
+        """分块处理长小说（在章节 / 段落处断开）"""
+        chunks = chunks or self.chunker.split(novel_text)
+        stats = self.chunker.stats
+        self.logger.info(
+            f"📚 将小说切分为 {len(chunks)} 个片段进行处理"
+            f"（每块不超过 {stats.budget_tokens} tokens，章节处断开 {stats.chapter_cuts} 次）"
+        )
         
         merged_setting = {
             "world_name": "",
@@ -85,12 +95,12 @@ class WorldSettingAgent:
             ]
         )
         chain = prompt | self.llm | StrOutputParser()
+        self._plan(chunks)
         
         for i, chunk in enumerate(chunks, 1):
             self.logger.info(f"🤖 处理片段 {i}/{len(chunks)}...")
             try:
-                response = chain.invoke({"novel_text": chunk}, config={"timeout": 18000})
-                chunk_setting = parse_json_response(response)
+                chunk_setting = self._invoke(chain, chunk, f"片段 {i}/{len(chunks)}")
                 
                 # 合并逻辑
                 if not merged_setting["world_name"] and chunk_setting.get("world_name"):
@@ -10,8 +10,13 @@ from dataclasses import dataclass, field
 from typing import Dict, Any, List, Optional, Callable
 from datetime import datetime
 
+from langchain_core.messages import HumanMessage
+
 from utils.logger import setup_logger
-from utils.llm_factory import get_llm
+from utils.llm_factory import get_llm, bind_json_mode
+from utils.metrics import record_cache
+from utils.structured_output import invoke_structured, validate_response
+from agents.response_schemas import NPCBriefingResponse, TurnPredictionResponse
 
 logger = setup_logger("Conductor", "conductor.log")
 
@@ -199,7 +204,7 @@ class Conductor:
         logger.info("🎭 初始化 Conductor（中枢指挥家）...")
 
         self.genesis_data = genesis_data
-        self.llm = llm or get_llm()
+        self.llm = llm or get_llm(agent_name="Conductor")
         self.enable_async_predict = enable_async_predict
 
         # ========== 幕管理（原ActDirector）==========
@@ -304,6 +309,7 @@ class Conductor:
             return layer0_result
 
         # ========== Layer 1: 缓存预判 ==========
+        record_cache("conductor_prediction", self.cached_prediction.is_valid)
         if self.cached_prediction.is_valid:
             layer1_result = self._layer1_cached_prediction(context, triggered_events)
             if layer1_result:
@@ -501,7 +507,7 @@ class Conductor:
             prompt = self._build_prediction_prompt(turn_result)
 
             # 异步调用LLM
-            result = await asyncio.to_thread(self.llm.invoke, prompt)
+            result = await asyncio.to_thread(bind_json_mode(self.llm).invoke, prompt)
             prediction = self._parse_prediction_result(result.content)
 
             # 更新缓存
@@ -569,45 +575,43 @@ class Conductor:
 """
 
     def _parse_prediction_result(self, content: str) -> TurnPrediction:
-        """解析预判结果"""
-        import json
-        import re
+        """
+        解析预判结果
 
+        预判是后台推测，校验失败直接使用默认预判，不重新询问。
+        """
         prediction = TurnPrediction()
 
-        try:
-            # 尝试提取JSON
-            json_match = re.search(r'\{[^{}]*\}', content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-
-                mode_str = data.get("predicted_mode", "DIALOGUE").upper()
-                if mode_str == "ACT_TRANSITION":
-                    prediction.predicted_mode = TurnMode.ACT_TRANSITION
-                elif mode_str == "PLOT_ADVANCE":
-                    prediction.predicted_mode = TurnMode.PLOT_ADVANCE
-                else:
-                    prediction.predicted_mode = TurnMode.DIALOGUE
-
-                prediction.confidence = float(data.get("confidence", 0.5))
-                prediction.scene_mood = data.get("scene_mood", "平静")
-                prediction.tension_level = float(data.get("tension_level", 0.3))
-
-                phase_str = data.get("dialogue_phase", "OPENING").upper()
-                if phase_str == "RISING":
-                    prediction.dialogue_phase = DialoguePhase.RISING
-                elif phase_str == "CLIMAX":
-                    prediction.dialogue_phase = DialoguePhase.CLIMAX
-                elif phase_str == "FALLING":
-                    prediction.dialogue_phase = DialoguePhase.FALLING
-                else:
-                    prediction.dialogue_phase = DialoguePhase.OPENING
+        result = validate_response(content, TurnPredictionResponse)
+        if not result.success:
+            logger.debug(f"解析预判结果失败: {result.errors[:3]}")
+            return prediction
+        data = result.data
+
+        mode_str = data["predicted_mode"].upper()
+        if mode_str == "ACT_TRANSITION":
+            prediction.predicted_mode = TurnMode.ACT_TRANSITION
+        elif mode_str == "PLOT_ADVANCE":
+            prediction.predicted_mode = TurnMode.PLOT_ADVANCE
+        else:
+            prediction.predicted_mode = TurnMode.DIALOGUE
+
+        prediction.confidence = data["confidence"]
+        prediction.scene_mood = data["scene_mood"]
+        prediction.tension_level = data["tension_level"]
+
+        phase_str = data["dialogue_phase"].upper()
+        if phase_str == "RISING":
+            prediction.dialogue_phase = DialoguePhase.RISING
+        elif phase_str == "CLIMAX":
+            prediction.dialogue_phase = DialoguePhase.CLIMAX
+        elif phase_str == "FALLING":
+            prediction.dialogue_phase = DialoguePhase.FALLING
+        else:
+            prediction.dialogue_phase = DialoguePhase.OPENING
 
-                prediction.phase_guidance = data.get("phase_guidance", "")
-                prediction.focal_npcs = data.get("focal_npcs", [])
-
-        except Exception as e:
-            logger.debug(f"解析预判结果失败: {e}")
+        prediction.phase_guidance = data["phase_guidance"]
+        prediction.focal_npcs = data["focal_npcs"]
 
         return prediction
 
@@ -1316,30 +1320,30 @@ class Conductor:
 """
 
         try:
-            result = await asyncio.to_thread(self.llm.invoke, prompt)
-            return self._parse_npc_briefing(npc_id, npc_name, result.content)
+            result = await asyncio.to_thread(
+                invoke_structured,
+                self.llm,
+                [HumanMessage(content=prompt)],
+                NPCBriefingResponse,
+                label=f"Briefing[{npc_id}]",
+            )
+            return self._parse_npc_briefing(npc_id, npc_name, result.data)
         except Exception:
             return NPCActBriefing(npc_id=npc_id, npc_name=npc_name)
 
-    def _parse_npc_briefing(self, npc_id: str, npc_name: str, content: str) -> NPCActBriefing:
-        """解析NPC幕级指令"""
-        import json
-        import re
-
+    def _parse_npc_briefing(
+        self, npc_id: str, npc_name: str, data: Optional[Dict[str, Any]]
+    ) -> NPCActBriefing:
+        """将校验后的幕级指令转换为 NPCActBriefing（data 为 None 时使用默认指令）"""
         briefing = NPCActBriefing(npc_id=npc_id, npc_name=npc_name)
-
-        try:
-            json_match = re.search(r'\{[^{}]*\}', content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                briefing.role_in_act = data.get("role_in_act", "参与者")
-                briefing.knowledge_scope = data.get("knowledge_scope", [])
-                briefing.forbidden_knowledge = data.get("forbidden_knowledge", [])
-                briefing.emotional_journey = data.get("emotional_journey", "")
-                briefing.key_lines = data.get("key_lines", [])
-        except Exception:
-            pass
-
+        if not data:
+            return briefing
+
+        briefing.role_in_act = data["role_in_act"]
+        briefing.knowledge_scope = data["knowledge_scope"]
+        briefing.forbidden_knowledge = data["forbidden_knowledge"]
+        briefing.emotional_journey = data["emotional_journey"]
+        briefing.key_lines = data["key_lines"]
         return briefing
 
     # ============================================================
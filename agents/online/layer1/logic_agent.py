@@ -34,7 +34,8 @@ class LogicValidator:
         self.llm = get_llm(
             temperature=0.3,
             timeout=online_timeout,
-            max_retries=online_retries
+            max_retries=online_retries,
+            agent_name="Logic"
         )
         
         # 加载系统提示词
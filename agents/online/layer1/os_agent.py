@@ -32,6 +32,8 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from utils.logger import setup_logger
 from utils.llm_factory import get_llm
+from utils.tracing import span, traced
+from utils.json_parser import extract_json
 from config.settings import settings
 from agents.message_protocol import (
     Message, AgentRole, MessageType, WorldContext
@@ -117,14 +119,15 @@ class OperatingSystem:
         self.npc_handlers: Dict[str, Callable] = {}  # character_id -> handler
         
         # LLM 实例（用于剧本拆分等智能任务）
-        self.llm = get_llm(temperature=0.7)
+        self.llm = get_llm(temperature=0.7, agent_name="OS")
         # 路由专用 LLM（在线交互更快超时与重试）
         online_timeout = getattr(settings, "ONLINE_LLM_TIMEOUT", 90.0)
         online_retries = getattr(settings, "ONLINE_LLM_MAX_RETRIES", 1)
         self.routing_llm = get_llm(
             temperature=0.3,
             timeout=online_timeout,
-            max_retries=online_retries
+            max_retries=online_retries,
+            agent_name="OS.Routing"
         )
         
         # 加载Genesis数据
@@ -1061,7 +1064,7 @@ class {class_name}:
         logger.info(f"🎭 初始化角色Agent: {{self.CHARACTER_NAME}} ({{self.CHARACTER_ID}})")
         
         # LLM实例
-        self.llm = get_llm(temperature=0.8)
+        self.llm = get_llm(temperature=0.8, agent_name="NPC")
         
         # 当前动态状态
         self.current_mood = "平静"
@@ -1536,58 +1539,15 @@ def create_agent() -> {class_name}:
         Returns:
             解析后的字典
         """
-        # 清理 markdown 代码块标记
-        result = llm_result.strip()
-        
-        # 尝试提取 JSON 块
-        # 方法1: 查找 ```json ... ``` 格式
-        json_match = re.search(r'```json\s*([\s\S]*?)\s*```', result)
-        if json_match:
-            result = json_match.group(1).strip()
-        else:
-            # 方法2: 查找 ``` ... ``` 格式
-            code_match = re.search(r'```\s*([\s\S]*?)\s*```', result)
-            if code_match:
-                result = code_match.group(1).strip()
-            else:
-                # 方法3: 尝试找到第一个 { 和最后一个 } 之间的内容
-                first_brace = result.find('{')
-                last_brace = result.rfind('}')
-                if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-                    result = result[first_brace:last_brace + 1]
-        
-        try:
-            return json.loads(result)
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON 解析失败: {e}")
-            logger.error(f"尝试解析的内容前500字符: {result[:500]}...")
-            
-            # 最后尝试：逐行解析找到有效的 JSON 对象
-            try:
-                # 找到 { 开始的行
-                lines = result.split('\n')
-                json_lines = []
-                in_json = False
-                brace_count = 0
-                
-                for line in lines:
-                    if '{' in line and not in_json:
-                        in_json = True
-                    
-                    if in_json:
-                        json_lines.append(line)
-                        brace_count += line.count('{') - line.count('}')
-                        
-                        if brace_count == 0:
-                            break
-                
-                if json_lines:
-                    json_str = '\n'.join(json_lines)
-                    return json.loads(json_str)
-            except:
-                pass
-            
-            return None
+        extraction = extract_json(llm_result, expect=dict)
+        if extraction.success and isinstance(extraction.value, dict):
+            if extraction.repairs:
+                logger.debug(f"剧本 JSON 已修复: {', '.join(extraction.repairs)}")
+            return extraction.value
+
+        logger.error(f"❌ JSON 解析失败: {extraction.error or '结果不是对象'}")
+        logger.error(f"尝试解析的内容前500字符: {llm_result[:500]}...")
+        return None
     
     def _archive_old_script(
         self,
@@ -1920,18 +1880,10 @@ def create_agent() -> {class_name}:
         Returns:
             路由决策结果
         """
-        # 清理响应中的代码块标记
-        result = response.strip()
-        if result.startswith("```json"):
-            result = result[7:]
-        if result.startswith("```"):
-            result = result[3:]
-        if result.endswith("```"):
-            result = result[:-3]
-        result = result.strip()
+        extraction = extract_json(response, expect=dict)
         
-        try:
-            data = json.loads(result)
+        if extraction.success and isinstance(extraction.value, dict):
+            data = extraction.value
             next_speaker = data.get("next_speaker_id", "")
             
             # 验证 next_speaker_id 是否有效
@@ -1956,9 +1908,9 @@ def create_agent() -> {class_name}:
                 "routing_reason": data.get("analysis", "LLM 裁决")
             }
             
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ LLM 路由响应解析失败: {e}")
-            logger.debug(f"原始响应: {result}")
+        else:
+            logger.error(f"❌ LLM 路由响应解析失败: {extraction.error or '结果不是对象'}")
+            logger.debug(f"原始响应: {response}")
             # 解析失败，使用默认
             return {
                 "next_speaker_id": active_npcs[0] if active_npcs else "user",
@@ -1971,6 +1923,7 @@ def create_agent() -> {class_name}:
     # 场景对话循环
     # ==========================================
     
+    @traced("os.scene_loop", root=True)
     def run_scene_loop(
         self,
         runtime_dir: Path,
@@ -2180,7 +2133,8 @@ def create_agent() -> {class_name}:
                 logger.info("⏸️ 等待玩家输入...")
                 
                 if user_input_callback:
-                    user_input = user_input_callback("请输入你的回应: ")
+                    with span("os.wait_player_input"):
+                        user_input = user_input_callback("请输入你的回应: ")
                     if user_input is None:
                         logger.info("⏸️ 回调返回空，暂停循环")
                         paused_for_user = True
@@ -2256,7 +2210,8 @@ def create_agent() -> {class_name}:
             }
             
             # 调用 NPC 演绎
-            actor_response = current_agent.react(scene_context=scene_ctx)
+            with span("npc.react", npc=current_speaker_id, turn=turn_count):
+                actor_response = current_agent.react(scene_context=scene_ctx)
             
             # 记录对话历史
             dialogue_history.append({
@@ -2271,15 +2226,16 @@ def create_agent() -> {class_name}:
             turn_in_scene = actor_turn_counts[current_speaker_id]
             
             # 保存到角色专属历史文件（包含 scene_id 和 turn_in_scene）
-            self._save_actor_history(
-                runtime_dir=runtime_dir,
-                actor_id=current_speaker_id,
-                actor_name=speaker_name,
-                turn=turn_count,
-                response=actor_response,
-                scene_id=current_scene_id,
-                turn_in_scene=turn_in_scene
-            )
+            with span("os.save_actor_history"):
+                self._save_actor_history(
+                    runtime_dir=runtime_dir,
+                    actor_id=current_speaker_id,
+                    actor_name=speaker_name,
+                    turn=turn_count,
+                    response=actor_response,
+                    scene_id=current_scene_id,
+                    turn_in_scene=turn_in_scene
+                )
             
             # 显示演绎结果
             logger.info(f"   💭 {actor_response.get('thought', '')[:50]}...")
@@ -2313,11 +2269,12 @@ def create_agent() -> {class_name}:
             
             if addressing_target == "everyone":
                 # 使用 LLM 智能裁决
-                routing_result = self.route_dialogue_with_llm(
-                    actor_response=actor_response,
-                    active_npcs=active_npc_info,
-                    scene_memory=scene_memory
-                )
+                with span("os.route_with_llm"):
+                    routing_result = self.route_dialogue_with_llm(
+                        actor_response=actor_response,
+                        active_npcs=active_npc_info,
+                        scene_memory=scene_memory
+                    )
             else:
                 # 使用简单路由
                 routing_result = self.route_dialogue(
@@ -2620,23 +2577,12 @@ def create_agent() -> {class_name}:
         Returns:
             解析后的字典，解析失败返回 None
         """
-        result = response.strip()
-        
-        # 移除 markdown 代码块标记
-        if result.startswith("```json"):
-            result = result[7:]
-        if result.startswith("```"):
-            result = result[3:]
-        if result.endswith("```"):
-            result = result[:-3]
-        result = result.strip()
-        
-        try:
-            return json.loads(result)
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON 解析失败: {e}")
-            logger.error(f"原始响应前200字符: {result[:200]}...")
-            return None
+        extraction = extract_json(response, expect=dict)
+        if extraction.success and isinstance(extraction.value, dict):
+            return extraction.value
+        logger.error(f"❌ JSON 解析失败: {extraction.error or '结果不是对象'}")
+        logger.error(f"原始响应前200字符: {response[:200]}...")
+        return None
     
     def _update_world_state_from_scene(
         self,
@@ -9,8 +9,10 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from utils.llm_factory import get_llm
 from utils.logger import setup_logger
+from utils.structured_output import validate_response
 from config.settings import settings
 from agents.message_protocol import Message, AgentRole, MessageType, PlotInstruction
+from agents.response_schemas import PlotScript
 
 logger = setup_logger("Plot", "plot.log")
 
@@ -31,7 +33,7 @@ class PlotDirector:
         logger.info("🎬 初始化命运编织者...")
         
         # LLM实例（较高温度以增加创造性）
-        self.llm = get_llm(temperature=0.8)
+        self.llm = get_llm(temperature=0.8, agent_name="Plot")
         
         # Genesis数据
         self.genesis_data = genesis_data
@@ -312,11 +314,12 @@ class PlotDirector:
         解析剧本（支持 JSON 和文本格式）
         
         plot_system.txt 要求输出文本格式（使用【】作为板块标题），
-        因此需要解析文本格式的剧本。
+        因此需要解析文本格式的剧本。JSON 形式的剧本按 PlotScript 校验，
+        文本格式本身就是合法输出，所以这里不做重新询问。
         """
         response = response.strip()
         
-        # 尝试解析 JSON 格式
+        # 去掉 markdown 代码块包裹
         if response.startswith("```json"):
             response = response[7:]
         if response.startswith("```"):
@@ -325,13 +328,12 @@ class PlotDirector:
             response = response[:-3]
         response = response.strip()
         
-        # 如果是 JSON 格式，直接解析
+        # 如果是 JSON 格式，按结构校验
         if response.startswith("{"):
-            try:
-                data = json.loads(response)
-                return data
-            except json.JSONDecodeError:
-                pass  # 继续尝试文本格式解析
+            result = validate_response(response, PlotScript)
+            if result.success:
+                return result.data
+            logger.debug(f"剧本 JSON 未通过校验，按文本格式解析: {result.errors[:2]}")
         
         # 解析文本格式（【剧情】【世界与物理事件】【角色登场与调度】）
         return self._parse_text_script(response)
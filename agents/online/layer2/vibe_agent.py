@@ -4,16 +4,18 @@
 利用角色的current_appearance字段进行视觉描写
 """
 import asyncio
-import json
 import os
 import weakref
 from typing import Dict, Any, Optional, List
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from utils.llm_factory import get_llm
+from utils.concurrency import llm_slot
+from utils.llm_factory import get_llm, bind_json_mode
 from utils.logger import setup_logger
+from utils.structured_output import invoke_structured
 from config.settings import settings
 from agents.message_protocol import Message, AgentRole, MessageType, GeneratedContent
+from agents.response_schemas import AtmosphereResponse
 
 # 并发控制（与其他模块共享配置）
 _LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "5"))
@@ -56,7 +58,7 @@ class AtmosphereCreator:
         logger.info("🎨 初始化氛围感受者...")
         
         # LLM实例（高温度以增加创造性）
-        self.llm = get_llm(temperature=0.9)
+        self.llm = get_llm(temperature=0.9, agent_name="Vibe")
         
         # Genesis数据
         self.genesis_data = genesis_data
@@ -121,7 +123,8 @@ class AtmosphereCreator:
 请创作富有感染力的氛围描写，返回JSON格式。描写时可以自然地融入角色的外观细节。""")
         ])
         
-        return prompt | self.llm | StrOutputParser()
+        self.prompt = prompt
+        return prompt | bind_json_mode(self.llm) | StrOutputParser()
     
     def create_atmosphere(
         self,
@@ -156,7 +159,7 @@ class AtmosphereCreator:
         character_appearances = self._get_character_appearances(present_characters or [])
         
         try:
-            response = self.chain.invoke({
+            invoke_vars = {
                 "genre": self.world_info.get("genre", "现代都市"),
                 "location_id": location_id,
                 "location_name": location_data.get("name", "未知地点"),
@@ -169,10 +172,11 @@ class AtmosphereCreator:
                 "weather": weather,
                 "character_appearances": character_appearances,
                 "recent_descriptions": self._format_recent_descriptions()
-            })
+            }
+            response = self.chain.invoke(invoke_vars)
             
             # 解析结果
-            atmosphere = self._parse_atmosphere(response)
+            atmosphere = self._parse_atmosphere(response, invoke_vars)
             
             # 记录到历史
             desc = atmosphere.get("atmosphere_description", "")
@@ -201,8 +205,7 @@ class AtmosphereCreator:
         """
         异步版本的氛围创作，使用线程池 + 并发限流
         """
-        sem = _get_semaphore()
-        async with sem:
+        async with llm_slot(_get_semaphore(), "Vibe"):
             return await asyncio.to_thread(
                 self.create_atmosphere,
                 location_id,
@@ -259,29 +262,25 @@ class AtmosphereCreator:
         
         return "\n".join([f"- {desc}..." for desc in self.description_history[-3:]])
     
-    def _parse_atmosphere(self, response: str) -> Dict[str, Any]:
-        """解析氛围描写"""
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response[7:]
-        if response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
-        response = response.strip()
-        
-        try:
-            data = json.loads(response)
-            return data
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ 解析氛围描写失败: {e}")
-            logger.error(f"原始响应: {response[:200]}...")
+    def _parse_atmosphere(self, response: str, invoke_vars: Dict[str, Any]) -> Dict[str, Any]:
+        """按 AtmosphereResponse 校验氛围描写，校验失败时用同一组输入重新询问"""
+        result = invoke_structured(
+            self.llm,
+            lambda: self.prompt.format_messages(**invoke_vars),
+            AtmosphereResponse,
+            first_response=response,
+            label="Vibe",
+        )
+        if not result.success:
+            logger.error(f"❌ 解析氛围描写失败: {result.errors[:3]}")
+            logger.error(f"原始响应: {result.raw[:200]}...")
             return {
                 "atmosphere_description": "环境很普通。",
                 "sensory_details": {},
                 "mood_keywords": ["平静"],
                 "focus_elements": []
             }
+        return result.data
     
     def _create_minimal_atmosphere(self, location_data: Dict[str, Any]) -> Dict[str, Any]:
         """创建最小氛围描写（出错时使用）"""
@@ -3,15 +3,16 @@
 仿真引擎，负责模拟时间流逝、NPC状态、离屏事件
 """
 import asyncio
-import json
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from utils.llm_factory import get_llm
+from utils.llm_factory import get_llm, bind_json_mode
 from utils.logger import setup_logger
+from utils.structured_output import invoke_structured
 from config.settings import settings
 from agents.message_protocol import Message, AgentRole, MessageType
+from agents.response_schemas import WorldStateUpdate
 
 logger = setup_logger("WorldState", "world_state.log")
 
@@ -32,7 +33,7 @@ class WorldStateManager:
         logger.info("🌍 初始化世界状态运行者...")
         
         # LLM实例
-        self.llm = get_llm(temperature=0.7)
+        self.llm = get_llm(temperature=0.7, agent_name="WS")
         
         # Genesis数据
         self.genesis_data = genesis_data
@@ -100,7 +101,8 @@ class WorldStateManager:
 请返回状态变化（JSON）：""")
         ])
 
-        return prompt | self.llm | StrOutputParser()
+        self.prompt = prompt
+        return prompt | bind_json_mode(self.llm) | StrOutputParser()
     
     def _parse_initial_time(self) -> str:
         """解析初始时间"""
@@ -233,14 +235,15 @@ class WorldStateManager:
 
         # 调用LLM获取增量更新
         try:
-            response = self.chain.invoke({
+            invoke_vars = {
                 "player_action": player_action,
                 "current_time": self.current_time,
                 "npc_states": npc_states_str
-            })
+            }
+            response = self.chain.invoke(invoke_vars)
 
             # 解析增量结果
-            update_data = self._parse_update_result(response)
+            update_data = self._parse_update_result(response, invoke_vars)
 
             # 应用增量更新
             self._apply_incremental_updates(update_data, time_cost)
@@ -285,25 +288,20 @@ class WorldStateManager:
             )
         return "\n".join(lines) if lines else "无NPC"
     
-    def _parse_update_result(self, response: str) -> Dict[str, Any]:
-        """解析LLM返回的更新结果"""
-        # 清理markdown
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response[7:]
-        if response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
-        response = response.strip()
-        
-        try:
-            data = json.loads(response)
-            return data
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ 解析世界状态更新失败: {e}")
-            logger.error(f"原始响应: {response[:200]}...")
+    def _parse_update_result(self, response: str, invoke_vars: Dict[str, Any]) -> Dict[str, Any]:
+        """按 WorldStateUpdate 校验LLM返回的更新结果，校验失败时用同一组输入重新询问"""
+        result = invoke_structured(
+            self.llm,
+            lambda: self.prompt.format_messages(**invoke_vars),
+            WorldStateUpdate,
+            first_response=response,
+            label="WS",
+        )
+        if not result.success:
+            logger.error(f"❌ 解析世界状态更新失败: {result.errors[:3]}")
+            logger.error(f"原始响应: {result.raw[:200]}...")
             return {}
+        return result.data
     
     def _apply_incremental_updates(self, update_data: Dict[str, Any], default_time_cost: int):
         """应用增量更新（diff模式）"""
@@ -19,9 +19,11 @@ from typing import Any, Dict, List, Optional
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from config.settings import settings
+from utils.concurrency import llm_slot
 from utils.logger import setup_logger
 from utils.llm_factory import get_llm
-from utils.json_parser import parse_json_response
+from utils.structured_output import invoke_structured
+from agents.response_schemas import NPCResponse
 
 # 尝试导入记忆管理器（可选依赖）
 try:
@@ -104,7 +106,8 @@ class NPCAgent:
         self.llm = get_llm(
             temperature=0.8,
             timeout=online_timeout,
-            max_retries=online_retries
+            max_retries=online_retries,
+            agent_name="NPC"
         )
         self.prompt_template = self._load_prompt_template()
 
@@ -389,9 +392,7 @@ class NPCAgent:
         ]
 
         try:
-            response = self.llm.invoke(messages)
-            content = getattr(response, "content", str(response))
-            data = self._parse_response(content)
+            data = self._invoke_and_parse(messages)
         except Exception as exc:  # noqa: BLE001
             logger.error("❌ NPC[%s] 调用 LLM 失败: %s", self.character_id, exc, exc_info=True)
             data = self._create_fallback_response()
@@ -515,8 +516,7 @@ class NPCAgent:
           这里显式使用 asyncio.to_thread，并通过全局 Semaphore 控制并发度，
           便于按需调整并发上限以避免 API 限流。
         """
-        sem = _get_semaphore()
-        async with sem:
+        async with llm_slot(_get_semaphore(), "NPC"):
             return await asyncio.to_thread(
                 self.react,
                 player_input,
@@ -677,8 +677,7 @@ class NPCAgent:
                 SystemMessage(content=prompt),
                 HumanMessage(content="请生成NPC的主动行为（对话或动作）")
             ]
-            raw = self.llm.invoke(messages).content
-            result = self._parse_response(raw)
+            result = self._invoke_and_parse(messages)
 
             # 标记为主动发起
             result["mode"] = "initiate"
@@ -766,8 +765,7 @@ class NPCAgent:
         player_available: bool = True
     ) -> Optional[Dict[str, Any]]:
         """异步版本的主动发起"""
-        sem = _get_semaphore()
-        async with sem:
+        async with llm_slot(_get_semaphore(), "NPC"):
             return await asyncio.to_thread(
                 self.take_initiative,
                 scene_context,
@@ -803,21 +801,25 @@ class NPCAgent:
     # JSON 解析与兜底
     # --------------------------------------------------------------------- #
 
-    def _parse_response(self, raw: str) -> Dict[str, Any]:
-        """解析 LLM 返回的 JSON 响应，并做字段归一化。"""
-        try:
-            data = parse_json_response(raw) or {}
-        except Exception as exc:  # noqa: BLE001
-            logger.error("❌ NPC[%s] JSON解析失败: %s", self.character_id, exc, exc_info=True)
-            return self._create_fallback_response(raw)
+    def _invoke_and_parse(self, messages: List[Any]) -> Dict[str, Any]:
+        """调用 LLM 并按 NPCResponse 校验，校验失败会先重新询问，仍失败则兜底。"""
+        result = invoke_structured(
+            self.llm, messages, NPCResponse, label=f"NPC[{self.character_id}]"
+        )
+        if not result.success:
+            return self._create_fallback_response(result.raw)
+        return self._normalize_response(result.data)
 
+    def _normalize_response(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """字段归一化：补齐默认值并附上角色身份。"""
         # 兼容字段名：content / dialogue
         text = data.get("dialogue") or data.get("content") or ""
         data["dialogue"] = text
         data["content"] = text
 
         data.setdefault("thought", "")
-        data.setdefault("emotion", self.current_mood)
+        if not data.get("emotion"):
+            data["emotion"] = self.current_mood
         data.setdefault("action", "")
         data.setdefault("addressing_target", "everyone")
         data.setdefault("is_scene_finished", False)
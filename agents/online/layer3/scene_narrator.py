@@ -7,11 +7,11 @@
 - NPC之间可以互相看、接话、呼应
 """
 
-import json
 import re
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 
+from utils.json_parser import extract_json
 from utils.llm_factory import get_llm
 from utils.logger import setup_logger
 from config.settings import settings
@@ -37,7 +37,8 @@ class SceneNarrator:
         self.llm = get_llm(
             temperature=0.8,
             timeout=online_timeout,
-            max_retries=online_retries
+            max_retries=online_retries,
+            agent_name="SceneNarrator"
         )
 
         # 加载提示词模板
@@ -275,16 +276,9 @@ class SceneNarrator:
         npcs: List[Dict[str, Any]]
     ) -> Dict[str, Any]:
         """解析LLM响应"""
-        try:
-            # 尝试提取JSON
-            json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                # 尝试直接解析
-                json_str = response_text
-
-            data = json.loads(json_str)
+        extraction = extract_json(response_text, expect=dict)
+        if extraction.success and isinstance(extraction.value, dict):
+            data = extraction.value
 
             # 验证响应格式
             responses = data.get("responses", [])
@@ -298,15 +292,14 @@ class SceneNarrator:
                 "responses": responses
             }
 
-        except json.JSONDecodeError:
-            # JSON解析失败，尝试回退解析
-            logger.warning("JSON解析失败，尝试回退解析")
-            responses = self._extract_responses_fallback(response_text, npcs)
-            return {
-                "success": True,
-                "narration": "",
-                "responses": responses
-            }
+        # JSON解析失败，尝试回退解析
+        logger.warning(f"JSON解析失败（{extraction.error or '结果不是对象'}），尝试回退解析")
+        responses = self._extract_responses_fallback(response_text, npcs)
+        return {
+            "success": True,
+            "narration": "",
+            "responses": responses
+        }
 
     def _extract_responses_fallback(
         self,
@@ -16,9 +16,11 @@ from typing import Dict, Any, Optional, List
 from pydantic import BaseModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from utils.llm_factory import get_llm
+from utils.llm_factory import get_llm, bind_json_mode
 from utils.logger import setup_logger
+from utils.structured_output import invoke_structured
 from config.settings import settings
+from agents.response_schemas import VisualRenderData
 
 logger = setup_logger("Screen", "screen.log")
 
@@ -93,7 +95,7 @@ class ScreenAgent:
         self.world_name = world_name
         
         # 初始化 LLM（用于视觉翻译）
-        self.llm = get_llm(temperature=0.7)
+        self.llm = get_llm(temperature=0.7, agent_name="Screen")
         
         # 加载提示词
         self.system_prompt = self._load_system_prompt()
@@ -156,7 +158,8 @@ class ScreenAgent:
 请输出符合 JSON Schema 的视觉渲染数据。""")
         ])
         
-        return prompt | self.llm | StrOutputParser()
+        self.prompt = prompt
+        return prompt | bind_json_mode(self.llm) | StrOutputParser()
 
     def _build_script_chain(self):
         """构建剧本视觉翻译链"""
@@ -185,7 +188,8 @@ class ScreenAgent:
 """)
         ])
         
-        return prompt | self.llm | StrOutputParser()
+        self.script_prompt = prompt
+        return prompt | bind_json_mode(self.llm) | StrOutputParser()
     
     # ==========================================
     # 功能模块一：终端渲染 (Human-Readable)
@@ -303,7 +307,7 @@ class ScreenAgent:
         characters_info = self._format_characters_info(input_data.characters_in_scene)
         
         try:
-            response = self.chain.invoke({
+            invoke_vars = {
                 "scene_summary": self._generate_scene_summary(input_data),
                 "location": location.get("name", "未知地点") + " - " + location.get("description", ""),
                 "time_of_day": ws.get("time_of_day", ""),
@@ -313,10 +317,11 @@ class ScreenAgent:
                 "action": current_action.get("action", ""),
                 "emotion": current_action.get("emotion", ""),
                 "characters_info": characters_info
-            })
+            }
+            response = self.chain.invoke(invoke_vars)
             
             # 解析响应
-            visual_data = self._parse_visual_response(response)
+            visual_data = self._parse_visual_response(response, self.prompt, invoke_vars)
             if not visual_data:
                 logger.warning("⚠️ 视觉解析为空，使用兜底模板")
                 return self._create_fallback_visual_data(input_data)
@@ -363,17 +368,18 @@ class ScreenAgent:
         characters_info = self._format_characters_info(input_data.characters_in_scene)
         
         try:
-            response = self.script_chain.invoke({
+            invoke_vars = {
                 "scene_summary": f"{location.get('name', '未知地点')} 的完整一幕",
                 "location": location.get("name", "未知地点") + " - " + location.get("description", ""),
                 "time_of_day": ws.get("time_of_day", ""),
                 "weather": ws.get("weather", ""),
                 "script_content": input_data.script_content,
                 "characters_info": characters_info
-            })
+            }
+            response = self.script_chain.invoke(invoke_vars)
             
             # 解析响应
-            visual_data = self._parse_visual_response(response)
+            visual_data = self._parse_visual_response(response, self.script_prompt, invoke_vars)
             if not visual_data:
                 logger.warning("⚠️ 视觉解析为空，使用兜底模板")
                 return self._create_fallback_visual_data(input_data)
@@ -424,29 +430,26 @@ class ScreenAgent:
         
         return f"在{location}的场景"
     
-    def _parse_visual_response(self, response: str) -> Dict[str, Any]:
-        """解析 LLM 的视觉翻译响应"""
-        response = response.strip()
-        
-        # 清理 markdown 代码块
-        if response.startswith("```json"):
-            response = response[7:]
-        if response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
-        response = response.strip()
-        
-        try:
-            data = json.loads(response)
-            # 如果返回的是完整结构，提取 visual_render_data
-            if "visual_render_data" in data:
-                return data["visual_render_data"]
-            return data
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON 解析失败: {e}")
-            logger.error(f"原始响应: {response[:300]}...")
+    def _parse_visual_response(
+        self,
+        response: str,
+        prompt: ChatPromptTemplate,
+        invoke_vars: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """按 VisualRenderData 校验视觉翻译响应（自动拆开 visual_render_data 外层），失败时重新询问"""
+        result = invoke_structured(
+            self.llm,
+            lambda: prompt.format_messages(**invoke_vars),
+            VisualRenderData,
+            first_response=response,
+            envelope="visual_render_data",
+            label="Screen",
+        )
+        if not result.success:
+            logger.error(f"❌ 视觉数据校验失败: {result.errors[:3]}")
+            logger.error(f"原始响应: {result.raw[:300]}...")
             return {}
+        return result.data
     
     def _create_fallback_visual_data(self, input_data: ScreenInput) -> Dict[str, Any]:
         """创建兜底的视觉数据（解析失败时使用）"""
@@ -0,0 +1,122 @@
+"""
+在线 Agent 的 LLM 响应结构定义
+
+每个 Agent 的输出都有一个 pydantic 模型，供 utils.structured_output 校验：
+- 必填字段缺失 → 触发重新询问（re-ask）
+- 可选字段类型错误 → 定向修复（丢弃该字段，回退默认值），不浪费一次调用
+- 未声明的字段原样保留（extra="allow"），避免丢失模型额外给出的信息
+"""
+from typing import Any, Dict, List, Optional
+
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, field_validator, model_validator
+
+
+def _as_str_list(value: Any) -> Any:
+    """LLM 常把单元素列表写成字符串，这里统一包装成列表。"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    return value
+
+
+class AgentResponse(BaseModel):
+    """所有响应模型的基类：允许额外字段，校验时兼容字符串形式的数字/布尔值"""
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+
+class NPCResponse(AgentResponse):
+    """NPC 一次演绎的输出（prompts/online/npc_system.txt 与主动发起 Prompt）"""
+    content: str = Field(
+        default="",
+        validation_alias=AliasChoices("content", "dialogue"),
+        description="台词（主动发起时可以只有动作）",
+    )
+    thought: str = Field(default="", description="内心独白")
+    emotion: str = Field(default="", description="情绪")
+    action: str = Field(default="", description="动作描写")
+    addressing_target: str = Field(default="everyone", description="说话对象")
+    is_scene_finished: bool = Field(default=False, description="本幕是否结束")
+
+    @model_validator(mode="after")
+    def _require_performance(self) -> "NPCResponse":
+        if not self.content.strip() and not self.action.strip():
+            raise ValueError("content 与 action 不能同时为空")
+        return self
+
+
+class PlotInstructionItem(AgentResponse):
+    """剧本中的单条调度指令"""
+    type: str = Field(default="", description="指令类型，如 character_entry / character_exit")
+    character_id: str = Field(default="", description="目标角色ID")
+
+
+class PlotScript(AgentResponse):
+    """Plot 以 JSON 形式给出的剧本（文本格式剧本走 _parse_text_script）"""
+    scene_analysis: Dict[str, Any] = Field(default_factory=dict)
+    scene_theme: Dict[str, Any] = Field(default_factory=dict)
+    instructions: List[PlotInstructionItem] = Field(default_factory=list)
+    plot_progression: Dict[str, Any] = Field(default_factory=dict)
+    director_notes: str = Field(default="")
+    act_completion: Dict[str, Any] = Field(default_factory=dict)
+
+
+class NPCStateUpdate(AgentResponse):
+    """WS 增量更新中单个 NPC 的变化"""
+    npc_id: str = Field(description="NPC ID")
+    mood: Optional[str] = None
+    activity: Optional[str] = None
+
+
+class WorldStateUpdate(AgentResponse):
+    """WS 的增量更新（只包含变化部分）"""
+    time_delta_minutes: Optional[int] = Field(default=None, ge=0, description="经过的分钟数")
+    npc_updates: List[NPCStateUpdate] = Field(default_factory=list)
+    offscreen_events: List[str] = Field(default_factory=list)
+    environment_changes: List[str] = Field(default_factory=list)
+
+    _coerce_lists = field_validator("offscreen_events", "environment_changes", mode="before")(_as_str_list)
+
+
+class AtmosphereResponse(AgentResponse):
+    """Vibe 的氛围描写"""
+    atmosphere_description: str = Field(description="氛围描写正文")
+    sensory_details: Dict[str, Any] = Field(default_factory=dict)
+    mood_keywords: List[str] = Field(default_factory=list)
+    focus_elements: List[str] = Field(default_factory=list)
+
+    _coerce_lists = field_validator("mood_keywords", "focus_elements", mode="before")(_as_str_list)
+
+
+class VisualRenderData(AgentResponse):
+    """Screen 的视觉渲染数据（visual_render_data 内部结构）"""
+    summary: str = Field(description="封面用简短描述")
+    environment: Dict[str, Any] = Field(default_factory=dict)
+    characters_in_shot: List[Dict[str, Any]] = Field(default_factory=list)
+    media_prompts: Dict[str, Any] = Field(default_factory=dict)
+
+
+class NPCBriefingResponse(AgentResponse):
+    """Conductor 为 NPC 生成的幕级指令"""
+    role_in_act: str = Field(default="参与者", description="引导者/阻碍者/旁观者/参与者")
+    knowledge_scope: List[str] = Field(default_factory=list)
+    forbidden_knowledge: List[str] = Field(default_factory=list)
+    emotional_journey: str = Field(default="")
+    key_lines: List[str] = Field(default_factory=list)
+
+    _coerce_lists = field_validator(
+        "knowledge_scope", "forbidden_knowledge", "key_lines", mode="before"
+    )(_as_str_list)
+
+
+class TurnPredictionResponse(AgentResponse):
+    """Conductor 的下一回合预判"""
+    predicted_mode: str = Field(default="DIALOGUE")
+    confidence: float = Field(default=0.5, ge=0.0, le=1.0)
+    scene_mood: str = Field(default="平静")
+    tension_level: float = Field(default=0.3, ge=0.0, le=1.0)
+    dialogue_phase: str = Field(default="OPENING")
+    phase_guidance: str = Field(default="")
+    focal_npcs: List[str] = Field(default_factory=list)
+
+    _coerce_lists = field_validator("focal_npcs", mode="before")(_as_str_list)
@@ -0,0 +1,163 @@
+"""
+API 过载保护
+
+- SessionTurnGate：同一会话同时只处理一个回合。会话忙时按 SESSION_BUSY_POLICY
+  排队等待（最多 SESSION_MAX_QUEUED 个、SESSION_QUEUE_TIMEOUT 秒）或立即返回 409
+- AdmissionController：全局准入。在途重请求数达到 ADMISSION_MAX_INFLIGHT 时返回 429，
+  LLM 排队深度超过 ADMISSION_MAX_LLM_QUEUE 时返回 503，均带 Retry-After，
+  让客户端尽早退避，而不是每个请求都排到 ONLINE_LLM_TIMEOUT 才超时
+
+用法（api_server）：
+    admission.check()                       # 先快速判断，避免注定失败的请求排队
+    async with session.turn_gate.hold(), admission.admit():
+        result = await engine.process_turn_async(action)
+"""
+import asyncio
+import math
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi import HTTPException
+
+from config.settings import settings
+from utils.concurrency import llm_queue_depth
+from utils.logger import setup_logger
+from utils.metrics import TURN_SECONDS, metrics
+
+logger = setup_logger("Admission", "admission.log")
+
+ADMISSION_REJECTIONS = metrics.counter(
+    "storymaker_admission_rejections_total", "被过载保护拒绝的请求数", ["reason"]
+)
+ADMISSION_INFLIGHT = metrics.gauge(
+    "storymaker_admission_inflight", "已准入、正在处理的重请求数（回合与开局）"
+)
+
+
+def _reject(status_code: int, reason: str, detail: str, retry_after: Optional[int] = None) -> HTTPException:
+    ADMISSION_REJECTIONS.inc(reason=reason)
+    logger.warning(f"⛔ 拒绝请求 [{reason}] {detail}")
+    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+    return HTTPException(status_code=status_code, detail=detail, headers=headers)
+
+
+class SessionTurnGate:
+    """单个会话的回合锁（每个 GameSession 持有一个）"""
+
+    def __init__(
+        self,
+        policy: Optional[str] = None,
+        queue_timeout: Optional[float] = None,
+        max_queued: Optional[int] = None,
+    ):
+        # 未显式指定时每次调用读取 settings，便于运行期调整
+        self._policy = policy
+        self._queue_timeout = queue_timeout
+        self._max_queued = max_queued
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+
+    @property
+    def policy(self) -> str:
+        return self._policy or settings.SESSION_BUSY_POLICY
+
+    @property
+    def queue_timeout(self) -> float:
+        return self._queue_timeout if self._queue_timeout is not None else settings.SESSION_QUEUE_TIMEOUT
+
+    @property
+    def max_queued(self) -> int:
+        return self._max_queued if self._max_queued is not None else settings.SESSION_MAX_QUEUED
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    @asynccontextmanager
+    async def hold(self) -> AsyncIterator[None]:
+        """
+        占用会话直到回合结束
+
+        Raises:
+            HTTPException(409): 会话忙且不排队、排队已满或等待超时
+        """
+        if self._lock.locked():
+            if self.policy != "queue":
+                raise _reject(409, "session_busy", "上一回合仍在处理中")
+            if self.waiting >= self.max_queued:
+                raise _reject(409, "session_queue_full", "该会话已有请求在排队")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._lock.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise _reject(409, "session_queue_timeout", f"等待上一回合超过 {self.queue_timeout:g}s") from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._lock.acquire()
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+
+class AdmissionController:
+    """全局准入控制（进程内单例 admission）"""
+
+    def __init__(
+        self,
+        max_inflight: Optional[int] = None,
+        max_llm_queue: Optional[int] = None,
+        queue_depth: Callable[[], int] = llm_queue_depth,
+    ):
+        self._max_inflight = max_inflight
+        self._max_llm_queue = max_llm_queue
+        self._queue_depth = queue_depth
+        self.inflight = 0
+
+    @property
+    def max_inflight(self) -> int:
+        return self._max_inflight if self._max_inflight is not None else settings.ADMISSION_MAX_INFLIGHT
+
+    @property
+    def max_llm_queue(self) -> int:
+        return self._max_llm_queue if self._max_llm_queue is not None else settings.ADMISSION_MAX_LLM_QUEUE
+
+    def retry_after(self) -> int:
+        """建议的重试间隔（秒）：取配置值与近期平均回合耗时中较大者"""
+        mean = TURN_SECONDS.mean()
+        fallback = settings.ADMISSION_RETRY_AFTER
+        return max(fallback, math.ceil(mean)) if mean else fallback
+
+    def check(self) -> None:
+        """
+        判断当前是否还能接收重请求
+
+        Raises:
+            HTTPException(429): 在途请求数已达上限
+            HTTPException(503): LLM 排队深度超过上限
+        """
+        if self.max_inflight > 0 and self.inflight >= self.max_inflight:
+            raise _reject(
+                429, "inflight", f"同时处理的请求已达上限 {self.max_inflight}", self.retry_after()
+            )
+        depth = self._queue_depth()
+        if self.max_llm_queue > 0 and depth > self.max_llm_queue:
+            raise _reject(
+                503, "llm_queue", f"LLM 排队 {depth} 个，超过上限 {self.max_llm_queue}", self.retry_after()
+            )
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """准入检查通过后计入在途数，结束时释放"""
+        self.check()
+        self.inflight += 1
+        ADMISSION_INFLIGHT.set(self.inflight)
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            ADMISSION_INFLIGHT.set(self.inflight)
+
+
+admission = AdmissionController()
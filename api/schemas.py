@@ -53,6 +53,25 @@ class VisualRenderData(BaseModel):
     characters_in_shot: List[CharacterInShot] = []
     media_prompts: MediaPrompts = MediaPrompts()
 
+class VisualHandle(BaseModel):
+    """视觉数据句柄 - 回合响应先返回，视觉数据通过 poll_url 获取"""
+    turn: int
+    status: str = "pending"  # pending / ready / failed / cancelled
+    poll_url: str
+
+class VisualDataResponse(BaseModel):
+    """视觉数据查询结果"""
+    turn: int
+    status: str  # pending / ready / failed / cancelled
+    visual_data: Optional[VisualRenderData] = None
+    error: Optional[str] = None
+
+class SuggestionsResponse(BaseModel):
+    """行动建议查询结果（回合响应时尚未生成完的建议通过此接口获取）"""
+    turn: int
+    done: bool
+    suggestions: List[str] = []
+
 # ========== 响应模型 ==========
 
 class TurnResponse(BaseModel):
@@ -62,8 +81,10 @@ class TurnResponse(BaseModel):
     atmosphere: Optional[Dict[str, Any]] = None
     npc_reactions: List[NPCReaction] = []
     suggestions: List[str] = []
+    suggestions_pending: bool = False  # True 时建议仍在生成，通过 /game/suggestions 获取
     error: Optional[str] = None
-    visual_data: Optional[VisualRenderData] = None  # 视觉渲染数据
+    visual_data: Optional[VisualRenderData] = None  # 视觉渲染数据（后台生成，通常为空，见 visual_handle）
+    visual_handle: Optional[VisualHandle] = None
 
 class ActionRequest(BaseModel):
     action: str
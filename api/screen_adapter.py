@@ -5,8 +5,12 @@ Screen Adapter - Screen Agent 与 API 层的适配器
 1. 将 GameEngine 返回的数据转换为 ScreenInput
 2. 调用 Screen Agent 生成视觉数据
 3. 将结果转换为 API Schema 格式
+4. 管理各回合的后台生成任务（VisualJob）：回合响应不等待视觉数据，
+   结果按回合缓存供轮询；玩家进入下一回合时取消尚未完成的旧任务
 """
 import asyncio
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, Optional, List
@@ -15,10 +19,57 @@ from agents.online.layer3.screen_agent import ScreenAgent, ScreenInput
 from api.schemas import (
     VisualRenderData, VisualEnvironment, CharacterInShot, MediaPrompts
 )
+from config.settings import settings
 from utils.logger import setup_logger
+from utils.metrics import metrics
 
 logger = setup_logger("ScreenAdapter", "screen_adapter.log")
 
+VISUAL_JOBS = metrics.counter(
+    "storymaker_visual_jobs_total", "视觉数据后台生成任务（按结束状态）", ["status"]
+)
+
+
+class VisualJob:
+    """单个回合的视觉数据生成任务"""
+
+    def __init__(self, turn: int):
+        self.turn = turn
+        self.status = "pending"  # pending / ready / failed / cancelled
+        self.data: Optional[VisualRenderData] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        # 线程中的同步生成无法被 asyncio 取消，靠该标志在调用 Screen Agent 前放弃
+        self.cancel_event = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status != "pending"
+
+    def cancel(self) -> bool:
+        """取消尚未完成的任务，返回是否确实取消"""
+        if self.done:
+            return False
+        self._finish("cancelled")
+        self.cancel_event.set()
+        if self.task is not None:
+            self.task.cancel()
+        return True
+
+    async def wait(self, timeout: float) -> None:
+        """最多等待 timeout 秒（长轮询用，超时不影响任务本身）"""
+        if self.done or self.task is None or timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self.task), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+
+    def _finish(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        VISUAL_JOBS.inc(status=status)
+
 
 class ScreenAdapter:
     """Screen Agent 与 API 层的适配器"""
@@ -33,6 +84,8 @@ class ScreenAdapter:
         self.game_engine = game_engine
         self.screen_agent: Optional[ScreenAgent] = None
         self._initialized = False
+        # turn -> VisualJob，只保留最近 VISUAL_CACHE_TURNS 个回合
+        self._jobs: "OrderedDict[int, VisualJob]" = OrderedDict()
 
     def _ensure_initialized(self):
         """延迟初始化 Screen Agent"""
@@ -158,12 +211,17 @@ class ScreenAdapter:
                 return loc.get("name", location_id)
         return location_id
 
-    def generate_visual_data(self, turn_result: Dict[str, Any]) -> Optional[VisualRenderData]:
+    def generate_visual_data(
+        self,
+        turn_result: Dict[str, Any],
+        cancelled: Optional[threading.Event] = None,
+    ) -> Optional[VisualRenderData]:
         """
         同步生成视觉数据
 
         Args:
             turn_result: GameEngine.process_turn_async() 的返回值
+            cancelled: 已置位时在调用 Screen Agent 前放弃
 
         Returns:
             VisualRenderData 或 None
@@ -177,6 +235,10 @@ class ScreenAdapter:
             screen_input = self.build_input(turn_result)
             logger.info(f"ScreenInput 构建完成: scene_id={screen_input.scene_id}")
 
+            if cancelled is not None and cancelled.is_set():
+                logger.info(f"回合 {screen_input.turn_id} 已过期，跳过视觉生成")
+                return None
+
             # 调用 Screen Agent
             logger.info("调用 Screen Agent...")
             result = self.screen_agent.translate_to_visual(screen_input)
@@ -200,12 +262,74 @@ class ScreenAdapter:
         Returns:
             VisualRenderData 或 None
         """
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            self.generate_visual_data,
-            turn_result
-        )
+        # to_thread 会带上当前上下文（遥测会话ID、追踪），run_in_executor 不会
+        return await asyncio.to_thread(self.generate_visual_data, turn_result)
+
+    # ============================================================
+    # 后台任务（回合响应不等待视觉数据）
+    # ============================================================
+
+    def start_visual_job(self, turn_result: Dict[str, Any]) -> VisualJob:
+        """
+        为当前回合启动后台生成（需在事件循环中调用），旧回合未完成的任务一并取消
+
+        Returns:
+            VisualJob，可通过 get_visual_job(turn) 再次取得
+        """
+        turn = getattr(self.game_engine.os, "turn_count", 0)
+        self.cancel_stale(turn)
+        job = self._jobs.get(turn)
+        if job is not None and job.status in ("pending", "ready"):
+            return job
+        job = VisualJob(turn)
+        job.task = asyncio.get_running_loop().create_task(self._run_job(job, turn_result))
+        self._jobs[turn] = job
+        self._jobs.move_to_end(turn)
+        while len(self._jobs) > max(1, settings.VISUAL_CACHE_TURNS):
+            _, evicted = self._jobs.popitem(last=False)
+            evicted.cancel()
+        return job
+
+    async def _run_job(self, job: VisualJob, turn_result: Dict[str, Any]) -> None:
+        try:
+            data = await asyncio.wait_for(
+                asyncio.to_thread(self.generate_visual_data, turn_result, job.cancel_event),
+                timeout=settings.VISUAL_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            job.cancel_event.set()
+            if not job.done:
+                job._finish("failed", f"超时（{settings.VISUAL_TIMEOUT:g}s）")
+            logger.warning(f"⚠️ 回合 {job.turn} 视觉数据生成超时")
+            return
+        except Exception as e:
+            if not job.done:
+                job._finish("failed", str(e))
+            logger.error(f"回合 {job.turn} 视觉数据生成失败: {e}")
+            return
+        if job.done:  # 生成期间已被取消
+            return
+        job.data = data
+        if data is None:
+            job._finish("failed", "Screen Agent 未返回结果")
+        else:
+            job._finish("ready")
+
+    def get_visual_job(self, turn: Optional[int] = None) -> Optional[VisualJob]:
+        """按回合取任务，turn 为空时取最近一个"""
+        if turn is None:
+            return next(reversed(self._jobs.values()), None)
+        return self._jobs.get(turn)
+
+    def cancel_stale(self, current_turn: Optional[int] = None) -> int:
+        """取消早于 current_turn 的未完成任务（为空时取消全部），返回取消数量"""
+        count = 0
+        for turn, job in list(self._jobs.items()):
+            if (current_turn is None or turn < current_turn) and job.cancel():
+                count += 1
+        if count:
+            logger.info(f"玩家已进入新回合，取消 {count} 个未完成的视觉生成")
+        return count
 
     def _convert_to_schema(self, raw_result: Any) -> Optional[VisualRenderData]:
         """
@@ -8,28 +8,58 @@ if not hasattr(langchain, 'llm_cache'):
     langchain.llm_cache = None
 
 import asyncio
+import time
 import uuid
 import uvicorn
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-from fastapi import FastAPI, HTTPException, Query, Header
+from fastapi import FastAPI, HTTPException, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pathlib import Path
 from typing import Optional, Dict
 from threading import Lock
 import json
 
 from game_engine import GameEngine
-from api.schemas import GameInitRequest, GameStateResponse, TurnResponse, ActionRequest, NPCReaction, HistoryEntry
+from api.admission import SessionTurnGate, admission
+from api.schemas import (
+    GameInitRequest, GameStateResponse, TurnResponse, ActionRequest, NPCReaction, HistoryEntry,
+    SuggestionsResponse, VisualDataResponse, VisualHandle,
+)
 from api.screen_adapter import ScreenAdapter
 from config.settings import settings
 from initial_Illuminati import IlluminatiInitializer
+from utils.database import mirror_queue_depth
 from utils.history_store import HistoryStore
-from utils.logger import setup_logger
+from utils.llm_telemetry import telemetry_context
+from utils.logger import get_log_queue_depth, setup_logger
+from utils.loop_monitor import LoopBlockMonitor
+from utils.metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, metrics
 from utils.progress_tracker import ProgressTracker
+from utils.tracing import (
+    TRACE_HEADER,
+    TRACE_ID_HEADER,
+    maybe_trace,
+    parse_trace_header,
+    span,
+    trace_store,
+)
 
-app = FastAPI(title="AAA-StoryMaker API")
 logger = setup_logger("ApiServer", "api_server.log")
+loop_monitor = LoopBlockMonitor()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """服务启动时开始监测事件循环（延迟指标 + 卡顿时记录调用栈）"""
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
+
+
+app = FastAPI(title="AAA-StoryMaker API", lifespan=lifespan)
 
 # Allow CORS for frontend
 app.add_middleware(
@@ -41,6 +71,36 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """按路由模板（而非实际路径）记录请求耗时，避免会话ID等路径参数撑爆标签"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        )
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """按 TRACE_SAMPLE_RATE 采样或 X-Trace 请求头追踪单个请求，响应头带回 X-Trace-Id"""
+    force = parse_trace_header(request.headers.get(TRACE_HEADER))
+    with maybe_trace(f"{request.method} {request.url.path}", force=force) as trace:
+        response = await call_next(request)
+    if trace is not None:
+        response.headers[TRACE_ID_HEADER] = trace.trace_id
+    return response
+
+
 # ============================================================
 # 会话管理器 - 支持多用户
 # ============================================================
@@ -54,6 +114,8 @@ class GameSession:
         self.runtime_dir = runtime_dir
         self.created_at = datetime.now()
         self.last_active = datetime.now()
+        # 同一会话的回合串行执行（GameEngine 不支持并发回合）
+        self.turn_gate = SessionTurnGate()
     
     def touch(self):
         """更新最后活跃时间"""
@@ -74,11 +136,12 @@ class SessionManager:
     - 线程安全
     """
     
-    def __init__(self, max_sessions: int = 100, session_timeout_minutes: int = 60):
+    def __init__(self, max_sessions: int = 100, session_timeout_minutes: int = 60, idle_minutes: int = 5):
         self._sessions: Dict[str, GameSession] = {}
         self._lock = Lock()
         self.max_sessions = max_sessions
         self.session_timeout_minutes = session_timeout_minutes
+        self.idle_minutes = idle_minutes
     
     def create_session(self, engine: GameEngine, screen_adapter: ScreenAdapter, runtime_dir: Path) -> str:
         """创建新会话，返回会话ID"""
@@ -129,16 +192,43 @@ class SessionManager:
     def get_stats(self) -> Dict:
         """获取会话统计"""
         with self._lock:
+            idle = sum(1 for s in self._sessions.values() if s.is_expired(self.idle_minutes))
             return {
                 "active_sessions": len(self._sessions),
+                "idle_sessions": idle,
                 "max_sessions": self.max_sessions,
-                "timeout_minutes": self.session_timeout_minutes
+                "timeout_minutes": self.session_timeout_minutes,
+                "busy_sessions": sum(1 for s in self._sessions.values() if s.turn_gate.busy),
+                "inflight_requests": admission.inflight,
             }
 
 
 # 全局会话管理器
 session_manager = SessionManager()
 
+
+# ============================================================
+# 指标采集（/metrics 抓取时调用）
+# ============================================================
+
+SESSIONS_GAUGE = metrics.gauge(
+    "storymaker_sessions", "会话数（idle 为超过 idle_minutes 未活动、尚未过期的会话）", ["state"]
+)
+PERSISTENCE_QUEUE_GAUGE = metrics.gauge(
+    "storymaker_persistence_queue_depth", "后台写入队列中待处理的条目数", ["queue"]
+)
+
+
+def _collect_server_metrics() -> None:
+    stats = session_manager.get_stats()
+    SESSIONS_GAUGE.set(stats["active_sessions"] - stats["idle_sessions"], state="active")
+    SESSIONS_GAUGE.set(stats["idle_sessions"], state="idle")
+    PERSISTENCE_QUEUE_GAUGE.set(mirror_queue_depth(), queue="json_mirror")
+    PERSISTENCE_QUEUE_GAUGE.set(get_log_queue_depth(), queue="log")
+
+
+metrics.register_collector(_collect_server_metrics)
+
 # 兼容旧API：保留默认会话（用于无session_id的请求）
 default_session_id: Optional[str] = None
 
@@ -282,74 +372,87 @@ async def init_game(request: GameInitRequest):
         else:
             raise HTTPException(status_code=404, detail="Save file not found")
     
-    # Mode 2: Create New
-    else:
-        logger.info(f"Creating new runtime for {world_name}...")
+    # 开局同样包含多次 LLM 调用，过载时与回合一样走准入控制
+    async with admission.admit():
+        # Mode 2: Create New
+        if target_runtime is None:
+            logger.info(f"Creating new runtime for {world_name}...")
+            try:
+                # 初始化器包含多次同步 LLM 调用与文件写入，放到线程池执行，不阻塞其他会话
+                target_runtime = await asyncio.to_thread(_create_runtime, world_name, request.player_name)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to create new game: {str(e)}")
+
+        # Initialize Engine
         try:
-            initializer = IlluminatiInitializer(world_name, player_profile={"name": request.player_name})
-            target_runtime = initializer.run()
-            
-            # Save genesis
-            with open(target_runtime / "genesis.json", "w", encoding="utf-8") as f:
-                json.dump(initializer.genesis_data, f, ensure_ascii=False, indent=2)
+            response = await asyncio.to_thread(_start_session, target_runtime, is_new_runtime)
+            default_session_id = response.session_id
+            logger.info(f"Game initialized: session={response.session_id}, world={world_name}")
+            return response
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to create new game: {str(e)}")
+            logger.error(f"Failed to initialize game: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
 
-    # Initialize Engine
-    try:
-        # Load engine
-        engine = GameEngine(target_runtime / "genesis.json", async_mode=True)
 
-        # Initialize Screen Adapter for visual generation
-        adapter = ScreenAdapter(engine)
+def _create_runtime(world_name: str, player_name: str) -> Path:
+    """创建新的运行时目录并写入 genesis.json（同步，在线程池中调用）"""
+    initializer = IlluminatiInitializer(world_name, player_profile={"name": player_name})
+    target_runtime = initializer.run()
+
+    # Save genesis
+    with open(target_runtime / "genesis.json", "w", encoding="utf-8") as f:
+        json.dump(initializer.genesis_data, f, ensure_ascii=False, indent=2)
+    return target_runtime
+
+
+def _start_session(target_runtime: Path, is_new_runtime: bool) -> GameInitResponse:
+    """加载引擎、创建会话并生成开场（同步，在线程池中调用）"""
+    # Load engine
+    engine = GameEngine(target_runtime / "genesis.json", async_mode=True, prefetch_suggestions=True)
+
+    # Initialize Screen Adapter for visual generation
+    adapter = ScreenAdapter(engine)
+
+    # 创建会话
+    session_id = session_manager.create_session(engine, adapter, target_runtime)
+
+    opening_text = None
+
+    # Check if it's a fresh game (Turn 0)
+    if engine.os.turn_count == 0:
+        opening_text = engine.start_game()
+
+    status = engine.get_game_status()
+    suggestions = engine.generate_action_suggestions()
+
+    response = GameInitResponse(
+        session_id=session_id,
+        turn=status['turn'],
+        location=str(status['location']),
+        time=status['time'],
+        text=opening_text or f"Loaded save: {target_runtime.name}",
+        bgm_url=None,
+        suggestions=suggestions
+    )
+
+    if opening_text and is_new_runtime:
+        try:
+            history_store = HistoryStore(target_runtime)
+            if not history_store.has_entries():
+                history_store.append_entries([
+                    history_store.build_entry(
+                        turn=0,
+                        seq=0,
+                        role="system",
+                        speaker_name="System",
+                        content=opening_text,
+                        meta={"event": "game_start"}
+                    )
+                ])
+        except Exception as e:
+            logger.warning(f"Failed to persist opening history: {e}")
+    return response
 
-        # 创建会话
-        session_id = session_manager.create_session(engine, adapter, target_runtime)
-        
-        # 设置为默认会话（向后兼容）
-        default_session_id = session_id
-
-        opening_text = None
-
-        # Check if it's a fresh game (Turn 0)
-        if engine.os.turn_count == 0:
-            opening_text = engine.start_game()
-
-        status = engine.get_game_status()
-        suggestions = engine.generate_action_suggestions()
-
-        response = GameInitResponse(
-            session_id=session_id,
-            turn=status['turn'],
-            location=str(status['location']),
-            time=status['time'],
-            text=opening_text or f"Loaded save: {target_runtime.name}",
-            bgm_url=None,
-            suggestions=suggestions
-        )
-        
-        if opening_text and is_new_runtime:
-            try:
-                history_store = HistoryStore(target_runtime)
-                if not history_store.has_entries():
-                    history_store.append_entries([
-                        history_store.build_entry(
-                            turn=0,
-                            seq=0,
-                            role="system",
-                            speaker_name="System",
-                            content=opening_text,
-                            meta={"event": "game_start"}
-                        )
-                    ])
-            except Exception as e:
-                logger.warning(f"Failed to persist opening history: {e}")
-        
-        logger.info(f"Game initialized: session={session_id}, world={world_name}")
-        return response
-    except Exception as e:
-        logger.error(f"Failed to initialize game: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
 
 class ActionRequestWithSession(ActionRequest):
     """带会话ID的行动请求"""
@@ -364,84 +467,152 @@ async def player_action(request: ActionRequestWithSession):
     Args:
         request.action: 玩家行动文本
         request.session_id: 会话ID（可选，不提供则使用默认会话）
+
+    过载保护：同一会话的回合串行（忙时排队或 409）；全局过载时 429/503 + Retry-After
     """
     try:
         session = _get_session(request.session_id)
-        engine = session.engine
-        screen_adapter = session.screen_adapter
-
-        # Use Async method!
-        result = await engine.process_turn_async(request.action)
-
-        # 并行执行: suggestions 生成 + 视觉数据生成
-        visual_task = None
-        if screen_adapter and result.get("success"):
-            visual_task = asyncio.create_task(
-                screen_adapter.async_generate_visual_data(result)
-            )
-
-        suggestions = engine.generate_action_suggestions()
-
-        # 等待视觉数据（100秒超时，LLM调用可能较慢）
-        visual_data = None
-        if visual_task:
-            try:
-                visual_data = await asyncio.wait_for(visual_task, timeout=100.0)
-            except asyncio.TimeoutError:
-                logger.warning("⚠️ 视觉数据生成超时，跳过")
-
-        # 构建 NPC 反应列表
-        npc_reactions = []
-        if result.get("npc_reactions"):
-            for item in result["npc_reactions"]:
-                npc = item["npc"]
-                reaction = item["reaction"]
-                npc_reactions.append(NPCReaction(
-                    character_name=npc.character_name,
-                    dialogue=reaction.get("dialogue"),
-                    action=reaction.get("action"),
-                    emotion=reaction.get("emotion")
-                ))
-
-        response = TurnResponse(
-            success=result["success"],
-            text=result["text"],
-            script=result.get("script", {}),
-            atmosphere=result.get("atmosphere"),
-            npc_reactions=npc_reactions,
-            suggestions=suggestions,
-            error=result.get("error"),
-            visual_data=visual_data
-        )
-        
-        try:
-            history_store = _get_history_store(session)
-            if history_store and result.get("success"):
-                history_store.append_turn(
-                    turn_id=getattr(engine.os, "turn_count", None),
-                    player_action=request.action,
-                    npc_reactions=[
-                        {
-                            "character_name": r.character_name,
-                            "dialogue": r.dialogue,
-                            "action": r.action,
-                            "emotion": r.emotion,
-                        }
-                        for r in npc_reactions
-                    ],
-                    narration=_extract_narration(result.get("text", "")),
-                    meta={"mode": result.get("mode")}
+        # 先做一次准入检查，避免注定被拒的请求还在会话锁上排队
+        admission.check()
+        # 本请求内的 LLM 调用都以会话ID归因（遥测）
+        async with session.turn_gate.hold(), admission.admit():
+            with telemetry_context(session_id=session.session_id):
+                engine = session.engine
+                screen_adapter = session.screen_adapter
+
+                # 玩家已进入新回合，上一回合还没生成完的视觉数据不再需要
+                if screen_adapter:
+                    screen_adapter.cancel_stale()
+
+                # Use Async method!
+                result = await engine.process_turn_async(request.action)
+
+                # 视觉数据在后台生成，响应只带句柄，前端通过 /game/visual 获取
+                visual_handle = None
+                if screen_adapter and result.get("success"):
+                    job = screen_adapter.start_visual_job(result)
+                    visual_handle = VisualHandle(
+                        turn=job.turn,
+                        status=job.status,
+                        poll_url=f"/game/visual?session_id={session.session_id}&turn={job.turn}",
+                    )
+
+                # 行动建议在回合收尾时已开始后台生成：生成完则随响应返回，
+                # 否则前端通过 /game/suggestions（或 /stream）单独获取，不等待
+                suggestions, suggestions_pending = [], False
+                if result.get("success"):
+                    suggestion_job = engine.prefetch_action_suggestions()
+                    if suggestion_job is not None:
+                        suggestions = list(suggestion_job.items) if suggestion_job.done else []
+                        suggestions_pending = not suggestion_job.done
+
+                # 构建 NPC 反应列表
+                npc_reactions = []
+                if result.get("npc_reactions"):
+                    for item in result["npc_reactions"]:
+                        npc = item["npc"]
+                        reaction = item["reaction"]
+                        npc_reactions.append(NPCReaction(
+                            character_name=npc.character_name,
+                            dialogue=reaction.get("dialogue"),
+                            action=reaction.get("action"),
+                            emotion=reaction.get("emotion")
+                        ))
+
+                response = TurnResponse(
+                    success=result["success"],
+                    text=result["text"],
+                    script=result.get("script", {}),
+                    atmosphere=result.get("atmosphere"),
+                    npc_reactions=npc_reactions,
+                    suggestions=suggestions,
+                    suggestions_pending=suggestions_pending,
+                    error=result.get("error"),
+                    visual_handle=visual_handle
                 )
-        except Exception as e:
-            logger.warning(f"Failed to persist history: {e}")
         
-        return response
+                try:
+                    history_store = _get_history_store(session)
+                    if history_store and result.get("success"):
+                        with span("history.append"):
+                            await asyncio.to_thread(
+                                history_store.append_turn,
+                                turn_id=getattr(engine.os, "turn_count", None),
+                                player_action=request.action,
+                                npc_reactions=[
+                                    {
+                                        "character_name": r.character_name,
+                                        "dialogue": r.dialogue,
+                                        "action": r.action,
+                                        "emotion": r.emotion,
+                                    }
+                                    for r in npc_reactions
+                                ],
+                                narration=_extract_narration(result.get("text", "")),
+                                meta={"mode": result.get("mode")}
+                            )
+                except Exception as e:
+                    logger.warning(f"Failed to persist history: {e}")
+        
+                return response
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Action failed: {e}")
         return TurnResponse(success=False, text=str(e), script={}, error=str(e))
 
+@app.get("/game/visual", response_model=VisualDataResponse)
+async def get_visual_data(
+    session_id: Optional[str] = Query(None, description="会话ID"),
+    turn: Optional[int] = Query(None, description="回合号，不填取最近一回合"),
+    wait: float = Query(0, ge=0, le=30, description="未完成时最多等待的秒数（长轮询）"),
+):
+    """获取回合的视觉数据（/game/action 响应中的 visual_handle.poll_url）"""
+    session = _get_session(session_id)
+    job = session.screen_adapter.get_visual_job(turn) if session.screen_adapter else None
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Visual data not found for turn: {turn}")
+    await job.wait(wait)
+    return VisualDataResponse(turn=job.turn, status=job.status, visual_data=job.data, error=job.error)
+
+
+def _get_suggestion_job(session: GameSession, turn: Optional[int]):
+    job = session.engine.action_suggester.get(turn)
+    if job is None and (turn is None or turn == session.engine.os.turn_count):
+        job = session.engine.prefetch_action_suggestions()
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Suggestions not found for turn: {turn}")
+    return job
+
+
+@app.get("/game/suggestions", response_model=SuggestionsResponse)
+async def get_suggestions(
+    session_id: Optional[str] = Query(None, description="会话ID"),
+    turn: Optional[int] = Query(None, description="回合号，不填取当前回合"),
+    wait: float = Query(0, ge=0, le=30, description="未完成时最多等待的秒数（长轮询）"),
+):
+    """获取回合的行动建议"""
+    job = _get_suggestion_job(_get_session(session_id), turn)
+    suggestions = await job.wait(wait)
+    return SuggestionsResponse(turn=job.turn, done=job.done, suggestions=suggestions)
+
+
+@app.get("/game/suggestions/stream")
+async def stream_suggestions(
+    session_id: Optional[str] = Query(None, description="会话ID"),
+    turn: Optional[int] = Query(None, description="回合号，不填取当前回合"),
+):
+    """以 Server-Sent Events 逐条推送行动建议（event: suggestion，结束时 event: done）"""
+    job = _get_suggestion_job(_get_session(session_id), turn)
+
+    async def events():
+        async for item in job.stream():
+            yield f"event: suggestion\ndata: {json.dumps({'turn': job.turn, 'text': item}, ensure_ascii=False)}\n\n"
+        yield f"event: done\ndata: {json.dumps({'turn': job.turn, 'suggestions': job.items}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @app.get("/game/state")
 def get_state(session_id: Optional[str] = Query(None, description="会话ID")):
     """
@@ -489,6 +660,36 @@ def get_sessions_stats():
     return session_manager.get_stats()
 
 
+@app.get("/traces")
+def list_traces():
+    """最近的追踪（内存中保留 TRACE_KEEP 条）"""
+    return [
+        {
+            "trace_id": trace.trace_id,
+            "name": trace.name,
+            "started_at": trace.started_at,
+            "duration_ms": trace.duration_ms,
+            "spans": len(trace.events),
+        }
+        for trace in trace_store.recent()
+    ]
+
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    """Chrome trace-event JSON（可直接在 chrome://tracing 或 Perfetto 中打开）"""
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace not found: {trace_id}")
+    return trace.to_chrome()
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus 文本格式的运行指标"""
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
+
 @app.delete("/game/session/{session_id}")
 def close_session(session_id: str):
     """关闭指定会话"""
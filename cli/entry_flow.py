@@ -216,6 +216,22 @@ def list_novels(reporter: OutputReporter) -> list[Path]:
     return novels
 
 
+def _report_build_estimate(reporter: OutputReporter, novel_filename: str) -> None:
+    """开始构建前给出试运行估算（失败不影响构建）"""
+    try:
+        from agents.offline.creatorGod import CreatorGod
+
+        estimate = CreatorGod().estimate(novel_filename)
+    except Exception as e:
+        reporter.detail(f"  (无法估算构建开销: {e})")
+        return
+    note = "，角色数为假设的上限估计" if estimate.assumed_cast else ""
+    reporter.info(
+        f"  预计 {estimate.total_calls} 次 LLM 调用、约 {estimate.total_prompt_tokens // 1000}k 提示词 token、"
+        f"约 {estimate.wall_seconds / 60:.0f} 分钟{note}"
+    )
+
+
 def build_world_from_novel(reporter: OutputReporter) -> bool:
     novels = list_novels(reporter)
     if not novels:
@@ -239,6 +255,7 @@ def build_world_from_novel(reporter: OutputReporter) -> bool:
 
     reporter.info("")
     reporter.info(f"  已选择: {selected.name}")
+    _report_build_estimate(reporter, selected.name)
     reporter.info("  正在构建世界，请耐心等待...")
 
     try:
@@ -55,6 +55,80 @@ class Settings:
     # 在线交互超时与重试（面向玩家的实时体验）
     ONLINE_LLM_TIMEOUT = float(os.getenv("ONLINE_LLM_TIMEOUT", "180"))
     ONLINE_LLM_MAX_RETRIES = int(os.getenv("ONLINE_LLM_MAX_RETRIES", "1"))
+    # 结构化输出：支持的提供商（OpenAI 兼容接口）请求 JSON 模式；校验失败后最多重新询问的次数
+    LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+    LLM_SCHEMA_MAX_REASKS = int(os.getenv("LLM_SCHEMA_MAX_REASKS", "1"))
+
+    # 运行时状态库分片数（按 game_id 哈希分布，1 表示沿用单一 state.db）
+    STATE_DB_SHARDS = int(os.getenv("STATE_DB_SHARDS", "16"))
+    # JSON 镜像模式：off（仅SQLite）/ sync（同步写入）/ background（后台线程写入）
+    STATE_JSON_MIRROR = os.getenv("STATE_JSON_MIRROR", "off").lower()
+    # Agent 快照关键帧间隔：每 K 条快照写一次完整快照，其余写增量（1 表示全部写完整快照）
+    STATE_SNAPSHOT_KEYFRAME_INTERVAL = int(os.getenv("STATE_SNAPSHOT_KEYFRAME_INTERVAL", "10"))
+
+    # 日志：异步队列写入（false 时回退为调用线程同步写入）
+    LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # 每个模块每秒最多放行的 DEBUG/INFO 日志条数（0 表示不限）；WARNING 及以上不受限
+    LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "50"))
+    # 按模块覆盖，如 "NPCManager=20,WorldState=5"
+    LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "")
+
+    # LLM 调用遥测：每次调用记录 token、首 token 延迟、总延迟等，写入 logs/llm_telemetry_YYYYMMDD.jsonl
+    LLM_TELEMETRY = os.getenv("LLM_TELEMETRY", "true").lower() == "true"
+    # 回合追踪：按比例采样（0~1，0 表示只追踪显式要求的请求，API 请求头 X-Trace: 1 强制开启、0 强制关闭）
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+    # 采样到的追踪导出为 Chrome trace JSON（logs/traces/），内存中另保留最近 TRACE_KEEP 条供 API 查询
+    TRACE_EXPORT = os.getenv("TRACE_EXPORT", "true").lower() == "true"
+    TRACE_KEEP = int(os.getenv("TRACE_KEEP", "50"))
+    # 事件循环卡顿超过该毫秒数时记录卡住处的调用栈（API 服务）
+    LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "50"))
+
+    # API 过载保护：同一会话同时只处理一个回合，忙时 queue（排队，最多等待 SESSION_QUEUE_TIMEOUT 秒）或 reject（立即 409）
+    SESSION_BUSY_POLICY = os.getenv("SESSION_BUSY_POLICY", "queue").lower()
+    SESSION_QUEUE_TIMEOUT = float(os.getenv("SESSION_QUEUE_TIMEOUT", "30"))
+    SESSION_MAX_QUEUED = int(os.getenv("SESSION_MAX_QUEUED", "1"))
+    # 全局准入：在途回合数超限返回 429，LLM 排队深度超限返回 503（均带 Retry-After；0 表示不限）
+    ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "32"))
+    ADMISSION_MAX_LLM_QUEUE = int(os.getenv("ADMISSION_MAX_LLM_QUEUE", "20"))
+    ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+
+    # 视觉数据在回合响应之后后台生成：单次生成超时秒数、每个会话缓存的回合数
+    VISUAL_TIMEOUT = float(os.getenv("VISUAL_TIMEOUT", "100"))
+    VISUAL_CACHE_TURNS = int(os.getenv("VISUAL_CACHE_TURNS", "8"))
+
+    # 创世组单次构建的 LLM 总预算（调用次数 / token 数，0 表示不限）
+    GENESIS_MAX_LLM_CALLS = int(os.getenv("GENESIS_MAX_LLM_CALLS", "0"))
+    GENESIS_MAX_LLM_TOKENS = int(os.getenv("GENESIS_MAX_LLM_TOKENS", "0"))
+    # 角色档案只取名字/别名提及处前后 GENESIS_MENTION_RADIUS 字作为上下文，
+    # 每次调用不超过 GENESIS_DETAIL_CONTEXT_TOKENS，单个角色最多 GENESIS_DETAIL_MAX_BATCHES 次调用
+    GENESIS_MENTION_RADIUS = int(os.getenv("GENESIS_MENTION_RADIUS", "300"))
+    GENESIS_DETAIL_CONTEXT_TOKENS = int(os.getenv("GENESIS_DETAIL_CONTEXT_TOKENS", "60000"))
+    GENESIS_DETAIL_MAX_BATCHES = int(os.getenv("GENESIS_DETAIL_MAX_BATCHES", "8"))
+    # 角色档案分级提取：重要性不低于 GENESIS_TIER_DEEP_MIN_IMPORTANCE 的角色深度提取，
+    # 不高于 GENESIS_TIER_LIGHT_MAX_IMPORTANCE 的角色只做一次精简提取（世界目录下 extraction_tiers.json 可覆盖）
+    GENESIS_TIER_DEEP_MIN_IMPORTANCE = float(os.getenv("GENESIS_TIER_DEEP_MIN_IMPORTANCE", "0.7"))
+    GENESIS_TIER_LIGHT_MAX_IMPORTANCE = float(os.getenv("GENESIS_TIER_LIGHT_MAX_IMPORTANCE", "0.3"))
+    # 精简提取的角色按共同出场的原文每 GENESIS_DETAIL_PACK_SIZE 个合并为一次调用（1 或 0 表示不合并）
+    GENESIS_DETAIL_PACK_SIZE = int(os.getenv("GENESIS_DETAIL_PACK_SIZE", "6"))
+    # 角色档案归并：多批结果去重后仍超过 GENESIS_PROFILE_TOKEN_CAP 时请模型精炼（0 表示不精炼），
+    # 单次精炼输入不超过 GENESIS_REDUCE_INPUT_TOKENS，超出时分层归并
+    GENESIS_PROFILE_TOKEN_CAP = int(os.getenv("GENESIS_PROFILE_TOKEN_CAP", "1500"))
+    GENESIS_REDUCE_INPUT_TOKENS = int(os.getenv("GENESIS_REDUCE_INPUT_TOKENS", "16000"))
+    # 创世试运行估算：没有角色表时假设的角色数
+    GENESIS_ESTIMATE_CAST = int(os.getenv("GENESIS_ESTIMATE_CAST", "30"))
+    # 创世分块：按模型上下文窗口（GENESIS_CONTEXT_TOKENS 为 0 时按模型名查表）的 GENESIS_CHUNK_FILL 比例装原文，
+    # 在章节 / 段落处断开，段落处断开时最多重叠 GENESIS_CHUNK_OVERLAP 字
+    GENESIS_CONTEXT_TOKENS = int(os.getenv("GENESIS_CONTEXT_TOKENS", "0"))
+    GENESIS_CHUNK_FILL = float(os.getenv("GENESIS_CHUNK_FILL", "0.6"))
+    GENESIS_CHUNK_OVERLAP = int(os.getenv("GENESIS_CHUNK_OVERLAP", "400"))
+    # 创世任务队列：默认 worker 进程数、每个任务的最大尝试次数、心跳间隔与判定 worker 失联的秒数；
+    # 所有 worker 共享每分钟 GENESIS_LLM_CALLS_PER_MINUTE 次 LLM 调用（0 表示不限）
+    GENESIS_QUEUE_WORKERS = int(os.getenv("GENESIS_QUEUE_WORKERS", "2"))
+    GENESIS_QUEUE_MAX_ATTEMPTS = int(os.getenv("GENESIS_QUEUE_MAX_ATTEMPTS", "3"))
+    GENESIS_QUEUE_HEARTBEAT_SECONDS = float(os.getenv("GENESIS_QUEUE_HEARTBEAT_SECONDS", "30"))
+    GENESIS_QUEUE_STALE_SECONDS = float(os.getenv("GENESIS_QUEUE_STALE_SECONDS", "300"))
+    GENESIS_LLM_CALLS_PER_MINUTE = float(os.getenv("GENESIS_LLM_CALLS_PER_MINUTE", "0"))
 
     # LangSmith 追踪配置
     LANGCHAIN_TRACING = os.getenv("LANGCHAIN_TRACING_V2", "false").lower() == "true"
@@ -66,6 +140,7 @@ class Settings:
     DATA_DIR = USER_DATA_ROOT / "data"
     NOVELS_DIR = DATA_DIR / "novels"
     GENESIS_DIR = DATA_DIR / "genesis"
+    GENESIS_QUEUE_DB = GENESIS_DIR / "queue.db"
     LOGS_DIR = USER_DATA_ROOT / "logs"
     PROMPTS_DIR = RESOURCE_ROOT / "prompts"
 
@@ -7,6 +7,7 @@ Infinite Story - 开发者控制台
 使用方法:
     python dev.py                    # 交互式菜单
     python dev.py --stage genesis    # 运行创世组
+    python dev.py --stage genesis --novel <文件> --dry-run  # 估算创世调用量与耗时
     python dev.py --stage game       # 运行游戏
     python dev.py --resume --runtime <dir>  # 续玩
 
@@ -18,7 +19,8 @@ Infinite Story - 开发者控制台
     --runtime <运行时目录>                   指定运行时目录
     --resume                                续玩模式
     --continue-build <世界名>               创世组断点续传
-    --parallel / --no-parallel             并行控制
+    --dry-run                              创世组试运行：只估算调用次数、token 与耗时
+    --parallel / --no-parallel             创世阶段 1、2 是否并行
     --concurrency <数量>                    并发数
     --verbose / --quiet                    日志控制
     --auto-test                            自动测试模式
@@ -26,6 +28,7 @@ Infinite Story - 开发者控制台
     --screen-agent / --no-screen-agent     Screen Agent 开关
     --list-worlds                          列出所有世界
     --list-novels                          列出所有小说
+    --export-state <游戏ID>                 从状态库导出JSON存档树
 """
 
 import argparse
@@ -124,23 +127,35 @@ def list_worlds(world_manager: WorldManager, detailed: bool = False):
     print()
 
 
+def export_state(game_id: str):
+    """从SQLite状态库导出某局游戏的JSON存档树"""
+    from utils.database import StateManager
+
+    try:
+        target = StateManager.export_game(game_id, shard_count=settings.STATE_DB_SHARDS)
+    except KeyError as e:
+        print(f"  [ERROR] {e.args[0]}", file=sys.stderr)
+        sys.exit(1)
+    print(f"  [OK] Exported game state to: {target}")
+
+
 def run_genesis(novel_filename: str, world_name: Optional[str] = None, parallel: bool = True):
-    """运行创世组"""
-    from run_world_builder import WorldBuilder
+    """运行创世组（已完成的工作项记录在账本中，重复运行即断点续传）"""
+    from agents.offline.creatorGod import CreatorGod
     
     print()
     print("  [GENESIS] Starting world building...")
     print(f"     Novel: {novel_filename}")
-    print(f"     Parallel mode: {'ON' if parallel else 'OFF'}")
+    print(f"     Parallel stages: {'ON' if parallel else 'OFF'}")
+    progress = ProgressTracker().load_genesis_progress(CreatorGod.ledger_path(novel_filename))
+    if progress.total:
+        print(f"     Resuming: {progress.done}/{progress.total} work items done ({progress.percent:.0f}%)")
+        for stage, counts in progress.stages.items():
+            print(f"       {stage:<16} {counts['done']}/{counts['total']}")
     print()
     
     try:
-        builder = WorldBuilder(
-            novel_filename=novel_filename,
-            world_name=world_name,
-            parallel=parallel
-        )
-        world_dir = builder.build()
+        world_dir = CreatorGod(parallel=parallel).run(novel_filename=novel_filename, world_name=world_name)
         
         print()
         print(f"  [OK] World building complete: {world_dir}")
@@ -151,6 +166,51 @@ def run_genesis(novel_filename: str, world_name: Optional[str] = None, parallel:
         return None
 
 
+def estimate_genesis(
+    novel_filename: str,
+    world_name: Optional[str] = None,
+    concurrency: int = 1,
+    parallel: bool = True,
+):
+    """创世试运行：分块、索引、构建提示词，估算调用次数、提示词 token 与耗时（不调用 LLM）"""
+    from agents.offline.creatorGod import CreatorGod
+
+    print()
+    print("  [GENESIS] Dry run (no LLM calls)...")
+    print(f"     Novel: {novel_filename}")
+    try:
+        estimate = CreatorGod(parallel=parallel).estimate(novel_filename, world_name=world_name, concurrency=concurrency)
+    except Exception as e:
+        print(f"\n  {handle_exception(e, 'Genesis dry run')}")
+        return None
+
+    cast = f"{estimate.characters} (assumed)" if estimate.assumed_cast else str(estimate.characters)
+    print(f"     Novel tokens: {estimate.novel_tokens}    Characters: {cast}")
+    print()
+    # 各阶段内的调用依次发出：阶段耗时即其调用耗时之和
+    print(f"     {'stage':<16} {'calls':>6} {'prompt tokens':>14} {'max/call':>9} {'time':>9}")
+    for name, stage in estimate.stages.items():
+        print(
+            f"     {name:<16} {stage.calls:>6} {stage.prompt_tokens:>14} {stage.max_prompt_tokens:>9} "
+            f"{stage.serial_seconds:>8.0f}s"
+        )
+        for note in stage.notes:
+            print(f"       - {note}")
+    overlap = "stage1 || stage2" if estimate.parallel_stages else "stages in sequence"
+    print(
+        f"     {'total':<16} {estimate.total_calls:>6} {estimate.total_prompt_tokens:>14} "
+        f"{'':>9} {estimate.wall_seconds:>8.0f}s  ({overlap})"
+    )
+    if concurrency > 1:
+        print(
+            f"     If calls within each stage ran {concurrency}-way parallel: "
+            f"~{estimate.projected_seconds:.0f}s (projection only; agents currently call one at a time)"
+        )
+    if not any(estimate.telemetry_samples.values()):
+        print("     (no Genesis telemetry yet, latencies use defaults)")
+    return estimate
+
+
 def run_illuminati(world_name: str, player_profile: dict = None):
     """运行光明会初始化"""
     from initial_Illuminati import IlluminatiInitializer
@@ -452,6 +512,7 @@ def parse_args(argv: List[str] = None):
     # 断点续传
     parser.add_argument("--resume", action="store_true", help="续玩模式")
     parser.add_argument("--continue-build", metavar="WORLD", help="创世组断点续传")
+    parser.add_argument("--dry-run", action="store_true", help="创世组试运行：只估算调用次数、token 与耗时")
     
     # 并行化控制
     parser.add_argument("--parallel", action="store_true", default=True, help="启用并行模式")
@@ -473,6 +534,7 @@ def parse_args(argv: List[str] = None):
     # 信息查询
     parser.add_argument("--list-worlds", action="store_true", help="列出所有世界")
     parser.add_argument("--list-novels", action="store_true", help="列出所有小说")
+    parser.add_argument("--export-state", metavar="GAME_ID", help="从状态库导出JSON存档树")
     
     return parser.parse_args(argv)
 
@@ -493,6 +555,10 @@ def main(argv: List[str] = None):
         print("[ERROR] --resume requires --runtime to specify runtime directory", file=sys.stderr)
         sys.exit(1)
     
+    if args.dry_run and args.stage != "genesis":
+        print("[ERROR] --dry-run is only for --stage genesis", file=sys.stderr)
+        sys.exit(1)
+    
     if args.continue_build and args.stage != "genesis":
         print("[ERROR] --continue-build is only for --stage genesis", file=sys.stderr)
         sys.exit(1)
@@ -510,6 +576,10 @@ def main(argv: List[str] = None):
         list_novels()
         return
     
+    if args.export_state:
+        export_state(args.export_state)
+        return
+    
     # 无参数时进入交互模式
     if not args.stage and not args.resume:
         interactive_mode()
@@ -521,7 +591,10 @@ def main(argv: List[str] = None):
             print("[ERROR] Genesis requires --novel or --continue-build", file=sys.stderr)
             sys.exit(1)
         
-        if args.continue_build:
+        if args.dry_run:
+            estimate_genesis(args.novel or f"{args.continue_build}.txt", args.world or args.continue_build,
+                             args.concurrency, args.parallel)
+        elif args.continue_build:
             run_genesis(f"{args.continue_build}.txt", args.continue_build, args.parallel)
         else:
             run_genesis(args.novel, args.world, args.parallel)
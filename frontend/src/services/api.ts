@@ -53,6 +53,25 @@ export interface VisualRenderData {
   media_prompts: MediaPrompts;
 }
 
+export interface VisualHandle {
+  turn: number;
+  status: 'pending' | 'ready' | 'failed' | 'cancelled';
+  poll_url: string;
+}
+
+export interface VisualDataResponse {
+  turn: number;
+  status: VisualHandle['status'];
+  visual_data?: VisualRenderData;
+  error?: string;
+}
+
+export interface SuggestionsResponse {
+  turn: number;
+  done: boolean;
+  suggestions: string[];
+}
+
 // ========== 响应类型 ==========
 
 export interface TurnResponse {
@@ -62,8 +81,10 @@ export interface TurnResponse {
   atmosphere?: any;
   npc_reactions: NPCReaction[];
   suggestions: string[];
+  suggestions_pending?: boolean;  // 建议仍在生成，通过 getSuggestions 获取
   error?: string;
   visual_data?: VisualRenderData;
+  visual_handle?: VisualHandle;  // 视觉数据后台生成，通过 getVisual 获取
 }
 
 export interface HistoryEntry {
@@ -109,6 +130,18 @@ export const gameApi = {
     return res.data;
   },
 
+  // 长轮询：未完成时服务端最多等待 wait 秒
+  getVisual: async (handle: VisualHandle, wait = 20) => {
+    const res = await api.get<VisualDataResponse>(handle.poll_url, { params: { wait } });
+    return res.data;
+  },
+
+  // 长轮询当前回合的行动建议（流式推送见 /game/suggestions/stream）
+  getSuggestions: async (wait = 20) => {
+    const res = await api.get<SuggestionsResponse>('/game/suggestions', { params: { wait } });
+    return res.data;
+  },
+
   getState: async () => {
     const res = await api.get<GameState>('/game/state');
     return res.data;
@@ -34,7 +34,7 @@ interface GameStore {
   loadHistory: () => Promise<void>;
 }
 
-export const useGameStore = create<GameStore>((set) => ({
+export const useGameStore = create<GameStore>((set, get) => ({
   isStarted: false,
   currentTurn: 0,
   location: "Unknown",
@@ -83,6 +83,37 @@ export const useGameStore = create<GameStore>((set) => ({
           currentTurn: state.currentTurn + 1,
           isLoading: false
         }));
+        // 行动建议后台生成，未随响应返回时单独获取
+        if (res.suggestions_pending) {
+          const turnAtAction = get().currentTurn;
+          gameApi.getSuggestions()
+            .then((pending) => {
+              if (get().currentTurn === turnAtAction) {
+                set({ suggestions: pending.suggestions });
+              }
+            })
+            .catch(() => {
+              // 建议获取失败不影响游戏流程
+            });
+        }
+        // 视觉数据后台生成，取回后若玩家仍停留在该回合才显示
+        if (res.visual_handle) {
+          const handle = res.visual_handle;
+          const turnAtAction = get().currentTurn;
+          (async () => {
+            try {
+              let visual = await gameApi.getVisual(handle);
+              while (visual.status === 'pending' && get().currentTurn === turnAtAction) {
+                visual = await gameApi.getVisual(handle);
+              }
+              if (visual.status === 'ready' && get().currentTurn === turnAtAction) {
+                set({ visualData: visual.visual_data || null });
+              }
+            } catch {
+              // 视觉数据失败不影响游戏流程
+            }
+          })();
+        }
         // Background refresh state
         const state = await gameApi.getState();
         const history = await gameApi.getHistory();
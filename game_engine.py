@@ -4,11 +4,15 @@
 """
 import asyncio
 import json
+import time
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 from uuid import uuid4
 from config.settings import settings
+from utils.llm_telemetry import current_session_id, telemetry_context
 from utils.logger import setup_logger
+from utils.metrics import TURN_SECONDS
+from utils.tracing import maybe_trace, span, trace_awaitable
 from utils.database import StateManager
 from utils.world_state_sync import WorldStateSync
 from agents.online.layer1.os_agent import OperatingSystem
@@ -23,6 +27,7 @@ from agents.message_protocol import AgentRole
 from utils.memory_manager import MemoryManager
 from agents.online.layer1.conductor import Conductor, TurnMode, TurnDecision
 from utils.in_act_accumulator import InActAccumulator
+from utils.action_suggestions import FALLBACK_SUGGESTIONS, ActionSuggester, SuggestionJob
 
 logger = setup_logger("GameEngine", "game_engine.log")
 
@@ -39,6 +44,7 @@ class GameEngine:
         async_mode: bool = True,
         enable_logic_check: bool = False,  # Logic验证开关，默认关闭
         enable_vibe: bool = False,  # Vibe氛围开关，默认关闭
+        prefetch_suggestions: bool = False,  # 回合结束即后台生成行动建议（API 使用，CLI 不读取建议）
     ):
         """
         初始化游戏引擎
@@ -48,6 +54,7 @@ class GameEngine:
             async_mode: 是否启用异步模式
             enable_logic_check: 是否启用Logic输入验证（默认关闭以提升速度）
             enable_vibe: 是否启用Vibe氛围描写（默认关闭以提升速度）
+            prefetch_suggestions: 回合结束时是否在后台预生成行动建议
         """
         logger.info("=" * 60)
         logger.info("🎮 初始化游戏引擎...")
@@ -58,12 +65,16 @@ class GameEngine:
         self.async_mode = async_mode
         self.enable_logic_check = enable_logic_check
         self.enable_vibe = enable_vibe
+        self.prefetch_suggestions = prefetch_suggestions
 
         self.game_id = uuid4().hex
         self.state_manager = StateManager(
             game_id=self.game_id,
             game_name=self.os.genesis_data.get("world", {}).get("title", "未知世界"),
-            genesis_path=str(genesis_path)
+            genesis_path=str(genesis_path),
+            shard_count=settings.STATE_DB_SHARDS,
+            json_mirror=settings.STATE_JSON_MIRROR,
+            keyframe_interval=settings.STATE_SNAPSHOT_KEYFRAME_INTERVAL,
         )
 
         # 初始化逻辑审查官Logic（可选）
@@ -90,6 +101,9 @@ class GameEngine:
         # 后台IO任务队列
         self._pending_io_tasks: List[asyncio.Task] = []
 
+        # 行动建议（按回合缓存，回合收尾时后台生成）
+        self.action_suggester = ActionSuggester()
+
         # 初始化NPC管理器
         self.npc_manager = NPCManager(self.os.genesis_data)
 
@@ -489,11 +503,19 @@ class GameEngine:
         - PLOT_ADVANCE: 剧情推进，完整处理（~3-5秒）
         - ACT_TRANSITION: 幕转换，同步所有状态
         """
+        # 未由调用方（如 API 会话）指定时，以 game_id 作为遥测会话ID
+        with telemetry_context(session_id=current_session_id() or self.game_id):
+            with maybe_trace("turn", game_id=self.game_id, turn=self.os.turn_count + 1):
+                return await self._process_turn_async(player_input)
+
+    async def _process_turn_async(self, player_input: str) -> Dict[str, Any]:
+        """process_turn_async 的实现"""
         logger.info("=" * 60)
         logger.info(f"🎮 [async] 处理回合 #{self.os.turn_count + 1}")
         logger.info(f"玩家输入: {player_input[:50]}...")
 
         current_turn = self.os.turn_count + 1
+        started = time.perf_counter()
 
         try:
             # 清理已完成的后台IO任务
@@ -507,7 +529,8 @@ class GameEngine:
                 "npc_states": self.npc_manager.get_state_snapshot() if hasattr(self.npc_manager, 'get_state_snapshot') else {},
                 "recent_dialogue": self.dialogue_history[-6:] if self.dialogue_history else []
             }
-            decision = self.conductor.decide_turn_mode(player_input, game_context)
+            with span("conductor.decide_turn_mode"):
+                decision = self.conductor.decide_turn_mode(player_input, game_context)
             turn_mode = decision.mode
 
             logger.info(f"📍 回合模式: {turn_mode.value} (Layer {decision.decision_layer})")
@@ -515,16 +538,17 @@ class GameEngine:
                 logger.info(f"   原因: {decision.should_advance_reason}")
             logger.info("=" * 60)
 
-            # Step 2: 根据模式分流处理
-            if turn_mode == TurnMode.DIALOGUE:
-                # 快速路径：仅NPC响应
-                result = await self._process_dialogue_turn_fast(player_input, decision)
-            elif turn_mode == TurnMode.ACT_TRANSITION:
-                # 幕转换：完整同步 + 切换幕
-                result = await self._process_act_transition_turn(player_input, decision)
-            else:
-                # 剧情推进：完整处理
-                result = await self._process_plot_advance_turn(player_input, decision)
+            # Step 2: 根据模式分流处理（LLM 遥测按回合模式归类）
+            with telemetry_context(turn_mode=turn_mode.value), span(f"turn.{turn_mode.value}"):
+                if turn_mode == TurnMode.DIALOGUE:
+                    # 快速路径：仅NPC响应
+                    result = await self._process_dialogue_turn_fast(player_input, decision)
+                elif turn_mode == TurnMode.ACT_TRANSITION:
+                    # 幕转换：完整同步 + 切换幕
+                    result = await self._process_act_transition_turn(player_input, decision)
+                else:
+                    # 剧情推进：完整处理
+                    result = await self._process_plot_advance_turn(player_input, decision)
 
             # Step 3: 更新Conductor状态
             self.conductor.on_turn_complete(turn_mode, player_input, self.player_location)
@@ -538,13 +562,19 @@ class GameEngine:
                 }
                 asyncio.create_task(self.conductor.async_predict_next_turn(turn_result))
 
-            # Step 5: 持久化数据（同步执行，避免SQLite线程问题）
+            # Step 5: 行动建议与持久化同时进行（建议在后台生成，API 单独推送给前端）
+            if result.get("success") and self.prefetch_suggestions:
+                self.prefetch_action_suggestions()
+
+            # Step 6: 持久化数据（在线程池中执行，SQLite 连接由 SQLiteStore 加锁串行化）
             if result.get("success"):
                 try:
-                    self._persist_turn_data_sync(result, turn_mode, current_turn)
+                    with span("persist_turn_data"):
+                        await asyncio.to_thread(self._persist_turn_data_sync, result, turn_mode, current_turn)
                 except Exception as e:
                     logger.warning(f"⚠️ 数据持久化失败: {e}")
 
+            TURN_SECONDS.observe(time.perf_counter() - started, mode=turn_mode.value)
             return result
 
         except Exception as e:
@@ -598,20 +628,22 @@ class GameEngine:
         if len(npcs_to_respond) >= 2:
             # 多NPC场景：使用场景演绎模式（单次LLM调用）
             logger.info(f"🎭 场景演绎模式: {len(npcs_to_respond)}个NPC协调响应")
-            npc_reactions = await self._narrate_multi_npc_scene(
-                player_input=player_input,
-                npcs=npcs_to_respond,
-                scene_context=scene_context
-            )
+            with span("narrator.scene", npcs=len(npcs_to_respond)):
+                npc_reactions = await self._narrate_multi_npc_scene(
+                    player_input=player_input,
+                    npcs=npcs_to_respond,
+                    scene_context=scene_context
+                )
         elif len(npcs_to_respond) == 1:
             # 单NPC：直接调用
             npc = npcs_to_respond[0]
             logger.info(f"🎭 单NPC响应: {npc.character_name}")
-            reaction = await npc.async_react(
-                player_input=player_input,
-                scene_context=scene_context,
-                director_instruction=None
-            )
+            with span("npc.react", npc=npc.character_id):
+                reaction = await npc.async_react(
+                    player_input=player_input,
+                    scene_context=scene_context,
+                    director_instruction=None
+                )
             npc_reactions.append({
                 "npc": npc,
                 "reaction": reaction,
@@ -724,7 +756,9 @@ class GameEngine:
             )
 
             validation_result, world_update, script = await asyncio.gather(
-                logic_task, ws_task, plot_task
+                trace_awaitable("logic.validate", logic_task),
+                trace_awaitable("ws.update", ws_task),
+                trace_awaitable("plot.scene_script", plot_task),
             )
 
             # 检查Logic验证结果
@@ -754,7 +788,10 @@ class GameEngine:
                 triggered_events=triggered_events_for_plot
             )
 
-            world_update, script = await asyncio.gather(ws_task, plot_task)
+            world_update, script = await asyncio.gather(
+                trace_awaitable("ws.update", ws_task),
+                trace_awaitable("plot.scene_script", plot_task),
+            )
 
         logger.info("✅ 世界状态 + 剧情决策完成")
 
@@ -889,7 +926,10 @@ class GameEngine:
         npc_reactions: List[Dict[str, Any]] = []
 
         if all_tasks:
-            results = await asyncio.gather(*all_tasks, return_exceptions=True)
+            results = await asyncio.gather(
+                *(trace_awaitable(f"content.{label_type}", task) for task, (label_type, _) in zip(all_tasks, task_labels)),
+                return_exceptions=True,
+            )
             for (label_type, label_data), res in zip(task_labels, results):
                 if isinstance(res, Exception):
                     if label_type == "vibe":
@@ -1047,7 +1087,8 @@ class GameEngine:
 
         # 同步幕内累积状态到WS
         logger.info("📤 同步幕内累积状态...")
-        sync_result = self.in_act_accumulator.flush_to_world_state(self.world_state)
+        with span("accumulator.flush"):
+            sync_result = self.in_act_accumulator.flush_to_world_state(self.world_state)
         logger.info(f"   - 时间同步: {sync_result.get('time_synced')}")
         logger.info(f"   - NPC同步: {sync_result.get('npc_synced')}个")
 
@@ -1085,7 +1126,8 @@ class GameEngine:
                 
                 if present_npcs:
                     logger.info(f"📝 为 {len(present_npcs)} 个NPC生成幕级指令...")
-                    await self.conductor.generate_npc_act_briefings(present_npcs)
+                    with span("conductor.npc_briefings", npcs=len(present_npcs)):
+                        await self.conductor.generate_npc_act_briefings(present_npcs)
             except Exception as e:
                 logger.warning(f"⚠️ 生成NPC幕级指令失败: {e}")
 
@@ -1120,7 +1162,7 @@ class GameEngine:
         turn_number: int
     ):
         """
-        同步持久化回合数据（避免SQLite线程安全问题）
+        持久化回合数据（同步实现，异步回合中经 asyncio.to_thread 调用）
         """
         # 只在非DIALOGUE模式下记录完整数据
         if turn_mode != TurnMode.DIALOGUE:
@@ -1513,22 +1555,18 @@ class GameEngine:
             self.npc_manager.load_state_snapshot(npc_snapshot)
 
     def _bootstrap_character_cards(self):
-        """将Genesis中的角色卡导入数据库系统"""
+        """将Genesis中的角色卡导入数据库系统（同一世界版本的卡组只存一份）"""
         characters = self.os.genesis_data.get("characters", [])
-        for char in characters:
-            char_id = char.get("id")
-            if not char_id:
-                continue
-            try:
-                self.state_manager.record_character_card(
-                    character_id=char_id,
-                    version=1,
-                    card_data=char,
-                    changes=None,
-                    changed_by="genesis_import"
-                )
-            except Exception as exc:
-                logger.warning(f"⚠️ 记录角色卡失败: {char_id} - {exc}")
+        world_title = self.os.genesis_data.get("world", {}).get("title", "")
+        try:
+            if self.state_manager.bootstrap_character_cards(
+                characters, world_key=world_title, source=self.state_manager.genesis_path
+            ):
+                logger.info(f"🗂️ 已导入新的角色卡组: {len(characters)} 张")
+            else:
+                logger.debug("角色卡组未变化，复用已有记录")
+        except Exception as exc:
+            logger.warning(f"⚠️ 记录角色卡失败: {exc}")
 
     def _record_turn_summary(
         self,
@@ -1550,13 +1588,15 @@ class GameEngine:
                 "npc_reactions": self._serialize_reactions(npc_reactions),
                 "npc_snapshot": self.npc_manager.get_state_snapshot(),
             }
-            self.state_manager.record_event(
-                event_type=event_type,
-                event_data=payload,
-                agent_source="GameEngine",
-                turn_number=turn_number,
-            )
-            self._record_agent_snapshots(turn_number=turn_number)
+            # 同一回合的事件与Agent快照合并为一次提交
+            with self.state_manager.transaction():
+                self.state_manager.record_event(
+                    event_type=event_type,
+                    event_data=payload,
+                    agent_source="GameEngine",
+                    turn_number=turn_number,
+                )
+                self._record_agent_snapshots(turn_number=turn_number)
 
             # 同步世界状态到 world_state.json
             self._sync_world_state_file(turn_number, world_update)
@@ -1856,91 +1896,60 @@ class GameEngine:
         except Exception as exc:
             logger.warning(f"⚠️ 记录Agent状态失败: {exc}")
 
+    def _build_suggestion_inputs(self) -> Dict[str, str]:
+        """行动建议的 Prompt 变量（在回合结束时取快照）"""
+        player_name = self._get_player_name()
+        location_name = self._get_location_name(self.player_location)
+        present_chars = [
+            self._get_character_name(c)
+            for c in self.os.world_context.present_characters
+            if c != "user"
+        ]
+        recent_events = self.os.recent_events[-3:] if hasattr(self.os, 'recent_events') else []
+
+        # 获取最近的对话历史（使用 self.dialogue_history）
+        dialogue_text = ""
+        if self.dialogue_history:
+            dialogue_lines = []
+            for entry in self.dialogue_history[-6:]:  # 最近3轮对话
+                speaker = entry.get('speaker', '???')
+                content = entry.get('content', '')
+                dialogue_lines.append(f"{speaker}: {content}")
+            dialogue_text = "\n".join(dialogue_lines)
+
+        return {
+            "player_name": player_name,
+            "location": location_name,
+            "present_characters": "、".join(present_chars) if present_chars else "无其他角色",
+            "dialogue_history": dialogue_text if dialogue_text else "（尚无对话）",
+            "recent_events": " | ".join(recent_events) if recent_events else "游戏刚开始",
+            "current_time": self.world_state.current_time if self.world_state else "未知"
+        }
+
     def generate_action_suggestions(self) -> List[str]:
         """
-        生成玩家行动建议（2个选项）
+        生成玩家行动建议（2个选项，同步；本回合已生成过时直接取缓存）
 
         Returns:
             包含2个行动建议的列表
         """
         try:
-            from utils.llm_factory import get_llm
-            from langchain_core.prompts import ChatPromptTemplate
-            from langchain_core.output_parsers import StrOutputParser
-
-            llm = get_llm(temperature=0.9)  # 高温度增加多样性
-
-            # 构建上下文
-            player_name = self._get_player_name()
-            location_name = self._get_location_name(self.player_location)
-            present_chars = [
-                self._get_character_name(c)
-                for c in self.os.world_context.present_characters
-                if c != "user"
-            ]
-            recent_events = self.os.recent_events[-3:] if hasattr(self.os, 'recent_events') else []
-
-            # 获取最近的对话历史（使用 self.dialogue_history）
-            dialogue_text = ""
-            if self.dialogue_history:
-                dialogue_lines = []
-                for entry in self.dialogue_history[-6:]:  # 最近3轮对话
-                    speaker = entry.get('speaker', '???')
-                    content = entry.get('content', '')
-                    dialogue_lines.append(f"{speaker}: {content}")
-                dialogue_text = "\n".join(dialogue_lines)
-
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", """你是一个互动叙事游戏的行动建议器。
-根据当前场景和对话进展，为玩家生成2个有趣且合理的行动选项。
-
-要求：
-1. 每个选项应该是具体的行动描述，10-30字
-2. 两个选项应该代表不同的方向（如：深入追问vs转换话题，直接行动vs继续观察）
-3. 建议必须基于当前对话进展，推动剧情向前发展
-4. 不要重复之前已经做过的行动
-5. 不要使用编号，直接输出两个选项，用换行分隔"""),
-                ("human", """当前场景信息：
-- 玩家: {player_name}
-- 位置: {location}
-- 在场角色: {present_characters}
-- 当前时间: {current_time}
-
-最近对话记录：
-{dialogue_history}
-
-最近事件：{recent_events}
-
-请根据对话进展生成2个行动建议（不要重复之前的行动）：""")
-            ])
-
-            chain = prompt | llm | StrOutputParser()
-
-            response = chain.invoke({
-                "player_name": player_name,
-                "location": location_name,
-                "present_characters": "、".join(present_chars) if present_chars else "无其他角色",
-                "dialogue_history": dialogue_text if dialogue_text else "（尚无对话）",
-                "recent_events": " | ".join(recent_events) if recent_events else "游戏刚开始",
-                "current_time": self.world_state.current_time if self.world_state else "未知"
-            })
-
-            # 解析响应，分割成两个选项
-            lines = [line.strip() for line in response.strip().split("\n") if line.strip()]
-            # 清理可能的编号前缀
-            suggestions = []
-            for line in lines[:2]:
-                # 移除常见的编号格式：1. 2. 1、2、① ② - 等
-                cleaned = line.lstrip("0123456789.、①②③④⑤-) ").strip()
-                if cleaned:
-                    suggestions.append(cleaned)
-
-            # 确保返回2个选项
-            while len(suggestions) < 2:
-                suggestions.append("观察周围环境")
+            inputs = self._build_suggestion_inputs()
+        except Exception as e:
+            logger.warning(f"⚠️ 生成行动建议失败: {e}")
+            return list(FALLBACK_SUGGESTIONS)
+        return self.action_suggester.generate(self.os.turn_count, inputs)
 
-            return suggestions[:2]
+    def prefetch_action_suggestions(self) -> Optional[SuggestionJob]:
+        """
+        在后台开始生成本回合的行动建议（需在事件循环中调用，重复调用复用同一任务）
 
+        Returns:
+            SuggestionJob；构建上下文失败时为 None
+        """
+        try:
+            inputs = self._build_suggestion_inputs()
         except Exception as e:
             logger.warning(f"⚠️ 生成行动建议失败: {e}")
-            return ["与在场角色交谈", "观察周围环境"]
+            return None
+        return self.action_suggester.start(self.os.turn_count, inputs)
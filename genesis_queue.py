@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Infinite Story - 创世任务队列
+批量提交小说，由多个 worker 进程构建世界；队列保存在 SQLite 中，重启后继续
+
+使用方法:
+    python genesis_queue.py submit 白鹿原.txt 围城.txt    # 提交小说
+    python genesis_queue.py submit --all                 # 提交小说目录下的全部 .txt
+    python genesis_queue.py run --workers 3 --rate 60    # 启动 worker，队列清空后退出
+    python genesis_queue.py run --watch                  # 持续等待新任务
+    python genesis_queue.py status [--json]              # 查看任务状态
+    python genesis_queue.py cancel <任务ID>              # 取消排队中的任务
+    python genesis_queue.py retry <任务ID>               # 重新排队失败 / 已取消的任务
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import List
+
+# 确保项目根目录在路径中
+PROJECT_ROOT = Path(__file__).parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config.settings import settings
+from agents.offline.creatorGod import GenesisJobQueue, run_workers
+
+
+def cmd_submit(queue: GenesisJobQueue, args) -> int:
+    novels: List[str] = list(args.novels)
+    if args.all:
+        novels += sorted(p.name for p in settings.NOVELS_DIR.glob("*.txt"))
+    if not novels:
+        print("❌ 请指定小说文件名，或使用 --all")
+        return 1
+
+    missing = [n for n in novels if not (settings.NOVELS_DIR / n).exists()]
+    if missing:
+        print(f"❌ 小说目录 {settings.NOVELS_DIR} 中找不到: {', '.join(missing)}")
+        return 1
+
+    for novel in novels:
+        job_id, created = queue.submit(novel, world_name=args.world if len(novels) == 1 else None,
+                                       priority=args.priority)
+        print(f"{'📥 已提交' if created else 'ℹ️ 已在队列中'} #{job_id}: {novel}")
+    return 0
+
+
+def cmd_status(queue: GenesisJobQueue, args) -> int:
+    jobs = queue.jobs(args.state)
+    if args.json:
+        print(json.dumps({"counts": queue.counts(), "jobs": [job.to_dict() for job in jobs]},
+                         ensure_ascii=False, indent=2))
+        return 0
+
+    counts = queue.counts()
+    print("  ".join(f"{status}: {n}" for status, n in counts.items()))
+    if not jobs:
+        print("（队列为空）")
+        return 0
+    print(f"{'ID':>4}  {'状态':<10}{'尝试':>6}  {'小说':<24}{'worker / 结果'}")
+    for job in jobs:
+        detail = job.world_dir or job.error or job.worker or ""
+        print(f"{job.id:>4}  {job.status:<10}{job.attempts:>3}/{job.max_attempts:<2}  {job.novel:<24}{detail}")
+    return 0
+
+
+def cmd_run(queue: GenesisJobQueue, args) -> int:
+    queue.close()
+    rate = args.rate if args.rate is not None else settings.GENESIS_LLM_CALLS_PER_MINUTE
+    print(f"🚀 启动 {args.workers} 个 worker（LLM 限流: {f'{rate:g} 次/分钟' if rate > 0 else '不限'}）")
+    try:
+        run_workers(processes=args.workers, db_path=args.db, until_empty=not args.watch, calls_per_minute=rate)
+    except KeyboardInterrupt:
+        print("\n🛑 已中断，运行中的任务已放回队列")
+        return 130
+    summary = GenesisJobQueue(args.db).counts()
+    print("✅ worker 已退出  " + "  ".join(f"{status}: {n}" for status, n in summary.items()))
+    return 0
+
+
+def cmd_cancel(queue: GenesisJobQueue, args) -> int:
+    if queue.cancel(args.job_id):
+        print(f"🛑 已取消 #{args.job_id}")
+        return 0
+    print(f"❌ #{args.job_id} 不在排队中，无法取消")
+    return 1
+
+
+def cmd_retry(queue: GenesisJobQueue, args) -> int:
+    if queue.retry(args.job_id):
+        print(f"🔁 已重新排队 #{args.job_id}")
+        return 0
+    print(f"❌ #{args.job_id} 不是失败或已取消的任务")
+    return 1
+
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description="Infinite Story 创世任务队列",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--db", type=Path, default=settings.GENESIS_QUEUE_DB, help="队列数据库路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    submit = sub.add_parser("submit", help="提交小说")
+    submit.add_argument("novels", nargs="*", help="小说文件名（位于小说目录）")
+    submit.add_argument("--all", action="store_true", help="提交小说目录下的全部 .txt")
+    submit.add_argument("--world", help="世界名称（仅提交一本小说时生效）")
+    submit.add_argument("--priority", type=int, default=0, help="优先级，越大越先构建")
+
+    status = sub.add_parser("status", help="查看任务状态")
+    status.add_argument("--state", choices=["queued", "running", "done", "failed", "cancelled"], help="只看某一状态")
+    status.add_argument("--json", action="store_true", help="以 JSON 输出")
+
+    run = sub.add_parser("run", help="启动 worker")
+    run.add_argument("--workers", type=int, default=settings.GENESIS_QUEUE_WORKERS, help="worker 进程数")
+    run.add_argument("--rate", type=float, help="所有 worker 共享的每分钟 LLM 调用数（0 表示不限）")
+    run.add_argument("--watch", action="store_true", help="队列清空后继续等待新任务")
+
+    cancel = sub.add_parser("cancel", help="取消排队中的任务")
+    cancel.add_argument("job_id", type=int)
+
+    retry = sub.add_parser("retry", help="重新排队失败或已取消的任务")
+    retry.add_argument("job_id", type=int)
+
+    return parser.parse_args(argv)
+
+
+COMMANDS = {
+    "submit": cmd_submit,
+    "status": cmd_status,
+    "run": cmd_run,
+    "cancel": cmd_cancel,
+    "retry": cmd_retry,
+}
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    queue = GenesisJobQueue(args.db)
+    try:
+        return COMMANDS[args.command](queue, args)
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
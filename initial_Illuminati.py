@@ -130,7 +130,7 @@ class IlluminatiInitializer:
         self.genesis_data = self._build_genesis_data()
         
         # LLM 实例
-        self.llm = get_llm(temperature=0.8)
+        self.llm = get_llm(temperature=0.8, agent_name="Illuminati")
         
         # 初始化结果
         self.initial_scene: Optional[InitialScene] = None
@@ -7,6 +7,7 @@
 3. test_character_data_model.py - 角色数据模型
 4. test_illuminati_init.py - 光明会初始化
 5. test_character_prompt_generation.py - 角色提示词动态生成（重点）
+之后是存储、创世流水线、遥测等 unittest 模块（没有 main 函数的模块按 unittest 用例运行）
 
 使用方法：
     python tests/run_all_tests.py
@@ -16,6 +17,7 @@
 import os
 import sys
 import importlib.util
+import unittest
 from pathlib import Path
 from datetime import datetime
 
@@ -74,11 +76,22 @@ def load_and_run_test(test_file: Path, test_name: str) -> dict:
                 "error": None
             }
         else:
+            # unittest 风格的模块：运行其中全部用例
+            suite = unittest.defaultTestLoader.loadTestsFromModule(module)
+            if suite.countTestCases() == 0:
+                return {
+                    "name": test_name,
+                    "file": test_file.name,
+                    "passed": False,
+                    "error": "测试模块缺少main函数或测试用例"
+                }
+            outcome = unittest.TextTestRunner(verbosity=1).run(suite)
             return {
                 "name": test_name,
                 "file": test_file.name,
-                "passed": False,
-                "error": "测试模块缺少main函数"
+                "passed": outcome.wasSuccessful(),
+                "error": None if outcome.wasSuccessful()
+                else f"{len(outcome.failures)} 个失败, {len(outcome.errors)} 个错误"
             }
     
     except Exception as e:
@@ -110,6 +123,28 @@ def main():
         ("test_character_prompt_generation.py", "5  角色提示词动态生成测试（重点）"),
         ("test_file_paths_and_placeholders.py", "6  文件路径和占位符测试"),
         ("test_world_state_dynamic_update.py", "7  世界状态动态更新测试"),
+        ("test_json_parser.py", "8  JSON 提取与修复测试"),
+        ("test_structured_output.py", "9  结构化输出校验测试"),
+        ("test_logger.py", "10 异步日志测试"),
+        ("test_metrics.py", "11 /metrics 指标测试"),
+        ("test_tracing.py", "12 回合追踪测试"),
+        ("test_llm_telemetry.py", "13 LLM 调用遥测测试"),
+        ("test_sqlite_store.py", "14 SQLite 存储与分片测试"),
+        ("test_state_manager.py", "15 状态管理器测试"),
+        ("test_chunker.py", "16 文本分块测试"),
+        ("test_novel_ingest.py", "17 小说导入测试"),
+        ("test_name_index.py", "18 角色名索引测试"),
+        ("test_extraction_tiers.py", "19 角色分级提取测试"),
+        ("test_detail_batching.py", "20 角色档案打包提取测试"),
+        ("test_profile_reducer.py", "21 角色档案归并测试"),
+        ("test_work_ledger.py", "22 创世工作项账本测试"),
+        ("test_genesis_pipeline.py", "23 创世流水线测试"),
+        ("test_genesis_estimator.py", "24 创世耗时预估测试"),
+        ("test_genesis_queue.py", "25 创世任务队列与共享限流测试"),
+        ("test_action_suggestions.py", "26 行动建议测试"),
+        ("test_admission.py", "27 API 过载保护测试"),
+        ("test_loop_monitor.py", "28 事件循环监控测试"),
+        ("test_visual_jobs.py", "29 视觉数据后台生成测试"),
     ]
     
     results = []
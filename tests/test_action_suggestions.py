@@ -0,0 +1,165 @@
+"""
+测试行动建议：共享 LLM 链、按回合缓存、逐条推送，以及不占用回合响应时间
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from utils import action_suggestions
+from utils.action_suggestions import ActionSuggester, get_suggestion_chain, parse_suggestions
+
+
+class _FakeChain:
+    """按块输出的假链：每块之间间隔 delay 秒"""
+
+    def __init__(self, chunks, delay=0.05):
+        self.chunks = chunks
+        self.delay = delay
+        self.calls = 0
+
+    def invoke(self, inputs):
+        self.calls += 1
+        return "".join(self.chunks)
+
+    async def astream(self, inputs):
+        self.calls += 1
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield chunk
+
+
+class _ChainTestCase(unittest.TestCase):
+    def use_chain(self, chain):
+        original = action_suggestions._chain
+        action_suggestions._chain = chain
+        self.addCleanup(setattr, action_suggestions, "_chain", original)
+        return chain
+
+
+class TestParsing(unittest.TestCase):
+    def test_clean_and_pad(self):
+        """测试去掉编号，不足两条时补默认项"""
+        self.assertEqual(parse_suggestions("1. 追问电话内容\n2、转身离开"), ["追问电话内容", "转身离开"])
+        self.assertEqual(parse_suggestions("① 观察周围环境"), ["观察周围环境", "与在场角色交谈"])
+
+    def test_shared_chain(self):
+        """测试建议链在进程内只创建一次"""
+        action_suggestions.reset_suggestion_chain()
+        self.assertIs(get_suggestion_chain(), get_suggestion_chain())
+
+
+class TestActionSuggester(_ChainTestCase):
+    def test_stream_before_done(self):
+        """测试第一条建议在生成结束前即可取到"""
+        self.use_chain(_FakeChain(["追问电话", "内容\n", "转身", "离开"], delay=0.05))
+        suggester = ActionSuggester()
+
+        async def scenario():
+            job = suggester.start(1, {})
+            received = []
+            async for item in job.stream():
+                received.append((item, job.done))
+            return received
+
+        received = asyncio.run(scenario())
+        self.assertEqual([item for item, _ in received], ["追问电话内容", "转身离开"])
+        self.assertFalse(received[0][1])
+
+    def test_cached_per_turn(self):
+        """测试同一回合重复请求复用结果，新回合重新生成"""
+        chain = self.use_chain(_FakeChain(["上前搭话\n继续观察"], delay=0))
+        suggester = ActionSuggester()
+
+        async def scenario():
+            job = suggester.start(1, {})
+            self.assertIs(suggester.start(1, {}), job)
+            return await job.wait(1.0)
+
+        self.assertEqual(asyncio.run(scenario()), ["上前搭话", "继续观察"])
+        self.assertEqual(suggester.generate(1, {}), ["上前搭话", "继续观察"])
+        self.assertEqual(chain.calls, 1)
+        suggester.generate(2, {})
+        self.assertEqual(chain.calls, 2)
+
+    def test_failure_falls_back(self):
+        """测试生成失败时返回默认建议"""
+
+        class _Broken:
+            def invoke(self, inputs):
+                raise RuntimeError("boom")
+
+            async def astream(self, inputs):
+                raise RuntimeError("boom")
+                yield  # pragma: no cover
+
+        self.use_chain(_Broken())
+        suggester = ActionSuggester()
+        self.assertEqual(suggester.generate(1, {}), action_suggestions.FALLBACK_SUGGESTIONS)
+
+        async def scenario():
+            return await suggester.start(2, {}).wait(1.0)
+
+        self.assertEqual(asyncio.run(scenario()), action_suggestions.FALLBACK_SUGGESTIONS)
+
+
+class _Engine:
+    def __init__(self):
+        self.os = SimpleNamespace(turn_count=0)
+        self.action_suggester = ActionSuggester()
+
+    async def process_turn_async(self, action):
+        self.os.turn_count += 1
+        self.prefetch_action_suggestions()
+        return {"success": True, "text": "门开了。", "mode": "dialogue", "npc_reactions": []}
+
+    def prefetch_action_suggestions(self):
+        return self.action_suggester.start(self.os.turn_count, {})
+
+
+class TestSuggestionEndpoints(_ChainTestCase):
+    """测试 /game/action 不等待建议，/game/suggestions 与 SSE 单独获取"""
+
+    def test_action_does_not_wait(self):
+        import httpx
+        import api_server
+
+        self.use_chain(_FakeChain(["进门\n", "守在门口"], delay=0.15))
+        engine = _Engine()
+        with tempfile.TemporaryDirectory() as tmp:
+            session_id = api_server.session_manager.create_session(engine, None, Path(tmp))
+
+            async def scenario():
+                transport = httpx.ASGITransport(app=api_server.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    started = time.perf_counter()
+                    action = await client.post("/game/action", json={"action": "敲门", "session_id": session_id})
+                    elapsed = time.perf_counter() - started
+                    stream = await client.get("/game/suggestions/stream", params={"session_id": session_id})
+                    polled = await client.get("/game/suggestions", params={"session_id": session_id, "turn": 1})
+                return action, elapsed, stream, polled
+
+            try:
+                action, elapsed, stream, polled = asyncio.run(scenario())
+            finally:
+                api_server.session_manager.remove_session(session_id)
+
+        self.assertLess(elapsed, 0.15)
+        self.assertTrue(action.json()["suggestions_pending"])
+        self.assertEqual(action.json()["suggestions"], [])
+        self.assertEqual(stream.text.count("event: suggestion"), 2)
+        self.assertIn("event: done", stream.text)
+        self.assertEqual(polled.json(), {"turn": 1, "done": True, "suggestions": ["进门", "守在门口"]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+"""
+测试 API 过载保护：会话级回合串行与全局准入控制
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from fastapi import HTTPException
+
+from api.admission import ADMISSION_REJECTIONS, AdmissionController, SessionTurnGate
+from config.settings import settings
+
+
+class TestSessionTurnGate(unittest.TestCase):
+    """测试会话回合锁"""
+
+    def test_queue_serializes(self):
+        """测试排队策略下同一会话的回合依次执行，不会重叠"""
+        gate = SessionTurnGate(policy="queue", queue_timeout=1.0, max_queued=1)
+        events = []
+
+        async def turn(name):
+            async with gate.hold():
+                events.append(f"{name}:start")
+                await asyncio.sleep(0.02)
+                events.append(f"{name}:end")
+
+        async def scenario():
+            await asyncio.gather(turn("a"), turn("b"))
+
+        asyncio.run(scenario())
+        self.assertEqual(events, ["a:start", "a:end", "b:start", "b:end"])
+
+    def test_reject_policy_409(self):
+        """测试拒绝策略下会话忙时立即返回 409"""
+        gate = SessionTurnGate(policy="reject")
+
+        async def scenario():
+            async with gate.hold():
+                with self.assertRaises(HTTPException) as ctx:
+                    async with gate.hold():
+                        pass
+            return ctx.exception
+
+        exc = asyncio.run(scenario())
+        self.assertEqual(exc.status_code, 409)
+        self.assertFalse(gate.busy)
+
+    def test_queue_full_and_timeout(self):
+        """测试排队已满与等待超时都返回 409，且不影响后续使用"""
+        gate = SessionTurnGate(policy="queue", queue_timeout=0.05, max_queued=1)
+
+        async def waiter():
+            async with gate.hold():
+                pass
+
+        async def scenario():
+            results = []
+            async with gate.hold():
+                first = asyncio.create_task(waiter())
+                await asyncio.sleep(0)
+                with self.assertRaises(HTTPException) as full:
+                    async with gate.hold():
+                        pass
+                results.append(full.exception.status_code)
+                with self.assertRaises(HTTPException) as timeout:
+                    await first
+                results.append(timeout.exception.status_code)
+            async with gate.hold():
+                results.append("ok")
+            return results
+
+        before = ADMISSION_REJECTIONS.get(reason="session_queue_timeout")
+        self.assertEqual(asyncio.run(scenario()), [409, 409, "ok"])
+        self.assertEqual(ADMISSION_REJECTIONS.get(reason="session_queue_timeout"), before + 1)
+
+
+class TestAdmissionController(unittest.TestCase):
+    """测试全局准入"""
+
+    def test_inflight_limit_429(self):
+        """测试在途数达上限时返回 429 与 Retry-After，释放后恢复"""
+        controller = AdmissionController(max_inflight=1, max_llm_queue=0)
+
+        async def scenario():
+            async with controller.admit():
+                with self.assertRaises(HTTPException) as ctx:
+                    async with controller.admit():
+                        pass
+            async with controller.admit():
+                pass
+            return ctx.exception
+
+        exc = asyncio.run(scenario())
+        self.assertEqual(exc.status_code, 429)
+        self.assertGreaterEqual(int(exc.headers["Retry-After"]), settings.ADMISSION_RETRY_AFTER)
+        self.assertEqual(controller.inflight, 0)
+
+    def test_llm_queue_limit_503(self):
+        """测试 LLM 排队深度超过上限时返回 503"""
+        depth = {"value": 3}
+        controller = AdmissionController(max_inflight=0, max_llm_queue=3, queue_depth=lambda: depth["value"])
+        controller.check()
+        depth["value"] = 4
+        with self.assertRaises(HTTPException) as ctx:
+            controller.check()
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertIn("Retry-After", ctx.exception.headers)
+
+
+class _FakeEngine:
+    def __init__(self):
+        self.os = SimpleNamespace(turn_count=1)
+        self.running = 0
+        self.max_running = 0
+
+    async def process_turn_async(self, action):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.05)
+        self.running -= 1
+        return {"success": True, "text": "风停了。", "mode": "dialogue", "npc_reactions": []}
+
+    def prefetch_action_suggestions(self):
+        return None
+
+
+class TestActionEndpoint(unittest.TestCase):
+    """测试 /game/action 接入过载保护"""
+
+    def _post_concurrently(self, session_id, count):
+        import httpx
+        import api_server
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=api_server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(*(
+                    client.post("/game/action", json={"action": "等", "session_id": session_id})
+                    for _ in range(count)
+                ))
+
+        return asyncio.run(scenario())
+
+    def _with_session(self, engine):
+        import api_server
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        session_id = api_server.session_manager.create_session(engine, None, Path(tmp.name))
+        self.addCleanup(api_server.session_manager.remove_session, session_id)
+        return session_id
+
+    def test_same_session_not_concurrent(self):
+        """测试同一会话的并发请求不会同时进入引擎，超出排队数的返回 409"""
+        engine = _FakeEngine()
+        session_id = self._with_session(engine)
+        responses = self._post_concurrently(session_id, 3)
+        codes = sorted(r.status_code for r in responses)
+        self.assertEqual(codes, [200, 200, 409])
+        self.assertEqual(engine.max_running, 1)
+
+    def test_overload_returns_503(self):
+        """测试 LLM 排队过深时直接返回 503 + Retry-After，不进入引擎"""
+        from utils.metrics import LLM_QUEUE_WAITING
+
+        engine = _FakeEngine()
+        session_id = self._with_session(engine)
+        original = settings.ADMISSION_MAX_LLM_QUEUE
+        settings.ADMISSION_MAX_LLM_QUEUE = 2
+        LLM_QUEUE_WAITING.inc(5, agent="AdmissionTest")
+        try:
+            response = self._post_concurrently(session_id, 1)[0]
+        finally:
+            LLM_QUEUE_WAITING.dec(5, agent="AdmissionTest")
+            settings.ADMISSION_MAX_LLM_QUEUE = original
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("retry-after", response.headers)
+        self.assertEqual(engine.max_running, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
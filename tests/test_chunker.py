@@ -0,0 +1,93 @@
+"""
+测试按章节 / 段落边界、按 token 预算的分块
+"""
+import os
+import sys
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from agents.offline.creatorGod import CreatorGod, StageLLMConfig, TokenChunker
+from agents.offline.creatorGod.chunker import context_window
+from config.settings import settings
+from utils.llm_telemetry import estimate_tokens
+
+
+def _chapters(count, paragraphs, length=50):
+    lines = []
+    for c in range(1, count + 1):
+        lines.append(f"第{c}章 风起")
+        lines.extend("雨" * (length - 1) + "。" for _ in range(paragraphs))
+    return "\n".join(lines) + "\n"
+
+
+class TestTokenChunker(unittest.TestCase):
+    def assertCovers(self, text, views, budget):
+        self.assertEqual(views[0].start, 0)
+        self.assertEqual(views[-1].end, len(text))
+        for prev, view in zip(views, views[1:]):
+            self.assertLessEqual(view.start, prev.end)
+        for view in views:
+            self.assertLessEqual(estimate_tokens(str(view)), budget)
+
+    def test_fits_in_one_chunk(self):
+        chunker = TokenChunker(1000)
+        text = _chapters(2, 3)
+        views = chunker.split(text)
+        self.assertEqual(len(views), 1)
+        self.assertIs(str(views[0]), text)
+        self.assertIs(chunker.split(text), views)
+
+    def test_cuts_at_chapters(self):
+        """测试优先在章节标题处断开，且不重叠"""
+        text = _chapters(6, 5)  # 每章约 255 tokens
+        chunker = TokenChunker(600, overlap_chars=400)
+        views = chunker.split(text)
+        self.assertCovers(text, views, 600)
+        for view in views:
+            self.assertTrue(str(view).startswith("第"), repr(str(view)[:10]))
+        self.assertEqual(chunker.stats.chapter_cuts, len(views) - 1)
+        self.assertEqual(chunker.stats.overlap_chars, 0)
+        self.assertEqual(chunker.stats.chunks, 3)
+
+    def test_paragraph_cuts_keep_short_overlap(self):
+        """测试无章节时在段落处断开，上一段带入下一块"""
+        text = "\n".join("云" * 99 + "。" for _ in range(20)) + "\n"
+        chunker = TokenChunker(350, overlap_chars=200)
+        views = chunker.split(text)
+        self.assertCovers(text, views, 350)
+        self.assertGreater(chunker.stats.paragraph_cuts, 0)
+        self.assertEqual(views[1].start, views[0].end - 101)
+        self.assertEqual(chunker.stats.overlap_chars, 101 * (len(views) - 1))
+
+        no_overlap = TokenChunker(350, overlap_chars=0).split(text)
+        self.assertEqual(no_overlap[1].start, no_overlap[0].end)
+
+    def test_long_paragraph_split_at_sentences(self):
+        text = "他走了很远很远的路。" * 200  # 单个 2000 字段落
+        chunker = TokenChunker(300)
+        views = chunker.split(text)
+        self.assertCovers(text, views, 300)
+        self.assertTrue(all(str(view).endswith("。") for view in views))
+        self.assertGreater(chunker.stats.sentence_cuts, 0)
+
+    def test_budget_from_model(self):
+        """测试按模型上下文窗口确定预算，阶段配置可覆盖"""
+        self.assertEqual(context_window("google/gemini-3-flash-preview"), 1_000_000)
+        self.assertEqual(context_window("glm-4-long"), 1_000_000)
+        self.assertEqual(context_window("glm-4"), 128_000)
+        self.assertEqual(
+            TokenChunker.for_model("glm-4").budget_tokens,
+            int(128_000 * settings.GENESIS_CHUNK_FILL),
+        )
+        god = CreatorGod(stage_llm_configs={"detail": StageLLMConfig(context_tokens=32_000)})
+        self.assertEqual(god.character_detail_agent.chunker.budget_tokens, int(32_000 * settings.GENESIS_CHUNK_FILL))
+        self.assertEqual(god.character_filter_agent.chunker.budget_tokens, int(1_000_000 * settings.GENESIS_CHUNK_FILL))
+
+
+if __name__ == '__main__':
+    unittest.main()
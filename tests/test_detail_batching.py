@@ -0,0 +1,121 @@
+"""
+测试次要角色打包提取：多个角色共用一次调用，缺失或不合格的角色单独补提
+"""
+import json
+import os
+import sys
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from langchain_core.runnables import RunnableLambda
+
+from agents.offline.creatorGod import CharacterDetailAgent, NameIndex
+from config.settings import settings
+
+CHARACTERS = [
+    {"id": "npc_001", "name": "张三", "importance": 1.0},
+    {"id": "npc_002", "name": "李四", "importance": 0.2},
+    {"id": "npc_003", "name": "王五", "importance": 0.1},
+    {"id": "npc_004", "name": "赵六", "importance": 0.1},
+]
+
+SINGLE = '{"gender": "男", "traits": ["单独"]}'
+
+
+class _BatchLLM:
+    """打包提示词返回 batch_response，单角色提示词返回固定档案"""
+
+    def __init__(self, batch_response):
+        self.batch_response = batch_response
+        self.batch_calls = 0
+        self.single_calls = 0
+
+    def __call__(self, prompt_value):
+        system = prompt_value.to_messages()[0].content
+        if "本次需要建档的角色" in system:
+            self.batch_calls += 1
+            return self.batch_response
+        self.single_calls += 1
+        return SINGLE
+
+
+def _profile(trait):
+    return {"gender": "男", "traits": [trait], "behavior_rules": ["守规矩"]}
+
+
+class TestDetailBatching(unittest.TestCase):
+    def _run(self, batch_response, text="张三、李四、王五、赵六同桌吃饭。"):
+        llm = _BatchLLM(batch_response)
+        agent = CharacterDetailAgent(llm=RunnableLambda(llm))
+        return agent.run(text, CHARACTERS), llm
+
+    def test_minor_characters_share_one_call(self):
+        """测试次要角色合并为一次调用，主要角色单独提取，结果按角色表顺序返回"""
+        response = json.dumps({
+            "npc_002": _profile("李"),
+            "npc_003": _profile("王"),
+            "npc_004": _profile("赵"),
+        }, ensure_ascii=False)
+        details, llm = self._run(response)
+
+        self.assertEqual(llm.batch_calls, 1)
+        self.assertEqual(llm.single_calls, 1)
+        self.assertEqual(list(details), [c["id"] for c in CHARACTERS])
+        self.assertEqual(details["npc_003"]["traits"], ["王"])
+        self.assertEqual(details["npc_003"]["name"], "王五")
+        self.assertEqual(details["npc_003"]["importance"], 0.1)
+        self.assertEqual(details["npc_001"]["traits"], ["单独"])
+
+    def test_invalid_record_falls_back(self):
+        """测试缺失或字段不合格的角色单独补提，其余角色保留打包结果"""
+        response = json.dumps({
+            "characters": [
+                {"id": "npc_002", **_profile("李")},
+                {"id": "npc_003", "traits": "不是列表"},
+            ]
+        }, ensure_ascii=False)
+        details, llm = self._run(response)
+
+        self.assertEqual(llm.batch_calls, 1)
+        self.assertEqual(llm.single_calls, 3)
+        self.assertEqual(details["npc_002"]["traits"], ["李"])
+        self.assertEqual(details["npc_003"]["traits"], ["单独"])
+        self.assertEqual(details["npc_004"]["traits"], ["单独"])
+
+    def test_parse_failure_falls_back_for_all(self):
+        """测试打包结果无法解析时，组内角色全部单独提取"""
+        details, llm = self._run("模型跑题了")
+        self.assertEqual(llm.batch_calls, 1)
+        self.assertEqual(llm.single_calls, 4)
+        self.assertTrue(all("error" not in data for data in details.values()))
+
+    def test_groups_follow_mentions_when_text_is_long(self):
+        """测试全书超出预算时，相邻出场的角色共用合并后的片段，远处出场的角色另成一组"""
+        filler = "风吹过山岗。" * 2000
+        text = filler + "李四遇见王五。" + filler + "赵六与钱七对饮。" + filler
+        cast = CHARACTERS + [{"id": "npc_005", "name": "钱七", "importance": 0.1}]
+        agent = CharacterDetailAgent(llm=RunnableLambda(_BatchLLM("{}")))
+        index = NameIndex(text, cast)
+
+        original = settings.GENESIS_DETAIL_CONTEXT_TOKENS
+        settings.GENESIS_DETAIL_CONTEXT_TOKENS = 500
+        try:
+            groups = agent.pack_groups(text, cast, index)
+        finally:
+            settings.GENESIS_DETAIL_CONTEXT_TOKENS = original
+
+        self.assertEqual(
+            [[c["id"] for c in members] for members, _ in groups],
+            [["npc_002", "npc_003"], ["npc_004", "npc_005"]],
+        )
+        self.assertEqual(groups[0][1].count("李四遇见王五"), 1)
+        self.assertLess(len(groups[0][1]), len(text) // 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+测试角色档案分级提取：按重要性选择提取深度，世界目录配置可覆盖
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from langchain_core.runnables import RunnableLambda
+
+from agents.offline.creatorGod import CharacterDetailAgent, TierPolicy
+from config.settings import settings
+
+CHARACTERS = [
+    {"id": "npc_001", "name": "张三", "importance": 1.0},
+    {"id": "npc_002", "name": "李四", "importance": 0.5},
+    {"id": "npc_003", "name": "王五", "importance": 0.1},
+]
+
+
+class TestTierPolicy(unittest.TestCase):
+    def test_tier_by_importance_and_override(self):
+        """测试按重要性分级，按 ID 或名字覆盖，未知级别报错"""
+        policy = TierPolicy(deep_min=0.7, light_max=0.3)
+        self.assertEqual([policy.tier_of(c) for c in CHARACTERS], ["deep", "standard", "light"])
+        self.assertEqual(policy.tier_of({"id": "npc_009", "name": "无名"}), "standard")
+
+        policy.apply({"characters": {"npc_003": "deep", "李四": "light"}})
+        self.assertEqual(policy.tier_of(CHARACTERS[2]), "deep")
+        self.assertEqual(policy.tier_of(CHARACTERS[1]), "light")
+        self.assertEqual(policy.counts(CHARACTERS), {"deep": 2, "standard": 0, "light": 1})
+        with self.assertRaises(ValueError):
+            policy.apply({"characters": {"npc_001": "epic"}})
+
+    def test_world_file_overrides_config(self):
+        """测试世界目录下的 extraction_tiers.json 覆盖传入配置"""
+        with tempfile.TemporaryDirectory() as tmp:
+            with (Path(tmp) / "extraction_tiers.json").open("w", encoding="utf-8") as f:
+                json.dump({"thresholds": {"light": 0.6}, "profiles": {"light": {"radius": 50}}}, f)
+            policy = TierPolicy.load(Path(tmp), {"thresholds": {"deep": 0.9, "light": 0.2}})
+
+        self.assertEqual(policy.deep_min, 0.9)
+        self.assertEqual(policy.tier_of(CHARACTERS[1]), "light")
+        self.assertEqual(policy.profiles["light"].radius, 50)
+        self.assertEqual(policy.profiles["light"].max_batches, 1)
+
+
+class _TierLLM:
+    """按提示词区分完整 / 精简档案，记录每个角色收到的调用次数"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, prompt_value):
+        system = prompt_value.to_messages()[0].content
+        schema = "light" if "简要档案" in system else "full"
+        name = next(c["name"] for c in CHARACTERS if f'"{c["name"]}" 建立' in system)
+        self.calls.append((name, schema))
+        return '{"gender": "男", "traits": ["机警"]}'
+
+
+class TestTieredExtraction(unittest.TestCase):
+    def test_depth_follows_importance(self):
+        """测试主角分多批深度提取，龙套一次精简提取"""
+        filler = "风吹过山岗。" * 500
+        text = filler
+        for _ in range(4):
+            text += "张三与王五擦肩而过。" + filler
+
+        llm = _TierLLM()
+        agent = CharacterDetailAgent(llm=RunnableLambda(llm))
+        agent.tier_policy = TierPolicy(deep_min=0.7, light_max=0.3)
+        original = settings.GENESIS_DETAIL_CONTEXT_TOKENS
+        settings.GENESIS_DETAIL_CONTEXT_TOKENS = 700
+        try:
+            details = agent.run(text, [CHARACTERS[0], CHARACTERS[2]])
+        finally:
+            settings.GENESIS_DETAIL_CONTEXT_TOKENS = original
+
+        deep_calls = [c for c in llm.calls if c[0] == "张三"]
+        light_calls = [c for c in llm.calls if c[0] == "王五"]
+        self.assertGreater(len(deep_calls), 1)
+        self.assertTrue(all(schema == "full" for _, schema in deep_calls))
+        self.assertEqual(light_calls, [("王五", "light")])
+        self.assertEqual(agent.last_tiers, {"deep": 1, "standard": 0, "light": 1})
+        self.assertEqual(details["npc_003"]["traits"], ["机警"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+测试创世试运行估算：不调用 LLM，按阶段统计调用次数与 token，按历史遥测推算耗时
+"""
+import os
+import sys
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from langchain_core.runnables import RunnableLambda
+
+from agents.offline.creatorGod import CreatorGod, GenesisEstimator, LatencyModel, TokenChunker
+from config.settings import settings
+
+CHARACTERS = [
+    {"id": "npc_001", "name": "张三", "importance": 1.0},
+    {"id": "npc_002", "name": "李四", "importance": 0.1},
+    {"id": "npc_003", "name": "王五", "importance": 0.1},
+]
+
+
+def _forbidden(_):
+    raise AssertionError("试运行不应调用 LLM")
+
+
+def _god(budget_tokens):
+    """阶段1、2 按 budget_tokens 分块，阶段3 的模型放得下全书"""
+    god = CreatorGod()
+    for agent in (god.character_filter_agent, god.world_setting_agent):
+        agent.llm = RunnableLambda(_forbidden)
+        agent.chunker = TokenChunker(budget_tokens, overlap_chars=0)
+    god.character_detail_agent.llm = RunnableLambda(_forbidden)
+    god.character_detail_agent.chunker = TokenChunker(100000)
+    return god
+
+
+class TestLatencyModel(unittest.TestCase):
+    def test_fit_from_telemetry(self):
+        """测试按提示词 token 拟合耗时，样本不足时取平均"""
+        records = [
+            {"agent": "Genesis.detail", "prompt_tokens": t, "latency_ms": 2000 + t, "success": True}
+            for t in (1000, 2000, 4000)
+        ]
+        model = LatencyModel.fit(records)
+        self.assertAlmostEqual(model.base_seconds, 2.0, places=3)
+        self.assertAlmostEqual(model.predict(3000), 5.0, places=3)
+        self.assertEqual(LatencyModel.fit(records[:1]).seconds_per_1k_tokens, 0.0)
+        self.assertEqual(LatencyModel.fit([]).samples, 0)
+
+
+class TestGenesisEstimator(unittest.TestCase):
+    def test_counts_calls_without_llm(self):
+        """测试分块决定阶段1、2 的调用数，阶段3 按打包与分级计数；墙钟时间按阶段内依次调用计"""
+        text = "".join(f"第{i}章 风云\n" + "张三、李四与王五同行。" * 200 + "\n" for i in range(1, 5))
+        telemetry = [
+            {"agent": "Genesis.filter", "prompt_tokens": 100, "latency_ms": 1000},
+            {"agent": "Genesis.detail", "prompt_tokens": 100, "latency_ms": 3000},
+        ]
+        god = _god(budget_tokens=2500)
+        estimator = GenesisEstimator(god, telemetry=telemetry)
+
+        serial = estimator.estimate(text, CHARACTERS, concurrency=1)
+        parallel = estimator.estimate(text, CHARACTERS, concurrency=4)
+
+        filter_stage = serial.stages["stage1.filter"]
+        self.assertEqual(filter_stage.calls, len(god.character_filter_agent.chunker.split(text)))
+        self.assertGreater(filter_stage.calls, 1)
+        # 全书放得下阶段3 的上下文预算：主角一次，两个龙套打包一次
+        self.assertEqual(serial.stages["stage3.detail"].calls, 2)
+        self.assertEqual(serial.stages["stage3.detail"].serial_seconds, 6.0)
+        self.assertFalse(serial.assumed_cast)
+        stages = serial.stages
+        expected = max(stages["stage1.filter"].serial_seconds, stages["stage2.world"].serial_seconds) + 6.0
+        self.assertAlmostEqual(serial.wall_seconds, expected + stages["stage3.reduce"].serial_seconds, places=1)
+        # 并发数只影响假设的并行化耗时，不改变按实际执行方式推算的墙钟时间
+        self.assertEqual(parallel.wall_seconds, serial.wall_seconds)
+        self.assertLess(parallel.projected_seconds, parallel.wall_seconds)
+
+        god.parallel = False
+        sequential = estimator.estimate(text, CHARACTERS)
+        self.assertAlmostEqual(
+            sequential.wall_seconds - serial.wall_seconds,
+            min(stages["stage1.filter"].serial_seconds, stages["stage2.world"].serial_seconds),
+            places=1,
+        )
+        self.assertEqual(serial.total_calls, sum(s["calls"] for s in serial.to_dict()["stages"].values()))
+
+    def test_assumed_cast_when_no_characters(self):
+        original = settings.GENESIS_ESTIMATE_CAST
+        settings.GENESIS_ESTIMATE_CAST = 10
+        try:
+            estimate = GenesisEstimator(_god(budget_tokens=100000), telemetry=[]).estimate("张三走进客栈。" * 100)
+        finally:
+            settings.GENESIS_ESTIMATE_CAST = original
+        self.assertTrue(estimate.assumed_cast)
+        self.assertEqual(estimate.characters, 10)
+        self.assertGreater(estimate.stages["stage3.detail"].calls, 0)
+        self.assertEqual(estimate.telemetry_samples["stage3.detail"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
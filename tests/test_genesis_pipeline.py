@@ -0,0 +1,129 @@
+"""
+测试创世流水线：阶段 DAG 并发、阶段耗时汇总与 LLM 预算
+"""
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from agents.offline.creatorGod import CreatorGod, Stage, StageDAG
+from utils.llm_factory import get_llm
+from utils.llm_telemetry import LLMBudget, LLMBudgetExceeded
+
+
+class TestStageDAG(unittest.TestCase):
+    def test_independent_stages_overlap(self):
+        """测试无依赖的阶段并发执行，依赖阶段拿到上游结果"""
+
+        def slow(value):
+            def run(_):
+                time.sleep(0.1)
+                return value
+            return run
+
+        dag = StageDAG([
+            Stage("a", slow(1)),
+            Stage("b", slow(2)),
+            Stage("c", lambda deps: deps["a"] + deps["b"], deps=("a", "b")),
+        ])
+        started = time.perf_counter()
+        results = dag.run()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(results["c"], 3)
+        self.assertLess(elapsed, 0.18)
+        summary = dag.summary()
+        self.assertGreater(summary["serial_seconds"], summary["wall_seconds"])
+        self.assertEqual(summary["stages"]["c"]["status"], "done")
+
+    def test_failure_skips_dependents(self):
+        """测试阶段失败时不启动依赖它的阶段，并抛出原异常"""
+
+        def boom(_):
+            raise RuntimeError("限流")
+
+        dag = StageDAG([
+            Stage("a", boom),
+            Stage("b", lambda deps: "ok"),
+            Stage("c", lambda deps: "never", deps=("a", "b")),
+        ])
+        with self.assertRaises(RuntimeError):
+            dag.run()
+        self.assertEqual(dag.timings["a"].status, "failed")
+        self.assertEqual(dag.timings["b"].status, "done")
+        self.assertEqual(dag.timings["c"].status, "skipped")
+
+    def test_cycle_rejected(self):
+        with self.assertRaises(ValueError):
+            StageDAG([Stage("a", lambda d: 1, deps=("b",)), Stage("b", lambda d: 1, deps=("a",))])
+
+
+class TestLLMBudget(unittest.TestCase):
+    def test_call_limit(self):
+        """测试调用次数用完后拒绝新调用"""
+        budget = LLMBudget(max_calls=1)
+        llm = budget.attach(get_llm(agent_name="BudgetTest"))
+        llm.invoke("你好")
+        with self.assertRaises(LLMBudgetExceeded):
+            llm.invoke("再来一次")
+        snapshot = budget.snapshot()
+        self.assertEqual(snapshot["calls"], 1)
+        self.assertEqual(snapshot["rejected"], 1)
+        self.assertGreater(snapshot["tokens"], 0)
+
+
+class _SlowAgent:
+    def __init__(self, result, delay=0.1):
+        self.result = result
+        self.delay = delay
+
+    def run(self, novel_text, *args):
+        time.sleep(self.delay)
+        return self.result
+
+
+class TestCreatorGodPipeline(unittest.TestCase):
+    def test_stage1_and_stage2_concurrent(self):
+        """测试阶段1与阶段2并发，摘要写入世界目录"""
+        god = CreatorGod()
+        god.character_filter_agent = _SlowAgent([{"id": "c1", "name": "甲", "importance": 1}])
+        god.world_setting_agent = _SlowAgent({"meta": {"world_name": "测试世界"}})
+        god.character_detail_agent = _SlowAgent({"c1": {"id": "c1"}}, delay=0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            world_dir = Path(tmp)
+            world_setting, characters_list, details = god.run_pipeline("小说", world_dir)
+            self.assertTrue((world_dir / "genesis_summary.json").exists())
+            self.assertTrue((world_dir / "world_setting.json").exists())
+
+        self.assertEqual(details, {"c1": {"id": "c1"}})
+        stages = god.last_summary["stages"]
+        self.assertLess(abs(stages["stage1.filter"]["start_offset"] - stages["stage2.world"]["start_offset"]), 0.05)
+        self.assertLess(god.last_summary["wall_seconds"], 0.18)
+        self.assertIn("llm_budget", god.last_summary)
+
+    def test_serial_stages(self):
+        """测试关闭并行后阶段1与阶段2依次执行"""
+        god = CreatorGod(parallel=False)
+        god.character_filter_agent = _SlowAgent([{"id": "c1", "name": "甲", "importance": 1}])
+        god.world_setting_agent = _SlowAgent({"meta": {"world_name": "测试世界"}})
+        god.character_detail_agent = _SlowAgent({"c1": {"id": "c1"}}, delay=0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            god.run_pipeline("小说", Path(tmp))
+
+        stages = god.last_summary["stages"]
+        gap = abs(stages["stage1.filter"]["start_offset"] - stages["stage2.world"]["start_offset"])
+        self.assertGreaterEqual(gap, 0.09)
+        self.assertGreaterEqual(god.last_summary["wall_seconds"], 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+测试创世任务队列：互斥认领、失败重试、失联回收、worker 处理任务，以及跨实例共享的 LLM 限流
+"""
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from agents.offline.creatorGod import GenesisJobQueue, run_worker
+from agents.offline.creatorGod.job_queue import _is_launcher_worker, launcher_worker_name
+from utils.llm_telemetry import SharedLLMRateLimit
+
+
+class QueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Path(self.tmp.name) / "queue.db"
+        self.queue = GenesisJobQueue(self.db)
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+
+class TestGenesisJobQueue(QueueTestCase):
+    def test_submit_dedupes_and_claims_exclusively(self):
+        """测试同一本小说不重复排队，两个实例不会认领到同一任务，优先级高的先出队"""
+        first, created = self.queue.submit("a.txt")
+        self.assertTrue(created)
+        self.assertEqual(self.queue.submit("a.txt"), (first, False))
+        urgent, _ = self.queue.submit("b.txt", priority=5)
+
+        other = GenesisJobQueue(self.db)
+        try:
+            claimed = [self.queue.claim("w1"), other.claim("w2"), other.claim("w2")]
+        finally:
+            other.close()
+        self.assertEqual([job.id for job in claimed[:2]], [urgent, first])
+        self.assertIsNone(claimed[2])
+        self.assertEqual(self.queue.counts()["running"], 2)
+        self.assertFalse(self.queue.cancel(first))
+
+    def test_fail_requeues_until_max_attempts(self):
+        job_id, _ = self.queue.submit("a.txt", max_attempts=2)
+        self.queue.claim("w1")
+        self.assertEqual(self.queue.fail(job_id, "boom"), "queued")
+        self.queue.claim("w1")
+        self.assertEqual(self.queue.fail(job_id, "boom"), "failed")
+        job = self.queue.get(job_id)
+        self.assertEqual((job.status, job.attempts, job.error), ("failed", 2, "boom"))
+
+        self.assertTrue(self.queue.retry(job_id))
+        self.assertEqual(self.queue.get(job_id).attempts, 0)
+
+    def test_recover_stale_running_jobs(self):
+        """测试心跳超时的任务重新排队，心跳正常的不受影响"""
+        stale, _ = self.queue.submit("a.txt")
+        alive, _ = self.queue.submit("b.txt")
+        self.queue.claim("w1")
+        self.queue.claim("w2")
+        self.queue.conn.execute("UPDATE genesis_jobs SET heartbeat_at = ? WHERE id = ?", (time.time() - 600, stale))
+
+        self.assertEqual(self.queue.recover_stale(300), [stale])
+        self.assertEqual(self.queue.get(stale).status, "queued")
+        self.assertEqual(self.queue.get(alive).status, "running")
+
+    def test_stale_job_fails_after_max_attempts(self):
+        """测试反复拖垮 worker 的任务用完尝试次数后标记失败，不再无限重排"""
+        job_id, _ = self.queue.submit("a.txt", max_attempts=2)
+        for _ in range(2):
+            self.queue.claim("w1")
+            self.queue.conn.execute("UPDATE genesis_jobs SET heartbeat_at = 0 WHERE id = ?", (job_id,))
+            self.assertEqual(self.queue.recover_stale(300), [job_id])
+        job = self.queue.get(job_id)
+        self.assertEqual((job.status, job.attempts), ("failed", 2))
+        self.assertIsNone(self.queue.claim("w1"))
+
+    def test_release_launcher_workers(self):
+        """测试重启时不等心跳超时，立即回收本机启动器遗留的任务"""
+        ours, _ = self.queue.submit("a.txt")
+        other, _ = self.queue.submit("b.txt")
+        self.queue.claim(launcher_worker_name(1))
+        self.queue.claim("other-host:w1")
+
+        self.assertEqual(self.queue.recover_stale(300), [])
+        self.assertEqual(self.queue.release_workers(_is_launcher_worker), [ours])
+        self.assertEqual(self.queue.get(ours).status, "queued")
+        self.assertEqual(self.queue.get(other).status, "running")
+
+
+class TestWorker(QueueTestCase):
+    def test_worker_drains_queue(self):
+        """测试 worker 处理到队列为空，成功记录世界目录与摘要，失败的任务用完尝试次数后标记失败"""
+        for novel in ("a.txt", "bad.txt", "c.txt"):
+            self.queue.submit(novel, max_attempts=2)
+        built = []
+
+        def builder(novel, world_name, rate_limit):
+            built.append(novel)
+            if novel == "bad.txt":
+                raise RuntimeError("模型不可用")
+            return Path(self.tmp.name) / novel, {"stages": {}}
+
+        handled = run_worker(self.db, worker="w1", builder=builder, calls_per_minute=0)
+
+        self.assertEqual(handled, 4)
+        self.assertEqual(built.count("bad.txt"), 2)
+        counts = self.queue.counts()
+        self.assertEqual((counts["done"], counts["failed"]), (2, 1))
+        done = self.queue.jobs("done")[0]
+        self.assertTrue(done.world_dir.endswith("a.txt"))
+        self.assertEqual(done.summary, {"stages": {}})
+
+
+class TestSharedLLMRateLimit(unittest.TestCase):
+    def test_instances_share_bucket(self):
+        """测试两个实例共用同一令牌桶：额度用完后任一实例都要等待"""
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Path(tmp) / "queue.db"
+            # 每分钟 120 次：桶容量 120，每 0.5 秒补充一个
+            first = SharedLLMRateLimit(db, 120)
+            second = SharedLLMRateLimit(db, 120)
+            for limiter in (first, second) * 60:
+                limiter.acquire()
+            self.assertEqual(first.waited_seconds + second.waited_seconds, 0)
+
+            start = time.monotonic()
+            second.acquire()
+            self.assertGreater(second.waited_seconds, 0)
+            self.assertGreater(time.monotonic() - start, 0.3)
+
+    def test_fractional_rate(self):
+        """测试每分钟不足一次时首个令牌立即可用，之后按速率等待而不是永远阻塞"""
+        with tempfile.TemporaryDirectory() as tmp:
+            limiter = SharedLLMRateLimit(Path(tmp) / "queue.db", 0.5)
+            self.assertEqual(limiter._take(), 0)
+            self.assertAlmostEqual(limiter._take(), 120, delta=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,7 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
-from utils.json_parser import parse_json_response, safe_parse_npc_response
+from utils.json_parser import extract_json, parse_json_response, safe_parse_npc_response
 
 
 class TestJsonParser(unittest.TestCase):
@@ -81,5 +81,73 @@ class TestJsonParser(unittest.TestCase):
         self.assertEqual(result["thought"], "（解析失败）")
 
 
+class TestExtractJson(unittest.TestCase):
+    """测试单遍提取器的修复能力与诊断信息"""
+
+    def test_url_inside_string_is_preserved(self):
+        """测试字符串内的 // 不被当作注释"""
+        result = extract_json('{"url": "https://example.com/a", // 注释\n "ok": true}')
+        self.assertTrue(result.success)
+        self.assertEqual(result.value["url"], "https://example.com/a")
+        self.assertIn("comments", result.repairs)
+
+    def test_trailing_comma(self):
+        """测试末尾多余逗号"""
+        result = extract_json('{"items": [1, 2, 3,], "name": "x",}')
+        self.assertTrue(result.success)
+        self.assertEqual(result.value, {"items": [1, 2, 3], "name": "x"})
+        self.assertIn("trailing_comma", result.repairs)
+
+    def test_truncated_output(self):
+        """测试截断输出补全"""
+        result = extract_json('```json\n{"a": 1, "b": {"c": "未写完')
+        self.assertTrue(result.success)
+        self.assertEqual(result.value, {"a": 1, "b": {"c": "未写完"}})
+        self.assertIn("truncated", result.repairs)
+
+    def test_truncated_after_key(self):
+        """测试截断在键之后时回退到最后一个完整元素"""
+        result = extract_json('{"a": 1, "b": ')
+        self.assertTrue(result.success)
+        self.assertEqual(result.value, {"a": 1})
+
+    def test_raw_newline_in_string(self):
+        """测试字符串内的裸换行"""
+        result = extract_json('{"text": "第一行\n第二行"}')
+        self.assertTrue(result.success)
+        self.assertEqual(result.value["text"], "第一行\n第二行")
+
+    def test_array_with_surrounding_text(self):
+        """测试顶层数组与前后说明文字"""
+        result = extract_json('结果如下：\n[{"id": 1}, {"id": 2}]\n以上。')
+        self.assertTrue(result.success)
+        self.assertEqual(len(result.value), 2)
+        self.assertIn("leading_text", result.repairs)
+        self.assertIn("trailing_text", result.repairs)
+
+    def test_expect_skips_prose_brackets(self):
+        """测试说明文字中的括号排在对象之前时，指定 expect=dict 仍取到对象"""
+        text = '角色[1]的剧本如下：{"a": 1}'
+        self.assertEqual(extract_json(text).value, [1])
+        result = extract_json(text, expect=dict)
+        self.assertTrue(result.success)
+        self.assertEqual(result.value, {"a": 1})
+        self.assertFalse(extract_json("[1, 2]", expect=dict).success)
+
+    def test_prefers_fenced_block(self):
+        """测试有代码块时优先取代码块内的 JSON"""
+        text = '参见[注1]和{草稿}。\n```json\n{"scene": 2}\n```\n以上。'
+        result = extract_json(text)
+        self.assertTrue(result.success)
+        self.assertEqual(result.value, {"scene": 2})
+        self.assertEqual(text[result.span[0]:result.span[1]], '{"scene": 2}')
+
+    def test_failure_diagnostics(self):
+        """测试失败时返回错误原因"""
+        result = extract_json("没有任何结构")
+        self.assertFalse(result.success)
+        self.assertTrue(result.error)
+
+
 if __name__ == '__main__':
     unittest.main()
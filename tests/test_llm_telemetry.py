@@ -0,0 +1,159 @@
+"""
+测试 LLM 调用遥测：token 统计、首 token 延迟、Agent / 会话 / 回合模式归因与 JSONL 落盘
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+import uuid
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from config.settings import settings
+from utils.llm_factory import get_llm
+from utils.llm_telemetry import (
+    InMemoryTelemetrySink,
+    JsonlTelemetrySink,
+    LLMTelemetry,
+    LLMTelemetryCallback,
+    estimate_tokens,
+    llm_telemetry,
+    telemetry_context,
+)
+from utils.logger import flush_logging
+from utils.mock_llm import MockChatLLM
+
+
+class TestEstimateTokens(unittest.TestCase):
+    """测试本地 token 估算"""
+
+    def test_cjk_and_latin(self):
+        """测试中文按字计数，英文按 4 字符计数"""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("你好，世界"), 5)
+        self.assertEqual(estimate_tokens("abcd efgh"), 2)
+
+
+class TestTelemetryCallback(unittest.TestCase):
+    """测试挂载在 LLM 实例上的回调"""
+
+    def setUp(self):
+        llm_telemetry.memory.clear()
+
+    def test_factory_llm_tagged_with_context(self):
+        """测试工厂创建的 LLM 记录 Agent、会话与回合模式"""
+        llm = get_llm(provider="mock", agent_name="TestAgent")
+        with telemetry_context(session_id="sess_1", turn_mode="dialogue"):
+            llm.invoke([HumanMessage(content="你好")])
+        llm.invoke([HumanMessage(content="再见")])
+
+        first, second = list(llm_telemetry.memory.records)
+        self.assertEqual(first.agent, "TestAgent")
+        self.assertEqual((first.session_id, first.turn_mode), ("sess_1", "dialogue"))
+        self.assertIsNone(second.session_id)
+        self.assertTrue(first.success)
+        self.assertEqual(first.usage_source, "estimate")
+        self.assertGreater(first.completion_tokens, 0)
+        self.assertEqual(llm_telemetry.memory.summary()["TestAgent"]["calls"], 2)
+
+    def test_stream_records_ttft(self):
+        """测试流式调用记录首 token 延迟"""
+        llm = get_llm(provider="mock", agent_name="Streamer")
+        "".join(chunk.content for chunk in llm.stream([HumanMessage(content="讲个故事")]))
+        record = llm_telemetry.memory.records[-1]
+        self.assertTrue(record.streamed)
+        self.assertLessEqual(record.ttft_ms, record.latency_ms)
+
+    def test_agent_override(self):
+        """测试 telemetry_context(agent=...) 覆盖实例上的 Agent 名"""
+        llm = get_llm(provider="mock", agent_name="NPC")
+        with telemetry_context(agent="NPC.Proactive"):
+            llm.invoke([HumanMessage(content="你好")])
+        self.assertEqual(llm_telemetry.memory.records[-1].agent, "NPC.Proactive")
+
+    def test_provider_usage_preferred(self):
+        """测试提供商返回 usage 时不再估算"""
+        telemetry = LLMTelemetry()
+        callback = LLMTelemetryCallback("Agent", "openai", "gpt", telemetry=telemetry)
+        run_id = uuid.uuid4()
+        callback.on_chat_model_start({}, [[HumanMessage(content="你好")]], run_id=run_id)
+        message = AIMessage(
+            content="好",
+            usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150},
+        )
+        callback.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+
+        record = telemetry.memory.records[-1]
+        self.assertEqual((record.prompt_tokens, record.completion_tokens), (120, 30))
+        self.assertEqual(record.usage_source, "provider")
+        self.assertFalse(record.streamed)
+        self.assertEqual(record.ttft_ms, record.latency_ms)
+
+    def test_error_recorded(self):
+        """测试调用失败时记录错误"""
+        llm = MockChatLLM(callbacks=[LLMTelemetryCallback("Broken", "mock", "mock")])
+        with patch.object(MockChatLLM, "_generate", side_effect=RuntimeError("连接超时")):
+            with self.assertRaises(RuntimeError):
+                llm.invoke([HumanMessage(content="你好")])
+        record = llm_telemetry.memory.records[-1]
+        self.assertFalse(record.success)
+        self.assertIn("连接超时", record.error)
+        self.assertEqual(llm_telemetry.memory.summary()["Broken"]["errors"], 1)
+
+
+class TestSinks(unittest.TestCase):
+    """测试记录分发"""
+
+    def test_jsonl_sink_writes_line(self):
+        """测试 JSONL sink 每条记录写一行，且不影响全局遥测的输出文件"""
+        global_sinks = [s for s in llm_telemetry._sinks if isinstance(s, JsonlTelemetrySink)]
+        global_handlers = [list(s._logger.handlers) for s in global_sinks]
+        tmp = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.addCleanup(tmp.cleanup)
+        # 绝对路径：不写入真实的日志目录
+        path = Path(tmp.name) / f"test_telemetry_{uuid.uuid4().hex[:8]}.jsonl"
+        telemetry = LLMTelemetry()
+        sink = JsonlTelemetrySink(str(path))
+        telemetry.add_sink(sink)
+        self.addCleanup(telemetry.remove_sink, sink)
+        callback = LLMTelemetryCallback("Agent", "mock", "mock", telemetry=telemetry)
+        run_id = uuid.uuid4()
+        callback.on_llm_start({}, ["提示"], run_id=run_id)
+        callback.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content="回应"))]]), run_id=run_id)
+        flush_logging()
+
+        lines = path.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(len(lines), 1)
+        data = json.loads(lines[0])
+        self.assertEqual(data["agent"], "Agent")
+        self.assertEqual(data["total_tokens"], data["prompt_tokens"] + data["completion_tokens"])
+        # 新建 sink 不会改写全局遥测的输出
+        self.assertEqual([list(s._logger.handlers) for s in global_sinks], global_handlers)
+
+    def test_failing_sink_isolated(self):
+        """测试单个 sink 出错不影响其他 sink"""
+
+        class _Broken(InMemoryTelemetrySink):
+            def emit(self, record):
+                raise ValueError("boom")
+
+        telemetry = LLMTelemetry()
+        telemetry._sinks.insert(0, _Broken())
+        callback = LLMTelemetryCallback("Agent", "mock", "mock", telemetry=telemetry)
+        run_id = uuid.uuid4()
+        callback.on_llm_start({}, ["提示"], run_id=run_id)
+        callback.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content="回应"))]]), run_id=run_id)
+        self.assertEqual(len(telemetry.memory.records), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
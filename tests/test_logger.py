@@ -0,0 +1,100 @@
+"""
+测试异步日志管线：后台写入、上下文快照、限流与队列满丢弃
+"""
+import logging
+import queue
+import sys
+import unittest
+import uuid
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config.settings import settings
+from utils import logger as logger_module
+from utils.logger import RateLimitFilter, flush_logging, log_operation, setup_logger
+
+
+class TestAsyncLogging(unittest.TestCase):
+    """测试 QueueHandler → QueueListener 管线"""
+
+    def setUp(self):
+        self._async = settings.LOG_ASYNC
+        settings.LOG_ASYNC = True
+        self.log_file = f"test_async_{uuid.uuid4().hex[:8]}.log"
+        self.logger = setup_logger(f"AsyncTest.{self.log_file}", self.log_file)
+
+    def tearDown(self):
+        settings.LOG_ASYNC = self._async
+        flush_logging()
+        path = settings.LOGS_DIR / self.log_file
+        if path.exists():
+            path.unlink()
+
+    def test_written_by_background_thread(self):
+        """测试日志由后台线程写入文件，上下文取自记录产生时"""
+        with log_operation("测试操作", scene_id=3):
+            self.logger.info("第 %d 回合", 7)
+        self.logger.info("上下文外")
+        self.assertTrue(flush_logging())
+        lines = (settings.LOGS_DIR / self.log_file).read_text(encoding="utf-8").splitlines()
+        self.assertIn("第 7 回合 [operation=测试操作, scene_id=3]", lines[0])
+        self.assertTrue(lines[1].endswith("上下文外"))
+
+    def test_not_formatted_on_caller(self):
+        """测试入队时不做格式化"""
+        handler = self.logger.handlers[0]
+        record = self.logger.makeRecord(self.logger.name, logging.INFO, __file__, 1, "x=%s", ("y",), None)
+        prepared = handler.prepare(record)
+        self.assertEqual(prepared.msg, "x=%s")
+        self.assertFalse(hasattr(prepared, "message"))
+
+    def test_queue_full_drops(self):
+        """测试队列满时丢弃而不阻塞"""
+        full = queue.Queue(maxsize=1)
+        full.put_nowait(None)
+        handler = logger_module._ModuleQueueHandler(full, None)
+        before = logger_module.get_dropped_log_count()
+        handler.emit(logging.makeLogRecord({"msg": "丢弃", "levelno": logging.INFO}))
+        self.assertEqual(logger_module.get_dropped_log_count(), before + 1)
+
+
+class TestRateLimitFilter(unittest.TestCase):
+    """测试按模块限流"""
+
+    def _record(self, level=logging.INFO):
+        return logging.makeLogRecord({"msg": "tick", "levelno": level})
+
+    def test_limits_info_but_not_warning(self):
+        """测试超出速率的 INFO 被丢弃，WARNING 始终放行"""
+        limiter = RateLimitFilter(per_second=2)
+        passed = [limiter.filter(self._record()) for _ in range(5)]
+        self.assertEqual(passed.count(True), 2)
+        self.assertTrue(limiter.filter(self._record(logging.WARNING)))
+
+    def test_suppressed_count_reported(self):
+        """测试令牌恢复后放行的记录带上被丢弃条数"""
+        limiter = RateLimitFilter(per_second=1)
+        limiter.filter(self._record())
+        limiter.filter(self._record())
+        limiter._last -= 1.0
+        record = self._record()
+        self.assertTrue(limiter.filter(record))
+        self.assertEqual(record.suppressed, 1)
+
+    def test_per_module_override(self):
+        """测试 LOG_RATE_LIMITS 覆盖单个模块"""
+        original = settings.LOG_RATE_LIMITS
+        settings.LOG_RATE_LIMITS = "NPCManager=5, Plot=0"
+        try:
+            self.assertEqual(logger_module._rate_limit_for("NPCManager"), 5)
+            self.assertEqual(logger_module._rate_limit_for("Plot"), 0)
+            self.assertEqual(logger_module._rate_limit_for("Other"), settings.LOG_RATE_LIMIT)
+        finally:
+            settings.LOG_RATE_LIMITS = original
+
+
+if __name__ == '__main__':
+    unittest.main()
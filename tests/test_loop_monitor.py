@@ -0,0 +1,129 @@
+"""
+测试事件循环阻塞检测，以及 /game/action 中的同步重活不会阻塞事件循环
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from utils.action_suggestions import SuggestionJob
+from utils.database.sqlite_store import SQLiteStore
+from utils.loop_monitor import LoopBlockMonitor
+
+
+def _blocking_helper():
+    time.sleep(0.15)
+
+
+class TestLoopBlockMonitor(unittest.TestCase):
+    """测试看门狗"""
+
+    def test_stall_logged_with_stack(self):
+        """测试事件循环被同步调用卡住时记录卡住处的调用栈"""
+        monitor = LoopBlockMonitor(threshold_ms=30)
+
+        async def scenario():
+            monitor.start()
+            await asyncio.sleep(0.02)
+            _blocking_helper()
+            await asyncio.sleep(0.02)
+            await monitor.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(monitor.stalls, 1)
+        self.assertIn("_blocking_helper", monitor.last_stack)
+
+    def test_idle_loop_no_stall(self):
+        monitor = LoopBlockMonitor(threshold_ms=30)
+
+        async def scenario():
+            monitor.start()
+            await asyncio.sleep(0.1)
+            await monitor.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(monitor.stalls, 0)
+
+
+class _SlowEngine:
+    """模拟引擎：回合本身是异步的，行动建议在回合收尾时已生成"""
+
+    def __init__(self):
+        self.os = SimpleNamespace(turn_count=1)
+
+    async def process_turn_async(self, action):
+        await asyncio.sleep(0.01)
+        return {"success": True, "text": "雨还在下。", "mode": "dialogue", "npc_reactions": []}
+
+    def prefetch_action_suggestions(self):
+        return SuggestionJob(self.os.turn_count, ["继续观察", "上前搭话"])
+
+
+class TestActionDoesNotBlock(unittest.TestCase):
+    """测试 /game/action 把同步重活放到线程池"""
+
+    def test_loop_stays_responsive(self):
+        import httpx
+        import api_server
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # 同一会话的回合是串行的，这里用三个会话并发
+            session_ids = [
+                api_server.session_manager.create_session(_SlowEngine(), None, Path(tmp)) for _ in range(3)
+            ]
+            monitor = LoopBlockMonitor(threshold_ms=30)
+
+            async def scenario():
+                monitor.start()
+                transport = httpx.ASGITransport(app=api_server.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    responses = await asyncio.gather(*(
+                        client.post("/game/action", json={"action": "看看四周", "session_id": session_id})
+                        for session_id in session_ids
+                    ))
+                await monitor.stop()
+                return responses
+
+            try:
+                responses = asyncio.run(scenario())
+            finally:
+                for session_id in session_ids:
+                    api_server.session_manager.remove_session(session_id)
+
+        self.assertTrue(all(r.json()["suggestions"] == ["继续观察", "上前搭话"] for r in responses))
+        self.assertEqual(monitor.stalls, 0)
+        self.assertLess(monitor.max_lag, 0.1)
+
+
+class TestSQLiteAcrossThreads(unittest.TestCase):
+    """测试 SQLite 连接可在线程池中使用"""
+
+    def test_concurrent_writes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SQLiteStore(Path(tmp) / "state.db")
+
+            def write(n):
+                for i in range(20):
+                    store.update_game_turn("g1", n * 100 + i, "2026-01-01T00:00:00")
+                    store.list_game_saves()
+
+            threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+"""
+测试 /metrics：文本格式、LLM 排队统计、事件循环延迟与本地启动服务后的抓取
+"""
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+import urllib.request
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from langchain_core.messages import HumanMessage
+
+from utils.concurrency import llm_slot
+from utils.llm_factory import get_llm
+from utils.metrics import (
+    EVENT_LOOP_LAG_HISTOGRAM,
+    LLM_QUEUE_WAIT_SECONDS,
+    LLM_QUEUE_WAITING,
+    EventLoopLagProbe,
+    MetricsRegistry,
+    metrics,
+    record_cache,
+)
+
+
+class TestExposition(unittest.TestCase):
+    """测试文本格式输出"""
+
+    def test_histogram_buckets_cumulative(self):
+        """测试直方图输出累计桶、+Inf、_sum 与 _count"""
+        registry = MetricsRegistry()
+        hist = registry.histogram("demo_seconds", "示例", ["route"], buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            hist.observe(value, route="/a")
+        text = registry.render()
+        self.assertIn("# TYPE demo_seconds histogram", text)
+        self.assertIn('demo_seconds_bucket{route="/a",le="0.1"} 1', text)
+        self.assertIn('demo_seconds_bucket{route="/a",le="1"} 2', text)
+        self.assertIn('demo_seconds_bucket{route="/a",le="+Inf"} 3', text)
+        self.assertIn('demo_seconds_count{route="/a"} 3', text)
+        self.assertIn('demo_seconds_sum{route="/a"} 5.55', text)
+
+    def test_labels_escaped_and_checked(self):
+        """测试标签值转义，标签名不符时报错"""
+        registry = MetricsRegistry()
+        counter = registry.counter("demo_total", "示例", ["name"])
+        counter.inc(name='a"b')
+        self.assertIn('demo_total{name="a\\"b"} 1', registry.render())
+        with self.assertRaises(ValueError):
+            counter.inc(other="x")
+        self.assertIs(registry.counter("demo_total", "示例", ["name"]), counter)
+        with self.assertRaises(ValueError):
+            registry.gauge("demo_total", "示例")
+
+    def test_cache_hit_ratio(self):
+        """测试抓取时计算缓存命中率"""
+        for hit in (True, True, True, False):
+            record_cache("unit_test_cache", hit)
+        self.assertIn('storymaker_cache_hit_ratio{cache="unit_test_cache"} 0.75', metrics.render())
+
+
+class TestRuntimeProbes(unittest.TestCase):
+    """测试 LLM 排队与事件循环延迟"""
+
+    def test_llm_slot_records_wait(self):
+        """测试名额被占用时记录排队数与等待时间"""
+        seen = []
+
+        async def scenario():
+            sem = asyncio.Semaphore(1)
+
+            async def holder():
+                async with llm_slot(sem, "QueueTest"):
+                    await asyncio.sleep(0.05)
+
+            async def waiter():
+                await asyncio.sleep(0.01)
+                async with llm_slot(sem, "QueueTest"):
+                    pass
+
+            async def observer():
+                await asyncio.sleep(0.03)
+                seen.append(LLM_QUEUE_WAITING.get(agent="QueueTest"))
+
+            await asyncio.gather(holder(), waiter(), observer())
+
+        before = LLM_QUEUE_WAIT_SECONDS.count(agent="QueueTest")
+        asyncio.run(scenario())
+        self.assertEqual(seen, [1])
+        self.assertEqual(LLM_QUEUE_WAITING.get(agent="QueueTest"), 0)
+        self.assertEqual(LLM_QUEUE_WAIT_SECONDS.count(agent="QueueTest"), before + 2)
+
+    def test_event_loop_lag_detected(self):
+        """测试同步阻塞会反映到事件循环延迟上"""
+
+        probe = EventLoopLagProbe(interval=0.01)
+
+        async def scenario():
+            probe.start()
+            await asyncio.sleep(0)
+            time.sleep(0.1)  # 故意阻塞事件循环
+            await asyncio.sleep(0.02)
+            await probe.stop()
+
+        asyncio.run(scenario())
+        self.assertGreaterEqual(probe.max_lag, 0.05)
+        self.assertGreaterEqual(EVENT_LOOP_LAG_HISTOGRAM.count(), 1)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """在本地启动 API 服务并抓取 /metrics"""
+
+    @classmethod
+    def setUpClass(cls):
+        import uvicorn
+        import api_server
+
+        cls.port = _free_port()
+        config = uvicorn.Config(api_server.app, host="127.0.0.1", port=cls.port, log_level="error")
+        cls.server = uvicorn.Server(config)
+        cls.thread = threading.Thread(target=cls.server.run, daemon=True)
+        cls.thread.start()
+        deadline = time.time() + 10
+        while not cls.server.started and time.time() < deadline:
+            time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.should_exit = True
+        cls.thread.join(timeout=5)
+
+    def _get(self, path: str):
+        return urllib.request.urlopen(f"http://127.0.0.1:{self.port}{path}", timeout=5)
+
+    def test_scrape(self):
+        """测试抓取结果包含路由延迟、LLM、会话与队列指标"""
+        self._get("/sessions/stats").read()
+        get_llm(provider="mock", agent_name="MetricsTest").invoke([HumanMessage(content="你好")])
+
+        response = self._get("/metrics")
+        self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+        text = response.read().decode("utf-8")
+        self.assertIn('storymaker_http_request_seconds_count{method="GET",route="/sessions/stats",status="200"}', text)
+        self.assertIn('storymaker_llm_calls_total{agent="MetricsTest",status="success"} 1', text)
+        self.assertIn('storymaker_llm_tokens_total{agent="MetricsTest",kind="completion"}', text)
+        self.assertIn('storymaker_sessions{state="active"} 0', text)
+        self.assertIn('storymaker_persistence_queue_depth{queue="json_mirror"}', text)
+        self.assertIn("# TYPE storymaker_event_loop_lag_seconds gauge", text)
+        self.assertIn("# TYPE storymaker_turn_seconds histogram", text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+测试角色名倒排索引与按提及片段提取角色档案
+"""
+import os
+import sys
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from agents.offline.creatorGod import CharacterDetailAgent, NameIndex, merge_profiles
+from config.settings import settings
+
+CHARACTERS = [
+    {"id": "npc_001", "name": "张三", "aliases": ["三哥"], "importance": 1.0},
+    {"id": "npc_002", "name": "张三丰", "importance": 0.5},
+    {"id": "npc_003", "name": "李四", "importance": 0.1},
+]
+
+
+class TestNameIndex(unittest.TestCase):
+    def test_longest_name_wins(self):
+        """测试长名字优先匹配，别名归到同一角色"""
+        text = "张三丰闭关。张三来了。三哥笑道：好。"
+        index = NameIndex(text, CHARACTERS)
+        self.assertEqual(index.mention_count("npc_002"), 1)
+        self.assertEqual(index.occurrences("npc_001"), [(6, 8), (11, 13)])
+        self.assertEqual(index.mention_count("npc_003"), 0)
+        self.assertEqual(index.context_batches("npc_003", max_tokens=100), [])
+
+    def test_windows_merge_and_budget(self):
+        """测试相邻提及合并为一个片段，片段按 token 预算分批"""
+        filler = "风吹过山岗。" * 200
+        text = filler + "李四出门。李四回头。" + filler + "李四睡了。" + filler
+        index = NameIndex(text, CHARACTERS)
+        windows = index.windows("npc_003", radius=20)
+        self.assertEqual(len(windows), 2)
+        for start, end in windows:
+            self.assertIn(text[end - 1], "。")
+
+        single = index.context_batches("npc_003", max_tokens=1000, radius=20)
+        self.assertEqual(len(single), 1)
+        self.assertLess(len(single[0]), len(text) // 10)
+        split = index.context_batches("npc_003", max_tokens=40, radius=20)
+        self.assertEqual(len(split), 2)
+        capped = index.context_batches("npc_003", max_tokens=40, radius=20, max_batches=1)
+        self.assertEqual(len(capped), 1)
+
+
+class _RecordingLLM:
+    """记录每次收到的上下文长度，返回固定档案"""
+
+    def __init__(self):
+        self.inputs = []
+
+    def __call__(self, prompt_value):
+        self.inputs.append(prompt_value.to_messages()[-1].content)
+        return '{"gender": "男", "traits": ["机警"], "relationship_matrix": {"npc_001": {"address_as": "三哥"}}}'
+
+
+class TestDetailAgentExcerpts(unittest.TestCase):
+    def test_minor_character_uses_excerpts(self):
+        """测试全书超出单次预算时，按名字或别名只发送提及片段，每个角色一次调用完成"""
+        from langchain_core.runnables import RunnableLambda
+
+        recorder = _RecordingLLM()
+        agent = CharacterDetailAgent(llm=RunnableLambda(recorder))
+        filler = "风吹过山岗。" * 3000
+        text = filler + "李四对三哥说：走吧。" + filler
+
+        original = settings.GENESIS_DETAIL_CONTEXT_TOKENS
+        settings.GENESIS_DETAIL_CONTEXT_TOKENS = 2000
+        try:
+            details = agent.run(text, [CHARACTERS[0], CHARACTERS[2]])
+        finally:
+            settings.GENESIS_DETAIL_CONTEXT_TOKENS = original
+
+        self.assertEqual(len(recorder.inputs), 2)
+        self.assertTrue(all(len(sent) < 2000 for sent in recorder.inputs))
+        self.assertEqual(details["npc_003"]["traits"], ["机警"])
+        self.assertEqual(details["npc_003"]["importance"], 0.1)
+        self.assertEqual(details["npc_003"]["name"], "李四")
+
+    def test_merge_profile(self):
+        """测试多批结果合并：字符串保留首个，列表去重追加，关系按键合并，身份字段不被片段覆盖"""
+        base = {key: CHARACTERS[0][key] for key in ("id", "name", "importance")}
+        merged = merge_profiles([
+            {"name": "张老三", "age": "30岁", "traits": ["豪爽"], "relationship_matrix": {"npc_002": {"attitude": "敬重"}}},
+            {"age": "", "traits": ["豪爽", "鲁莽"], "relationship_matrix": {"npc_002": {"attitude": "厌恶"}, "npc_003": {}}},
+        ], base=base)
+        self.assertEqual(merged["name"], "张三")
+        self.assertEqual(merged["age"], "30岁")
+        self.assertEqual(merged["traits"], ["豪爽", "鲁莽"])
+        self.assertEqual(merged["relationship_matrix"]["npc_002"], {"attitude": "敬重"})
+        self.assertIn("npc_003", merged["relationship_matrix"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+测试小说读取：样本判断编码、单遍流式解码，以及分块视图不复制文本
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from agents.offline.creatorGod.ingest import chunk_views, detect_encoding, read_novel
+
+
+class TestReadNovel(unittest.TestCase):
+    def _write(self, data: bytes) -> Path:
+        tmp = tempfile.NamedTemporaryFile(suffix=".txt", delete=False)
+        tmp.write(data)
+        tmp.close()
+        self.addCleanup(os.unlink, tmp.name)
+        return Path(tmp.name)
+
+    def test_encodings(self):
+        """测试 UTF-8（含 BOM）与 GB18030 文件都能正确识别，换行统一为 \\n"""
+        text = "第一章 风起\r\n张三推门而入。\r\n"
+        cases = [
+            (text.encode("utf-8"), "utf-8"),
+            (text.encode("utf-8-sig"), "utf-8-sig"),
+            (text.encode("gb18030"), "gb18030"),
+        ]
+        for data, expected in cases:
+            novel = read_novel(self._write(data))
+            self.assertEqual(novel.encoding, expected)
+            self.assertEqual(novel.text, "第一章 风起\n张三推门而入。\n")
+
+    def test_multibyte_char_across_blocks(self):
+        """测试多字节字符跨越样本/块边界时解码不出错"""
+        text = "甲乙丙丁" * 1000
+        data = text.encode("utf-8")
+        self.assertEqual(detect_encoding(data[:100]), "utf-8")  # 100 不是 3 的倍数，截断了一个字符
+        novel = read_novel(self._write(data), sample_bytes=100, block_bytes=7)
+        self.assertEqual(novel.text, text)
+
+    def test_invalid_after_sample_falls_back(self):
+        """测试样本之后才出现非 UTF-8 字节时回退到其他编码"""
+        data = b"Chapter 1\n" * 10 + "后文".encode("gb18030")
+        novel = read_novel(self._write(data), sample_bytes=30)
+        self.assertEqual(novel.encoding, "gb18030")
+        self.assertTrue(novel.text.endswith("后文"))
+
+    def test_peak_memory_near_one_copy(self):
+        """测试读取与切分大文件后只保留一份文本，解码峰值不超过约两份"""
+        text = "山外青山楼外楼，西湖歌舞几时休。\n" * 60000  # 约 100 万字
+        path = self._write(text.encode("utf-8"))
+        text_bytes = sys.getsizeof(text)
+        del text
+
+        tracemalloc.start()
+        try:
+            novel = read_novel(path)
+            views = chunk_views(novel.text, 50000, 2000)
+            hits = sum(1 for view in views if view.contains("西湖"))
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(hits, len(views))
+        self.assertEqual(str(views[1])[:5], novel.text[48000:48005])
+        self.assertLess(current, text_bytes * 1.1)
+        self.assertLess(peak, text_bytes * 2.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
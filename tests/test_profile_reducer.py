@@ -0,0 +1,104 @@
+"""
+测试角色档案归并：确定性去重、超限时模型精炼、分层归并不超过单次输入上限
+"""
+import json
+import os
+import sys
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from langchain_core.runnables import RunnableLambda
+
+from agents.offline.creatorGod import ProfileReducer, merge_profiles
+from utils.character_data import CharacterDataFormatter
+from utils.llm_telemetry import estimate_tokens
+
+CHAR = {"id": "npc_001", "name": "张三", "importance": 0.9}
+
+
+def _part(i):
+    """模拟一批片段的提取结果：标签与规则大量重复，台词各不相同"""
+    return {
+        "gender": "男",
+        "age": "未知" if i else "30岁",
+        "traits": ["剑客", "落魄剑客", "豪爽。"],
+        "behavior_rules": ["遇强则强", "遇强则强！"],
+        "relationship_matrix": {"npc_002": {"address_as": "" if i else "四弟", "attitude": "信任"}},
+        "voice_samples": [f"第{i}句台词：" + "好酒" * 30],
+    }
+
+
+class _ConsolidateLLM:
+    """记录每次精炼的输入长度；drop_relations 时故意丢掉关系"""
+
+    def __init__(self, drop_relations=False):
+        self.inputs = []
+        self.drop_relations = drop_relations
+
+    def __call__(self, prompt_value):
+        card = json.loads(prompt_value.to_messages()[-1].content)
+        self.inputs.append(estimate_tokens(prompt_value.to_messages()[-1].content))
+        result = {
+            "traits": card.get("traits", [])[:2],
+            "voice_samples": card.get("voice_samples", [])[:2],
+            "relationship_matrix": {} if self.drop_relations else card.get("relationship_matrix", {}),
+        }
+        return json.dumps(result, ensure_ascii=False)
+
+
+class TestMergeProfiles(unittest.TestCase):
+    def test_deterministic_dedupe(self):
+        """测试近义重复合并、被包含的短条目并入长条目、关系子字段补齐"""
+        merged = merge_profiles([_part(1), _part(0)])
+        self.assertEqual(merged["traits"], ["落魄剑客", "豪爽。"])
+        self.assertEqual(merged["behavior_rules"], ["遇强则强"])
+        self.assertEqual(merged["age"], "30岁")
+        self.assertEqual(merged["relationship_matrix"]["npc_002"], {"address_as": "四弟", "attitude": "信任"})
+        self.assertEqual(len(merged["voice_samples"]), 2)
+
+    def test_formatter_dedupes(self):
+        """测试格式化提示词时也会去掉重复条目"""
+        self.assertEqual(CharacterDataFormatter.format_traits(["剑客", "落魄剑客", "剑客"]), "落魄剑客")
+
+
+class TestProfileReducer(unittest.TestCase):
+    def test_small_profile_skips_llm(self):
+        llm = _ConsolidateLLM()
+        reducer = ProfileReducer(RunnableLambda(llm), token_cap=10000)
+        profile = reducer.reduce(CHAR, [_part(0), _part(1)])
+        self.assertEqual(llm.inputs, [])
+        self.assertEqual(profile["id"], "npc_001")
+        self.assertEqual(profile["importance"], 0.9)
+
+    def test_hierarchical_reduce_respects_input_cap(self):
+        """测试档案过大时分组精炼，每次调用输入不超过上限，遗漏的字段用确定性结果补齐"""
+        llm = _ConsolidateLLM()
+        reducer = ProfileReducer(RunnableLambda(llm), token_cap=150, input_tokens=400)
+        parts = [_part(i) for i in range(12)]
+        profile = reducer.reduce(CHAR, parts)
+
+        self.assertGreater(len(llm.inputs), 1)
+        self.assertTrue(all(tokens <= 400 for tokens in llm.inputs))
+        self.assertEqual(len(profile["voice_samples"]), 2)
+        self.assertEqual(profile["behavior_rules"], ["遇强则强"])
+        self.assertEqual(profile["gender"], "男")
+        self.assertEqual(reducer.fallbacks, 0)
+
+    def test_lossy_consolidation_falls_back(self):
+        """测试精炼结果丢掉关系对象时保留确定性归并结果"""
+        llm = _ConsolidateLLM(drop_relations=True)
+        reducer = ProfileReducer(RunnableLambda(llm), token_cap=150, input_tokens=100000)
+        profile = reducer.reduce(CHAR, [_part(i) for i in range(6)])
+        self.assertEqual(len(llm.inputs), 1)
+        self.assertEqual(reducer.fallbacks, 1)
+        self.assertEqual(len(profile["voice_samples"]), 6)
+        self.assertIn("npc_002", profile["relationship_matrix"])
+
+
+if __name__ == '__main__':
+    unittest.main()
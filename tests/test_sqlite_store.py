@@ -0,0 +1,167 @@
+"""
+测试 SQLiteStore 的批量提交、索引、迁移与区间查询
+"""
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.database.shard_router import ShardRouter
+from utils.database.sqlite_store import SCHEMA_VERSION, SQLiteStore
+from utils.database.state_manager import StateManager
+
+
+def _agent_state(game_id: str, turn: int, agent_type: str = "WS") -> dict:
+    return {
+        "id": f"{game_id}-{agent_type}-{turn}",
+        "game_id": game_id,
+        "agent_type": agent_type,
+        "turn_number": turn,
+        "state_snapshot": {"turn": turn},
+        "timestamp": f"2025-01-01T00:00:{turn:02d}.000000Z",
+        "is_synced": 0,
+    }
+
+
+class TestSQLiteStore(unittest.TestCase):
+    """测试 SQLiteStore"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self._tmp.name) / "state.db"
+        self.store = SQLiteStore(self.db_path)
+
+    def tearDown(self):
+        self.store.close()
+        self._tmp.cleanup()
+
+    def _count_from_other_connection(self, table: str) -> int:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_indexes_created(self):
+        """测试复合索引已建立"""
+        rows = self.store.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        ).fetchall()
+        names = {row["name"] for row in rows}
+        self.assertIn("idx_agent_states_game_turn", names)
+        self.assertIn("idx_event_logs_game_type", names)
+        self.assertIn("idx_memory_diffs_game_turn", names)
+        columns = [row["name"] for row in self.store.conn.execute("PRAGMA index_info(idx_event_logs_game_type)")]
+        self.assertEqual(columns, ["game_id", "turn_number", "event_type"])
+
+    def test_event_log_index_upgraded(self):
+        """测试 v3 数据库的旧事件日志索引（按 agent_source）被替换为按 event_type"""
+        self.store.conn.executescript(
+            """
+            DROP INDEX idx_event_logs_game_type;
+            CREATE INDEX idx_event_logs_game_turn ON event_logs (game_id, turn_number, agent_source);
+            PRAGMA user_version = 3;
+            """
+        )
+        self.store.close()
+        self.store = SQLiteStore(self.db_path)
+        names = {row["name"] for row in self.store.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn("idx_event_logs_game_type", names)
+        self.assertNotIn("idx_event_logs_game_turn", names)
+
+    def test_transaction_commits_once(self):
+        """测试事务内的写入在退出前对其他连接不可见"""
+        with self.store.transaction():
+            self.store.insert_agent_state(_agent_state("g1", 1))
+            self.store.insert_agent_state(_agent_state("g1", 1, "Plot"))
+            self.assertEqual(self._count_from_other_connection("agent_states"), 0)
+        self.assertEqual(self._count_from_other_connection("agent_states"), 2)
+
+    def test_transaction_rollback(self):
+        """测试事务内异常时整批回滚"""
+        with self.assertRaises(RuntimeError):
+            with self.store.transaction():
+                self.store.insert_agent_state(_agent_state("g1", 1))
+                raise RuntimeError("boom")
+        self.assertEqual(self.store.query_agent_states("g1"), [])
+
+    def test_range_query(self):
+        """测试按回合区间读取"""
+        for turn in range(10):
+            self.store.insert_agent_state(_agent_state("g1", turn))
+        self.store.insert_agent_state(_agent_state("g2", 5))
+
+        rows = self.store.query_agent_states("g1", start_turn=3, end_turn=5)
+        self.assertEqual([row["turn_number"] for row in rows], [3, 4, 5])
+        self.assertEqual(rows[0]["state_snapshot"], {"turn": 3})
+
+    def test_migrate_legacy_database(self):
+        """测试旧库（无 turn_number 列、无索引）可以被升级"""
+        legacy_path = Path(self._tmp.name) / "legacy.db"
+        conn = sqlite3.connect(legacy_path)
+        conn.executescript(
+            """
+            CREATE TABLE memory_diffs (
+                id TEXT PRIMARY KEY, game_id TEXT, agent_type TEXT, field TEXT,
+                old_value TEXT, new_value TEXT, trigger TEXT, timestamp TEXT,
+                is_synced INTEGER DEFAULT 0
+            );
+            INSERT INTO memory_diffs (id, game_id, agent_type, field)
+                VALUES ('d1', 'g1', 'NPC', 'mood');
+            """
+        )
+        conn.commit()
+        conn.close()
+
+        store = SQLiteStore(legacy_path)
+        try:
+            version = store.conn.execute("PRAGMA user_version").fetchone()[0]
+            self.assertEqual(version, SCHEMA_VERSION)
+            rows = store.query_memory_diffs("g1", start_turn=0, end_turn=0)
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(rows[0]["field"], "mood")
+        finally:
+            store.close()
+
+
+class TestShardRouter(unittest.TestCase):
+    """测试按 game_id 分片"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.base_dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_single_shard_uses_legacy_db(self):
+        """测试 shard_count=1 时沿用 state.db"""
+        router = ShardRouter(self.base_dir, shard_count=1)
+        self.assertEqual(router.db_path_for("any"), self.base_dir / "state.db")
+
+    def test_routing_is_stable(self):
+        """测试同一 game_id 总是路由到同一分片"""
+        router = ShardRouter(self.base_dir, shard_count=8)
+        self.assertEqual(router.db_path_for("game-a"), router.db_path_for("game-a"))
+        paths = {router.db_path_for(f"game-{i}") for i in range(64)}
+        self.assertGreater(len(paths), 1)
+
+    def test_list_games_across_shards(self):
+        """测试跨分片列出游戏"""
+        managers = [
+            StateManager(f"game-{i}", f"世界{i}", "genesis.json", base_dir=self.base_dir, shard_count=4)
+            for i in range(6)
+        ]
+        for manager in managers:
+            manager.close()
+        games = StateManager.list_games(self.base_dir, shard_count=4)
+        self.assertEqual({g["id"] for g in games}, {f"game-{i}" for i in range(6)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+"""
+测试 StateManager 的 JSON 镜像模式与导出
+"""
+import json
+import sys
+import tempfile
+import os
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.database.state_manager import StateManager
+
+
+class TestStateManagerMirror(unittest.TestCase):
+    """测试 JSON 镜像与导出"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.base_dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _make(self, mode: str) -> StateManager:
+        return StateManager("g1", "测试世界", "genesis.json", base_dir=self.base_dir, json_mirror=mode)
+
+    def _write_turn(self, manager: StateManager) -> None:
+        with manager.transaction():
+            manager.record_event("turn_summary", {"player_input": "你好"}, "GameEngine", 1)
+            manager.record_agent_state("WS", 1, {"weather": "晴"})
+        manager.record_character_card("npc_001", 1, {"name": "林晨"}, None, "genesis_import")
+
+    def test_mirror_off_writes_no_json(self):
+        """测试 off 模式下不产生 JSON 文件"""
+        manager = self._make("off")
+        self._write_turn(manager)
+        manager.close()
+        self.assertFalse((self.base_dir / "saves" / "g1").exists())
+
+    def test_mirror_background_flushes_on_close(self):
+        """测试 background 模式在关闭时写完镜像"""
+        manager = self._make("background")
+        self._write_turn(manager)
+        manager.close()
+        game_dir = self.base_dir / "saves" / "g1"
+        self.assertTrue((game_dir / "agent_states" / "ws_turn_0001.json").exists())
+        self.assertTrue((game_dir / "events" / "turn_0001.jsonl").exists())
+
+    def test_export_from_sqlite(self):
+        """测试从 SQLite 导出完整 JSON 目录树"""
+        manager = self._make("off")
+        self._write_turn(manager)
+        manager.close()
+
+        game_dir = StateManager.export_game("g1", base_dir=self.base_dir)
+        self.assertTrue((game_dir / "metadata.json").exists())
+        self.assertTrue((game_dir / "agent_states" / "ws_turn_0001.json").exists())
+        self.assertTrue((game_dir / "character_cards" / "npc_001_v0001.json").exists())
+        events = (game_dir / "events" / "turn_0001.jsonl").read_text(encoding="utf-8")
+        self.assertEqual(len(events.strip().splitlines()), 1)
+
+    def test_invalid_mode(self):
+        """测试未知模式报错"""
+        with self.assertRaises(ValueError):
+            self._make("always")
+
+
+class TestSnapshotKeyframes(unittest.TestCase):
+    """测试增量快照 + 关键帧"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.manager = StateManager(
+            "g1", "测试世界", "genesis.json",
+            base_dir=Path(self._tmp.name), json_mirror="off", keyframe_interval=3,
+        )
+
+    def tearDown(self):
+        self.manager.close()
+        self._tmp.cleanup()
+
+    def _snapshot(self, turn: int) -> dict:
+        snapshot = {
+            "current_time": f"08:{turn:02d}",
+            "weather": {"condition": "晴", "temperature": 20},
+            "flags": {"met_npc": turn >= 2},
+            "events": list(range(turn)),
+        }
+        if turn >= 4:
+            snapshot["weather"]["condition"] = "雨"
+            snapshot.pop("flags")
+        return snapshot
+
+    def test_keyframe_every_k(self):
+        """测试每 K 条写一次关键帧，其余为增量"""
+        for turn in range(7):
+            self.manager.record_agent_state("WS", turn, self._snapshot(turn))
+        rows = self.manager.sqlite_store.query_agent_states("g1", agent_type="WS")
+        kinds = [row["snapshot_kind"] for row in rows]
+        self.assertEqual(kinds, ["full", "delta", "delta", "full", "delta", "delta", "full"])
+        self.assertNotIn("weather", rows[1]["state_snapshot"].get("$set", {}))
+
+    def test_read_api_returns_full_snapshots(self):
+        """测试按区间读取时增量记录已还原，区间从链中间开始也能还原"""
+        for turn in range(7):
+            self.manager.record_agent_state("WS", turn, self._snapshot(turn))
+        rows = self.manager.get_agent_states(start_turn=2, end_turn=5, agent_type="WS")
+        self.assertEqual([row["state_snapshot"] for row in rows], [self._snapshot(t) for t in range(2, 6)])
+        self.assertTrue(all(row["snapshot_kind"] == "full" for row in rows))
+
+    def test_export_across_keyframes(self):
+        """测试导出与JSON镜像跨越关键帧时写出的都是完整快照"""
+        base_dir = Path(self._tmp.name)
+        manager = StateManager(
+            "g2", "测试世界", "genesis.json",
+            base_dir=base_dir, json_mirror="sync", keyframe_interval=3,
+        )
+        for turn in range(7):
+            manager.record_agent_state("WS", turn, self._snapshot(turn))
+        manager.close()
+
+        mirror_dir = base_dir / "saves" / "g2" / "agent_states"
+        export_dir = StateManager.export_game("g2", base_dir=base_dir, target_dir=base_dir / "export")
+        for turn in range(7):
+            for agent_dir in (mirror_dir, export_dir / "agent_states"):
+                payload = json.loads((agent_dir / f"ws_turn_{turn:04d}.json").read_text(encoding="utf-8"))
+                self.assertEqual(payload["state_snapshot"], self._snapshot(turn))
+
+    def test_reconstruct_at_turn(self):
+        """测试任意回合都能还原出完整快照"""
+        for turn in range(7):
+            self.manager.record_agent_state("WS", turn, self._snapshot(turn))
+        for turn in range(7):
+            self.assertEqual(self.manager.get_agent_state_at("WS", turn), self._snapshot(turn))
+        self.assertIsNone(self.manager.get_agent_state_at("Plot", 3))
+
+
+class TestCharacterCardDedup(unittest.TestCase):
+    """测试角色卡按内容哈希去重"""
+
+    CARDS = [
+        {"id": "npc_001", "name": "林晨", "traits": ["冷静"]},
+        {"id": "npc_002", "name": "苏晴", "traits": ["敏锐"]},
+    ]
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.base_dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _make(self, game_id: str) -> StateManager:
+        return StateManager(game_id, "测试世界", "genesis.json", base_dir=self.base_dir, json_mirror="off")
+
+    def test_same_world_reuses_card_set(self):
+        """测试相同卡组只写一次，各局游戏通过引用读取"""
+        first, second = self._make("g1"), self._make("g2")
+        try:
+            self.assertTrue(first.bootstrap_character_cards(self.CARDS, "测试世界"))
+            self.assertFalse(second.bootstrap_character_cards(self.CARDS, "测试世界"))
+            count = second.sqlite_store.conn.execute("SELECT COUNT(*) FROM card_contents").fetchone()[0]
+            self.assertEqual(count, 2)
+            self.assertEqual(second.get_character_cards()["npc_001"]["name"], "林晨")
+        finally:
+            first.close()
+            second.close()
+
+    def test_changed_card_creates_new_set(self):
+        """测试卡组变化时生成新版本，未变化的卡内容仍然共享"""
+        first, second = self._make("g1"), self._make("g2")
+        try:
+            first.bootstrap_character_cards(self.CARDS)
+            changed = [dict(self.CARDS[0], name="林晨(改)"), self.CARDS[1]]
+            self.assertTrue(second.bootstrap_character_cards(changed))
+            count = second.sqlite_store.conn.execute("SELECT COUNT(*) FROM card_contents").fetchone()[0]
+            self.assertEqual(count, 3)
+            second.record_character_card("npc_002", 2, {"id": "npc_002", "name": "苏晴v2"}, None, "runtime")
+            cards = second.get_character_cards()
+            self.assertEqual(cards["npc_001"]["name"], "林晨(改)")
+            self.assertEqual(cards["npc_002"]["name"], "苏晴v2")
+        finally:
+            first.close()
+            second.close()
+
+    def test_shards_share_card_set(self):
+        """测试分片时卡组存在共享库中：不同分片的游戏只存一份卡片，导出仍包含初始卡组"""
+        # g1、g4 在 2 个分片下落在不同的分片库
+        first = StateManager("g1", "测试世界", "genesis.json", base_dir=self.base_dir,
+                             shard_count=2, json_mirror="off")
+        second = StateManager("g4", "测试世界", "genesis.json", base_dir=self.base_dir,
+                              shard_count=2, json_mirror="off")
+        try:
+            self.assertNotEqual(first.sqlite_store.db_path, second.sqlite_store.db_path)
+            self.assertTrue(first.bootstrap_character_cards(self.CARDS))
+            self.assertFalse(second.bootstrap_character_cards(self.CARDS))
+            count = second.card_store.conn.execute("SELECT COUNT(*) FROM card_contents").fetchone()[0]
+            self.assertEqual(count, 2)
+            for manager in (first, second):
+                local = manager.sqlite_store.conn.execute("SELECT COUNT(*) FROM card_contents").fetchone()[0]
+                self.assertEqual(local, 0)
+            self.assertEqual(second.get_character_cards()["npc_002"]["name"], "苏晴")
+        finally:
+            first.close()
+            second.close()
+
+        game_dir = StateManager.export_game("g4", base_dir=self.base_dir, shard_count=2)
+        self.assertTrue((game_dir / "character_cards" / "npc_001_v0001.json").exists())
+
+    def test_unchanged_genesis_skips_hashing(self):
+        """测试 Genesis 文件未修改时按文件指纹复用卡组，不再计算卡组哈希；文件修改后重新计算"""
+        genesis = self.base_dir / "genesis.json"
+        genesis.write_text(json.dumps({"characters": self.CARDS}, ensure_ascii=False), encoding="utf-8")
+        first, second = self._make("g1"), self._make("g2")
+        try:
+            self.assertTrue(first.bootstrap_character_cards(self.CARDS, source=genesis))
+            with mock.patch("utils.database.state_manager.content_hash") as hashed:
+                self.assertFalse(second.bootstrap_character_cards(self.CARDS, source=genesis))
+                hashed.assert_not_called()
+            self.assertEqual(second.get_character_cards()["npc_001"]["name"], "林晨")
+
+            stat = genesis.stat()
+            os.utime(genesis, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            changed = [dict(self.CARDS[0], name="林晨(改)"), self.CARDS[1]]
+            self.assertTrue(second.bootstrap_character_cards(changed, source=genesis))
+        finally:
+            first.close()
+            second.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
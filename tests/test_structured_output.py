@@ -0,0 +1,128 @@
+"""
+测试 Agent 输出的结构化校验、定向修复与重新询问（使用 MockChatLLM 的畸形输出样例）
+"""
+import os
+import sys
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from langchain_core.messages import HumanMessage
+
+from agents.response_schemas import NPCResponse, VisualRenderData, WorldStateUpdate
+from utils.mock_llm import MockChatLLM
+from utils.structured_output import invoke_structured, validate_response
+
+GOOD_NPC = '{"thought": "想", "emotion": "平静", "action": "点头", "content": "好的。"}'
+
+
+class TestValidateResponse(unittest.TestCase):
+    """测试不调用 LLM 的校验与修复"""
+
+    def test_syntax_and_type_coercion(self):
+        """测试注释、尾逗号与字符串布尔值都能通过"""
+        raw = '```json\n{"dialogue": "走吧", // 台词\n "is_scene_finished": "true",}\n```'
+        result = validate_response(raw, NPCResponse)
+        self.assertTrue(result.success)
+        self.assertEqual(result.data["content"], "走吧")
+        self.assertIs(result.data["is_scene_finished"], True)
+        self.assertIn("comments", result.repairs)
+
+    def test_invalid_optional_field_dropped(self):
+        """测试可选字段类型错误时丢弃该字段，不判为失败"""
+        raw = '{"time_delta_minutes": "十分钟", "offscreen_events": "街角有人争吵"}'
+        result = validate_response(raw, WorldStateUpdate)
+        self.assertTrue(result.success)
+        self.assertNotIn("time_delta_minutes", result.data)
+        self.assertEqual(result.data["offscreen_events"], ["街角有人争吵"])
+        self.assertIn("dropped_invalid:time_delta_minutes", result.repairs)
+
+    def test_envelope_unwrapped(self):
+        """测试约定的外层包装会被拆开"""
+        raw = '{"visual_render_data": {"summary": "雨夜"}, "visual_render_data_en": {}}'
+        result = validate_response(raw, VisualRenderData, envelope="visual_render_data")
+        self.assertTrue(result.success)
+        self.assertEqual(result.data["summary"], "雨夜")
+
+    def test_prose_brackets_before_object(self):
+        """测试对象前的说明文字带括号时仍取到对象，单元素数组照常拆包"""
+        result = validate_response('第[1]步，回应如下：' + GOOD_NPC, NPCResponse)
+        self.assertTrue(result.success)
+        self.assertEqual(result.data["content"], "好的。")
+
+        result = validate_response('[' + GOOD_NPC + ']', NPCResponse)
+        self.assertTrue(result.success)
+        self.assertIn("unwrapped_list", result.repairs)
+
+    def test_missing_required_fails(self):
+        """测试缺少必填内容时失败并给出错误"""
+        result = validate_response('{"thought": "只有想法"}', NPCResponse)
+        self.assertFalse(result.success)
+        self.assertTrue(result.errors)
+
+
+class TestInvokeStructured(unittest.TestCase):
+    """测试重新询问流程"""
+
+    def test_reask_after_prose(self):
+        """测试首个响应不是 JSON 时重新询问一次即恢复"""
+        llm = MockChatLLM(scripted_responses=["好的，我会照做。", GOOD_NPC])
+        result = invoke_structured(llm, [HumanMessage(content="输出 JSON")], NPCResponse, max_reasks=1)
+        self.assertTrue(result.success)
+        self.assertEqual(result.attempts, 2)
+        self.assertIn("reasked", result.repairs)
+
+    def test_repair_avoids_reask(self):
+        """测试能定向修复的输出不会触发额外调用"""
+        llm = MockChatLLM(scripted_responses=['{"content": "嗯", "is_scene_finished": "也许"}'])
+        result = invoke_structured(llm, [HumanMessage(content="输出 JSON")], NPCResponse, max_reasks=1)
+        self.assertTrue(result.success)
+        self.assertEqual(llm.calls, 1)
+
+    def test_reasks_exhausted(self):
+        """测试重新询问次数用尽后返回失败与最后一次原始输出"""
+        llm = MockChatLLM(scripted_responses=["不是JSON", "还是不是"])
+        result = invoke_structured(
+            llm, [HumanMessage(content="输出 JSON")], NPCResponse, first_response="{}", max_reasks=2
+        )
+        self.assertFalse(result.success)
+        self.assertEqual(result.attempts, 2)
+        self.assertEqual(result.raw, "还是不是")
+
+
+class TestAgentIntegration(unittest.TestCase):
+    """测试 Agent 接入后的行为"""
+
+    def test_npc_recovers_from_malformed_output(self):
+        """测试 NPC 遇到畸形输出时重新询问并得到正常台词"""
+        from agents.online.layer3.npc_agent import NPCAgent
+
+        agent = NPCAgent({"id": "npc_001", "name": "林晨"})
+        agent.llm = MockChatLLM(scripted_responses=['{"thought": "……"', GOOD_NPC])
+        data = agent.react("你好")
+        self.assertEqual(data["content"], "好的。")
+        self.assertEqual(data["character_id"], "npc_001")
+
+    def test_ws_reask_uses_same_inputs(self):
+        """测试 WS 校验失败时以同一组输入重新询问"""
+        from agents.online.layer2.ws_agent import WorldStateManager
+
+        agent = WorldStateManager({"world": {}, "characters": []})
+        agent.llm = MockChatLLM(scripted_responses=[
+            "时间过去了一刻钟，没有人注意到你。",
+            '{"time_delta_minutes": 15, "npc_updates": [{"mood": "烦躁"}, {"npc_id": "npc_001"}]}',
+        ])
+        agent.chain = agent._build_chain()
+        update = agent.update_world_state("四处看看", "loc_001")
+        self.assertEqual(update["time_delta_minutes"], 15)
+        self.assertEqual([u["npc_id"] for u in update["npc_updates"]], ["npc_001"])
+        self.assertEqual(agent.llm.calls, 2)
+        self.assertEqual(agent.current_time, "2024-11-26 15:15")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+"""
+测试回合追踪：span 嵌套与泳道、采样与强制开关、Chrome trace 导出、API 请求头
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from langchain_core.messages import HumanMessage
+
+from config.settings import settings
+from utils.llm_factory import get_llm
+from utils.tracing import (
+    current_trace,
+    export_trace,
+    maybe_trace,
+    span,
+    start_trace,
+    trace_awaitable,
+    trace_store,
+    traced,
+)
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self._rate = settings.TRACE_SAMPLE_RATE
+        self._export = settings.TRACE_EXPORT
+        settings.TRACE_EXPORT = False
+        trace_store.clear()
+
+    def tearDown(self):
+        settings.TRACE_SAMPLE_RATE = self._rate
+        settings.TRACE_EXPORT = self._export
+
+
+class TestSpans(TracingTestCase):
+    """测试 span 记录"""
+
+    def test_disabled_is_noop(self):
+        """测试未追踪时 span 返回共享空对象、不产生记录"""
+        self.assertIs(span("a"), span("b"))
+        with span("a"):
+            pass
+        self.assertIsNone(current_trace())
+        self.assertEqual(trace_store.recent(), [])
+
+    def test_gather_children_get_own_lanes(self):
+        """测试 gather 的子任务各占一条泳道，且时间重叠"""
+
+        async def step(delay):
+            await asyncio.sleep(delay)
+
+        async def turn():
+            with start_trace("turn") as trace:
+                with span("conductor.decide"):
+                    pass
+                await asyncio.gather(
+                    trace_awaitable("ws.update", step(0.02)),
+                    trace_awaitable("plot.scene_script", step(0.02)),
+                )
+            return trace
+
+        trace = asyncio.run(turn())
+        events = {e["name"]: e for e in trace.to_chrome()["traceEvents"] if e["ph"] == "X"}
+        self.assertEqual(set(events), {"turn", "conductor.decide", "ws.update", "plot.scene_script"})
+        self.assertEqual(events["turn"]["tid"], events["conductor.decide"]["tid"])
+        self.assertNotEqual(events["ws.update"]["tid"], events["plot.scene_script"]["tid"])
+        self.assertLess(events["plot.scene_script"]["ts"], events["ws.update"]["ts"] + events["ws.update"]["dur"])
+        self.assertIs(trace_store.get(trace.trace_id), trace)
+
+    def test_error_recorded_on_span(self):
+        """测试异常写入 span 参数并继续抛出"""
+        with start_trace("turn") as trace:
+            with self.assertRaises(ValueError):
+                with span("plot.scene_script"):
+                    raise ValueError("坏剧本")
+        event = next(e for e in trace.events if e["name"] == "plot.scene_script")
+        self.assertIn("坏剧本", event["args"]["error"])
+
+    def test_llm_call_becomes_span(self):
+        """测试追踪中的 LLM 调用记为 llm.<agent> span"""
+        llm = get_llm(provider="mock", agent_name="Plot")
+        with start_trace("turn") as trace:
+            llm.invoke([HumanMessage(content="写剧本")])
+        event = next(e for e in trace.events if e["name"] == "llm.Plot")
+        self.assertGreater(event["args"]["completion_tokens"], 0)
+
+    def test_traced_decorator(self):
+        """测试装饰器同时支持同步与异步函数"""
+
+        @traced("sync.step")
+        def sync_step():
+            return 1
+
+        @traced("async.step")
+        async def async_step():
+            return 2
+
+        with start_trace("turn") as trace:
+            self.assertEqual(sync_step(), 1)
+            self.assertEqual(asyncio.run(async_step()), 2)
+        self.assertEqual({e["name"] for e in trace.events}, {"turn", "sync.step", "async.step"})
+
+
+class TestSampling(TracingTestCase):
+    """测试采样与强制开关"""
+
+    def test_rate_zero_skips(self):
+        settings.TRACE_SAMPLE_RATE = 0
+        with maybe_trace("turn") as trace:
+            self.assertIsNone(trace)
+
+    def test_rate_one_traces(self):
+        settings.TRACE_SAMPLE_RATE = 1
+        with maybe_trace("turn") as trace:
+            self.assertIsNotNone(trace)
+
+    def test_forced_off_suppresses_inner_entry(self):
+        """测试外层入口决定不追踪时，内层入口不会重新采样"""
+        settings.TRACE_SAMPLE_RATE = 1
+        with maybe_trace("request", force=False):
+            with maybe_trace("turn") as inner:
+                self.assertIsNone(inner)
+
+    def test_nested_entry_is_span(self):
+        """测试已在追踪中时入口记为子 span"""
+        with maybe_trace("request", force=True) as outer:
+            with maybe_trace("turn") as inner:
+                self.assertIs(inner, outer)
+        self.assertEqual([e["name"] for e in outer.events], ["turn", "request"])
+
+
+class TestExport(TracingTestCase):
+    """测试 Chrome trace JSON 与 API"""
+
+    def test_export_file(self):
+        with start_trace("turn", game_id="g1") as trace:
+            with span("persist_turn_data"):
+                pass
+        with tempfile.TemporaryDirectory() as tmp:
+            path = export_trace(trace, Path(tmp) / "trace.json")
+            data = json.loads(path.read_text(encoding="utf-8"))
+        self.assertEqual(data["otherData"]["game_id"], "g1")
+        phases = {e["ph"] for e in data["traceEvents"]}
+        self.assertEqual(phases, {"M", "X"})
+
+    def test_export_filename_is_flat(self):
+        """测试路由名中的空格与斜杠不会产生子目录"""
+        with start_trace("POST /game/action") as trace:
+            pass
+        original = settings.LOGS_DIR
+        with tempfile.TemporaryDirectory() as tmp:
+            settings.LOGS_DIR = Path(tmp)
+            try:
+                path = export_trace(trace)
+            finally:
+                settings.LOGS_DIR = original
+            self.assertEqual(path.parent, Path(tmp) / "traces")
+            self.assertEqual(path.name, f"trace_POST_game_action_{trace.trace_id}.json")
+
+    def test_api_header(self):
+        """测试 X-Trace 请求头开启追踪并可通过 /traces 取回"""
+        from fastapi.testclient import TestClient
+        import api_server
+
+        client = TestClient(api_server.app)
+        settings.TRACE_SAMPLE_RATE = 0
+        self.assertNotIn("X-Trace-Id", client.get("/sessions/stats").headers)
+
+        response = client.get("/sessions/stats", headers={"X-Trace": "1"})
+        trace_id = response.headers["X-Trace-Id"]
+        chrome = client.get(f"/traces/{trace_id}").json()
+        self.assertEqual(chrome["otherData"]["name"], "GET /sessions/stats")
+        self.assertEqual(client.get("/traces").json()[0]["trace_id"], trace_id)
+        self.assertEqual(client.get("/traces/missing").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+测试视觉数据后台生成：回合响应不等待、按回合缓存、新回合取消旧任务
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from api.schemas import VisualRenderData
+from api.screen_adapter import ScreenAdapter
+
+
+class _SlowScreenAdapter(ScreenAdapter):
+    """模拟 Screen Agent：生成耗时 delay 秒"""
+
+    def __init__(self, engine, delay=0.1):
+        super().__init__(engine)
+        self.delay = delay
+        self.generated = []
+
+    def generate_visual_data(self, turn_result, cancelled=None):
+        time.sleep(self.delay)
+        if cancelled is not None and cancelled.is_set():
+            return None
+        self.generated.append(turn_result["text"])
+        return VisualRenderData(summary=turn_result["text"])
+
+
+class _Engine:
+    def __init__(self):
+        self.os = SimpleNamespace(turn_count=0)
+
+    async def process_turn_async(self, action):
+        self.os.turn_count += 1
+        return {"success": True, "text": f"第{self.os.turn_count}回合", "mode": "dialogue", "npc_reactions": []}
+
+    def prefetch_action_suggestions(self):
+        return None
+
+
+class TestVisualJobs(unittest.TestCase):
+    """测试 ScreenAdapter 的后台任务"""
+
+    def test_ready_and_cached(self):
+        """测试任务完成后按回合缓存，重复启动复用同一任务"""
+        engine = _Engine()
+        engine.os.turn_count = 3
+        adapter = _SlowScreenAdapter(engine, delay=0.02)
+
+        async def scenario():
+            job = adapter.start_visual_job({"text": "雨夜"})
+            self.assertEqual(job.status, "pending")
+            await job.wait(1.0)
+            self.assertIs(adapter.start_visual_job({"text": "雨夜"}), job)
+            return job
+
+        job = asyncio.run(scenario())
+        self.assertEqual(job.status, "ready")
+        self.assertEqual(adapter.get_visual_job(3).data.summary, "雨夜")
+        self.assertIs(adapter.get_visual_job(), job)
+        self.assertEqual(adapter.generated, ["雨夜"])
+
+    def test_new_turn_cancels_stale(self):
+        """测试进入新回合时未完成的旧任务被取消，线程中的生成也放弃"""
+        engine = _Engine()
+        engine.os.turn_count = 1
+        adapter = _SlowScreenAdapter(engine, delay=0.05)
+
+        async def scenario():
+            old = adapter.start_visual_job({"text": "旧"})
+            await asyncio.sleep(0)
+            engine.os.turn_count = 2
+            new = adapter.start_visual_job({"text": "新"})
+            await new.wait(1.0)
+            await asyncio.sleep(0.1)  # 等旧任务的线程结束
+            return old, new
+
+        old, new = asyncio.run(scenario())
+        self.assertEqual(old.status, "cancelled")
+        self.assertTrue(old.cancel_event.is_set())
+        self.assertEqual(new.status, "ready")
+        self.assertEqual(adapter.generated, ["新"])
+
+
+class TestVisualEndpoint(unittest.TestCase):
+    """测试 /game/action 不等待视觉数据，/game/visual 长轮询取回"""
+
+    def test_action_returns_before_visual(self):
+        import httpx
+        import api_server
+
+        engine = _Engine()
+        adapter = _SlowScreenAdapter(engine, delay=0.3)
+        with tempfile.TemporaryDirectory() as tmp:
+            session_id = api_server.session_manager.create_session(engine, adapter, Path(tmp))
+
+            async def scenario():
+                transport = httpx.ASGITransport(app=api_server.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    started = time.perf_counter()
+                    action = await client.post("/game/action", json={"action": "等", "session_id": session_id})
+                    elapsed = time.perf_counter() - started
+                    handle = action.json()["visual_handle"]
+                    visual = await client.get(handle["poll_url"] + "&wait=2")
+                    missing = await client.get("/game/visual", params={"session_id": session_id, "turn": 99})
+                return action, elapsed, handle, visual, missing
+
+            try:
+                action, elapsed, handle, visual, missing = asyncio.run(scenario())
+            finally:
+                api_server.session_manager.remove_session(session_id)
+
+        self.assertEqual(action.status_code, 200)
+        self.assertLess(elapsed, 0.25)
+        self.assertEqual(handle["status"], "pending")
+        self.assertIsNone(action.json()["visual_data"])
+        self.assertEqual(visual.json()["status"], "ready")
+        self.assertEqual(visual.json()["visual_data"]["summary"], "第1回合")
+        self.assertEqual(missing.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+测试创世工作项账本：中断后重跑只执行未完成的工作项，改提示词只影响对应阶段
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add project root to path
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("LLM_PROVIDER", "mock")
+
+from langchain_core.runnables import RunnableLambda
+
+from agents.offline.creatorGod import CreatorGod, WorkLedger
+from agents.offline.creatorGod.work_ledger import invoke_json
+from utils.progress_tracker import ProgressTracker
+
+NOVEL = "张三推门而入。李四抬头看他。"
+CHARACTERS = [
+    {"id": "npc_001", "name": "张三", "importance": 1.0},
+    {"id": "npc_002", "name": "李四", "importance": 0.5},
+]
+
+
+class _FakeLLM:
+    """按系统提示词区分阶段；fail_on 中的角色名调用时抛出异常"""
+
+    def __init__(self, fail_on=()):
+        self.calls = []
+        self.fail_on = set(fail_on)
+
+    def __call__(self, prompt_value):
+        system = prompt_value.to_messages()[0].content
+        if "选角导演" in system:
+            self.calls.append("filter")
+            return json.dumps(CHARACTERS, ensure_ascii=False)
+        if "心理侧写师" in system:
+            name = next(c["name"] for c in CHARACTERS if f'角色 "{c["name"]}" 建立' in system)
+            self.calls.append(name)
+            if name in self.fail_on:
+                raise RuntimeError("限流")
+            return json.dumps({"name": name, "traits": ["沉默"]}, ensure_ascii=False)
+        self.calls.append("world")
+        return json.dumps({"meta": {"world_name": "测试世界"}}, ensure_ascii=False)
+
+
+def _build(fake):
+    god = CreatorGod()
+    for agent in (god.character_filter_agent, god.world_setting_agent, god.character_detail_agent):
+        agent.llm = RunnableLambda(fake)
+    return god
+
+
+class TestWorkLedger(unittest.TestCase):
+    def test_resume_only_failed_items(self):
+        """测试第二次运行只重新执行上次失败的角色，进度由账本统计"""
+        with tempfile.TemporaryDirectory() as tmp:
+            world_dir = Path(tmp)
+            first = _FakeLLM(fail_on={"李四"})
+            _, _, details = _build(first).run_pipeline(NOVEL, world_dir)
+            self.assertIn("error", details["npc_002"])
+            self.assertEqual(sorted(first.calls), ["filter", "world", "张三", "李四"])
+
+            ledger_path = world_dir / "genesis_ledger.jsonl"
+            progress = ProgressTracker().load_genesis_progress(ledger_path)
+            self.assertEqual((progress.done, progress.total), (3, 4))
+            self.assertEqual(progress.stages["stage3.detail"], {"done": 1, "total": 2})
+
+            second = _FakeLLM()
+            god = _build(second)
+            _, _, details = god.run_pipeline(NOVEL, world_dir)
+            self.assertEqual(second.calls, ["李四"])
+            self.assertEqual(details["npc_002"]["traits"], ["沉默"])
+            self.assertEqual(god.last_summary["ledger"]["reused"], 3)
+            self.assertEqual(ProgressTracker().load_genesis_progress(ledger_path).percent, 100.0)
+
+    def test_prompt_change_reruns_stage(self):
+        """测试只修改世界观提示词时，其他阶段的结果照常复用"""
+        ledger = WorkLedger()
+        first = _FakeLLM()
+        god = _build(first)
+        god.use_ledger(ledger)
+        god.run_pipeline(NOVEL)
+
+        second = _FakeLLM()
+        god = _build(second)
+        god.use_ledger(ledger)
+        god.world_setting_agent.prompt_text += "\n补充要求：地名保留原文。"
+        god.run_pipeline(NOVEL)
+        self.assertEqual(second.calls, ["world"])
+
+    def test_truncated_line_ignored(self):
+        """测试进程中途被杀留下的半行记录不影响加载"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "ledger.jsonl"
+            ledger = WorkLedger(path)
+            ledger.put("k1", "stage1.filter", "全文", [1])
+            with path.open("a", encoding="utf-8") as f:
+                f.write('{"key": "k2", "res')
+            self.assertEqual(WorkLedger(path).get("k1"), [1])
+            self.assertIsNone(WorkLedger(path).get("k2"))
+
+    def test_prose_brackets_not_cached(self):
+        """测试说明文字里的 "[2]" 不会被当成结果写入账本，接受数组的调用方仍可取到数组"""
+        ledger = WorkLedger()
+        chain = RunnableLambda(lambda _: '共[2]名角色：{"name": "张三"}')
+        kwargs = dict(ledger=ledger, stage="stage3.detail", item="张三", prompt_text="p", llm=None)
+        self.assertEqual(invoke_json(chain, NOVEL, **kwargs), {"name": "张三"})
+        self.assertEqual(invoke_json(chain, NOVEL, **kwargs), {"name": "张三"})
+
+        listing = RunnableLambda(lambda _: '[{"id": 1}, {"id": 2}]')
+        self.assertEqual(len(invoke_json(listing, NOVEL, ledger=None, stage="stage1.filter", item="全文",
+                                         prompt_text="p", llm=None, expect=(list, dict))), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
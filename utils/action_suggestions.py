@@ -0,0 +1,226 @@
+"""
+玩家行动建议
+
+- 共享一条 prompt | llm | parser 链（进程内只创建一次 LLM 实例）
+- 每个回合一个 SuggestionJob：回合收尾阶段即在后台开始生成，逐行解析，
+  生成出一条即可推送给客户端（/game/suggestions/stream），不占用回合响应时间
+- 按回合缓存（GameEngine 为每个会话各持有一个 ActionSuggester，即按 (会话, 回合) 缓存）
+
+用法：
+    suggester = ActionSuggester()
+    job = suggester.start(turn, inputs)       # 需在事件循环中调用，重复调用复用同一任务
+    async for item in job.stream():
+        ...
+    suggester.generate(inputs)                # 同步版本（开局等非异步路径）
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional
+
+from utils.logger import setup_logger
+from utils.metrics import record_cache
+
+logger = setup_logger("ActionSuggestions", "action_suggestions.log")
+
+SUGGESTION_COUNT = 2
+FALLBACK_SUGGESTIONS = ["与在场角色交谈", "观察周围环境"]
+
+SYSTEM_PROMPT = """你是一个互动叙事游戏的行动建议器。
+根据当前场景和对话进展，为玩家生成2个有趣且合理的行动选项。
+
+要求：
+1. 每个选项应该是具体的行动描述，10-30字
+2. 两个选项应该代表不同的方向（如：深入追问vs转换话题，直接行动vs继续观察）
+3. 建议必须基于当前对话进展，推动剧情向前发展
+4. 不要重复之前已经做过的行动
+5. 不要使用编号，直接输出两个选项，用换行分隔"""
+
+HUMAN_PROMPT = """当前场景信息：
+- 玩家: {player_name}
+- 位置: {location}
+- 在场角色: {present_characters}
+- 当前时间: {current_time}
+
+最近对话记录：
+{dialogue_history}
+
+最近事件：{recent_events}
+
+请根据对话进展生成2个行动建议（不要重复之前的行动）："""
+
+_chain = None
+_chain_lock = threading.Lock()
+
+
+def get_suggestion_chain():
+    """进程内共享的建议生成链（LLM 客户端无会话状态，可跨会话复用）"""
+    global _chain
+    with _chain_lock:
+        if _chain is None:
+            from langchain_core.output_parsers import StrOutputParser
+            from langchain_core.prompts import ChatPromptTemplate
+            from utils.llm_factory import get_llm
+
+            prompt = ChatPromptTemplate.from_messages([("system", SYSTEM_PROMPT), ("human", HUMAN_PROMPT)])
+            llm = get_llm(temperature=0.9, agent_name="ActionSuggestions")  # 高温度增加多样性
+            _chain = prompt | llm | StrOutputParser()
+        return _chain
+
+
+def reset_suggestion_chain() -> None:
+    """丢弃共享链（切换 LLM 配置后调用）"""
+    global _chain
+    with _chain_lock:
+        _chain = None
+
+
+def clean_suggestion(line: str) -> str:
+    """移除常见的编号格式：1. 2. 1、2、① ② - 等"""
+    return line.strip().lstrip("0123456789.、①②③④⑤-) ").strip()
+
+
+def parse_suggestions(text: str) -> List[str]:
+    """解析完整响应为恰好 SUGGESTION_COUNT 条建议（不足时补默认项）"""
+    suggestions = [s for s in (clean_suggestion(line) for line in text.split("\n")) if s]
+    return _pad(suggestions[:SUGGESTION_COUNT])
+
+
+def _pad(suggestions: List[str]) -> List[str]:
+    suggestions = list(suggestions)
+    for fallback in FALLBACK_SUGGESTIONS:
+        if len(suggestions) >= SUGGESTION_COUNT:
+            break
+        if fallback not in suggestions:
+            suggestions.append(fallback)
+    return suggestions[:SUGGESTION_COUNT]
+
+
+class SuggestionJob:
+    """单个回合的建议生成任务，条目生成一条追加一条"""
+
+    def __init__(self, turn: int, items: Optional[List[str]] = None):
+        self.turn = turn
+        self.items: List[str] = list(items or [])
+        self.done = items is not None
+        self.task: Optional[asyncio.Task] = None
+        self._changed: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    async def _notify(self) -> None:
+        condition = self._condition()
+        async with condition:
+            condition.notify_all()
+
+    async def _append(self, item: str) -> None:
+        if len(self.items) < SUGGESTION_COUNT:
+            self.items.append(item)
+            await self._notify()
+
+    async def _finish(self, items: List[str]) -> None:
+        self.items = items
+        self.done = True
+        await self._notify()
+
+    async def wait(self, timeout: float) -> List[str]:
+        """最多等待 timeout 秒，返回当前已有的条目"""
+        if not self.done and timeout > 0:
+            condition = self._condition()
+            try:
+                async with condition:
+                    await asyncio.wait_for(condition.wait_for(lambda: self.done), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self.items)
+
+    async def stream(self) -> AsyncIterator[str]:
+        """按生成顺序逐条产出，任务结束时停止"""
+        sent = 0
+        condition = self._condition()
+        while True:
+            async with condition:
+                await condition.wait_for(lambda: self.done or len(self.items) > sent)
+                pending, finished = self.items[sent:], self.done
+            for item in pending:
+                yield item
+            sent += len(pending)
+            if finished and sent >= len(self.items):
+                return
+
+
+class ActionSuggester:
+    """按回合缓存的行动建议生成器"""
+
+    def __init__(self, keep_turns: int = 4):
+        self.keep_turns = keep_turns
+        self._jobs: "OrderedDict[int, SuggestionJob]" = OrderedDict()
+
+    def get(self, turn: Optional[int] = None) -> Optional[SuggestionJob]:
+        """按回合取任务，turn 为空时取最近一个"""
+        if turn is None:
+            return next(reversed(self._jobs.values()), None)
+        return self._jobs.get(turn)
+
+    def cached(self, turn: int) -> Optional[List[str]]:
+        job = self._jobs.get(turn)
+        return list(job.items) if job is not None and job.done else None
+
+    def _remember(self, job: SuggestionJob) -> SuggestionJob:
+        self._jobs[job.turn] = job
+        self._jobs.move_to_end(job.turn)
+        while len(self._jobs) > max(1, self.keep_turns):
+            _, evicted = self._jobs.popitem(last=False)
+            if evicted.task is not None and not evicted.done:
+                evicted.task.cancel()
+        return job
+
+    def start(self, turn: int, inputs: Dict[str, str]) -> SuggestionJob:
+        """启动（或复用）该回合的后台生成，需在事件循环中调用"""
+        job = self._jobs.get(turn)
+        record_cache("action_suggestions", job is not None)
+        if job is not None:
+            return job
+        job = SuggestionJob(turn)
+        job.task = asyncio.get_running_loop().create_task(self._run(job, inputs))
+        return self._remember(job)
+
+    def generate(self, turn: int, inputs: Dict[str, str]) -> List[str]:
+        """同步生成（命中缓存时直接返回）"""
+        cached = self.cached(turn)
+        record_cache("action_suggestions", cached is not None)
+        if cached is not None:
+            return cached
+        try:
+            response = get_suggestion_chain().invoke(inputs)
+            suggestions = parse_suggestions(response)
+        except Exception as e:
+            logger.warning(f"⚠️ 生成行动建议失败: {e}")
+            return list(FALLBACK_SUGGESTIONS)
+        self._remember(SuggestionJob(turn, suggestions))
+        return suggestions
+
+    async def _run(self, job: SuggestionJob, inputs: Dict[str, str]) -> None:
+        buffer = ""
+        try:
+            async for chunk in get_suggestion_chain().astream(inputs):
+                buffer += chunk
+                # 每收到完整的一行就先推送
+                while "\n" in buffer:
+                    line, buffer = buffer.split("\n", 1)
+                    cleaned = clean_suggestion(line)
+                    if cleaned:
+                        await job._append(cleaned)
+            cleaned = clean_suggestion(buffer)
+            if cleaned:
+                await job._append(cleaned)
+            await job._finish(_pad(job.items))
+        except asyncio.CancelledError:
+            await job._finish(_pad(job.items))
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ 生成行动建议失败: {e}")
+            await job._finish(_pad(job.items))
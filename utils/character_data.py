@@ -2,9 +2,51 @@
 角色数据模型和工具
 数据与逻辑分离：专门处理角色卡JSON数据的解析、验证和格式化
 """
+import re
+import unicodedata
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass, field
 
+# 比较文本时忽略的字符：空白、标点与下划线
+_IGNORED_CHARS = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """用于判重的规范形式：全角转半角、小写、去掉空白与标点"""
+    return _IGNORED_CHARS.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def dedupe_texts(items: List[Any]) -> List[Any]:
+    """
+    列表字段去重（保持首次出现的顺序）
+
+    规范形式相同的条目只保留第一条；一条被另一条完整包含时（"剑客" 与 "落魄剑客"）
+    只保留较长的那条。非字符串条目按相等判重。
+    """
+    kept: List[Any] = []
+    keys: List[Optional[str]] = []
+    for item in items:
+        if not isinstance(item, str):
+            if item not in kept:
+                kept.append(item)
+                keys.append(None)
+            continue
+        key = normalize_text(item)
+        if not key:
+            continue
+        if any(k is not None and key in k for k in keys):
+            continue
+        # 新条目包含已有条目时，替换掉被包含的那条（位置不变）
+        contained = [i for i, k in enumerate(keys) if k is not None and k in key]
+        if contained:
+            kept[contained[0]], keys[contained[0]] = item, key
+            for i in reversed(contained[1:]):
+                del kept[i], keys[i]
+            continue
+        kept.append(item)
+        keys.append(key)
+    return kept
+
 
 @dataclass
 class CharacterData:
@@ -115,7 +157,7 @@ class CharacterDataFormatter:
         Returns:
             格式化的特质字符串
         """
-        return ", ".join(traits) if traits else "普通人"
+        return ", ".join(dedupe_texts(traits)) if traits else "普通人"
     
     @staticmethod
     def format_behavior_rules(behavior_rules: List[str]) -> str:
@@ -131,7 +173,7 @@ class CharacterDataFormatter:
         if not behavior_rules:
             return "无特殊行为准则"
         
-        return "\n".join([f"- {rule}" for rule in behavior_rules])
+        return "\n".join([f"- {rule}" for rule in dedupe_texts(behavior_rules)])
     
     @staticmethod
     def format_relationship_matrix(relationship_matrix: Dict[str, Dict[str, str]]) -> str:
@@ -176,7 +218,7 @@ class CharacterDataFormatter:
         if not voice_samples:
             return "无语言样本"
         
-        samples_to_show = voice_samples[:max_samples]
+        samples_to_show = dedupe_texts(voice_samples)[:max_samples]
         return "\n".join([f'"{sample}"' for sample in samples_to_show])
     
     @staticmethod
@@ -193,7 +235,7 @@ class CharacterDataFormatter:
         if not possessions:
             return "无特殊物品"
         
-        return "\n".join([f"- {item}" for item in possessions])
+        return "\n".join([f"- {item}" for item in dedupe_texts(possessions)])
     
     @classmethod
     def format_for_prompt(cls, character_data: CharacterData) -> Dict[str, str]:
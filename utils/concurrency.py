@@ -6,12 +6,22 @@ LLM 并发控制模块
     
     async with llm_concurrency.get_semaphore():
         result = await llm.ainvoke(...)
+
+需要统计排队情况时用 llm_slot 包一层：
+    async with llm_slot(sem, "NPC"):
+        ...
+
+llm_queue_depth() 返回当前排队总数（API 准入控制使用）
 """
 
 import asyncio
 import os
+import time
 import weakref
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from utils.metrics import LLM_QUEUE_WAIT_SECONDS, LLM_QUEUE_WAITING
 
 
 class LLMConcurrencyManager:
@@ -45,6 +55,29 @@ class LLMConcurrencyManager:
         return self._concurrency
 
 
+@asynccontextmanager
+async def llm_slot(semaphore: asyncio.Semaphore, agent: str) -> AsyncIterator[None]:
+    """
+    获取 LLM 并发名额，同时记录排队中的调用数与等待耗时（/metrics）
+    """
+    LLM_QUEUE_WAITING.inc(agent=agent)
+    started = time.perf_counter()
+    try:
+        await semaphore.acquire()
+    finally:
+        LLM_QUEUE_WAITING.dec(agent=agent)
+    LLM_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started, agent=agent)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def llm_queue_depth() -> int:
+    """当前等待 LLM 并发名额的调用总数（所有 agent）"""
+    return int(LLM_QUEUE_WAITING.total())
+
+
 # 全局单例
 llm_concurrency = LLMConcurrencyManager()
 
@@ -8,8 +8,9 @@ from .models import (
     GameSave,
     MemoryDiff,
 )
+from .shard_router import ShardRouter
 from .sqlite_store import SQLiteStore
-from .state_manager import StateManager
+from .state_manager import StateManager, mirror_queue_depth
 
 __all__ = [
     "AgentState",
@@ -18,7 +19,9 @@ __all__ = [
     "GameSave",
     "MemoryDiff",
     "LocalStore",
+    "ShardRouter",
     "SQLiteStore",
     "StateManager",
+    "mirror_queue_depth",
 ]
 
@@ -1,12 +1,12 @@
 """
-本地JSON文件存储，用于在写入数据库之前做备份。
+本地JSON文件存储，用于调试镜像或从SQLite按需导出。
 """
 
 from __future__ import annotations
 
 import json
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterable
 
 
 class LocalStore:
@@ -15,8 +15,13 @@ class LocalStore:
     def __init__(self, base_dir: Path | str = Path("data/runtime")) -> None:
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
+        # 已创建过目录的游戏，避免每次写入都重复 mkdir
+        self._game_dirs: Dict[str, Dict[str, Path]] = {}
 
     def _ensure_game_dirs(self, game_id: str) -> Dict[str, Path]:
+        cached = self._game_dirs.get(game_id)
+        if cached is not None:
+            return cached
         game_root = self.base_dir / "saves" / game_id
         dirs = {
             "root": game_root,
@@ -26,6 +31,7 @@ class LocalStore:
         }
         for path in dirs.values():
             path.mkdir(parents=True, exist_ok=True)
+        self._game_dirs[game_id] = dirs
         return dirs
 
     def save_game_metadata(self, game_id: str, metadata: Dict[str, Any]) -> Path:
@@ -61,6 +67,22 @@ class LocalStore:
             f.write("\n")
         return file_path
 
+    def write_events(
+        self,
+        game_id: str,
+        turn_number: int,
+        payloads: Iterable[Dict[str, Any]],
+    ) -> Path:
+        """整体覆盖写入某回合的事件文件（导出时使用，重复导出不会产生重复行）。"""
+        dirs = self._ensure_game_dirs(game_id)
+        filename = f"turn_{turn_number:04d}.jsonl"
+        file_path = dirs["events"] / filename
+        with file_path.open("w", encoding="utf-8") as f:
+            for payload in payloads:
+                f.write(json.dumps(payload, ensure_ascii=False))
+                f.write("\n")
+        return file_path
+
     def save_character_card(
         self,
         game_id: str,
@@ -73,4 +95,3 @@ class LocalStore:
         file_path = dirs["characters"] / filename
         file_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
         return file_path
-
@@ -3,6 +3,8 @@
 """
 from __future__ import annotations
 
+import hashlib
+import json
 from dataclasses import dataclass, asdict
 from datetime import datetime
 from typing import Any, Dict, Optional
@@ -21,6 +23,12 @@ def generate_id() -> str:
     return uuid4().hex
 
 
+def content_hash(data: Any) -> str:
+    """对可JSON序列化的数据计算稳定的内容哈希（键排序后取 sha1）。"""
+    canonical = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
 @dataclass
 class BaseRecord:
     id: str
@@ -57,6 +65,8 @@ class AgentState(BaseRecord):
     agent_type: str = ""
     turn_number: int = 0
     state_snapshot: Dict[str, Any] = None
+    # full: 完整快照（关键帧）；delta: 相对上一条快照的增量
+    snapshot_kind: str = "full"
 
     @classmethod
     def create(
@@ -65,6 +75,7 @@ class AgentState(BaseRecord):
         agent_type: str,
         turn_number: int,
         state_snapshot: Dict[str, Any],
+        snapshot_kind: str = "full",
     ) -> "AgentState":
         return cls(
             id=generate_id(),
@@ -73,6 +84,7 @@ class AgentState(BaseRecord):
             agent_type=agent_type,
             turn_number=turn_number,
             state_snapshot=state_snapshot,
+            snapshot_kind=snapshot_kind,
         )
 
 
@@ -138,6 +150,7 @@ class EventLog(BaseRecord):
 @dataclass
 class MemoryDiff(BaseRecord):
     game_id: str = ""
+    turn_number: int = 0
     agent_type: str = ""
     field: str = ""
     old_value: Optional[Any] = None
@@ -153,11 +166,13 @@ class MemoryDiff(BaseRecord):
         old_value: Optional[Any],
         new_value: Optional[Any],
         trigger: str,
+        turn_number: int = 0,
     ) -> "MemoryDiff":
         return cls(
             id=generate_id(),
             timestamp=now_iso(),
             game_id=game_id,
+            turn_number=turn_number,
             agent_type=agent_type,
             field=field,
             old_value=old_value,
@@ -0,0 +1,72 @@
+"""
+运行时状态库的分片路由：按 game_id 将写入分散到固定数量的SQLite文件。
+
+SQLite 在 WAL 模式下仍然只有一个写锁，所有会话共用一个 state.db 时，
+并发玩家越多写入排队越长。分片后每个库只承载 1/N 的游戏。
+"""
+
+from __future__ import annotations
+
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List
+
+from .sqlite_store import SQLiteStore
+
+LEGACY_DB_NAME = "state.db"
+SHARD_DIR_NAME = "state_shards"
+CARD_DB_NAME = "card_sets.db"
+
+
+class ShardRouter:
+    """根据 game_id 计算所属分片的数据库路径。"""
+
+    def __init__(self, base_dir: Path | str = Path("data/runtime"), shard_count: int = 1) -> None:
+        self.base_dir = Path(base_dir)
+        self.shard_count = max(1, int(shard_count))
+
+    def shard_index(self, game_id: str) -> int:
+        """稳定哈希（crc32），保证跨进程、跨重启映射一致。"""
+        if self.shard_count == 1:
+            return 0
+        return zlib.crc32(game_id.encode("utf-8")) % self.shard_count
+
+    def db_path_for(self, game_id: str) -> Path:
+        if self.shard_count == 1:
+            return self.base_dir / LEGACY_DB_NAME
+        index = self.shard_index(game_id)
+        return self.base_dir / SHARD_DIR_NAME / f"state_{index:02d}.db"
+
+    def card_db_path(self) -> Path:
+        """
+        角色卡组库：卡组按世界版本去重，必须跨分片共享才能只存一份。
+        未分片时就是 state.db，分片时为分片目录下单独的库。
+        """
+        if self.shard_count == 1:
+            return self.base_dir / LEGACY_DB_NAME
+        return self.base_dir / SHARD_DIR_NAME / CARD_DB_NAME
+
+    def all_db_paths(self) -> List[Path]:
+        """返回所有已存在的状态库（包含未分片时期的 state.db）。"""
+        paths: List[Path] = []
+        legacy = self.base_dir / LEGACY_DB_NAME
+        if legacy.exists():
+            paths.append(legacy)
+        shard_dir = self.base_dir / SHARD_DIR_NAME
+        if shard_dir.exists():
+            paths.extend(sorted(shard_dir.glob("state_*.db")))
+        return paths
+
+    def list_games(self) -> List[Dict[str, Any]]:
+        """跨分片列出所有游戏存档元数据，按最近游玩时间倒序。"""
+        games: List[Dict[str, Any]] = []
+        for db_path in self.all_db_paths():
+            store = SQLiteStore(db_path)
+            try:
+                for game in store.list_game_saves():
+                    game["db_path"] = str(db_path)
+                    games.append(game)
+            finally:
+                store.close()
+        games.sort(key=lambda g: g.get("last_played_at") or "", reverse=True)
+        return games
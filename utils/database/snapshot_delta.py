@@ -0,0 +1,60 @@
+"""
+Agent 状态快照的结构化增量（diff / apply）。
+
+增量格式（各部分为空时省略）：
+    {
+        "$set":    {键: 新值},          # 新增或被整体替换的字段（列表、标量按整体替换）
+        "$unset":  [键, ...],           # 被删除的字段
+        "$nested": {键: 子增量},         # 新旧都是字典时递归描述
+    }
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict
+
+
+def normalize_snapshot(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """经一次JSON往返，得到与入库后一致的结构（字符串键），同时起到深拷贝作用。"""
+    return json.loads(json.dumps(snapshot, ensure_ascii=False))
+
+
+def diff_snapshot(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """计算把 old 变为 new 所需的增量；两者相同时返回空字典。"""
+    set_fields: Dict[str, Any] = {}
+    nested: Dict[str, Any] = {}
+    for key, value in new.items():
+        if key not in old:
+            set_fields[key] = value
+            continue
+        old_value = old[key]
+        if old_value == value:
+            continue
+        if isinstance(old_value, dict) and isinstance(value, dict):
+            nested[key] = diff_snapshot(old_value, value)
+        else:
+            set_fields[key] = value
+    unset = [key for key in old if key not in new]
+
+    delta: Dict[str, Any] = {}
+    if set_fields:
+        delta["$set"] = set_fields
+    if unset:
+        delta["$unset"] = unset
+    if nested:
+        delta["$nested"] = nested
+    return delta
+
+
+def apply_delta(base: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """将增量应用到 base 上，返回新字典（不修改 base）。"""
+    result = dict(base)
+    for key in delta.get("$unset", []):
+        result.pop(key, None)
+    for key, value in delta.get("$set", {}).items():
+        result[key] = value
+    for key, sub_delta in delta.get("$nested", {}).items():
+        current = result.get(key)
+        result[key] = apply_delta(current if isinstance(current, dict) else {}, sub_delta)
+    return result
@@ -4,21 +4,60 @@ SQLite存储，用于在本地维护结构化的热数据。
 
 from __future__ import annotations
 
+import functools
 import json
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+# 当前表结构版本（保存在 PRAGMA user_version 中）
+SCHEMA_VERSION = 4
+
+# 以JSON文本存储的列，读取时自动反序列化
+_JSON_COLUMNS = {
+    "state_snapshot",
+    "event_data",
+    "card_data",
+    "changes",
+    "old_value",
+    "new_value",
+}
+
+
+T = TypeVar("T")
+
+
+def _locked(method: Callable[..., T]) -> Callable[..., T]:
+    """串行化对同一连接的访问。"""
+
+    @functools.wraps(method)
+    def wrapper(self: "SQLiteStore", *args: Any, **kwargs: Any) -> T:
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class SQLiteStore:
-    """封装与SQLite的交互。"""
+    """
+    封装与SQLite的交互。
+
+    连接允许跨线程使用（持久化会被放到线程池执行，避免阻塞事件循环），
+    所有访问经同一把可重入锁串行化；transaction() 在整个事务期间持有该锁。
+    """
 
     def __init__(self, db_path: Path | str = Path("data/runtime/state.db")) -> None:
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        # 事务嵌套深度；大于0时写入只进入当前事务，不单独提交
+        self._batch_depth = 0
         self._init_schema()
+        self._migrate()
 
     def _init_schema(self) -> None:
         cursor = self.conn.cursor()
@@ -43,6 +82,7 @@ class SQLiteStore:
                 agent_type TEXT,
                 turn_number INTEGER,
                 state_snapshot TEXT,
+                snapshot_kind TEXT DEFAULT 'full',
                 timestamp TEXT,
                 is_synced INTEGER DEFAULT 0
             );
@@ -73,6 +113,7 @@ class SQLiteStore:
             CREATE TABLE IF NOT EXISTS memory_diffs (
                 id TEXT PRIMARY KEY,
                 game_id TEXT,
+                turn_number INTEGER DEFAULT 0,
                 agent_type TEXT,
                 field TEXT,
                 old_value TEXT,
@@ -82,6 +123,39 @@ class SQLiteStore:
                 is_synced INTEGER DEFAULT 0
             );
 
+            -- 角色卡内容按哈希去重存储；同一世界版本的卡组只存一份，由各局游戏引用
+            CREATE TABLE IF NOT EXISTS card_contents (
+                content_hash TEXT PRIMARY KEY,
+                character_id TEXT,
+                card_data TEXT,
+                created_at TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS card_sets (
+                set_hash TEXT PRIMARY KEY,
+                world_key TEXT,
+                card_count INTEGER,
+                created_at TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS card_set_members (
+                set_hash TEXT,
+                character_id TEXT,
+                content_hash TEXT,
+                PRIMARY KEY (set_hash, character_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS game_card_sets (
+                game_id TEXT PRIMARY KEY,
+                set_hash TEXT
+            );
+
+            -- Genesis 文件指纹（路径 + 修改时间 + 大小）到卡组的映射，文件未变时无需重新计算卡组哈希
+            CREATE TABLE IF NOT EXISTS card_set_sources (
+                source_key TEXT PRIMARY KEY,
+                set_hash TEXT
+            );
+
             CREATE TABLE IF NOT EXISTS sync_queue (
                 id TEXT PRIMARY KEY,
                 table_name TEXT,
@@ -95,6 +169,103 @@ class SQLiteStore:
         )
         self.conn.commit()
 
+    # ------------------------------------------------------------------
+    # 表结构迁移
+    # ------------------------------------------------------------------
+
+    def _column_names(self, table: str) -> List[str]:
+        rows = self.conn.execute(f"PRAGMA table_info({table})").fetchall()
+        return [row["name"] for row in rows]
+
+    def _migrate(self) -> None:
+        """
+        按 user_version 逐级升级旧数据库。
+
+        每个版本只做增量变更（加列、建索引），已有数据保持不动。
+        """
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        if version < 2:
+            # v2: memory_diffs 增加 turn_number 列，并为按游戏/回合的查询建立复合索引
+            if "turn_number" not in self._column_names("memory_diffs"):
+                self.conn.execute(
+                    "ALTER TABLE memory_diffs ADD COLUMN turn_number INTEGER DEFAULT 0"
+                )
+            self.conn.executescript(
+                """
+                CREATE INDEX IF NOT EXISTS idx_agent_states_game_turn
+                    ON agent_states (game_id, turn_number, agent_type);
+                CREATE INDEX IF NOT EXISTS idx_event_logs_game_type
+                    ON event_logs (game_id, turn_number, event_type);
+                CREATE INDEX IF NOT EXISTS idx_memory_diffs_game_turn
+                    ON memory_diffs (game_id, turn_number, agent_type);
+                CREATE INDEX IF NOT EXISTS idx_character_cards_game_char
+                    ON character_cards (game_id, character_id, version);
+                """
+            )
+
+        if version < 3:
+            # v3: agent_states 支持增量快照，旧数据均视为完整快照
+            if "snapshot_kind" not in self._column_names("agent_states"):
+                self.conn.execute(
+                    "ALTER TABLE agent_states ADD COLUMN snapshot_kind TEXT DEFAULT 'full'"
+                )
+
+        if version < 4:
+            # v4: query_event_logs 按 event_type 过滤，事件日志索引改为 (game_id, turn_number, event_type)
+            self.conn.executescript(
+                """
+                DROP INDEX IF EXISTS idx_event_logs_game_turn;
+                CREATE INDEX IF NOT EXISTS idx_event_logs_game_type
+                    ON event_logs (game_id, turn_number, event_type);
+                """
+            )
+
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+
+    # ------------------------------------------------------------------
+    # 事务 / 批量写入
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def transaction(self) -> Iterator["SQLiteStore"]:
+        """
+        将多次写入合并为一次提交。
+
+        可嵌套使用，只有最外层退出时才提交；发生异常时整批回滚。
+
+        Example:
+            with store.transaction():
+                store.insert_event_log(...)
+                store.insert_agent_state(...)
+        """
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            except Exception:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.conn.rollback()
+                raise
+            else:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.conn.commit()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._batch_depth > 0
+
+    def _commit(self) -> None:
+        """非批量模式下立即提交。"""
+        if self._batch_depth == 0:
+            self.conn.commit()
+
+    @_locked
     def _insert(self, table: str, payload: Dict[str, Any]) -> None:
         placeholders = ", ".join(["?"] * len(payload))
         columns = ", ".join(payload.keys())
@@ -106,7 +277,7 @@ class SQLiteStore:
             else:
                 values.append(value)
         self.conn.execute(sql, values)
-        self.conn.commit()
+        self._commit()
 
     def insert_game_save(self, payload: Dict[str, Any]) -> None:
         self._insert("game_saves", payload)
@@ -123,13 +294,241 @@ class SQLiteStore:
     def insert_memory_diff(self, payload: Dict[str, Any]) -> None:
         self._insert("memory_diffs", payload)
 
+    @_locked
+    def has_card_set(self, set_hash: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM card_sets WHERE set_hash = ?", (set_hash,)
+        ).fetchone()
+        return row is not None
+
+    @_locked
+    def insert_card_set(
+        self,
+        set_hash: str,
+        world_key: str,
+        cards: Dict[str, Tuple[str, Dict[str, Any]]],
+        created_at: str,
+    ) -> None:
+        """
+        写入一个卡组。
+
+        Args:
+            cards: character_id -> (content_hash, card_data)
+        """
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO card_contents (content_hash, character_id, card_data, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (digest, char_id, json.dumps(card, ensure_ascii=False), created_at)
+                for char_id, (digest, card) in cards.items()
+            ],
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO card_set_members (set_hash, character_id, content_hash) "
+            "VALUES (?, ?, ?)",
+            [(set_hash, char_id, digest) for char_id, (digest, _) in cards.items()],
+        )
+        self.conn.execute(
+            "INSERT OR IGNORE INTO card_sets (set_hash, world_key, card_count, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (set_hash, world_key, len(cards), created_at),
+        )
+        self._commit()
+
+    @_locked
+    def lookup_card_set_source(self, source_key: str) -> Optional[str]:
+        """按 Genesis 文件指纹查找已记录的卡组哈希。"""
+        row = self.conn.execute(
+            """
+            SELECT s.set_hash FROM card_set_sources s
+            JOIN card_sets c ON c.set_hash = s.set_hash
+            WHERE s.source_key = ?
+            """,
+            (source_key,),
+        ).fetchone()
+        return row["set_hash"] if row else None
+
+    @_locked
+    def record_card_set_source(self, source_key: str, set_hash: str) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO card_set_sources (source_key, set_hash) VALUES (?, ?)",
+            (source_key, set_hash),
+        )
+        self._commit()
+
+    @_locked
+    def link_game_card_set(self, game_id: str, set_hash: str) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO game_card_sets (game_id, set_hash) VALUES (?, ?)",
+            (game_id, set_hash),
+        )
+        self._commit()
+
+    @_locked
+    def query_game_card_set(self, game_id: str) -> List[Dict[str, Any]]:
+        """读取某局游戏引用的初始卡组（每个角色一条）。"""
+        rows = self.conn.execute(
+            """
+            SELECT m.character_id, m.content_hash, c.card_data
+            FROM game_card_sets g
+            JOIN card_set_members m ON m.set_hash = g.set_hash
+            JOIN card_contents c ON c.content_hash = m.content_hash
+            WHERE g.game_id = ?
+            ORDER BY m.character_id
+            """,
+            (game_id,),
+        ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @_locked
     def update_game_turn(self, game_id: str, turn_number: int, last_played_at: str) -> None:
         self.conn.execute(
             "UPDATE game_saves SET current_turn = ?, last_played_at = ?, is_synced = 0 WHERE id = ?",
             (turn_number, last_played_at, game_id),
         )
-        self.conn.commit()
+        self._commit()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        data = dict(row)
+        for key in _JSON_COLUMNS.intersection(data.keys()):
+            value = data[key]
+            if isinstance(value, str):
+                try:
+                    data[key] = json.loads(value)
+                except (TypeError, ValueError):
+                    pass
+        return data
+
+    @_locked
+    def _query_turn_range(
+        self,
+        table: str,
+        game_id: str,
+        start_turn: Optional[int],
+        end_turn: Optional[int],
+        filters: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        clauses = ["game_id = ?"]
+        params: List[Any] = [game_id]
+        if start_turn is not None:
+            clauses.append("turn_number >= ?")
+            params.append(start_turn)
+        if end_turn is not None:
+            clauses.append("turn_number <= ?")
+            params.append(end_turn)
+        for column, value in filters.items():
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        sql = (
+            f"SELECT * FROM {table} WHERE {' AND '.join(clauses)} "
+            "ORDER BY turn_number, timestamp"
+        )
+        rows = self.conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @_locked
+    def get_game_save(self, game_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute("SELECT * FROM game_saves WHERE id = ?", (game_id,)).fetchone()
+        return dict(row) if row else None
+
+    @_locked
+    def list_game_saves(self) -> List[Dict[str, Any]]:
+        """列出本库中的所有游戏存档元数据。"""
+        rows = self.conn.execute(
+            "SELECT * FROM game_saves ORDER BY last_played_at DESC"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def query_agent_states(
+        self,
+        game_id: str,
+        start_turn: Optional[int] = None,
+        end_turn: Optional[int] = None,
+        agent_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """读取某局游戏在 [start_turn, end_turn] 区间内的Agent快照。"""
+        return self._query_turn_range(
+            "agent_states", game_id, start_turn, end_turn, {"agent_type": agent_type}
+        )
 
+    @_locked
+    def query_snapshot_chain(
+        self,
+        game_id: str,
+        agent_type: str,
+        turn_number: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        读取重建第 turn_number 回合快照所需的记录链：
+        最近一个关键帧 + 其后按写入顺序排列的增量。
+        """
+        keyframe = self.conn.execute(
+            """
+            SELECT rowid AS seq, * FROM agent_states
+            WHERE game_id = ? AND agent_type = ? AND turn_number <= ? AND snapshot_kind = 'full'
+            ORDER BY turn_number DESC, rowid DESC LIMIT 1
+            """,
+            (game_id, agent_type, turn_number),
+        ).fetchone()
+        if keyframe is None:
+            return []
+        deltas = self.conn.execute(
+            """
+            SELECT rowid AS seq, * FROM agent_states
+            WHERE game_id = ? AND agent_type = ? AND turn_number <= ?
+                AND snapshot_kind = 'delta' AND rowid > ?
+            ORDER BY rowid
+            """,
+            (game_id, agent_type, turn_number, keyframe["seq"]),
+        ).fetchall()
+        return [self._row_to_dict(keyframe)] + [self._row_to_dict(row) for row in deltas]
+
+    def query_event_logs(
+        self,
+        game_id: str,
+        start_turn: Optional[int] = None,
+        end_turn: Optional[int] = None,
+        event_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """读取某局游戏在 [start_turn, end_turn] 区间内的事件日志。"""
+        return self._query_turn_range(
+            "event_logs", game_id, start_turn, end_turn, {"event_type": event_type}
+        )
+
+    def query_memory_diffs(
+        self,
+        game_id: str,
+        start_turn: Optional[int] = None,
+        end_turn: Optional[int] = None,
+        agent_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """读取某局游戏在 [start_turn, end_turn] 区间内的记忆变更。"""
+        return self._query_turn_range(
+            "memory_diffs", game_id, start_turn, end_turn, {"agent_type": agent_type}
+        )
+
+    @_locked
+    def query_character_cards(
+        self,
+        game_id: str,
+        character_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """读取某局游戏的角色卡版本（按角色、版本排序）。"""
+        sql = "SELECT * FROM character_cards WHERE game_id = ?"
+        params: List[Any] = [game_id]
+        if character_id is not None:
+            sql += " AND character_id = ?"
+            params.append(character_id)
+        sql += " ORDER BY character_id, version"
+        rows = self.conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @_locked
     def close(self) -> None:
         self.conn.close()
-
@@ -1,11 +1,20 @@
 """
 状态管理器：负责协调本地文件与SQLite存储。
+
+SQLite 是唯一的数据源；JSON 目录树只是可选镜像：
+- off: 不写 JSON（生产默认），需要时通过 export_game 从SQLite导出
+- sync: 与SQLite同步写入（旧行为，便于调试）
+- background: 由单个后台线程异步写入，不占用回合路径
 """
 
 from __future__ import annotations
 
+import queue
+import threading
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from .local_store import LocalStore
 from .models import (
@@ -14,10 +23,117 @@ from .models import (
     EventLog,
     GameSave,
     MemoryDiff,
+    content_hash,
     now_iso,
 )
+from .shard_router import ShardRouter
+from .snapshot_delta import apply_delta, diff_snapshot, normalize_snapshot
 from .sqlite_store import SQLiteStore
 
+JSON_MIRROR_MODES = ("off", "sync", "background")
+
+
+class _MirrorWriter:
+    """后台JSON镜像写入线程。"""
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="json-mirror", daemon=True)
+        self._thread.start()
+        _MIRROR_WRITERS.add(self)
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> None:
+        self._queue.put((func, args))
+
+    def pending(self) -> int:
+        """尚未写出的任务数。"""
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            func, args = item
+            try:
+                func(*args)
+            except Exception:
+                # 镜像只用于调试，失败不影响主流程
+                pass
+
+    def close(self) -> None:
+        """写完队列中剩余的任务后退出。"""
+        self._queue.put(None)
+        self._thread.join()
+
+
+_MIRROR_WRITERS: "weakref.WeakSet[_MirrorWriter]" = weakref.WeakSet()
+
+
+def mirror_queue_depth() -> int:
+    """所有后台镜像线程待写入的任务总数（供 /metrics 使用）。"""
+    return sum(writer.pending() for writer in list(_MIRROR_WRITERS))
+
+
+def _replay_chain(chain: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """从关键帧开始依次应用增量，得到链末端的完整快照。"""
+    if not chain:
+        return None
+    snapshot = chain[0]["state_snapshot"]
+    for row in chain[1:]:
+        snapshot = apply_delta(snapshot, row["state_snapshot"])
+    return snapshot
+
+
+def _materialize_agent_states(
+    store: SQLiteStore,
+    game_id: str,
+    rows: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    把按回合排序的快照记录中的增量还原为完整快照。
+
+    同一Agent的记录依次应用增量；区间内首条即为增量时，先沿关键帧链重建上一回合的快照。
+    """
+    current: Dict[str, Dict[str, Any]] = {}
+    result: List[Dict[str, Any]] = []
+    for row in rows:
+        agent_type = row["agent_type"]
+        snapshot = row["state_snapshot"]
+        if row.get("snapshot_kind") == "delta":
+            base = current.get(agent_type)
+            if base is None:
+                chain = store.query_snapshot_chain(game_id, agent_type, row["turn_number"] - 1)
+                base = _replay_chain(chain) or {}
+            snapshot = apply_delta(base, snapshot)
+        current[agent_type] = snapshot
+        result.append({**row, "state_snapshot": snapshot, "snapshot_kind": "full"})
+    return result
+
+
+def _genesis_source_key(source: Path | str | None) -> Optional[str]:
+    """Genesis 文件指纹（绝对路径 + 修改时间 + 大小）；没有文件时返回 None。"""
+    if not source:
+        return None
+    try:
+        path = Path(source).resolve()
+        stat = path.stat()
+    except OSError:
+        return None
+    return f"{path}|{stat.st_mtime_ns}|{stat.st_size}"
+
+
+def _query_game_card_set(
+    card_store: Optional[SQLiteStore],
+    store: SQLiteStore,
+    game_id: str,
+) -> List[Dict[str, Any]]:
+    """读取某局游戏引用的初始卡组；共享卡组库中没有时，回退到分片库里早先写入的引用。"""
+    rows = card_store.query_game_card_set(game_id) if card_store is not None else []
+    if not rows and card_store is not store:
+        rows = store.query_game_card_set(game_id)
+    return rows
+
 
 class StateManager:
     """状态写入的统一入口。"""
@@ -28,21 +144,48 @@ class StateManager:
         game_name: str,
         genesis_path: str,
         base_dir: Path | str = Path("data/runtime"),
+        shard_count: int = 1,
+        json_mirror: str = "sync",
+        keyframe_interval: int = 1,
     ) -> None:
+        if json_mirror not in JSON_MIRROR_MODES:
+            raise ValueError(f"未知的 json_mirror 模式: {json_mirror}（可选 {JSON_MIRROR_MODES}）")
         self.game_id = game_id
         self.game_name = game_name
         self.genesis_path = genesis_path
         self.base_dir = Path(base_dir)
+        self.json_mirror = json_mirror
         self.local_store = LocalStore(self.base_dir)
-        self.sqlite_store = SQLiteStore(self.base_dir / "state.db")
+        self._mirror_writer = _MirrorWriter() if json_mirror == "background" else None
+        # 每个Agent最多连续写 keyframe_interval-1 条增量后强制写一次完整快照
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self._last_snapshots: Dict[str, Dict[str, Any]] = {}
+        self._delta_chain_len: Dict[str, int] = {}
+        # shard_count=1 时沿用单一 state.db；大于1时按 game_id 路由到分片库
+        self.router = ShardRouter(self.base_dir, shard_count)
+        self.sqlite_store = SQLiteStore(self.router.db_path_for(game_id))
+        # 角色卡组存放在跨分片共享的库中，同一世界版本在所有分片里只存一份
+        card_db = self.router.card_db_path()
+        self.card_store = (
+            self.sqlite_store if card_db == self.sqlite_store.db_path else SQLiteStore(card_db)
+        )
 
         self.game_save_record = GameSave.create(game_name=game_name, genesis_path=genesis_path)
         self.game_save_record.id = game_id  # 使用外部传入的ID
         self._persist_game_metadata()
 
+    def _mirror(self, func: Callable[..., Any], *args: Any) -> None:
+        """按镜像模式写入JSON副本。"""
+        if self.json_mirror == "off":
+            return
+        if self._mirror_writer is not None:
+            self._mirror_writer.submit(func, *args)
+        else:
+            func(*args)
+
     def _persist_game_metadata(self) -> None:
         payload = self.game_save_record.to_dict()
-        self.local_store.save_game_metadata(self.game_id, payload)
+        self._mirror(self.local_store.save_game_metadata, self.game_id, payload)
         self.sqlite_store.insert_game_save(
             {
                 "id": payload["id"],
@@ -55,38 +198,98 @@ class StateManager:
             }
         )
 
+    @contextmanager
+    def transaction(self) -> Iterator["StateManager"]:
+        """将一个回合内的多次写入合并为一次SQLite提交。"""
+        try:
+            with self.sqlite_store.transaction():
+                yield self
+        except Exception:
+            # 回滚后内存中的增量基准已不可信，下次写入强制关键帧
+            self._reset_snapshot_chain()
+            raise
+
+    def _reset_snapshot_chain(self, agent_type: Optional[str] = None) -> None:
+        if agent_type is None:
+            self._last_snapshots.clear()
+            self._delta_chain_len.clear()
+        else:
+            self._last_snapshots.pop(agent_type, None)
+            self._delta_chain_len.pop(agent_type, None)
+
     def record_agent_state(
         self,
         agent_type: str,
         turn_number: int,
         state_snapshot: Dict[str, Any],
     ) -> AgentState:
+        stored_snapshot, snapshot_kind = self._encode_snapshot(agent_type, state_snapshot)
         record = AgentState.create(
             game_id=self.game_id,
             agent_type=agent_type,
             turn_number=turn_number,
-            state_snapshot=state_snapshot,
+            state_snapshot=stored_snapshot,
+            snapshot_kind=snapshot_kind,
         )
         payload = record.to_dict()
-        self.local_store.save_agent_state(
+        mirror_payload = payload
+        if snapshot_kind == "delta":
+            # JSON镜像始终写完整快照，便于直接阅读
+            mirror_payload = {**payload, "state_snapshot": self._last_snapshots[agent_type], "snapshot_kind": "full"}
+        self._mirror(
+            self.local_store.save_agent_state,
             self.game_id,
             agent_type,
             turn_number,
-            payload,
-        )
-        self.sqlite_store.insert_agent_state(
-            {
-                "id": payload["id"],
-                "game_id": payload["game_id"],
-                "agent_type": payload["agent_type"],
-                "turn_number": payload["turn_number"],
-                "state_snapshot": payload["state_snapshot"],
-                "timestamp": payload["timestamp"],
-                "is_synced": int(payload["is_synced"]),
-            }
+            mirror_payload,
         )
+        try:
+            self.sqlite_store.insert_agent_state(
+                {
+                    "id": payload["id"],
+                    "game_id": payload["game_id"],
+                    "agent_type": payload["agent_type"],
+                    "turn_number": payload["turn_number"],
+                    "state_snapshot": payload["state_snapshot"],
+                    "snapshot_kind": payload["snapshot_kind"],
+                    "timestamp": payload["timestamp"],
+                    "is_synced": int(payload["is_synced"]),
+                }
+            )
+        except Exception:
+            self._reset_snapshot_chain(agent_type)
+            raise
         return record
 
+    def _encode_snapshot(
+        self,
+        agent_type: str,
+        state_snapshot: Dict[str, Any],
+    ) -> Tuple[Dict[str, Any], str]:
+        """决定本次写完整关键帧还是相对上一条快照的增量。"""
+        if self.keyframe_interval <= 1:
+            return state_snapshot, "full"
+
+        current = normalize_snapshot(state_snapshot)
+        previous = self._last_snapshots.get(agent_type)
+        chain_len = self._delta_chain_len.get(agent_type, 0)
+        self._last_snapshots[agent_type] = current
+
+        if previous is None or chain_len + 1 >= self.keyframe_interval:
+            self._delta_chain_len[agent_type] = 0
+            return current, "full"
+        self._delta_chain_len[agent_type] = chain_len + 1
+        return diff_snapshot(previous, current), "delta"
+
+    def get_agent_state_at(self, agent_type: str, turn_number: int) -> Optional[Dict[str, Any]]:
+        """
+        重建某个Agent在第 turn_number 回合结束时的完整快照。
+
+        从最近的关键帧开始依次应用增量，链长不超过 keyframe_interval。
+        """
+        chain = self.sqlite_store.query_snapshot_chain(self.game_id, agent_type, turn_number)
+        return _replay_chain(chain)
+
     def record_event(
         self,
         event_type: str,
@@ -102,7 +305,7 @@ class StateManager:
             agent_source=agent_source,
         )
         payload = record.to_dict()
-        self.local_store.append_event(self.game_id, turn_number, payload)
+        self._mirror(self.local_store.append_event, self.game_id, turn_number, payload)
         self.sqlite_store.insert_event_log(
             {
                 "id": payload["id"],
@@ -134,7 +337,8 @@ class StateManager:
             changed_by=changed_by,
         )
         payload = record.to_dict()
-        self.local_store.save_character_card(
+        self._mirror(
+            self.local_store.save_character_card,
             self.game_id,
             character_id,
             version,
@@ -155,6 +359,52 @@ class StateManager:
         )
         return record
 
+    def bootstrap_character_cards(
+        self,
+        cards: List[Dict[str, Any]],
+        world_key: str = "",
+        source: Path | str | None = None,
+    ) -> bool:
+        """
+        导入 Genesis 初始角色卡（按内容哈希去重）。
+
+        同一世界版本的卡组在共享卡组库中只存一份，本局游戏只记录一条引用；
+        卡组未变化时不写入任何卡片。传入 source（Genesis 文件路径）时按文件指纹
+        记住卡组哈希，文件未修改就不再序列化整个角色表。
+
+        Returns:
+            True 表示写入了新的卡组，False 表示复用已有卡组
+        """
+        store = self.card_store
+        source_key = _genesis_source_key(source)
+        created = False
+        with store.transaction():
+            set_hash = store.lookup_card_set_source(source_key) if source_key else None
+            if set_hash is None:
+                set_hash = content_hash(cards)
+                if not store.has_card_set(set_hash):
+                    members = {
+                        card["id"]: (content_hash(card), card)
+                        for card in cards
+                        if card.get("id")
+                    }
+                    store.insert_card_set(set_hash, world_key, members, now_iso())
+                    created = True
+                if source_key:
+                    store.record_card_set_source(source_key, set_hash)
+            store.link_game_card_set(self.game_id, set_hash)
+        return created
+
+    def get_character_cards(self) -> Dict[str, Dict[str, Any]]:
+        """返回本局游戏每个角色的最新角色卡（初始卡组 + 之后记录的新版本）。"""
+        cards = {
+            row["character_id"]: row["card_data"]
+            for row in _query_game_card_set(self.card_store, self.sqlite_store, self.game_id)
+        }
+        for row in self.sqlite_store.query_character_cards(self.game_id):
+            cards[row["character_id"]] = row["card_data"]
+        return cards
+
     def record_memory_diff(
         self,
         agent_type: str,
@@ -162,6 +412,7 @@ class StateManager:
         old_value: Any,
         new_value: Any,
         trigger: str,
+        turn_number: int = 0,
     ) -> MemoryDiff:
         record = MemoryDiff.create(
             game_id=self.game_id,
@@ -170,12 +421,14 @@ class StateManager:
             old_value=old_value,
             new_value=new_value,
             trigger=trigger,
+            turn_number=turn_number,
         )
         payload = record.to_dict()
         self.sqlite_store.insert_memory_diff(
             {
                 "id": payload["id"],
                 "game_id": payload["game_id"],
+                "turn_number": payload["turn_number"],
                 "agent_type": payload["agent_type"],
                 "field": payload["field"],
                 "old_value": payload["old_value"],
@@ -192,13 +445,129 @@ class StateManager:
         self.game_save_record.current_turn = turn_number
         self.game_save_record.last_played_at = now_iso()
         payload = self.game_save_record.to_dict()
-        self.local_store.save_game_metadata(self.game_id, payload)
+        self._mirror(self.local_store.save_game_metadata, self.game_id, payload)
         self.sqlite_store.update_game_turn(
             self.game_id,
             turn_number,
             payload["last_played_at"],
         )
 
+    def get_agent_states(
+        self,
+        start_turn: Optional[int] = None,
+        end_turn: Optional[int] = None,
+        agent_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """按回合区间读取当前游戏的Agent快照（增量记录已还原为完整快照）。"""
+        rows = self.sqlite_store.query_agent_states(
+            self.game_id, start_turn, end_turn, agent_type
+        )
+        return _materialize_agent_states(self.sqlite_store, self.game_id, rows)
+
+    def get_events(
+        self,
+        start_turn: Optional[int] = None,
+        end_turn: Optional[int] = None,
+        event_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """按回合区间读取当前游戏的事件日志。"""
+        return self.sqlite_store.query_event_logs(
+            self.game_id, start_turn, end_turn, event_type
+        )
+
+    @staticmethod
+    def list_games(
+        base_dir: Path | str = Path("data/runtime"),
+        shard_count: int = 1,
+    ) -> List[Dict[str, Any]]:
+        """跨所有分片列出游戏存档。"""
+        return ShardRouter(base_dir, shard_count).list_games()
+
+    @staticmethod
+    def export_game(
+        game_id: str,
+        base_dir: Path | str = Path("data/runtime"),
+        shard_count: int = 1,
+        target_dir: Path | str | None = None,
+    ) -> Path:
+        """
+        从SQLite导出某局游戏的完整JSON目录树。
+
+        Args:
+            game_id: 游戏ID
+            base_dir: 运行时数据目录（状态库所在位置）
+            shard_count: 分片数，需与写入时一致
+            target_dir: 导出目标目录，默认与 base_dir 相同（即 saves/{game_id}）
+
+        Returns:
+            导出的游戏目录
+        """
+        router = ShardRouter(base_dir, shard_count)
+        db_path = router.db_path_for(game_id)
+        if not db_path.exists():
+            raise KeyError(f"状态库不存在: {db_path}")
+        store = SQLiteStore(db_path)
+        card_db = router.card_db_path()
+        if card_db == db_path:
+            card_store: Optional[SQLiteStore] = store
+        else:
+            card_store = SQLiteStore(card_db) if card_db.exists() else None
+        local_store = LocalStore(target_dir or base_dir)
+        try:
+            game = store.get_game_save(game_id)
+            if game is None:
+                raise KeyError(f"状态库中不存在游戏: {game_id}")
+            metadata = {
+                "id": game["id"],
+                "timestamp": game["created_at"],
+                "is_synced": bool(game["is_synced"]),
+                "game_name": game["game_name"],
+                "genesis_path": game["genesis_path"],
+                "current_turn": game["current_turn"],
+                "last_played_at": game["last_played_at"],
+            }
+            local_store.save_game_metadata(game_id, metadata)
+
+            for row in _materialize_agent_states(store, game_id, store.query_agent_states(game_id)):
+                row["is_synced"] = bool(row["is_synced"])
+                local_store.save_agent_state(game_id, row["agent_type"], row["turn_number"], row)
+
+            events_by_turn: Dict[int, List[Dict[str, Any]]] = {}
+            for row in store.query_event_logs(game_id):
+                row["is_synced"] = bool(row["is_synced"])
+                events_by_turn.setdefault(row["turn_number"], []).append(row)
+            for turn_number, events in events_by_turn.items():
+                local_store.write_events(game_id, turn_number, events)
+
+            for row in _query_game_card_set(card_store, store, game_id):
+                local_store.save_character_card(
+                    game_id,
+                    row["character_id"],
+                    1,
+                    {
+                        "game_id": game_id,
+                        "character_id": row["character_id"],
+                        "version": 1,
+                        "card_data": row["card_data"],
+                        "content_hash": row["content_hash"],
+                        "changed_by": "genesis_import",
+                    },
+                )
+
+            for row in store.query_character_cards(game_id):
+                row["is_synced"] = bool(row["is_synced"])
+                local_store.save_character_card(game_id, row["character_id"], row["version"], row)
+        finally:
+            if card_store is not None and card_store is not store:
+                card_store.close()
+            store.close()
+        return local_store.base_dir / "saves" / game_id
+
     def close(self) -> None:
+        if self._mirror_writer is not None:
+            self._mirror_writer.close()
+            self._mirror_writer = None
+        if self.card_store is not self.sqlite_store:
+            self.card_store.close()
         self.sqlite_store.close()
 
@@ -12,6 +12,7 @@ from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 
 from utils.logger import setup_logger
+from utils.metrics import record_cache
 
 logger = setup_logger("InActAccumulator", "accumulator.log")
 
@@ -282,6 +283,7 @@ class InActAccumulator:
             "turns_in_act": self.turns_count
         }
 
+        record_cache("scene_context", bool(self.cached_scene_context))
         if self.cached_scene_context:
             base_context.update({
                 "scene_summary": self.cached_scene_summary,
@@ -2,239 +2,275 @@
 健壮的 JSON 解析器
 用于处理 LLM 返回的不规范 JSON 响应
 
-特性：
-- 去除 markdown 代码块包裹
-- 去除 // 和 /* */ 注释
-- 大括号匹配提取 JSON 对象
-- 逐行解析作为备选
-- 正则表达式作为最后手段
+所有调用方统一走 extract_json：一次 O(n) 状态机扫描完成以下修复，
+最多只调用一次（截断时两次）json.loads，不再做多轮重扫：
+- 优先解析 markdown 代码块内的内容，跳过 JSON 前后的说明文字
+- 可指定期望的类型（如 expect=dict），说明文字里的 [1] 之类不会被当作结果
+- 去除字符串外的 // 与 /* */ 注释（字符串内的 // 原样保留，如 URL）
+- 删除对象/数组末尾多余的逗号
+- 将字符串内的裸换行、制表符转义
+- 输出被截断时补全未闭合的字符串与括号
 """
 import json
 import re
-from typing import Any, Optional
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
 
 from utils.logger import setup_logger
 
 logger = setup_logger("JSONParser", "json_parser.log")
 
+_OPENERS = {"{": "}", "[": "]"}
+_CLOSERS = {"}", "]"}
+_STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+# 起始括号解析失败时，最多再尝试后续几个候选起点
+_MAX_START_ATTEMPTS = 3
+# markdown 代码块（未闭合时取到文末，兼容截断输出）
+_FENCE = re.compile(r"```[ \t]*(?:json)?[ \t]*\r?\n?(.*?)(?:```|\Z)", re.DOTALL | re.IGNORECASE)
+_EXPECTED_OPENERS = {dict: "{", list: "["}
+
+
+@dataclass
+class JsonExtraction:
+    """extract_json 的结果与诊断信息"""
+    value: Any = None
+    success: bool = False
+    repairs: List[str] = field(default_factory=list)   # 实际应用过的修复，如 comments / trailing_comma / truncated
+    error: Optional[str] = None
+    span: Tuple[int, int] = (-1, -1)                    # JSON 在原文中的起止位置 [start, end)
 
-def parse_json_response(response: str, raise_on_error: bool = False) -> Optional[Any]:
-    """
-    解析 LLM 返回的 JSON，去除 markdown 包裹与注释
-    
-    增强版：能够处理 JSON 后面有多余内容的情况
-    
-    Args:
-        response: LLM 原始响应字符串
-        raise_on_error: 如果为 True，解析失败时抛出异常；否则返回 None
-        
-    Returns:
-        解析后的 Python 对象，或 None（如果解析失败且 raise_on_error=False）
-    """
-    if not response or not response.strip():
-        if raise_on_error:
-            raise ValueError("空响应")
-        return None
-        
-    cleaned = response.strip()
-    
-    # 1. 去除 markdown 代码块包裹
-    if cleaned.startswith("```json"):
-        cleaned = cleaned[7:]
-    elif cleaned.startswith("```JSON"):
-        cleaned = cleaned[7:]
-    elif cleaned.startswith("```"):
-        cleaned = cleaned[3:]
-    if cleaned.endswith("```"):
-        cleaned = cleaned[:-3]
-    cleaned = cleaned.strip()
-    
-    # 2. 去除 // 与 /* */ 注释
-    cleaned = re.sub(r"//.*?(?=\n|$)", "", cleaned)
-    cleaned = re.sub(r"/\*.*?\*/", "", cleaned, flags=re.DOTALL)
-    
-    # 3. 尝试直接解析
-    try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError as e:
-        logger.debug(f"直接解析失败: {e}")
-    
-    # 4. 方法1: 大括号匹配提取第一个完整的 JSON 对象
-    first_brace = cleaned.find('{')
-    if first_brace != -1:
-        result = _extract_json_by_brace_matching(cleaned, first_brace)
-        if result is not None:
-            logger.debug("通过大括号匹配成功提取 JSON")
-            return result
-    
-    # 5. 方法2: 逐行解析
-    result = _extract_json_line_by_line(cleaned)
-    if result is not None:
-        logger.debug("通过逐行解析成功提取 JSON")
-        return result
-    
-    # 6. 方法3: 正则表达式（最后手段，简单情况）
-    result = _extract_json_by_regex(cleaned)
-    if result is not None:
-        logger.debug("通过正则表达式成功提取 JSON")
-        return result
-    
-    # 所有方法都失败
-    logger.warning(f"JSON 解析失败，原始响应前200字: {response[:200]}...")
-    
-    if raise_on_error:
-        raise ValueError("无法解析 JSON 响应")
-    return None
 
+def _find_start(text: str, pos: int, expect: Optional[type] = None) -> int:
+    """返回 pos 之后第一个 { 或 [ 的位置（指定 expect 时只找对应的括号），找不到返回 -1。"""
+    if expect in _EXPECTED_OPENERS:
+        return text.find(_EXPECTED_OPENERS[expect], pos)
+    brace = text.find("{", pos)
+    bracket = text.find("[", pos)
+    if brace == -1:
+        return bracket
+    if bracket == -1:
+        return brace
+    return min(brace, bracket)
 
-def _extract_json_by_brace_matching(text: str, start_pos: int) -> Optional[Any]:
+
+def _scan(text: str, start: int) -> Tuple[str, int, List[str], Optional[str]]:
     """
-    通过大括号匹配提取 JSON 对象
-    
-    Args:
-        text: 文本内容
-        start_pos: 第一个 '{' 的位置
-        
+    从 start 处的括号开始单遍扫描，产出清理后的 JSON 文本。
+
     Returns:
-        解析后的对象，或 None
+        (json_text, end_pos, repairs, truncated_fallback)
+        truncated_fallback 为截断时回退到最后一个完整元素处的候选文本
     """
-    brace_count = 0
+    out: List[str] = []
+    stack: List[str] = []
+    repairs: List[str] = []
     in_string = False
-    escape_next = False
-    last_brace = -1
-    
-    for i in range(start_pos, len(text)):
-        char = text[i]
-        
-        # 处理转义字符
-        if escape_next:
-            escape_next = False
+    escape = False
+    pending_comma = -1          # out 中最近一个尚未被后续元素“确认”的逗号位置
+    safe_point: Optional[Tuple[int, List[str]]] = None  # (out 长度, 当时的栈)
+    i = start
+    n = len(text)
+
+    def note(repair: str) -> None:
+        if repair not in repairs:
+            repairs.append(repair)
+
+    while i < n:
+        ch = text[i]
+
+        if in_string:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == '"':
+                in_string = False
+                out.append(ch)
+            elif ch in _STRING_ESCAPES:
+                note("control_chars")
+                out.append(_STRING_ESCAPES[ch])
+            else:
+                out.append(ch)
+            i += 1
             continue
-        
-        if char == '\\':
-            escape_next = True
+
+        if ch == "/" and i + 1 < n and text[i + 1] in "/*":
+            note("comments")
+            if text[i + 1] == "/":
+                newline = text.find("\n", i + 2)
+                i = n if newline == -1 else newline
+            else:
+                close = text.find("*/", i + 2)
+                i = n if close == -1 else close + 2
             continue
-        
-        # 处理字符串内的引号
-        if char == '"' and not escape_next:
-            in_string = not in_string
+
+        if ch in " \t\r\n":
+            out.append(ch)
+            i += 1
             continue
-        
-        # 只在非字符串状态下计算大括号
-        if not in_string:
-            if char == '{':
-                brace_count += 1
-            elif char == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    last_brace = i
-                    break
-    
-    if last_brace != -1:
-        json_str = text[start_pos:last_brace + 1]
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
-    
-    return None
+
+        if ch == ",":
+            safe_point = (len(out), list(stack))
+            pending_comma = len(out)
+            out.append(ch)
+            i += 1
+            continue
+
+        if ch in _CLOSERS:
+            if pending_comma != -1:
+                note("trailing_comma")
+                out[pending_comma] = ""
+            pending_comma = -1
+            expected = _OPENERS[stack.pop()] if stack else ch
+            if expected != ch:
+                note("mismatched_bracket")
+            out.append(expected)
+            i += 1
+            if not stack:
+                return "".join(out), i, repairs, None
+            continue
+
+        pending_comma = -1
+        if ch in _OPENERS:
+            stack.append(ch)
+        elif ch == '"':
+            in_string = True
+        out.append(ch)
+        i += 1
+
+    # 文本结束但括号未闭合：输出被截断
+    note("truncated")
+    completed = list(out)
+    if in_string:
+        if escape:
+            completed.pop()
+        completed.append('"')
+    if pending_comma != -1:
+        completed[pending_comma] = ""
+    completed.extend(_OPENERS[opener] for opener in reversed(stack))
+
+    fallback = None
+    if safe_point is not None:
+        length, safe_stack = safe_point
+        fallback = "".join(out[:length]) + "".join(_OPENERS[o] for o in reversed(safe_stack))
+    return "".join(completed), n, repairs, fallback
 
 
-def _extract_json_line_by_line(text: str) -> Optional[Any]:
+def extract_json(text: str, expect: Optional[type] = None) -> JsonExtraction:
     """
-    逐行解析提取 JSON 对象
-    
+    从 LLM 输出中提取第一个 JSON 对象或数组
+
+    有 markdown 代码块时优先取代码块内的 JSON，取不到再扫描全文。
+
     Args:
-        text: 文本内容
-        
+        text: LLM 原始响应
+        expect: 期望的类型（dict 或 list）；类型不符的候选会被跳过
+
     Returns:
-        解析后的对象，或 None
+        JsonExtraction，success=False 时 error 给出原因
     """
-    lines = text.split('\n')
-    json_lines = []
-    in_json = False
-    brace_count = 0
-    in_string = False
-    escape_next = False
-    
-    for line in lines:
-        # 找到第一个包含 { 的行
-        if '{' in line and not in_json:
-            in_json = True
-        
-        if in_json:
-            json_lines.append(line)
-            
-            # 计算大括号（考虑字符串内的引号）
-            for char in line:
-                if escape_next:
-                    escape_next = False
-                    continue
-                if char == '\\':
-                    escape_next = True
-                    continue
-                if char == '"' and not escape_next:
-                    in_string = not in_string
-                    continue
-                if not in_string:
-                    if char == '{':
-                        brace_count += 1
-                    elif char == '}':
-                        brace_count -= 1
-            
-            # 当大括号匹配时，JSON 对象完整
-            if brace_count == 0 and json_lines:
-                json_str = '\n'.join(json_lines)
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    # 重置继续尝试
-                    json_lines = []
-                    in_json = False
-                    brace_count = 0
-    
-    return None
+    if not text or not text.strip():
+        return JsonExtraction(error="空响应")
+
+    fence = _FENCE.search(text)
+    if fence and _find_start(fence.group(1), 0, expect) != -1:
+        result = _extract(fence.group(1), expect)
+        if result.success:
+            offset = fence.start(1)
+            result.span = (result.span[0] + offset, result.span[1] + offset)
+            return result
+    return _extract(text, expect)
+
+
+def _extract(text: str, expect: Optional[type]) -> JsonExtraction:
+    def accepted(value: Any) -> bool:
+        return expect is None or isinstance(value, expect)
 
+    # 快速路径：本身就是合法 JSON
+    stripped = text.strip()
+    if stripped and stripped[0] in _OPENERS:
+        try:
+            value = json.loads(stripped)
+        except json.JSONDecodeError:
+            value = None
+        else:
+            if accepted(value):
+                offset = text.index(stripped[0])
+                return JsonExtraction(value=value, success=True, span=(offset, offset + len(stripped)))
+
+    last_error = "未找到 JSON 起始括号"
+    pos = 0
+    for _ in range(_MAX_START_ATTEMPTS):
+        start = _find_start(text, pos, expect)
+        if start == -1:
+            break
+        candidate, end, repairs, fallback = _scan(text, start)
+        if start > 0 and text[:start].strip():
+            repairs.insert(0, "leading_text")
+        if end < len(text) and text[end:].strip():
+            repairs.append("trailing_text")
+        try:
+            value = json.loads(candidate)
+            if accepted(value):
+                return JsonExtraction(value=value, success=True, repairs=repairs, span=(start, end))
+            last_error = f"期望 {expect.__name__}，实际为 {type(value).__name__}"
+        except json.JSONDecodeError as e:
+            last_error = str(e)
+        if fallback is not None:
+            try:
+                value = json.loads(fallback)
+                if accepted(value):
+                    repairs.append("dropped_partial_tail")
+                    return JsonExtraction(value=value, success=True, repairs=repairs, span=(start, end))
+            except json.JSONDecodeError:
+                pass
+        pos = start + 1
+
+    return JsonExtraction(error=last_error)
 
-def _extract_json_by_regex(text: str) -> Optional[Any]:
+
+def parse_json_response(response: str, raise_on_error: bool = False) -> Optional[Any]:
     """
-    使用正则表达式提取 JSON 对象（最后手段，简单情况）
-    
-    注意：这个方法可能无法正确处理嵌套的复杂 JSON
-    
+    解析 LLM 返回的 JSON，去除 markdown 包裹与注释
+
+    增强版：能够处理 JSON 后面有多余内容的情况
+
     Args:
-        text: 文本内容
-        
+        response: LLM 原始响应字符串
+        raise_on_error: 如果为 True，解析失败时抛出异常；否则返回 None
+
     Returns:
-        解析后的对象，或 None
+        解析后的 Python 对象，或 None（如果解析失败且 raise_on_error=False）
     """
-    # 尝试匹配简单的 JSON 对象
-    json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-    json_matches = re.finditer(json_pattern, text, re.DOTALL)
-    
-    for match in json_matches:
-        json_str = match.group(0)
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            continue
-    
+    result = extract_json(response)
+    if result.success:
+        if result.repairs:
+            logger.debug(f"JSON 已修复: {', '.join(result.repairs)}")
+        return result.value
+
+    if response and response.strip():
+        logger.warning(f"JSON 解析失败（{result.error}），原始响应前200字: {response[:200]}...")
+    if raise_on_error:
+        raise ValueError(f"无法解析 JSON 响应: {result.error}")
     return None
 
 
 def safe_parse_npc_response(response: str, default_values: dict = None) -> dict:
     """
     安全解析 NPC 响应，失败时返回带有默认值的字典
-    
+
     Args:
         response: LLM 原始响应
         default_values: 解析失败时使用的默认值字典
-        
+
     Returns:
         解析后的字典，或带有默认值的字典
     """
     result = parse_json_response(response)
-    
+
     if result is not None and isinstance(result, dict):
         # 确保必要的字段存在
         result.setdefault("thought", "")
@@ -245,7 +281,7 @@ def safe_parse_npc_response(response: str, default_values: dict = None) -> dict:
         result.setdefault("addressing_target", "everyone")
         result.setdefault("is_scene_finished", False)
         return result
-    
+
     # 解析失败，使用默认值
     defaults = {
         "thought": "（解析失败）",
@@ -256,8 +292,8 @@ def safe_parse_npc_response(response: str, default_values: dict = None) -> dict:
         "addressing_target": "everyone",
         "is_scene_finished": False
     }
-    
+
     if default_values:
         defaults.update(default_values)
-    
+
     return defaults
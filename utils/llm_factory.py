@@ -3,7 +3,7 @@ LLM工厂模块
 支持多种LLM提供商，遵循低耦合原则
 支持: zhipu(智谱清言), openai, openrouter
 """
-from typing import Optional
+from typing import Any, Optional
 from langchain_core.language_models import BaseLanguageModel
 from config.settings import settings
 from utils.logger import setup_logger
@@ -31,7 +31,8 @@ class LLMFactory:
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
         timeout: Optional[float] = None,
-        max_retries: Optional[int] = None
+        max_retries: Optional[int] = None,
+        agent_name: Optional[str] = None
     ) -> BaseLanguageModel:
         """
         创建LLM实例
@@ -41,9 +42,10 @@ class LLMFactory:
             model_name: 模型名称，默认从配置读取
             temperature: 温度参数，默认从配置读取
             max_tokens: 最大token数，默认从配置读取
+            agent_name: 调用方 Agent 名称，用于遥测归因
         
         Returns:
-            LLM实例
+            LLM实例（已挂载遥测回调）
         """
         provider = provider or settings.LLM_PROVIDER
 
@@ -51,7 +53,7 @@ class LLMFactory:
             from utils.mock_llm import MockChatLLM
 
             logger.info("🧪 使用 MockChatLLM（离线/CI 模式）")
-            return MockChatLLM()
+            return LLMFactory._instrument(MockChatLLM(), agent_name, provider, "mock")
         
         # OpenRouter使用专门的模型配置
         if provider == "openrouter":
@@ -66,16 +68,31 @@ class LLMFactory:
         
         try:
             if provider == "zhipu":
-                return LLMFactory._create_zhipu(model_name, temperature, max_tokens, timeout)
+                llm = LLMFactory._create_zhipu(model_name, temperature, max_tokens, timeout)
             elif provider == "openai":
-                return LLMFactory._create_openai(model_name, temperature, max_tokens, timeout, max_retries)
+                llm = LLMFactory._create_openai(model_name, temperature, max_tokens, timeout, max_retries)
             elif provider == "openrouter":
-                return LLMFactory._create_openrouter(model_name, temperature, max_tokens, timeout, max_retries)
+                llm = LLMFactory._create_openrouter(model_name, temperature, max_tokens, timeout, max_retries)
             else:
                 raise ValueError(f"不支持的LLM提供商: {provider}")
         except Exception as e:
             logger.error(f"❌ 创建LLM失败: {e}")
             raise
+        return LLMFactory._instrument(llm, agent_name, provider, model_name)
+
+    @staticmethod
+    def _instrument(
+        llm: BaseLanguageModel,
+        agent_name: Optional[str],
+        provider: str,
+        model_name: str
+    ) -> BaseLanguageModel:
+        """挂载遥测回调：经由本工厂创建的 LLM，其每次调用（含链式调用、bind 后的调用）都会被记录"""
+        from utils.llm_telemetry import LLMTelemetryCallback
+
+        callback = LLMTelemetryCallback(agent_name or "unknown", provider, model_name)
+        llm.callbacks = list(llm.callbacks or []) + [callback]
+        return llm
     
     @staticmethod
     def _create_zhipu(
@@ -182,3 +199,20 @@ class LLMFactory:
 def get_llm(**kwargs) -> BaseLanguageModel:
     """获取LLM实例的便捷函数"""
     return LLMFactory.create_llm(**kwargs)
+
+
+def supports_json_mode(llm: Any) -> bool:
+    """是否支持 response_format=json_object（OpenAI 兼容接口：openai / openrouter）"""
+    return isinstance(llm, ChatOpenAI)
+
+
+def bind_json_mode(llm: Any) -> Any:
+    """
+    为支持的提供商开启 JSON 模式（结构化输出请求）
+
+    不支持的提供商（智谱、Mock）原样返回，仍依赖 Prompt 约束 + 事后校验。
+    注意：OpenAI 要求消息中出现 "JSON" 字样，调用方 Prompt 需满足这一点。
+    """
+    if settings.LLM_JSON_MODE and supports_json_mode(llm):
+        return llm.bind(response_format={"type": "json_object"})
+    return llm
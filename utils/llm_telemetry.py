@@ -0,0 +1,534 @@
+"""
+LLM 调用遥测
+
+LLMFactory 创建的每个 LLM 实例都挂载 LLMTelemetryCallback，逐次记录：
+- prompt / completion token（优先取提供商返回的 usage，缺失时本地估算，如 MockChatLLM）
+- 首 token 延迟（仅流式调用可测；非流式时等于总延迟）与总延迟
+- 所属 Agent、会话 ID、回合模式（后两者来自 telemetry_context 设置的上下文变量）
+
+记录分发给已注册的 sink：默认写 logs/llm_telemetry_YYYYMMDD.jsonl，在内存中保留最近记录与按 Agent 汇总，
+并累计到 /metrics 的 LLM 指标。
+
+LLMBudget 是另一种回调：为一组调用（如一次创世构建）设定总调用次数 / token 上限。
+SharedLLMRateLimit 按每分钟调用数限流，令牌桶存放在 SQLite 中，多个进程（如创世队列的各个 worker）共用同一额度。
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from config.settings import settings
+from utils.logger import setup_jsonl_logger
+from utils.metrics import metrics
+from utils.tracing import Trace, current_trace
+
+_session_id: ContextVar[Optional[str]] = ContextVar("llm_session_id", default=None)
+_turn_mode: ContextVar[Optional[str]] = ContextVar("llm_turn_mode", default=None)
+_agent_override: ContextVar[Optional[str]] = ContextVar("llm_agent", default=None)
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]+")
+_SPACE_PATTERN = re.compile(r"\s+")
+
+
+@contextmanager
+def telemetry_context(
+    session_id: Optional[str] = None,
+    turn_mode: Optional[str] = None,
+    agent: Optional[str] = None,
+):
+    """
+    在此范围内发起的 LLM 调用都带上这些标签（None 表示沿用外层的值）
+
+    基于 contextvars：asyncio 任务与 asyncio.to_thread 都会继承当前值。
+    """
+    tokens = []
+    for var, value in ((_session_id, session_id), (_turn_mode, turn_mode), (_agent_override, agent)):
+        if value is not None:
+            tokens.append((var, var.set(value)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_session_id() -> Optional[str]:
+    """当前上下文中的会话 ID"""
+    return _session_id.get()
+
+
+def _run_length(pattern: "re.Pattern[str]", text: str, start: int, end: int) -> int:
+    return sum(m.end() - m.start() for m in pattern.finditer(text, start, end))
+
+
+def estimate_tokens(text: str, start: int = 0, end: Optional[int] = None) -> int:
+    """
+    本地估算 token 数（未安装分词器时使用）
+
+    中日韩字符按 1 字 1 token，其余非空白字符按 4 字符 1 token。
+    按连续片段计数、不复制文本；给出 start/end 时只统计 text[start:end]。
+    """
+    if not text:
+        return 0
+    end = len(text) if end is None else min(end, len(text))
+    if end <= start:
+        return 0
+    cjk = _run_length(_CJK_PATTERN, text, start, end)
+    others = (end - start) - _run_length(_SPACE_PATTERN, text, start, end) - cjk
+    return cjk + (others + 3) // 4
+
+
+@dataclass
+class LLMCallRecord:
+    """一次 LLM 调用的遥测记录"""
+    agent: str
+    provider: str
+    model: str
+    session_id: Optional[str]
+    turn_mode: Optional[str]
+    started_at: str
+    latency_ms: float
+    ttft_ms: Optional[float]
+    streamed: bool
+    prompt_tokens: int
+    completion_tokens: int
+    usage_source: str          # provider / estimate
+    success: bool
+    error: str = ""
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["total_tokens"] = self.total_tokens
+        return data
+
+
+# ============================================================
+# Sink
+# ============================================================
+
+class TelemetrySink:
+    """遥测记录的接收方"""
+
+    def emit(self, record: LLMCallRecord) -> None:
+        raise NotImplementedError
+
+
+class JsonlTelemetrySink(TelemetrySink):
+    """逐行写入 JSONL 文件（经异步日志管线，由后台线程落盘）"""
+
+    def __init__(self, log_file: Optional[str] = None):
+        log_file = log_file or f"llm_telemetry_{datetime.now().strftime('%Y%m%d')}.jsonl"
+        # 每个文件一个 logger：setup_jsonl_logger 会清空同名 logger 的 handler，共用名字会把全局遥测改写到新文件
+        self._logger = setup_jsonl_logger(f"LLMTelemetry.{log_file}", log_file)
+
+    def emit(self, record: LLMCallRecord) -> None:
+        self._logger.debug(json.dumps(record.to_dict(), ensure_ascii=False))
+
+
+class InMemoryTelemetrySink(TelemetrySink):
+    """保留最近 N 条记录，并按 Agent 累计调用次数、错误、token 与延迟"""
+
+    def __init__(self, maxlen: int = 1000):
+        self.records: deque = deque(maxlen=maxlen)
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def emit(self, record: LLMCallRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+            totals = self._totals.setdefault(record.agent, {
+                "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "latency_ms_total": 0.0, "latency_ms_max": 0.0,
+            })
+            totals["calls"] += 1
+            totals["errors"] += 0 if record.success else 1
+            totals["prompt_tokens"] += record.prompt_tokens
+            totals["completion_tokens"] += record.completion_tokens
+            totals["latency_ms_total"] += record.latency_ms
+            totals["latency_ms_max"] = max(totals["latency_ms_max"], record.latency_ms)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按 Agent 汇总（累计值，不受 maxlen 影响）"""
+        with self._lock:
+            return {agent: dict(totals) for agent, totals in self._totals.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self.records.clear()
+            self._totals.clear()
+
+
+class MetricsTelemetrySink(TelemetrySink):
+    """写入进程内指标，供 /metrics 抓取"""
+
+    def __init__(self):
+        self.calls = metrics.counter("storymaker_llm_calls_total", "LLM 调用次数", ["agent", "status"])
+        self.tokens = metrics.counter("storymaker_llm_tokens_total", "LLM token 数", ["agent", "kind"])
+        self.latency = metrics.histogram("storymaker_llm_call_seconds", "LLM 调用总耗时", ["agent"])
+        self.ttft = metrics.histogram("storymaker_llm_ttft_seconds", "LLM 首 token 延迟", ["agent"])
+
+    def emit(self, record: LLMCallRecord) -> None:
+        agent = record.agent
+        self.calls.inc(agent=agent, status="success" if record.success else "error")
+        self.tokens.inc(record.prompt_tokens, agent=agent, kind="prompt")
+        self.tokens.inc(record.completion_tokens, agent=agent, kind="completion")
+        self.latency.observe(record.latency_ms / 1000, agent=agent)
+        if record.ttft_ms is not None:
+            self.ttft.observe(record.ttft_ms / 1000, agent=agent)
+
+
+class LLMTelemetry:
+    """sink 注册表"""
+
+    def __init__(self):
+        self._sinks: List[TelemetrySink] = []
+        self.memory = InMemoryTelemetrySink()
+        self.add_sink(self.memory)
+
+    def add_sink(self, sink: TelemetrySink) -> None:
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink: TelemetrySink) -> None:
+        if sink in self._sinks:
+            self._sinks.remove(sink)
+
+    def emit(self, record: LLMCallRecord) -> None:
+        for sink in list(self._sinks):
+            try:
+                sink.emit(record)
+            except Exception:  # noqa: BLE001 - 遥测失败不能影响调用方
+                pass
+
+
+llm_telemetry = LLMTelemetry()
+llm_telemetry.add_sink(MetricsTelemetrySink())
+if settings.LLM_TELEMETRY:
+    llm_telemetry.add_sink(JsonlTelemetrySink())
+
+
+# ============================================================
+# LangChain 回调
+# ============================================================
+
+@dataclass
+class _PendingCall:
+    started: float
+    started_at: str
+    session_id: Optional[str]
+    turn_mode: Optional[str]
+    agent: str
+    prompts: Any
+    first_token: Optional[float] = None
+    trace: Optional[Trace] = None
+    lane: int = 0
+
+
+def _prompt_text(prompts: Any) -> str:
+    """把 on_chat_model_start 的消息或 on_llm_start 的字符串拼成文本（仅估算时使用）"""
+    parts: List[str] = []
+    for item in prompts or []:
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        for message in item:
+            content = getattr(message, "content", message)
+            parts.append(content if isinstance(content, str) else str(content))
+    return "\n".join(parts)
+
+
+def _provider_usage(response: LLMResult) -> Optional[Tuple[int, int]]:
+    """从 usage_metadata 或 llm_output.token_usage 读取 (prompt, completion)"""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    if token_usage:
+        return int(token_usage.get("prompt_tokens", 0)), int(token_usage.get("completion_tokens", 0))
+    return None
+
+
+class LLMTelemetryCallback(BaseCallbackHandler):
+    """挂在 LLM 实例上的遥测回调（同步内联执行，异步调用时不额外占用线程池）"""
+
+    run_inline = True
+
+    def __init__(self, agent: str, provider: str, model: str, telemetry: Optional[LLMTelemetry] = None):
+        self.agent = agent
+        self.provider = provider
+        self.model = model
+        self.telemetry = telemetry or llm_telemetry
+        self._pending: Dict[UUID, _PendingCall] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, prompts: Any) -> None:
+        agent = _agent_override.get() or self.agent
+        trace = current_trace()
+        # 回合正在追踪时，LLM 调用也记为时间线上的一个 span
+        lane = trace.lane(f"llm.{agent}") if trace is not None else 0
+        with self._lock:
+            self._pending[run_id] = _PendingCall(
+                started=time.perf_counter(),
+                started_at=datetime.now().isoformat(timespec="milliseconds"),
+                session_id=_session_id.get(),
+                turn_mode=_turn_mode.get(),
+                agent=agent,
+                prompts=prompts,
+                trace=trace,
+                lane=lane,
+            )
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, messages)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, prompts)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        pending = self._pending.get(run_id)
+        if pending is not None and pending.first_token is None:
+            pending.first_token = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        usage = _provider_usage(response)
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage
+            source = "provider"
+        else:
+            completion = "".join(g.text for gens in response.generations for g in gens)
+            prompt_tokens = estimate_tokens(_prompt_text(pending.prompts))
+            completion_tokens = estimate_tokens(completion)
+            source = "estimate"
+        self._emit(pending, True, prompt_tokens, completion_tokens, source)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        self._emit(pending, False, estimate_tokens(_prompt_text(pending.prompts)), 0, "estimate", str(error))
+
+    def _emit(
+        self,
+        pending: _PendingCall,
+        success: bool,
+        prompt_tokens: int,
+        completion_tokens: int,
+        usage_source: str,
+        error: str = "",
+    ) -> None:
+        now = time.perf_counter()
+        latency_ms = (now - pending.started) * 1000
+        streamed = pending.first_token is not None
+        ttft_ms = (pending.first_token - pending.started) * 1000 if streamed else latency_ms
+        if pending.trace is not None:
+            pending.trace.add_span(f"llm.{pending.agent}", pending.started, now, pending.lane, {
+                "model": self.model,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "ttft_ms": round(ttft_ms, 2),
+                "success": success,
+            })
+        self.telemetry.emit(LLMCallRecord(
+            agent=pending.agent,
+            provider=self.provider,
+            model=self.model,
+            session_id=pending.session_id,
+            turn_mode=pending.turn_mode,
+            started_at=pending.started_at,
+            latency_ms=round(latency_ms, 2),
+            ttft_ms=round(ttft_ms, 2) if success else None,
+            streamed=streamed,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            usage_source=usage_source,
+            success=success,
+            error=error,
+        ))
+
+
+# ============================================================
+# 调用预算
+# ============================================================
+
+class LLMBudgetExceeded(RuntimeError):
+    """LLM 调用预算已用完"""
+
+
+class LLMBudget(BaseCallbackHandler):
+    """
+    一组 LLM 调用的总预算（调用次数 / token 数，0 表示不限）
+
+    挂到 LLM 实例的 callbacks 上：发起调用前检查，超出时抛出 LLMBudgetExceeded（raise_error），
+    调用结束后累计 token（优先取提供商返回的 usage，缺失时本地估算）。
+    同一实例可被多个线程中的多个 LLM 共享。
+    """
+
+    run_inline = True
+    raise_error = True
+
+    def __init__(self, max_calls: int = 0, max_tokens: int = 0):
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+        self.calls = 0
+        self.tokens = 0
+        self.rejected = 0
+        self._prompts: Dict[UUID, Any] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        with self._lock:
+            return self._exhausted_locked()
+
+    def _exhausted_locked(self) -> bool:
+        return (self.max_calls > 0 and self.calls >= self.max_calls) or (
+            self.max_tokens > 0 and self.tokens >= self.max_tokens
+        )
+
+    def _start(self, run_id: UUID, prompts: Any) -> None:
+        with self._lock:
+            if self._exhausted_locked():
+                self.rejected += 1
+                raise LLMBudgetExceeded(
+                    f"LLM 预算已用完（调用 {self.calls}/{self.max_calls or '∞'}，"
+                    f"token {self.tokens}/{self.max_tokens or '∞'}）"
+                )
+            self.calls += 1
+            self._prompts[run_id] = prompts
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, messages)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, prompts)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            prompts = self._prompts.pop(run_id, None)
+        usage = _provider_usage(response)
+        if usage is None:
+            completion = "".join(g.text for gens in response.generations for g in gens)
+            usage = (estimate_tokens(_prompt_text(prompts)), estimate_tokens(completion))
+        with self._lock:
+            self.tokens += sum(usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            prompts = self._prompts.pop(run_id, None)
+            self.tokens += estimate_tokens(_prompt_text(prompts))
+
+    def attach(self, llm: Any) -> Any:
+        """挂到 LLM 实例上（返回同一实例）"""
+        llm.callbacks = list(llm.callbacks or []) + [self]
+        return llm
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_calls": self.max_calls,
+                "max_tokens": self.max_tokens,
+                "calls": self.calls,
+                "tokens": self.tokens,
+                "rejected": self.rejected,
+                "exhausted": self._exhausted_locked(),
+            }
+
+
+class SharedLLMRateLimit(BaseCallbackHandler):
+    """
+    跨进程共享的 LLM 调用限流（令牌桶，每分钟 calls_per_minute 次，允许一分钟额度的突发）
+
+    挂到 LLM 实例的 callbacks 上：发起调用前取一个令牌，取不到时阻塞等待。
+    令牌桶的状态保存在 db_path 的 llm_rate_buckets 表中，同一文件、同一 name 的实例共用额度；
+    calls_per_minute 为 0 时不限流。
+    """
+
+    run_inline = True
+    raise_error = True
+
+    def __init__(self, db_path: Path, calls_per_minute: float, name: str = "llm"):
+        self.db_path = Path(db_path)
+        self.calls_per_minute = calls_per_minute
+        self.name = name
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_rate_buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)"
+            )
+        return self._conn
+
+    def _take(self) -> float:
+        """取一个令牌；成功返回 0，否则返回还需等待的秒数"""
+        # 桶容量至少为 1：每分钟不足一次（如 0.5）时也能攒满一个令牌，否则会永远等待
+        rate = float(self.calls_per_minute) / 60
+        capacity = max(1.0, float(self.calls_per_minute))
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM llm_rate_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if wait == 0.0:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (self.name, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self) -> None:
+        if self.calls_per_minute <= 0:
+            return
+        with self._lock:
+            while True:
+                wait = self._take()
+                if wait <= 0:
+                    return
+                self.waited_seconds += wait
+                time.sleep(wait)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self.acquire()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self.acquire()
+
+    def attach(self, llm: Any) -> Any:
+        """挂到 LLM 实例上（返回同一实例）"""
+        llm.callbacks = list(llm.callbacks or []) + [self]
+        return llm
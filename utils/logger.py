@@ -8,9 +8,16 @@
 - 自动堆栈跟踪
 - 上下文追踪（当前场景、角色等）
 - LLM 调用日志记录
+- 异步写入：各模块 logger 只把记录放入队列，终端与文件 I/O 由唯一的后台线程完成，
+  格式化也推迟到后台线程；高频 DEBUG/INFO 日志按模块限流
 """
+import atexit
 import logging
+import logging.handlers
+import queue
 import colorlog
+import threading
+import time
 import traceback
 import sys
 import json
@@ -96,15 +103,31 @@ def log_operation(operation: str, **kwargs):
 # 增强的日志格式化器
 # ============================================================
 
+def _decorate_record(record: logging.LogRecord) -> logging.LogRecord:
+    """
+    附加上下文与抑制计数，返回副本（同一条记录会经过多个 handler，不能原地修改 msg）
+
+    异步模式下上下文在调用线程入队时已快照到 record.log_context，
+    同步模式下直接读取当前上下文。
+    """
+    context_str = getattr(record, "log_context", None)
+    if context_str is None:
+        context_str = log_context.format_context()
+    suppressed = getattr(record, "suppressed", 0)
+    if not context_str and not suppressed:
+        return record
+
+    record = logging.makeLogRecord(record.__dict__)
+    record.msg = f"{record.msg}{context_str}"
+    if suppressed:
+        record.msg = f"{record.msg} （此前 {suppressed} 条同模块日志因限流被丢弃）"
+    return record
+
+
 class EnhancedFormatter(logging.Formatter):
     """增强的日志格式化器 - 添加上下文信息和堆栈跟踪"""
     
     def format(self, record):
-        # 添加上下文信息
-        context_str = log_context.format_context()
-        if context_str:
-            record.msg = f"{record.msg}{context_str}"
-        
         # 对于错误级别，自动添加堆栈跟踪
         if record.levelno >= logging.ERROR and not record.exc_info:
             # 检查是否在异常处理中
@@ -112,17 +135,233 @@ class EnhancedFormatter(logging.Formatter):
             if exc_info[0] is not None:
                 record.exc_info = exc_info
         
-        return super().format(record)
+        return super().format(_decorate_record(record))
 
 
 class ColoredEnhancedFormatter(colorlog.ColoredFormatter):
     """彩色增强格式化器"""
     
     def format(self, record):
-        context_str = log_context.format_context()
-        if context_str:
-            record.msg = f"{record.msg}{context_str}"
-        return super().format(record)
+        return super().format(_decorate_record(record))
+
+
+# ============================================================
+# 限流
+# ============================================================
+
+class RateLimitFilter(logging.Filter):
+    """
+    令牌桶限流：每秒最多放行 per_second 条低于 WARNING 的记录
+
+    被丢弃的条数会记在下一条放行的记录上（record.suppressed），格式化时注明。
+    """
+
+    def __init__(self, per_second: float):
+        super().__init__()
+        self.per_second = per_second
+        self._tokens = per_second
+        self._last = time.monotonic()
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.per_second <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_second, self._tokens + (now - self._last) * self.per_second)
+            self._last = now
+            if self._tokens < 1:
+                self._suppressed += 1
+                return False
+            self._tokens -= 1
+            if self._suppressed:
+                record.suppressed = self._suppressed
+                self._suppressed = 0
+        return True
+
+
+def _rate_limit_for(name: str) -> float:
+    """读取模块限流配置：LOG_RATE_LIMITS 中的单独配置优先，否则使用 LOG_RATE_LIMIT"""
+    for item in settings.LOG_RATE_LIMITS.split(","):
+        key, _, value = item.partition("=")
+        if key.strip() == name and value.strip():
+            return float(value)
+    return settings.LOG_RATE_LIMIT
+
+
+# ============================================================
+# Handler 构建
+# ============================================================
+
+def _make_console_handler() -> logging.Handler:
+    console_handler = colorlog.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_format = ColoredEnhancedFormatter(
+        '%(log_color)s[%(asctime)s.%(msecs)03d] [%(name)s] [%(levelname)s]%(reset)s %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        log_colors={
+            'DEBUG': 'cyan',
+            'INFO': 'green',
+            'WARNING': 'yellow',
+            'ERROR': 'red',
+            'CRITICAL': 'red,bg_white',
+        }
+    )
+    console_handler.setFormatter(console_format)
+    return console_handler
+
+
+def _make_file_handler(log_file: str) -> logging.Handler:
+    file_handler = logging.FileHandler(settings.LOGS_DIR / log_file, encoding='utf-8')
+    file_handler.setLevel(logging.DEBUG)
+    file_format = EnhancedFormatter(
+        '[%(asctime)s.%(msecs)03d] [%(name)s] [%(levelname)s] [%(filename)s:%(lineno)d] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    file_handler.setFormatter(file_format)
+    return file_handler
+
+
+def _make_raw_file_handler(log_file: str) -> logging.Handler:
+    """只写消息本身的文件处理器（用于 JSONL 等结构化日志）"""
+    file_handler = logging.FileHandler(settings.LOGS_DIR / log_file, encoding='utf-8')
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+    return file_handler
+
+
+def _make_error_handler() -> logging.Handler:
+    error_log_path = settings.LOGS_DIR / f"errors_{datetime.now().strftime('%Y%m%d')}.log"
+    error_handler = logging.FileHandler(error_log_path, encoding='utf-8')
+    error_handler.setLevel(logging.ERROR)
+    error_format = EnhancedFormatter(
+        '\n{"timestamp": "%(asctime)s.%(msecs)03d", "logger": "%(name)s", "level": "%(levelname)s", '
+        '"file": "%(filename)s", "line": %(lineno)d, "function": "%(funcName)s", '
+        '"message": "%(message)s"}\n%(exc_text)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    error_handler.setFormatter(error_format)
+    return error_handler
+
+
+# ============================================================
+# 异步日志管线：各 logger 只挂一个 QueueHandler，由唯一的后台线程写终端与文件
+# ============================================================
+
+class _FileRouter(logging.Handler):
+    """按 record.log_file 分发到对应文件（仅在后台写入线程中调用，同一文件只打开一次）"""
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self._handlers: Dict[str, logging.Handler] = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        log_file = getattr(record, "log_file", None)
+        if not log_file:
+            return
+        handler = self._handlers.get(log_file)
+        if handler is None:
+            factory = _make_raw_file_handler if getattr(record, "log_raw", False) else _make_file_handler
+            handler = self._handlers[log_file] = factory(log_file)
+        handler.handle(record)
+
+    def flush(self) -> None:
+        for handler in self._handlers.values():
+            handler.flush()
+
+    def close(self) -> None:
+        for handler in self._handlers.values():
+            handler.close()
+        super().close()
+
+
+class _ModuleQueueHandler(logging.handlers.QueueHandler):
+    """
+    入队前只补充后台线程拿不到的信息（目标文件、上下文快照、当前异常），
+    不在调用线程上做格式化；队列满时直接丢弃并计数，绝不阻塞调用方。
+    """
+
+    def __init__(self, log_queue: "queue.Queue", log_file: Optional[str], raw: bool = False):
+        super().__init__(log_queue)
+        self.log_file = log_file
+        self.raw = raw
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.log_file = self.log_file
+        record.log_raw = self.raw
+        record.log_context = log_context.format_context()
+        if record.levelno >= logging.ERROR and not record.exc_info:
+            exc_info = sys.exc_info()
+            if exc_info[0] is not None:
+                record.exc_info = exc_info
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global _dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped_records += 1
+
+
+_log_queue: Optional["queue.Queue"] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_lock = threading.Lock()
+_dropped_records = 0
+
+
+def _get_log_queue() -> "queue.Queue":
+    """懒启动唯一的后台写入线程"""
+    global _log_queue, _listener
+    with _listener_lock:
+        if _listener is None:
+            _log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+            _listener = logging.handlers.QueueListener(
+                _log_queue,
+                _make_console_handler(),
+                _FileRouter(),
+                _make_error_handler(),
+                respect_handler_level=True,
+            )
+            _listener.start()
+            atexit.register(shutdown_logging)
+        return _log_queue
+
+
+def flush_logging(timeout: float = 5.0) -> bool:
+    """等待队列中的日志全部写出；超时返回 False"""
+    log_queue = _log_queue
+    if log_queue is None or _listener is None:
+        return True
+    deadline = time.monotonic() + timeout
+    while log_queue.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def shutdown_logging() -> None:
+    """停止后台写入线程（会先写完队列中剩余的日志）"""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def get_dropped_log_count() -> int:
+    """因队列已满被丢弃的日志条数"""
+    return _dropped_records
+
+
+def get_log_queue_depth() -> int:
+    """异步日志队列中尚未写出的记录数"""
+    return _log_queue.qsize() if _log_queue is not None else 0
 
 
 # ============================================================
@@ -143,69 +382,75 @@ def setup_logger(name: str, log_file: str = None) -> logging.Logger:
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
     
-    # 避免重复添加handler (清除现有handler)
+    # 避免重复添加handler/限流器 (清除现有的)
     if logger.handlers:
         logger.handlers.clear()
+    for old_filter in [f for f in logger.filters if isinstance(f, RateLimitFilter)]:
+        logger.removeFilter(old_filter)
     
     # 禁止向上传播，防止根logger重复记录
     logger.propagate = False
     
     settings.ensure_directories()
+
+    rate_limit = _rate_limit_for(name)
+    if rate_limit > 0:
+        logger.addFilter(RateLimitFilter(rate_limit))
+
+    if settings.LOG_ASYNC:
+        # 终端、模块日志文件、错误日志统一由后台线程写入
+        logger.addHandler(_ModuleQueueHandler(_get_log_queue(), log_file))
+        return logger
     
+    # 同步模式：在调用线程直接写入
     # 1. 彩色控制台输出
-    console_handler = colorlog.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    console_format = ColoredEnhancedFormatter(
-        '%(log_color)s[%(asctime)s.%(msecs)03d] [%(name)s] [%(levelname)s]%(reset)s %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S',
-        log_colors={
-            'DEBUG': 'cyan',
-            'INFO': 'green',
-            'WARNING': 'yellow',
-            'ERROR': 'red',
-            'CRITICAL': 'red,bg_white',
-        }
-    )
-    console_handler.setFormatter(console_format)
-    logger.addHandler(console_handler)
+    logger.addHandler(_make_console_handler())
     
     # 2. 普通日志文件输出（如果指定）
     if log_file:
-        file_path = settings.LOGS_DIR / log_file
-        file_handler = logging.FileHandler(file_path, encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)
-        file_format = EnhancedFormatter(
-            '[%(asctime)s.%(msecs)03d] [%(name)s] [%(levelname)s] [%(filename)s:%(lineno)d] %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        file_handler.setFormatter(file_format)
-        logger.addHandler(file_handler)
+        logger.addHandler(_make_file_handler(log_file))
     
     # 3. 错误专用日志文件（自动添加）
-    error_log_path = settings.LOGS_DIR / f"errors_{datetime.now().strftime('%Y%m%d')}.log"
-    error_handler = logging.FileHandler(error_log_path, encoding='utf-8')
-    error_handler.setLevel(logging.ERROR)
-    error_format = EnhancedFormatter(
-        '\n{"timestamp": "%(asctime)s.%(msecs)03d", "logger": "%(name)s", "level": "%(levelname)s", '
-        '"file": "%(filename)s", "line": %(lineno)d, "function": "%(funcName)s", '
-        '"message": "%(message)s"}\n%(exc_text)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    error_handler.setFormatter(error_format)
-    logger.addHandler(error_handler)
+    logger.addHandler(_make_error_handler())
     
     return logger
 
 
+_RAW_LOGGERS: set = set()
+
+
+def setup_jsonl_logger(name: str, log_file: str) -> logging.Logger:
+    """
+    配置只写 JSONL 文件的 logger（每条消息一行，不加前缀、不输出到终端、不限流）
+
+    记录请以 DEBUG 级别写入，避免出现在终端。
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.handlers.clear()
+    logger.propagate = False
+    settings.ensure_directories()
+    _RAW_LOGGERS.add(name)
+
+    if settings.LOG_ASYNC:
+        handler = _ModuleQueueHandler(_get_log_queue(), log_file, raw=True)
+        # 文件路由只按文件名分发，终端(INFO)与错误日志(ERROR)不会收到 DEBUG 记录
+        logger.addHandler(handler)
+    else:
+        logger.addHandler(_make_raw_file_handler(log_file))
+    return logger
+
+
 def mute_console_handlers() -> None:
     root = logging.getLogger()
     logger_dict = logging.root.manager.loggerDict
 
-    for logger in logger_dict.values():
-        if isinstance(logger, logging.PlaceHolder):
+    for name, logger in logger_dict.items():
+        if isinstance(logger, logging.PlaceHolder) or name in _RAW_LOGGERS:
             continue
         for handler in list(logger.handlers):
-            if isinstance(handler, logging.StreamHandler):
+            # 异步管线的 QueueHandler 同样包含终端输出，一并移除
+            if isinstance(handler, (logging.StreamHandler, _ModuleQueueHandler)):
                 logger.removeHandler(handler)
         logger.propagate = True
 
@@ -0,0 +1,85 @@
+"""
+事件循环阻塞检测
+
+EventLoopLagProbe 只能在事件循环恢复之后才知道"刚才卡了多久"，看不到是谁卡住的。
+LoopBlockMonitor 另开一个看门狗线程：事件循环上的心跳超过阈值未更新时，
+直接抓取事件循环线程当前的调用栈写入日志，定位把同步重活放在协程里的代码。
+
+用法（api_server 的 lifespan 中）：
+    monitor = LoopBlockMonitor()
+    monitor.start()        # 需在事件循环内调用
+    ...
+    await monitor.stop()
+"""
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from config.settings import settings
+from utils.logger import setup_logger
+from utils.metrics import EventLoopLagProbe, metrics
+
+logger = setup_logger("LoopMonitor", "loop_monitor.log")
+
+LOOP_STALLS = metrics.counter(
+    "storymaker_event_loop_stalls_total", "事件循环卡顿超过阈值的次数"
+)
+
+
+class LoopBlockMonitor(EventLoopLagProbe):
+    """事件循环延迟测量 + 卡顿时记录调用栈"""
+
+    def __init__(self, threshold_ms: Optional[float] = None, interval: Optional[float] = None):
+        threshold = (threshold_ms if threshold_ms is not None else settings.LOOP_BLOCK_THRESHOLD_MS) / 1000
+        super().__init__(interval=interval if interval is not None else max(threshold / 4, 0.005))
+        self.threshold = threshold
+        self.stalls = 0
+        self.last_stack = ""
+        self._heartbeat = time.perf_counter()
+        self._reported = False
+        self._loop_thread_id: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def _on_tick(self, lag: float) -> None:
+        self._heartbeat = time.perf_counter()
+        if self._reported:
+            logger.warning(f"⚠️ 事件循环恢复，本次卡顿约 {lag * 1000:.0f}ms")
+        self._reported = False
+
+    def _watch(self) -> None:
+        # 心跳正常间隔为 interval，超过 interval + threshold 仍未更新即视为卡住
+        limit = self.interval + self.threshold
+        poll = max(self.interval / 2, 0.002)
+        while not self._stop_event.wait(poll):
+            stalled_for = time.perf_counter() - self._heartbeat
+            if stalled_for < limit or self._reported:
+                continue
+            self._reported = True
+            self.stalls += 1
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            self.last_stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            logger.warning(
+                f"⚠️ 事件循环已阻塞 {stalled_for * 1000:.0f}ms（阈值 {self.threshold * 1000:.0f}ms），"
+                f"卡住位置:\n{self.last_stack}"
+            )
+
+    def start(self) -> None:
+        """在当前事件循环中启动心跳与看门狗线程"""
+        super().start()
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._loop_thread_id = threading.get_ident()
+            self._heartbeat = time.perf_counter()
+            self._stop_event.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop_event.set()
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1.0)
+            self._watchdog = None
+        await super().stop()
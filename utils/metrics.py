@@ -0,0 +1,347 @@
+"""
+进程内指标（Prometheus 文本格式）
+
+不依赖 prometheus_client，只实现本项目用到的三种类型：
+- Counter：单调递增计数（如 LLM token 数、缓存命中/未命中）
+- Gauge：可增可减的瞬时值（如 LLM 排队数、事件循环延迟）
+- Histogram：固定分桶的延迟分布（如各路由、各回合模式的耗时）
+
+抓取时才能得到的值（会话数、队列深度等）通过 register_collector 注册回调，
+由 render() 在生成文本前调用。
+
+用法：
+    from utils.metrics import metrics
+
+    TURN_SECONDS = metrics.histogram("storymaker_turn_seconds", "回合耗时", ["mode"])
+    TURN_SECONDS.observe(1.2, mode="dialogue")
+    text = metrics.render()
+"""
+import asyncio
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 覆盖从毫秒级的路由到数十秒的剧情推进回合
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类：按标签值组合保存各自的数据"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """单调递增计数"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("Counter 只能递增")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        """按标签值元组返回当前所有计数"""
+        with self._lock:
+            return dict(self._values)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """瞬时值"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def total(self) -> float:
+        """所有标签组合的值之和"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """固定分桶的分布（输出累计桶、_sum 与 _count）"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每个标签组合：[各桶计数..., +Inf 计数], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def mean(self) -> Optional[float]:
+        """所有标签组合合并后的平均值（尚无观测时为 None）"""
+        with self._lock:
+            count = sum(sum(counts) for counts, _ in self._values.values())
+            total = sum(total[0] for _, total in self._values.values())
+        return total / count if count else None
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标只创建一次，render() 按注册顺序输出"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def register_collector(self, collector: Callable[[], None]) -> None:
+        """注册抓取前调用的回调（通常用来把当前状态写进 Gauge）"""
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式"""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics_list = list(self._metrics.values())
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:  # noqa: BLE001 - 单个采集失败不影响其余指标
+                pass
+        lines: List[str] = []
+        for metric in metrics_list:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+# ============================================================
+# 公共指标
+# ============================================================
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "storymaker_http_request_seconds", "API 请求耗时（按路由模板）", ["method", "route", "status"]
+)
+TURN_SECONDS = metrics.histogram(
+    "storymaker_turn_seconds", "回合处理耗时（按回合模式）", ["mode"]
+)
+LLM_QUEUE_WAITING = metrics.gauge(
+    "storymaker_llm_queue_waiting", "正在等待 LLM 并发名额的调用数", ["agent"]
+)
+LLM_QUEUE_WAIT_SECONDS = metrics.histogram(
+    "storymaker_llm_queue_wait_seconds", "等待 LLM 并发名额的耗时", ["agent"]
+)
+EVENT_LOOP_LAG_SECONDS = metrics.gauge(
+    "storymaker_event_loop_lag_seconds", "最近一次测得的事件循环调度延迟"
+)
+EVENT_LOOP_LAG_HISTOGRAM = metrics.histogram(
+    "storymaker_event_loop_lag_distribution_seconds", "事件循环调度延迟分布",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+CACHE_REQUESTS = metrics.counter(
+    "storymaker_cache_requests_total", "缓存查询次数", ["cache", "result"]
+)
+CACHE_HIT_RATIO = metrics.gauge(
+    "storymaker_cache_hit_ratio", "缓存命中率（累计）", ["cache"]
+)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """记录一次缓存查询"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _collect_cache_ratios() -> None:
+    values = CACHE_REQUESTS.snapshot()
+    caches = {cache for cache, _ in values}
+    for cache in caches:
+        hits = values.get((cache, "hit"), 0.0)
+        total = hits + values.get((cache, "miss"), 0.0)
+        CACHE_HIT_RATIO.set(hits / total if total else 0.0, cache=cache)
+
+
+metrics.register_collector(_collect_cache_ratios)
+
+
+class EventLoopLagProbe:
+    """
+    周期性测量事件循环延迟：sleep(interval) 实际醒来的时间减去预期时间
+
+    延迟持续偏高说明有同步阻塞调用占住了事件循环。
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG_SECONDS.set(lag)
+            EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+            self._on_tick(lag)
+
+    def _on_tick(self, lag: float) -> None:
+        """每次测量后调用（子类扩展用）"""
+
+    def start(self) -> None:
+        """在当前事件循环中启动（重复调用无副作用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
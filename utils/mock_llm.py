@@ -16,8 +16,14 @@ class MockChatLLM(BaseChatModel):
     - Never touches network
     - Always returns valid JSON for pipelines that expect JSON
     - Minimal heuristics based on prompt content
+
+    `scripted_responses` lets tests queue exact outputs (e.g. malformed JSON
+    fixtures); they are consumed in order before falling back to heuristics.
     """
 
+    scripted_responses: List[str] = []
+    calls: int = 0
+
     def _join_messages(self, messages: List[BaseMessage]) -> str:
         parts: List[str] = []
         for m in messages:
@@ -29,6 +35,10 @@ class MockChatLLM(BaseChatModel):
         return "\n\n".join(parts)
 
     def _make_json_content(self, messages: List[BaseMessage]) -> str:
+        self.calls += 1
+        if self.scripted_responses:
+            return self.scripted_responses.pop(0)
+
         text = self._join_messages(messages)
 
         # WS init (initial_Illuminati.init_world_state)
@@ -5,13 +5,14 @@
 - 加载/保存 progress.json
 - 兼容 v1/v2 格式
 - 处理损坏的进度文件
+- 按创世工作项账本统计世界构建进度
 """
 
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
 from utils.logger import setup_logger
 
@@ -37,6 +38,24 @@ class ProgressData:
     is_corrupted: bool = False  # 标记 progress.json 是否损坏
 
 
+@dataclass
+class GenesisProgress:
+    """世界构建进度：各阶段计划的工作项中已完成的数量"""
+    stages: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    @property
+    def done(self) -> int:
+        return sum(stage["done"] for stage in self.stages.values())
+
+    @property
+    def total(self) -> int:
+        return sum(stage["total"] for stage in self.stages.values())
+
+    @property
+    def percent(self) -> float:
+        return 100.0 * self.done / self.total if self.total else 0.0
+
+
 class ProgressTracker:
     """进度跟踪器"""
     
@@ -164,6 +183,23 @@ class ProgressTracker:
             raise
 
 
+    def load_genesis_progress(self, ledger_path: Path) -> GenesisProgress:
+        """
+        读取创世工作项账本，统计真实完成度
+
+        阶段尚未开始（未登记计划）时不计入；阶段3 的计划在阶段1 完成后才登记。
+        """
+        from agents.offline.creatorGod.work_ledger import WorkLedger
+
+        if not Path(ledger_path).exists():
+            return GenesisProgress()
+        try:
+            return GenesisProgress(stages=WorkLedger(ledger_path).completion())
+        except Exception as e:
+            logger.error(f"读取创世账本失败: {e}")
+            return GenesisProgress()
+
+
 # 全局单例（便捷使用）
 progress_tracker = ProgressTracker()
 
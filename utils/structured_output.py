@@ -0,0 +1,193 @@
+"""
+结构化输出：按 pydantic 模型校验 LLM 响应
+
+流程（每一步失败才进入下一步，尽量不浪费 LLM 调用）：
+1. extract_json 单遍提取 JSON（已包含注释/尾逗号/截断等语法修复）
+2. 定向修复：拆掉单元素列表或约定的外层包装，丢弃类型错误的可选字段（列表只丢弃不合格元素）
+3. 仍缺少必填字段或无法提取 JSON 时，带着错误说明重新询问（re-ask）
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type, Union
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from pydantic import BaseModel, ValidationError
+
+from config.settings import settings
+from utils.json_parser import extract_json
+from utils.llm_factory import bind_json_mode
+from utils.logger import setup_logger
+
+logger = setup_logger("StructuredOutput", "json_parser.log")
+
+MessagesLike = Union[Sequence[BaseMessage], Callable[[], Sequence[BaseMessage]]]
+
+
+@dataclass
+class StructuredResult:
+    """validate_response / invoke_structured 的结果"""
+    data: Optional[Dict[str, Any]] = None     # 校验通过后的字典（model_dump，省略空值）
+    success: bool = False
+    repairs: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    raw: str = ""                             # 最后一次 LLM 原始输出
+    attempts: int = 0                         # 实际发起的 LLM 调用次数
+
+
+def _format_error(error: Dict[str, Any]) -> str:
+    loc = ".".join(str(part) for part in error.get("loc", ())) or "<root>"
+    return f"{loc}: {error.get('msg', '')}"
+
+
+def _is_required(schema: Type[BaseModel], name: Any) -> bool:
+    info = schema.model_fields.get(name) if isinstance(name, str) else None
+    return info is None or info.is_required()
+
+
+def validate_response(
+    raw: str,
+    schema: Type[BaseModel],
+    envelope: Optional[str] = None,
+) -> StructuredResult:
+    """
+    不调用 LLM，仅对一段原始输出做提取 + 校验 + 定向修复
+
+    Args:
+        raw: LLM 原始输出
+        schema: 目标 pydantic 模型
+        envelope: 约定的外层包装键（如 Screen 的 visual_render_data），存在时先拆开
+    """
+    result = StructuredResult(raw=raw or "")
+    # 先按对象提取，避免说明文字里的 "第[1]步" 之类括号被当成结果；
+    # 只有对象本身被包在数组里（[{...}]）时才改取数组，交给下面的拆包逻辑
+    extraction = extract_json(raw, expect=dict)
+    if "[" in (raw or "")[:max(extraction.span[0], 0)] or not extraction.success:
+        listed = extract_json(raw, expect=list)
+        if listed.success and (
+            not extraction.success or listed.span[0] < extraction.span[0] < listed.span[1]
+        ):
+            extraction = listed
+    if not extraction.success:
+        result.errors.append(f"无法提取 JSON: {extraction.error}")
+        return result
+    result.repairs.extend(extraction.repairs)
+
+    value = extraction.value
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], dict):
+        value = value[0]
+        result.repairs.append("unwrapped_list")
+    if envelope and isinstance(value, dict) and isinstance(value.get(envelope), dict):
+        value = value[envelope]
+        result.repairs.append("unwrapped_envelope")
+    if not isinstance(value, dict):
+        result.errors.append(f"期望 JSON 对象，实际为 {type(value).__name__}")
+        return result
+
+    try:
+        model = schema.model_validate(value)
+    except ValidationError as exc:
+        # 只有可选字段出错时，丢掉这些字段回退默认值；必填字段或整体约束出错则交给 re-ask
+        errors = exc.errors()
+        bad_fields = {err["loc"][0] for err in errors if err.get("loc")}
+        fatal = [err for err in errors if not err.get("loc") or _is_required(schema, err["loc"][0])]
+        if fatal:
+            result.errors.extend(_format_error(err) for err in fatal)
+            return result
+        value = dict(value)
+        for name in sorted(bad_fields):
+            bad_items = {
+                err["loc"][1] for err in errors
+                if err["loc"][0] == name and len(err["loc"]) > 1 and isinstance(err["loc"][1], int)
+            }
+            if bad_items and isinstance(value.get(name), list):
+                # 列表中只有个别元素不合格时，只丢弃这些元素
+                value[name] = [item for i, item in enumerate(value[name]) if i not in bad_items]
+                result.repairs.append(f"dropped_invalid_items:{name}")
+            else:
+                value.pop(name, None)
+                result.repairs.append(f"dropped_invalid:{name}")
+        try:
+            model = schema.model_validate(value)
+        except ValidationError as retry_exc:
+            result.errors.extend(_format_error(err) for err in retry_exc.errors())
+            return result
+
+    result.data = model.model_dump(exclude_none=True)
+    result.success = True
+    return result
+
+
+def build_reask_prompt(schema: Type[BaseModel], errors: List[str]) -> str:
+    """生成重新询问的提示：指出错误并列出字段要求"""
+    fields = [
+        f"{name}（必填）" if info.is_required() else name
+        for name, info in schema.model_fields.items()
+    ]
+    return (
+        "你上一次的输出无法通过格式校验：\n"
+        + "\n".join(f"- {err}" for err in errors[:5])
+        + f"\n请只输出一个 JSON 对象，字段包括：{', '.join(fields)}。不要输出任何解释或 Markdown。"
+    )
+
+
+def _content(response: Any) -> str:
+    content = getattr(response, "content", response)
+    return content if isinstance(content, str) else str(content)
+
+
+def invoke_structured(
+    llm: Any,
+    messages: MessagesLike,
+    schema: Type[BaseModel],
+    first_response: Optional[str] = None,
+    envelope: Optional[str] = None,
+    max_reasks: Optional[int] = None,
+    label: str = "",
+) -> StructuredResult:
+    """
+    调用 LLM 并按 schema 校验，失败时重新询问
+
+    Args:
+        llm: LLM 实例（支持时自动开启 JSON 模式）
+        messages: 对话消息，或返回消息的函数（只有需要 re-ask 时才会构建）
+        schema: 目标 pydantic 模型
+        first_response: 调用方已通过自己的链拿到首个响应时传入，省去首次调用
+        envelope: 见 validate_response
+        max_reasks: 最多重新询问次数，默认 settings.LLM_SCHEMA_MAX_REASKS
+        label: 日志中的调用方标识
+    """
+    if max_reasks is None:
+        max_reasks = settings.LLM_SCHEMA_MAX_REASKS
+    structured_llm = bind_json_mode(llm)
+
+    attempts = 0
+    if first_response is None:
+        base_messages = list(messages() if callable(messages) else messages)
+        raw = _content(structured_llm.invoke(base_messages))
+        attempts += 1
+    else:
+        base_messages = None
+        raw = first_response
+
+    result = validate_response(raw, schema, envelope)
+    reasks = 0
+    while not result.success and reasks < max_reasks:
+        reasks += 1
+        logger.warning(f"⚠️ {label or schema.__name__} 输出未通过校验，重新询问（第{reasks}次）: {result.errors[:3]}")
+        if base_messages is None:
+            base_messages = list(messages() if callable(messages) else messages)
+        followup = base_messages + [
+            AIMessage(content=raw),
+            HumanMessage(content=build_reask_prompt(schema, result.errors)),
+        ]
+        raw = _content(structured_llm.invoke(followup))
+        attempts += 1
+        result = validate_response(raw, schema, envelope)
+
+    if reasks and result.success:
+        result.repairs.append("reasked")
+    if result.repairs and result.success:
+        logger.debug(f"{label or schema.__name__} 输出已修复: {', '.join(result.repairs)}")
+    if not result.success:
+        logger.error(f"❌ {label or schema.__name__} 输出校验失败: {result.errors[:3]}")
+    result.attempts = attempts
+    return result
@@ -0,0 +1,362 @@
+"""
+回合级追踪（span 时间线）
+
+基于 contextvars：一次回合 / 一次 API 请求 / 一次 Genesis 构建对应一个 Trace，
+其中的每个步骤记为一个 span，可导出为 Chrome trace-event JSON
+（chrome://tracing 或 https://ui.perfetto.dev 直接打开）。
+
+- span(name, **args)：记录一个步骤；当前没有 Trace 时返回共享的空上下文，几乎无开销
+- maybe_trace(name, force=None)：入口处使用。已有 Trace 时等同 span；否则按
+  TRACE_SAMPLE_RATE 采样（force=True/False 可强制开启/关闭）决定是否新建 Trace
+- trace_awaitable(name, aw)：给 asyncio.gather 的子任务套上 span
+- traced(name, root=False)：装饰器版本，root=True 时等同 maybe_trace
+
+并发的 asyncio 任务与线程各占一条泳道（Chrome trace 中的 tid），时间线互不覆盖。
+"""
+import asyncio
+import functools
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+from uuid import uuid4
+
+from config.settings import settings
+from utils.logger import setup_logger
+
+logger = setup_logger("Tracing", "tracing.log")
+
+T = TypeVar("T")
+
+TRACE_HEADER = "X-Trace"
+TRACE_ID_HEADER = "X-Trace-Id"
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+# 入口已决定本次不追踪时置 True，避免内层入口重新采样
+_suppressed: ContextVar[bool] = ContextVar("trace_suppressed", default=False)
+
+
+def _lane_key() -> Any:
+    """当前泳道：运行中的 asyncio 任务，或所在线程"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return ("task", id(task))
+    return ("thread", threading.get_ident())
+
+
+class Trace:
+    """一次追踪：收集已完成的 span，导出为 Chrome trace-event JSON"""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, **args: Any):
+        self.trace_id = trace_id or uuid4().hex[:16]
+        self.name = name
+        self.args = args
+        self.started_at = datetime.now().isoformat(timespec="milliseconds")
+        self.origin = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self._lanes: Dict[Any, int] = {}
+        self._lane_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def lane(self, label: str = "") -> int:
+        """当前泳道编号（首次出现时以 label 命名）"""
+        key = _lane_key()
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = len(self._lanes) + 1
+                self._lanes[key] = lane
+                self._lane_names[lane] = label or f"{key[0]}-{lane}"
+            return lane
+
+    def add_span(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        lane: int,
+        args: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """记录一个已完成的 span（start / end 为 time.perf_counter() 值）"""
+        event = {
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",
+            "ts": round((start - self.origin) * 1e6, 1),
+            "dur": round(max(0.0, end - start) * 1e6, 1),
+            "pid": 1,
+            "tid": lane,
+        }
+        if args:
+            event["args"] = {key: _json_safe(value) for key, value in args.items()}
+        with self._lock:
+            self.events.append(event)
+
+    @property
+    def duration_ms(self) -> float:
+        with self._lock:
+            ends = [(event["ts"] + event["dur"]) / 1000 for event in self.events]
+        return round(max(ends, default=0.0), 2)
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Chrome trace-event 格式（JSON Object Format）"""
+        with self._lock:
+            events = sorted(self.events, key=lambda e: (e["ts"], -e["dur"]))
+            lane_names = dict(self._lane_names)
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.name}},
+        ] + [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": lane, "args": {"name": label}}
+            for lane, label in sorted(lane_names.items())
+        ]
+        return {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "started_at": self.started_at,
+                **{key: _json_safe(value) for key, value in self.args.items()},
+            },
+        }
+
+
+def _json_safe(value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+# ============================================================
+# 导出与查询
+# ============================================================
+
+class TraceStore:
+    """保留最近的追踪供 API 查询，并在后台线程写出 JSON 文件"""
+
+    def __init__(self, keep: int = 50):
+        self.keep = keep
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def add(self, trace: Trace) -> None:
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            while len(self._traces) > self.keep:
+                self._traces.popitem(last=False)
+        if settings.TRACE_EXPORT:
+            self._export_async(trace)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def recent(self) -> List[Trace]:
+        with self._lock:
+            return list(reversed(self._traces.values()))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+
+    def _export_async(self, trace: Trace) -> None:
+        # 导出不占用调用方（通常是事件循环）
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+        self._executor.submit(export_trace, trace)
+
+    def flush(self) -> None:
+        """等待已提交的导出写完（测试使用）"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def trace_dir():
+    return settings.LOGS_DIR / "traces"
+
+
+def trace_filename(trace: Trace) -> str:
+    """导出文件名：名称中的空格、斜杠等替换为下划线（API 追踪名形如 "POST /game/action"）"""
+    name = re.sub(r"[^\w.-]+", "_", trace.name).strip("_.") or "trace"
+    return f"trace_{name}_{trace.trace_id}.json"
+
+
+def export_trace(trace: Trace, path=None):
+    """把追踪写成 Chrome trace JSON 文件，返回路径"""
+    path = path or trace_dir() / trace_filename(trace)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(trace.to_chrome(), ensure_ascii=False), encoding="utf-8")
+    except OSError as exc:
+        logger.warning(f"⚠️ 追踪导出失败 {trace.trace_id}: {exc}")
+        return None
+    return path
+
+
+trace_store = TraceStore(keep=settings.TRACE_KEEP)
+
+
+# ============================================================
+# span API
+# ============================================================
+
+class _NullSpan:
+    """未追踪时共用的空上下文"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc: Any) -> bool:
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "args", "start", "lane")
+
+    def __init__(self, trace: Trace, name: str, args: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.lane = self.trace.lane(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"
+        self.trace.add_span(self.name, self.start, time.perf_counter(), self.lane, self.args)
+        return False
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def span(name: str, **args: Any):
+    """记录一个步骤；当前没有 Trace 时不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, args)
+
+
+def should_sample(force: Optional[bool] = None) -> bool:
+    if force is not None:
+        return force
+    rate = settings.TRACE_SAMPLE_RATE
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, **args: Any) -> Iterator[Trace]:
+    """新建 Trace 并把整个范围记为根 span，结束后存入 trace_store"""
+    trace = Trace(name, trace_id, **args)
+    token = _current_trace.set(trace)
+    try:
+        with _Span(trace, name, dict(args)):
+            yield trace
+    finally:
+        _current_trace.reset(token)
+        trace_store.add(trace)
+        logger.debug(f"🧭 追踪完成 {name} [{trace.trace_id}] {trace.duration_ms}ms, {len(trace.events)} spans")
+
+
+@contextmanager
+def maybe_trace(name: str, force: Optional[bool] = None, **args: Any) -> Iterator[Optional[Trace]]:
+    """
+    入口处使用：已在追踪中则记为 span；否则按采样决定是否新建 Trace
+
+    Yields:
+        当前 Trace；本次不追踪时为 None
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        with _Span(trace, name, args):
+            yield trace
+        return
+    if _suppressed.get() or not should_sample(force):
+        token = _suppressed.set(True)
+        try:
+            yield None
+        finally:
+            _suppressed.reset(token)
+        return
+    with start_trace(name, **args) as new_trace:
+        yield new_trace
+
+
+async def _traced_await(name: str, awaitable: Awaitable[T], args: Dict[str, Any]) -> T:
+    with span(name, **args):
+        return await awaitable
+
+
+def trace_awaitable(name: str, awaitable: Awaitable[T], **args: Any) -> Awaitable[T]:
+    """给 gather 的子任务套上 span（未追踪时原样返回）"""
+    if _current_trace.get() is None:
+        return awaitable
+    return _traced_await(name, awaitable, args)
+
+
+def traced(name: str, root: bool = False) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """
+    函数装饰器：整个调用记为一个 span
+
+    Args:
+        name: span 名称
+        root: True 时调用也是追踪入口（等同 maybe_trace）
+    """
+
+    def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        scope = maybe_trace if root else span
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> T:
+                if not root and _current_trace.get() is None:
+                    return await func(*args, **kwargs)
+                with scope(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            if not root and _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with scope(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def parse_trace_header(value: Optional[str]) -> Optional[bool]:
+    """解析 X-Trace 请求头：1/true/on 强制开启，0/false/off 强制关闭，其他值按采样"""
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value in ("1", "true", "on", "yes"):
+        return True
+    if value in ("0", "false", "off", "no"):
+        return False
+    return None